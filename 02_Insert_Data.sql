@@ -1,3 +1,7 @@
+-- Windows hosts with the CSVs on local disk can run this script directly.
+-- Elsewhere (or for large watch_history files) use the streaming loader:
+--   python bulk_load.py --data-dir /path/to/combined_dataset
+
 USE netflix_analytics_v2;
 GO
 
@@ -1,3 +1,5 @@
+USE netflix_analytics_v2;
+GO
 
 -- ============================================================================
 -- TRIGGERS
@@ -12,10 +14,11 @@ BEGIN
     SET NOCOUNT ON;
 
     UPDATE wh
-    SET completed = CASE WHEN i.watch_percentage >= 90 THEN 1 ELSE 0 END
+    SET completed = CASE WHEN i.watch_percentage >= 0.9 THEN 1 ELSE 0 END
     FROM watch_history wh
     INNER JOIN inserted i ON wh.watch_id = i.watch_id;
 END;
+GO
 
 
 -- Trigger 2: Update user's total watch time when new watch history is added
@@ -26,14 +29,21 @@ AS
 BEGIN
     SET NOCOUNT ON;
 
+    -- Aggregate per user first: a multi-row INSERT can hold several events
+    -- for the same user, and UPDATE ... FROM applies only one matching row
     UPDATE u
-    SET u.watch_time_hours = u.watch_time_hours + ((t.runtime * i.watch_percentage) / 60),
+    SET u.watch_time_hours = u.watch_time_hours + d.hours,
         u.updated_at = SYSDATETIME()
     FROM users u
-    INNER JOIN inserted i ON u.user_id = i.user_id
-    INNER JOIN titles t ON i.title_id = t.title_id
-    WHERE t.runtime IS NOT NULL;
+    INNER JOIN (
+        SELECT i.user_id, SUM((t.runtime * i.watch_percentage) / 60) AS hours
+        FROM inserted i
+        INNER JOIN titles t ON i.title_id = t.title_id
+        WHERE t.runtime IS NOT NULL
+        GROUP BY i.user_id
+    ) d ON u.user_id = d.user_id;
 END;
+GO
 
 
 -- ============================================================================
@@ -41,20 +51,29 @@ END;
 -- ============================================================================
 
 -- View 1: User Activity Summary
+-- users has no subscription_type column; use the most recently started
+-- subscription
 CREATE OR ALTER VIEW vw_user_activity_summary AS
 SELECT 
     u.user_id,
     u.name,
     u.country,
-    u.subscription_type,
+    cs.subscription_type,
     u.watch_time_hours,
     COUNT(DISTINCT wh.title_id) AS titles_watched,
     COUNT(wh.watch_id) AS total_watches,
     SUM(CAST(wh.completed AS INT)) AS completed_watches,
     ROUND(AVG(CAST(wh.watch_percentage AS FLOAT)) * 100, 2) AS avg_watch_percentage
 FROM users u
+OUTER APPLY (
+    SELECT TOP 1 s.subscription_type
+    FROM subscriptions s
+    WHERE s.user_id = u.user_id
+    ORDER BY s.subscription_start_date DESC
+) cs
 LEFT JOIN watch_history wh ON u.user_id = wh.user_id
-GROUP BY u.user_id, u.name, u.country, u.subscription_type, u.watch_time_hours;
+GROUP BY u.user_id, u.name, u.country, cs.subscription_type, u.watch_time_hours;
+GO
 
 
 -- View 2: Genre Performance
@@ -71,6 +90,7 @@ FROM genres g
 LEFT JOIN title_genres tg ON g.genre_id = tg.genre_id
 LEFT JOIN watch_history wh ON tg.title_id = wh.title_id
 GROUP BY g.genre_id, g.name;
+GO
 
 -- View 3: Active Subscriptions
 CREATE OR ALTER VIEW vw_active_subscriptions AS
@@ -87,9 +107,11 @@ SELECT
 FROM subscriptions s
 JOIN users u ON s.user_id = u.user_id
 WHERE s.subscription_status = 'active'
-  AND (s.subscription_end_date IS NULL OR s.subscription_end_date >= '2025-01-01');
+  AND (s.subscription_end_date IS NULL OR s.subscription_end_date >= CAST(GETDATE() AS DATE));
+GO
 
 SELECT COUNT(*) AS count FROM vw_active_subscriptions
+GO
 
 -- View 4: Revenue Analysis
 CREATE OR ALTER VIEW vw_revenue_analysis AS
@@ -102,6 +124,7 @@ SELECT
 FROM subscriptions s
 WHERE s.subscription_status = 'active'
 GROUP BY s.subscription_type, s.monthly_fee;
+GO
 
 -- View 5: User Engagement by Country
 CREATE OR ALTER VIEW vw_country_engagement AS
@@ -118,6 +141,7 @@ INNER JOIN watch_history wh
 WHERE u.country IS NOT NULL
   AND wh.watch_percentage IS NOT NULL
 GROUP BY u.country;
+GO
 
 -- ============================================================================
 -- STORED PROCEDURES
@@ -154,6 +178,7 @@ BEGIN
     GROUP BY t.title_id, t.title, t.release_year, t.imdb_score
     ORDER BY t.imdb_score DESC; 
 END;
+GO
 
 -- Procedure 2: Generates genre-level analytics,
 CREATE OR ALTER PROCEDURE sp_get_genre_trends
@@ -176,8 +201,10 @@ BEGIN
     GROUP BY g.genre_id, g.name
     ORDER BY total_watch_events DESC;
 END;
+GO
 
 EXEC sp_get_genre_trends
+GO
 
 
 -- ============================================================================
@@ -196,6 +223,7 @@ BEGIN
 
     RETURN ISNULL(@ltv, 0.00);
 END;
+GO
 
 
 -- Function 2: Get User Subscription Duration in Days
@@ -211,6 +239,42 @@ BEGIN
 
     RETURN ISNULL(@duration, 0);
 END;
+GO
+
+
+-- Function 3: Set-based LTV and subscription duration (inline table-valued)
+-- Same arithmetic as fn_calculate_user_ltv / fn_subscription_duration, but inlined
+-- into the calling query so it runs as one aggregate over subscriptions instead
+-- of once per row, and does not block parallel plans.
+CREATE OR ALTER FUNCTION fn_user_ltv(@p_user_id VARCHAR(50))
+RETURNS TABLE
+AS
+RETURN
+    SELECT
+        CAST(ISNULL(SUM(s.monthly_fee * DATEDIFF(DAY, s.subscription_start_date, ISNULL(s.subscription_end_date, CAST(GETDATE() AS DATE))) / 30.0), 0.00) AS DECIMAL(10, 2)) AS lifetime_value,
+        ISNULL(SUM(DATEDIFF(DAY, s.subscription_start_date, ISNULL(s.subscription_end_date, CAST(GETDATE() AS DATE)))), 0) AS subscription_days
+    FROM subscriptions s
+    WHERE s.user_id = @p_user_id;
+GO
+
+
+-- View 6: Lifetime value for every user (set-based replacement for fn_calculate_user_ltv)
+CREATE OR ALTER VIEW vw_user_ltv AS
+SELECT
+    u.user_id,
+    u.name,
+    CAST(ISNULL(l.lifetime_value, 0.00) AS DECIMAL(10, 2)) AS lifetime_value,
+    ISNULL(l.subscription_days, 0) AS subscription_days
+FROM users u
+LEFT JOIN (
+    SELECT
+        s.user_id,
+        SUM(s.monthly_fee * DATEDIFF(DAY, s.subscription_start_date, ISNULL(s.subscription_end_date, CAST(GETDATE() AS DATE))) / 30.0) AS lifetime_value,
+        SUM(DATEDIFF(DAY, s.subscription_start_date, ISNULL(s.subscription_end_date, CAST(GETDATE() AS DATE)))) AS subscription_days
+    FROM subscriptions s
+    GROUP BY s.user_id
+) l ON u.user_id = l.user_id;
+GO
 
 
 -- ============================================================================
@@ -381,12 +445,12 @@ GROUP BY subscription_type;
 
 -- Query 3: Lifetime value by user
 SELECT 
-    u.user_id,
-    u.name,
-    dbo.fn_calculate_user_ltv(u.user_id) AS lifetime_value
-FROM users u
+    user_id,
+    name,
+    lifetime_value
+FROM vw_user_ltv
 ORDER BY lifetime_value DESC;
-Insight: Identify high-value users for retention strategies.
+-- Insight: Identify high-value users for retention strategies.
 
 -- Cross-Analysis: Content vs User Engagement
 -- Query 1: Active vs Inactive subscriptions
@@ -408,21 +472,20 @@ SELECT
     u.user_id,
     u.name,
     ROUND(AVG(wh.watch_percentage * 100), 2) AS avg_watch_percentage,
-    dbo.fn_calculate_user_ltv(u.user_id) AS lifetime_value
+    l.lifetime_value
 FROM users u
 JOIN watch_history wh ON u.user_id = wh.user_id
-GROUP BY u.user_id, u.name
-HAVING AVG(wh.watch_percentage) > 0.8 AND dbo.fn_calculate_user_ltv(u.user_id) < 50
+JOIN vw_user_ltv l ON u.user_id = l.user_id
+GROUP BY u.user_id, u.name, l.lifetime_value
+HAVING AVG(wh.watch_percentage) > 0.8 AND l.lifetime_value < 50
 ORDER BY avg_watch_percentage DESC;
 -- Insight: These are highly engaged but low-paying users—good for upsell campaigns.
 
 -- ============================================================================
 -- INDEXES FOR PERFORMANCE OPTIMIZATION
 -- ============================================================================
-
-CREATE INDEX idx_watch_user_date_title ON watch_history(user_id, title_id);
-CREATE INDEX idx_subscription_user_status ON subscriptions(user_id, subscription_status);
-CREATE INDEX idx_user_country_subscription ON users(country, subscription_type);
+-- Indexes, partitioning and the watch_history columnstore are versioned
+-- schema changes in migrations/, applied with: python migrate.py apply
 
 -- ============================================================================
 -- END
@@ -0,0 +1,156 @@
+-- ============================================================================
+-- DEFERRED MAINTENANCE OF watch_time_hours AND completed
+-- ============================================================================
+-- Alternative to the two AFTER INSERT triggers on watch_history. In deferred
+-- mode the triggers are disabled, writers set `completed` themselves
+-- (watch_percentage >= 0.9), and sp_apply_watch_time periodically adds the
+-- watch time of every event above a watermark to users.watch_time_hours in
+-- one set-based pass. maintenance.py drives the passes and switches modes.
+
+USE netflix_analytics_v2;
+GO
+
+-- ============================================================================
+-- TABLE: maintenance_watermarks
+-- ============================================================================
+IF OBJECT_ID('maintenance_watermarks', 'U') IS NULL
+CREATE TABLE maintenance_watermarks (
+    name VARCHAR(50) PRIMARY KEY,
+    last_watch_id INT NOT NULL DEFAULT 0,
+    updated_at DATETIME2 DEFAULT SYSDATETIME() NOT NULL
+);
+GO
+
+
+-- ============================================================================
+-- PROCEDURES
+-- ============================================================================
+
+-- Procedure 1: Apply watch time for events above the watermark
+-- Processes at most @p_batch_size watch_ids per call; @p_remaining tells the
+-- caller whether to call again.
+CREATE OR ALTER PROCEDURE sp_apply_watch_time
+    @p_batch_size INT = 500000,
+    @p_to_watch_id INT = NULL OUTPUT,
+    @p_users_updated INT = NULL OUTPUT,
+    @p_remaining INT = NULL OUTPUT
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    DECLARE @low INT, @high INT, @max INT;
+    SET @p_users_updated = 0;
+
+    BEGIN TRANSACTION;
+
+    -- A shared table lock waits for in-flight inserts to commit, so no
+    -- watch_id at or below @max can appear after this pass has run
+    SELECT @max = ISNULL(MAX(watch_id), 0) FROM watch_history WITH (TABLOCK, HOLDLOCK);
+
+    SELECT @low = last_watch_id
+    FROM maintenance_watermarks WITH (UPDLOCK, HOLDLOCK)
+    WHERE name = 'watch_time';
+
+    IF @low IS NULL
+    BEGIN
+        -- First run: everything so far was applied by the triggers
+        INSERT INTO maintenance_watermarks (name, last_watch_id) VALUES ('watch_time', @max);
+        SET @low = @max;
+    END
+
+    SET @high = CASE WHEN @max - @low > @p_batch_size THEN @low + @p_batch_size ELSE @max END;
+
+    IF @high > @low
+    BEGIN
+        UPDATE wh
+        SET completed = CASE WHEN wh.watch_percentage >= 0.9 THEN 1 ELSE 0 END
+        FROM watch_history wh
+        WHERE wh.watch_id > @low AND wh.watch_id <= @high
+          AND ISNULL(wh.completed, 255) <> CASE WHEN wh.watch_percentage >= 0.9 THEN 1 ELSE 0 END;
+
+        UPDATE u
+        SET u.watch_time_hours = u.watch_time_hours + d.hours,
+            u.updated_at = SYSDATETIME()
+        FROM users u
+        INNER JOIN (
+            SELECT wh.user_id, SUM((t.runtime * wh.watch_percentage) / 60) AS hours
+            FROM watch_history wh
+            INNER JOIN titles t ON wh.title_id = t.title_id
+            WHERE wh.watch_id > @low AND wh.watch_id <= @high
+              AND t.runtime IS NOT NULL
+            GROUP BY wh.user_id
+        ) d ON u.user_id = d.user_id;
+        SET @p_users_updated = @@ROWCOUNT;
+
+        UPDATE maintenance_watermarks
+        SET last_watch_id = @high, updated_at = SYSDATETIME()
+        WHERE name = 'watch_time';
+    END
+
+    COMMIT TRANSACTION;
+
+    SET @p_to_watch_id = @high;
+    SET @p_remaining = @max - @high;
+END;
+GO
+
+
+-- Procedure 2: Switch between trigger and deferred maintenance
+-- Inserts are blocked while switching so no event is applied twice or missed.
+CREATE OR ALTER PROCEDURE sp_set_watch_maintenance_mode
+    @p_mode VARCHAR(10)
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    IF @p_mode NOT IN ('trigger', 'deferred')
+        THROW 50001, 'Maintenance mode must be ''trigger'' or ''deferred''.', 1;
+
+    DECLARE @max INT, @remaining INT = 1;
+
+    BEGIN TRANSACTION;
+
+    SELECT @max = ISNULL(MAX(watch_id), 0) FROM watch_history WITH (TABLOCKX, HOLDLOCK);
+
+    IF @p_mode = 'deferred'
+    BEGIN
+        -- Only start deferring if the triggers are currently active;
+        -- otherwise the existing watermark is still correct
+        IF EXISTS (
+            SELECT 1 FROM sys.triggers
+            WHERE parent_id = OBJECT_ID('watch_history')
+              AND name = 'trg_watch_history_update_user_time'
+              AND is_disabled = 0
+        )
+        BEGIN
+            MERGE maintenance_watermarks AS m
+            USING (SELECT 'watch_time' AS name) AS s ON m.name = s.name
+            WHEN MATCHED THEN UPDATE SET last_watch_id = @max, updated_at = SYSDATETIME()
+            WHEN NOT MATCHED THEN INSERT (name, last_watch_id) VALUES ('watch_time', @max);
+        END
+
+        DISABLE TRIGGER trg_watch_history_completed ON watch_history;
+        DISABLE TRIGGER trg_watch_history_update_user_time ON watch_history;
+    END
+    ELSE
+    BEGIN
+        -- Drain the backlog, then hand over to the triggers. If they are
+        -- already active the watermark is stale and must not be applied.
+        IF EXISTS (
+            SELECT 1 FROM sys.triggers
+            WHERE parent_id = OBJECT_ID('watch_history')
+              AND name = 'trg_watch_history_update_user_time'
+              AND is_disabled = 1
+        )
+            WHILE @remaining > 0
+                EXEC sp_apply_watch_time @p_batch_size = 500000, @p_remaining = @remaining OUTPUT;
+
+        ENABLE TRIGGER trg_watch_history_completed ON watch_history;
+        ENABLE TRIGGER trg_watch_history_update_user_time ON watch_history;
+    END
+
+    COMMIT TRANSACTION;
+END;
+GO
@@ -0,0 +1,352 @@
+-- ============================================================================
+-- TREND ROLLUPS OVER watch_history.created_at
+-- ============================================================================
+-- Hourly and daily buckets of watch_history per title, genre, country and
+-- subscription type (plus dimension 'all' for the whole platform), so trend
+-- queries read a few hundred buckets instead of scanning every event.
+--
+-- sp_apply_trend_rollups adds the events above a watch_id watermark to their
+-- buckets. A late event (old created_at, new watch_id) is therefore still
+-- picked up and lands in its old bucket. sp_backfill_trend_rollups rebuilds
+-- the buckets of a date range from scratch, e.g. after rows below the
+-- watermark were loaded, corrected or deleted. rollups.py drives both.
+--
+-- Measures are additive, so rolling windows are sums of buckets:
+--   watches, completed_watches, watch_percentage_sum, watch_percentage_count
+-- The subscription type of an event is the user's plan on the day of the
+-- event ('None' without one); a NULL country is stored as 'Unknown'.
+
+USE netflix_analytics_v2;
+GO
+
+-- ============================================================================
+-- TABLES
+-- ============================================================================
+IF OBJECT_ID('maintenance_watermarks', 'U') IS NULL
+CREATE TABLE maintenance_watermarks (
+    name VARCHAR(50) PRIMARY KEY,
+    last_watch_id INT NOT NULL DEFAULT 0,
+    updated_at DATETIME2 DEFAULT SYSDATETIME() NOT NULL
+);
+GO
+
+IF OBJECT_ID('watch_rollups', 'U') IS NULL
+CREATE TABLE watch_rollups (
+    grain VARCHAR(4) NOT NULL,                  -- 'hour' | 'day'
+    dimension VARCHAR(20) NOT NULL,             -- 'all' | 'title' | 'genre' | 'country' | 'subscription_type'
+    member NVARCHAR(100) NOT NULL,              -- title_id, genre name, country, plan, or 'all'
+    bucket_start DATETIME2(0) NOT NULL,
+    watches INT NOT NULL,
+    completed_watches INT NOT NULL,
+    watch_percentage_sum DECIMAL(18,2) NOT NULL,
+    watch_percentage_count INT NOT NULL,
+    CONSTRAINT pk_watch_rollups PRIMARY KEY (grain, dimension, member, bucket_start)
+);
+GO
+
+
+-- ============================================================================
+-- FUNCTIONS
+-- ============================================================================
+
+-- Function 1: Bucket rows for the events in a watch_id range, optionally
+-- limited to a created_at range [@p_from, @p_to). created_at is nullable
+-- until migration 0001; such events are bucketed by updated_at, and events
+-- with neither are left out (bucket_start is part of the key).
+CREATE OR ALTER FUNCTION fn_watch_rollup_rows (
+    @p_low_watch_id INT,
+    @p_high_watch_id INT,
+    @p_from DATETIME2 = NULL,
+    @p_to DATETIME2 = NULL
+)
+RETURNS TABLE
+AS
+RETURN
+    WITH events AS (
+        SELECT
+            wh.title_id,
+            wh.watch_percentage,
+            ISNULL(wh.completed, 0) AS completed,
+            ISNULL(u.country, 'Unknown') AS country,
+            ISNULL(s.subscription_type, 'None') AS subscription_type,
+            CAST(DATEADD(HOUR, DATEDIFF(HOUR, 0, t.event_at), 0) AS DATETIME2(0)) AS hour_start,
+            CAST(CAST(t.event_at AS DATE) AS DATETIME2(0)) AS day_start
+        FROM watch_history wh
+        CROSS APPLY (SELECT COALESCE(wh.created_at, wh.updated_at) AS event_at) t
+        LEFT JOIN users u ON u.user_id = wh.user_id
+        OUTER APPLY (
+            SELECT TOP 1 sub.subscription_type
+            FROM subscriptions sub
+            WHERE sub.user_id = wh.user_id
+              AND sub.subscription_start_date <= t.event_at
+              AND (sub.subscription_end_date IS NULL OR sub.subscription_end_date >= CAST(t.event_at AS DATE))
+            ORDER BY sub.subscription_start_date DESC, sub.subscription_id DESC
+        ) s
+        WHERE wh.watch_id > @p_low_watch_id AND wh.watch_id <= @p_high_watch_id
+          AND t.event_at IS NOT NULL
+          AND (@p_from IS NULL OR t.event_at >= @p_from)
+          AND (@p_to IS NULL OR t.event_at < @p_to)
+    ),
+    members AS (
+        SELECT e.*, d.dimension, d.member
+        FROM events e
+        CROSS APPLY (VALUES
+            ('all', CAST('all' AS NVARCHAR(100))),
+            ('title', e.title_id),
+            ('country', e.country),
+            ('subscription_type', e.subscription_type)
+        ) d (dimension, member)
+        UNION ALL
+        SELECT e.*, 'genre', g.name
+        FROM events e
+        JOIN title_genres tg ON tg.title_id = e.title_id
+        JOIN genres g ON g.genre_id = tg.genre_id
+    )
+    SELECT
+        b.grain,
+        m.dimension,
+        m.member,
+        b.bucket_start,
+        COUNT(*) AS watches,
+        SUM(CAST(m.completed AS INT)) AS completed_watches,
+        ISNULL(SUM(m.watch_percentage), 0) AS watch_percentage_sum,
+        COUNT(m.watch_percentage) AS watch_percentage_count
+    FROM members m
+    CROSS APPLY (VALUES ('hour', m.hour_start), ('day', m.day_start)) b (grain, bucket_start)
+    GROUP BY b.grain, m.dimension, m.member, b.bucket_start;
+GO
+
+
+-- ============================================================================
+-- PROCEDURES
+-- ============================================================================
+
+-- Procedure 1: Add events above the watermark to their buckets
+-- Processes at most @p_batch_size watch_ids per call; @p_remaining tells the
+-- caller whether to call again. The first call starts from watch_id 0.
+CREATE OR ALTER PROCEDURE sp_apply_trend_rollups
+    @p_batch_size INT = 500000,
+    @p_to_watch_id INT = NULL OUTPUT,
+    @p_buckets_updated INT = NULL OUTPUT,
+    @p_remaining INT = NULL OUTPUT
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    DECLARE @low INT, @high INT, @max INT;
+    SET @p_buckets_updated = 0;
+
+    BEGIN TRANSACTION;
+
+    -- As in sp_apply_watch_time: no watch_id at or below @max can commit
+    -- after this pass has read it
+    SELECT @max = ISNULL(MAX(watch_id), 0) FROM watch_history WITH (TABLOCK, HOLDLOCK);
+
+    SELECT @low = last_watch_id
+    FROM maintenance_watermarks WITH (UPDLOCK, HOLDLOCK)
+    WHERE name = 'trend_rollups';
+
+    IF @low IS NULL
+    BEGIN
+        INSERT INTO maintenance_watermarks (name, last_watch_id) VALUES ('trend_rollups', 0);
+        SET @low = 0;
+    END
+
+    SET @high = CASE WHEN @max - @low > @p_batch_size THEN @low + @p_batch_size ELSE @max END;
+
+    IF @high > @low
+    BEGIN
+        MERGE watch_rollups AS r
+        USING fn_watch_rollup_rows(@low, @high, NULL, NULL) AS d
+        ON r.grain = d.grain AND r.dimension = d.dimension
+           AND r.member = d.member AND r.bucket_start = d.bucket_start
+        WHEN MATCHED THEN UPDATE SET
+            watches = r.watches + d.watches,
+            completed_watches = r.completed_watches + d.completed_watches,
+            watch_percentage_sum = r.watch_percentage_sum + d.watch_percentage_sum,
+            watch_percentage_count = r.watch_percentage_count + d.watch_percentage_count
+        WHEN NOT MATCHED THEN
+            INSERT (grain, dimension, member, bucket_start, watches, completed_watches,
+                    watch_percentage_sum, watch_percentage_count)
+            VALUES (d.grain, d.dimension, d.member, d.bucket_start, d.watches, d.completed_watches,
+                    d.watch_percentage_sum, d.watch_percentage_count);
+        SET @p_buckets_updated = @@ROWCOUNT;
+
+        UPDATE maintenance_watermarks
+        SET last_watch_id = @high, updated_at = SYSDATETIME()
+        WHERE name = 'trend_rollups';
+    END
+
+    COMMIT TRANSACTION;
+
+    SET @p_to_watch_id = @high;
+    SET @p_remaining = @max - @high;
+END;
+GO
+
+
+-- Procedure 2: Rebuild every bucket of the days @p_from..@p_to (inclusive)
+-- Only events up to the watermark are counted; later ones are still added
+-- by the next sp_apply_trend_rollups pass.
+CREATE OR ALTER PROCEDURE sp_backfill_trend_rollups
+    @p_from DATE,
+    @p_to DATE,
+    @p_buckets_written INT = NULL OUTPUT
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    DECLARE @watermark INT;
+    DECLARE @from DATETIME2(0) = CAST(@p_from AS DATETIME2(0));
+    DECLARE @to DATETIME2(0) = DATEADD(DAY, 1, CAST(@p_to AS DATETIME2(0)));
+
+    BEGIN TRANSACTION;
+
+    -- Holding the watermark row keeps apply passes out while rebuilding
+    SELECT @watermark = last_watch_id
+    FROM maintenance_watermarks WITH (UPDLOCK, HOLDLOCK)
+    WHERE name = 'trend_rollups';
+
+    IF @watermark IS NULL
+    BEGIN
+        INSERT INTO maintenance_watermarks (name, last_watch_id) VALUES ('trend_rollups', 0);
+        SET @watermark = 0;
+    END
+
+    DELETE FROM watch_rollups
+    WHERE bucket_start >= @from AND bucket_start < @to;
+
+    INSERT INTO watch_rollups (grain, dimension, member, bucket_start, watches, completed_watches,
+                               watch_percentage_sum, watch_percentage_count)
+    SELECT grain, dimension, member, bucket_start, watches, completed_watches,
+           watch_percentage_sum, watch_percentage_count
+    FROM fn_watch_rollup_rows(0, @watermark, @from, @to);
+    SET @p_buckets_written = @@ROWCOUNT;
+
+    COMMIT TRANSACTION;
+END;
+GO
+
+
+-- ============================================================================
+-- TREND QUERIES
+-- ============================================================================
+-- Windows end at the newest daily bucket, not today, so a dataset that
+-- stopped growing still shows its last trends.
+
+-- View 1: Platform watches and completion rate per day, with rolling
+-- 7 and 30 day totals
+CREATE OR ALTER VIEW vw_daily_trends AS
+SELECT
+    t.day,
+    t.watches,
+    ROUND(t.completed_watches * 100.0 / NULLIF(t.watches, 0), 2) AS completion_rate,
+    ROUND(t.watch_percentage_sum * 100.0 / NULLIF(t.watch_percentage_count, 0), 2) AS avg_watch_percentage,
+    t.watches_7d,
+    ROUND(t.completed_7d * 100.0 / NULLIF(t.watches_7d, 0), 2) AS completion_rate_7d,
+    t.watches_30d,
+    ROUND(t.completed_30d * 100.0 / NULLIF(t.watches_30d, 0), 2) AS completion_rate_30d
+FROM (
+    SELECT
+        CAST(d.bucket_start AS DATE) AS day,
+        d.watches,
+        d.completed_watches,
+        d.watch_percentage_sum,
+        d.watch_percentage_count,
+        (SELECT SUM(r.watches) FROM watch_rollups r
+         WHERE r.grain = 'day' AND r.dimension = 'all'
+           AND r.bucket_start > DATEADD(DAY, -7, d.bucket_start) AND r.bucket_start <= d.bucket_start) AS watches_7d,
+        (SELECT SUM(r.completed_watches) FROM watch_rollups r
+         WHERE r.grain = 'day' AND r.dimension = 'all'
+           AND r.bucket_start > DATEADD(DAY, -7, d.bucket_start) AND r.bucket_start <= d.bucket_start) AS completed_7d,
+        (SELECT SUM(r.watches) FROM watch_rollups r
+         WHERE r.grain = 'day' AND r.dimension = 'all'
+           AND r.bucket_start > DATEADD(DAY, -30, d.bucket_start) AND r.bucket_start <= d.bucket_start) AS watches_30d,
+        (SELECT SUM(r.completed_watches) FROM watch_rollups r
+         WHERE r.grain = 'day' AND r.dimension = 'all'
+           AND r.bucket_start > DATEADD(DAY, -30, d.bucket_start) AND r.bucket_start <= d.bucket_start) AS completed_30d
+    FROM watch_rollups d
+    WHERE d.grain = 'day' AND d.dimension = 'all'
+) t;
+GO
+
+
+-- Procedure 3: Titles whose watches grew most over the last @p_days days
+-- compared with the @p_days before
+CREATE OR ALTER PROCEDURE sp_get_trending_titles
+    @p_days INT = 7,
+    @p_limit INT = 20
+AS
+BEGIN
+    SET NOCOUNT ON;
+    WITH latest AS (
+        SELECT MAX(bucket_start) AS last_day
+        FROM watch_rollups
+        WHERE grain = 'day' AND dimension = 'all'
+    ),
+    periods AS (
+        SELECT
+            r.member AS title_id,
+            SUM(CASE WHEN r.bucket_start > DATEADD(DAY, -@p_days, l.last_day) THEN r.watches ELSE 0 END) AS recent_watches,
+            SUM(CASE WHEN r.bucket_start <= DATEADD(DAY, -@p_days, l.last_day) THEN r.watches ELSE 0 END) AS previous_watches,
+            SUM(CASE WHEN r.bucket_start > DATEADD(DAY, -@p_days, l.last_day) THEN r.completed_watches ELSE 0 END) AS recent_completed
+        FROM watch_rollups r
+        CROSS JOIN latest l
+        WHERE r.grain = 'day' AND r.dimension = 'title'
+          AND r.bucket_start > DATEADD(DAY, -2 * @p_days, l.last_day)
+        GROUP BY r.member
+    )
+    SELECT TOP (@p_limit)
+        p.title_id,
+        t.title,
+        p.recent_watches,
+        p.previous_watches,
+        p.recent_watches - p.previous_watches AS watch_growth,
+        ROUND((p.recent_watches - p.previous_watches) * 100.0 / NULLIF(p.previous_watches, 0), 2) AS growth_pct,
+        ROUND(p.recent_completed * 100.0 / NULLIF(p.recent_watches, 0), 2) AS completion_rate
+    FROM periods p
+    JOIN titles t ON t.title_id = p.title_id
+    WHERE p.recent_watches > 0
+    ORDER BY p.recent_watches - p.previous_watches DESC, p.recent_watches DESC, p.title_id;
+END;
+GO
+
+
+-- Procedure 4: Genre momentum over the last @p_days days compared with the
+-- @p_days before, with each genre's share of recent watches
+CREATE OR ALTER PROCEDURE sp_get_genre_momentum
+    @p_days INT = 7
+AS
+BEGIN
+    SET NOCOUNT ON;
+    WITH latest AS (
+        SELECT MAX(bucket_start) AS last_day
+        FROM watch_rollups
+        WHERE grain = 'day' AND dimension = 'all'
+    ),
+    periods AS (
+        SELECT
+            r.member AS genre,
+            SUM(CASE WHEN r.bucket_start > DATEADD(DAY, -@p_days, l.last_day) THEN r.watches ELSE 0 END) AS recent_watches,
+            SUM(CASE WHEN r.bucket_start <= DATEADD(DAY, -@p_days, l.last_day) THEN r.watches ELSE 0 END) AS previous_watches,
+            SUM(CASE WHEN r.bucket_start > DATEADD(DAY, -@p_days, l.last_day) THEN r.watch_percentage_sum ELSE 0 END) AS recent_pct_sum,
+            SUM(CASE WHEN r.bucket_start > DATEADD(DAY, -@p_days, l.last_day) THEN r.watch_percentage_count ELSE 0 END) AS recent_pct_count
+        FROM watch_rollups r
+        CROSS JOIN latest l
+        WHERE r.grain = 'day' AND r.dimension = 'genre'
+          AND r.bucket_start > DATEADD(DAY, -2 * @p_days, l.last_day)
+        GROUP BY r.member
+    )
+    SELECT
+        p.genre,
+        p.recent_watches,
+        p.previous_watches,
+        ROUND((p.recent_watches - p.previous_watches) * 100.0 / NULLIF(p.previous_watches, 0), 2) AS momentum_pct,
+        ROUND(p.recent_watches * 100.0 / NULLIF(SUM(p.recent_watches) OVER (), 0), 2) AS share_of_watches,
+        ROUND(p.recent_pct_sum * 100.0 / NULLIF(p.recent_pct_count, 0), 2) AS avg_watch_percentage
+    FROM periods p
+    ORDER BY momentum_pct DESC, p.recent_watches DESC;
+END;
+GO
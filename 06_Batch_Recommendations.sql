@@ -0,0 +1,95 @@
+-- ============================================================================
+-- PRECOMPUTED RECOMMENDATIONS
+-- ============================================================================
+-- Top-N titles per user, written by batch_recommend.py so recommendations
+-- are served with one index seek instead of one sp_get_user_recommendations
+-- execution per user. The ranking is the procedure's: unwatched titles in
+-- the genres the user watched, best imdb_score first.
+--
+-- A run bulk-inserts into user_recommendations_staging and then calls
+-- sp_publish_recommendations, which swaps the new rows in for the users
+-- that were scored, in one transaction. Incremental runs only score the
+-- users with watch events above the 'recommendations' watermark.
+
+USE netflix_analytics_v2;
+GO
+
+-- ============================================================================
+-- TABLES
+-- ============================================================================
+IF OBJECT_ID('maintenance_watermarks', 'U') IS NULL
+CREATE TABLE maintenance_watermarks (
+    name VARCHAR(50) PRIMARY KEY,
+    last_watch_id INT NOT NULL DEFAULT 0,
+    updated_at DATETIME2 DEFAULT SYSDATETIME() NOT NULL
+);
+GO
+
+IF OBJECT_ID('user_recommendations', 'U') IS NULL
+CREATE TABLE user_recommendations (
+    user_id VARCHAR(50) NOT NULL,
+    rank SMALLINT NOT NULL,                     -- 1 = best
+    title_id VARCHAR(50) NOT NULL,
+    avg_rating FLOAT NULL,                      -- titles.imdb_score at scoring time
+    generated_at DATETIME2 DEFAULT SYSDATETIME() NOT NULL,
+    CONSTRAINT pk_user_recommendations PRIMARY KEY (user_id, rank)
+);
+GO
+
+-- Heap without indexes so bulk inserts are minimally logged
+IF OBJECT_ID('user_recommendations_staging', 'U') IS NULL
+CREATE TABLE user_recommendations_staging (
+    user_id VARCHAR(50) NOT NULL,
+    rank SMALLINT NOT NULL,
+    title_id VARCHAR(50) NOT NULL,
+    avg_rating FLOAT NULL
+);
+GO
+
+
+-- ============================================================================
+-- PROCEDURES
+-- ============================================================================
+
+-- Procedure 1: Replace the recommendations of the scored users with the
+-- staged rows and advance the watermark to @p_high_watch_id.
+-- @p_low_watch_id NULL means a full run: every user was scored, so all old
+-- rows go. Otherwise only users with events in (@p_low_watch_id,
+-- @p_high_watch_id] are replaced, including those left without candidates.
+CREATE OR ALTER PROCEDURE sp_publish_recommendations
+    @p_low_watch_id INT = NULL,
+    @p_high_watch_id INT,
+    @p_rows_published INT = NULL OUTPUT
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    BEGIN TRANSACTION;
+
+    IF @p_low_watch_id IS NULL
+        DELETE FROM user_recommendations;
+    ELSE
+        DELETE FROM user_recommendations
+        WHERE user_id IN (
+            SELECT wh.user_id
+            FROM watch_history wh
+            WHERE wh.watch_id > @p_low_watch_id AND wh.watch_id <= @p_high_watch_id
+        );
+
+    INSERT INTO user_recommendations (user_id, rank, title_id, avg_rating)
+    SELECT user_id, rank, title_id, avg_rating
+    FROM user_recommendations_staging;
+    SET @p_rows_published = @@ROWCOUNT;
+
+    TRUNCATE TABLE user_recommendations_staging;
+
+    UPDATE maintenance_watermarks
+    SET last_watch_id = @p_high_watch_id, updated_at = SYSDATETIME()
+    WHERE name = 'recommendations';
+    IF @@ROWCOUNT = 0
+        INSERT INTO maintenance_watermarks (name, last_watch_id) VALUES ('recommendations', @p_high_watch_id);
+
+    COMMIT TRANSACTION;
+END;
+GO
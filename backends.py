@@ -0,0 +1,566 @@
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from columnar import arrow_odbc_available, frame_from_arrow, frame_from_cursor, frame_from_rows, read_arrow_odbc
+from schema import IDENTITY_COLUMNS, TABLE_COLUMNS
+
+# ------------------------------
+# Query backends
+# ------------------------------
+# run_query and the in-memory engines talk to a backend instead of a pyodbc
+# pool directly:
+#   read(sql, params, timings=None) -> DataFrame; fills timings with the
+#                      execute / fetch / build seconds when given a dict
+#   run(fn)            -> fn(conn) with a DB-API style connection (writes)
+#   metrics(), close()
+#
+# "sqlserver" is the existing pooled pyodbc path; NETFLIX_FETCH picks how
+# results are turned into DataFrames (columnar | arrow | rows, see
+# columnar.py). "duckdb" is an embedded
+# columnar replica: the tables are loaded from Parquet/CSV, the views and
+# read-only procedures are translated from 03_Queries_And_Procedures.sql,
+# and the watch_history triggers are emulated on insert. The backend is
+# chosen with NETFLIX_BACKEND (sqlserver | duckdb); the DuckDB data
+# directory comes from NETFLIX_DATA_DIR.
+
+SQL_DIR = os.path.dirname(os.path.abspath(__file__))
+PROCEDURES_FILE = os.path.join(SQL_DIR, '03_Queries_And_Procedures.sql')
+TRENDS_FILE = os.path.join(SQL_DIR, '05_Trend_Rollups.sql')
+
+# Read-only procedures the embedded engine can run
+EMBEDDED_PROCEDURES = ['sp_get_user_recommendations', 'sp_get_genre_trends',
+                       'sp_get_trending_titles', 'sp_get_genre_momentum']
+
+
+FETCH_MODES = ('columnar', 'arrow', 'rows')
+
+
+class SqlServerBackend:
+    name = 'sqlserver'
+
+    def __init__(self, pool, fetch=None):
+        self.pool = pool
+        self.fetch = (fetch or os.environ.get('NETFLIX_FETCH', 'columnar')).lower()
+        if self.fetch not in FETCH_MODES:
+            raise ValueError(f"Unknown fetch mode: {self.fetch}")
+        if self.fetch == 'arrow' and not (arrow_odbc_available() and getattr(pool, 'connection_string', None)):
+            print("arrow-odbc is not available; using columnar fetch")
+            self.fetch = 'columnar'
+
+    def read(self, sql, params=None, timings=None):
+        if self.fetch == 'arrow':
+            # arrow-odbc opens its own connection per query
+            return read_arrow_odbc(self.pool.connection_string, sql, params, timings)
+        reader = frame_from_cursor if self.fetch == 'columnar' else frame_from_rows
+        return self.pool.run(lambda conn: reader(conn.cursor(), sql, params, timings))
+
+    def run(self, fn, retries=1):
+        return self.pool.run(fn, retries=retries)
+
+    @contextmanager
+    def connection(self):
+        with self.pool.connection() as conn:
+            yield conn
+
+    def metrics(self):
+        return dict(backend=self.name, fetch=self.fetch, **self.pool.metrics())
+
+    def close(self):
+        self.pool.close()
+
+
+# ------------------------------
+# T-SQL -> DuckDB translation
+# ------------------------------
+_TYPE_NAMES = {
+    'str': 'VARCHAR', 'int': 'BIGINT', 'float': 'DOUBLE', 'decimal': 'DECIMAL(10, 2)',
+    'date': 'DATE', 'datetime': 'TIMESTAMP',
+}
+
+_DATEPARTS = {'DAY': 'day', 'DD': 'day', 'MONTH': 'month', 'MM': 'month', 'YEAR': 'year',
+              'YY': 'year', 'WEEK': 'week', 'HOUR': 'hour', 'MINUTE': 'minute', 'SECOND': 'second'}
+
+_REWRITES = [
+    (re.compile(r"\bdbo\.", re.IGNORECASE), ''),
+    (re.compile(r"\b(?:GETDATE|SYSDATETIME)\s*\(\s*\)", re.IGNORECASE), 'CAST(now() AS TIMESTAMP)'),
+    (re.compile(r"\bISNULL\s*\(", re.IGNORECASE), 'COALESCE('),
+    (re.compile(r"\bAS\s+FLOAT\b", re.IGNORECASE), 'AS DOUBLE'),
+    (re.compile(r"\bAS\s+N?VARCHAR\s*\(\s*MAX\s*\)", re.IGNORECASE), 'AS VARCHAR'),
+    (re.compile(r"\bLEN\s*\(", re.IGNORECASE), 'length('),
+    # SQL Server's default collation compares case-insensitively
+    (re.compile(r"\bLIKE\b", re.IGNORECASE), 'ILIKE'),
+    (re.compile(r"\bDATEDIFF\s*\(\s*(\w+)\s*,", re.IGNORECASE),
+     lambda m: f"date_diff('{_DATEPARTS.get(m.group(1).upper(), m.group(1).lower())}',"),
+    (re.compile(r"\bDATEADD\s*\(\s*(\w+)\s*,", re.IGNORECASE),
+     lambda m: f"tsql_dateadd('{_DATEPARTS.get(m.group(1).upper(), m.group(1).lower())}',"),
+]
+
+_TOP_RE = re.compile(r"(\bSELECT\s+(?:DISTINCT\s+)?)TOP\s*(\(\s*[^)]*\)|\d+)\s*", re.IGNORECASE)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+
+
+def _depth_at(sql, position):
+    # Parenthesis depth at `position`, ignoring string literals
+    masked = _STRING_RE.sub(lambda m: ' ' * len(m.group(0)), sql[:position])
+    return masked.count('(') - masked.count(')')
+
+
+def translate(sql, params=None):
+    # Rewrite one T-SQL statement into DuckDB SQL; returns (sql, params)
+    params = list(params or [])
+    for pattern, replacement in _REWRITES:
+        sql = pattern.sub(replacement, sql)
+
+    # Outer SELECT TOP n -> LIMIT n
+    for match in _TOP_RE.finditer(sql):
+        if _depth_at(sql, match.start()) != 0:
+            continue
+        limit = match.group(2).strip()
+        if limit.startswith('('):
+            limit = limit[1:-1].strip()
+        if limit == '?':
+            position = sql[:match.start()].count('?')
+            params.append(params.pop(position))
+        sql = sql[:match.start()] + match.group(1) + sql[match.end():]
+        sql = sql.rstrip().rstrip(';').rstrip() + f' LIMIT {limit}'
+        break
+    return sql, params
+
+
+def _split_arguments(text):
+    # "@a = ?, @b = 'x,y', 5" -> ['@a = ?', "@b = 'x,y'", '5']
+    parts, current, quoted = [], '', False
+    for ch in text:
+        if ch == "'":
+            quoted = not quoted
+        if ch == ',' and not quoted:
+            parts.append(current.strip())
+            current = ''
+        else:
+            current += ch
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def parse_exec(sql, params=None):
+    # "EXEC sp_x @p_a = ?, @p_b = 5" -> ('sp_x', {'p_a': ..., 'p_b': 5}) or None
+    match = re.match(r"\s*EXEC(?:UTE)?\s+(?:dbo\.)?(\w+)\s*(.*?)\s*;?\s*$", sql, re.IGNORECASE | re.DOTALL)
+    if not match:
+        return None
+    name, rest = match.group(1).lower(), match.group(2)
+    params = list(params or [])
+    arguments = {}
+    for position, part in enumerate(_split_arguments(rest)):
+        key, _, value = part.partition('=')
+        if not _:
+            key, value = f'#{position}', key
+        key, value = key.strip().lstrip('@'), value.strip()
+        if value == '?':
+            arguments[key] = params.pop(0)
+        elif value.startswith("'"):
+            arguments[key] = value[1:-1].replace("''", "'")
+        elif re.fullmatch(r"-?\d+", value):
+            arguments[key] = int(value)
+        elif re.fullmatch(r"-?\d*\.\d+", value):
+            arguments[key] = float(value)
+        elif value.upper() == 'NULL':
+            arguments[key] = None
+        else:
+            arguments[key] = value
+    return name, arguments
+
+
+def extract_views(text):
+    # {name: select body} for every CREATE OR ALTER VIEW; later definitions win
+    views = {}
+    for match in re.finditer(r"CREATE\s+OR\s+ALTER\s+VIEW\s+(\w+)\s+AS\s+(.*?);", text, re.IGNORECASE | re.DOTALL):
+        views[match.group(1).lower()] = match.group(2).strip()
+    return views
+
+
+def extract_procedures(text, names):
+    # {name: (parameter names, translated body with $named parameters)}
+    procedures = {}
+    pattern = re.compile(
+        r"CREATE\s+OR\s+ALTER\s+PROCEDURE\s+(\w+)(.*?)\bAS\s+BEGIN\s+SET\s+NOCOUNT\s+ON;\s*(.*?);\s*END;",
+        re.IGNORECASE | re.DOTALL)
+    for match in pattern.finditer(text):
+        name = match.group(1).lower()
+        if name not in names:
+            continue
+        parameters = [p.lower() for p in re.findall(r"@(\w+)\s+\w+", match.group(2))]
+        body, _ = translate(match.group(3))
+        body = re.sub(r"@(\w+)", lambda m: '$' + m.group(1).lower(), body)
+        procedures[name] = (parameters, body)
+    return procedures
+
+
+# Views whose T-SQL definition does not translate
+VIEW_OVERRIDES = {
+    # OUTER APPLY (SELECT TOP 1 ...) for the most recently started
+    # subscription; arg_max picks the same row
+    'vw_user_activity_summary': """
+        SELECT
+            u.user_id,
+            u.name,
+            u.country,
+            cs.subscription_type,
+            u.watch_time_hours,
+            COUNT(DISTINCT wh.title_id) AS titles_watched,
+            COUNT(wh.watch_id) AS total_watches,
+            SUM(CAST(wh.completed AS INT)) AS completed_watches,
+            ROUND(AVG(CAST(wh.watch_percentage AS DOUBLE)) * 100, 2) AS avg_watch_percentage
+        FROM users u
+        LEFT JOIN (
+            SELECT user_id, arg_max(subscription_type, subscription_start_date) AS subscription_type
+            FROM subscriptions
+            GROUP BY user_id
+        ) cs ON u.user_id = cs.user_id
+        LEFT JOIN watch_history wh ON u.user_id = wh.user_id
+        GROUP BY u.user_id, u.name, u.country, cs.subscription_type, u.watch_time_hours""",
+}
+
+FUNCTION_MACROS = [
+    """CREATE OR REPLACE MACRO fn_calculate_user_ltv(p_user_id) AS (
+        SELECT CAST(COALESCE(SUM(s.monthly_fee * date_diff('day', s.subscription_start_date,
+               COALESCE(s.subscription_end_date, CAST(now() AS DATE))) / 30.0), 0.00) AS DECIMAL(10, 2))
+        FROM subscriptions s
+        WHERE s.user_id = p_user_id)""",
+    """CREATE OR REPLACE MACRO fn_subscription_duration(p_user_id) AS (
+        SELECT CAST(COALESCE(SUM(date_diff('day', s.subscription_start_date,
+               COALESCE(s.subscription_end_date, CAST(now() AS DATE)))), 0) AS INTEGER)
+        FROM subscriptions s
+        WHERE s.user_id = p_user_id)""",
+    """CREATE OR REPLACE MACRO fn_user_ltv(p_user_id) AS TABLE
+        SELECT fn_calculate_user_ltv(p_user_id) AS lifetime_value,
+               fn_subscription_duration(p_user_id) AS subscription_days""",
+    # DATEADD(part, n, d); the translated part is a string literal
+    """CREATE OR REPLACE MACRO tsql_dateadd(part, n, d) AS
+        CAST(d AS TIMESTAMP) + CASE part
+            WHEN 'year' THEN to_years(CAST(n AS INTEGER))
+            WHEN 'month' THEN to_months(CAST(n AS INTEGER))
+            WHEN 'week' THEN to_days(CAST(n AS INTEGER) * 7)
+            WHEN 'day' THEN to_days(CAST(n AS INTEGER))
+            WHEN 'hour' THEN to_hours(CAST(n AS BIGINT))
+            WHEN 'minute' THEN to_minutes(CAST(n AS BIGINT))
+            ELSE to_seconds(CAST(n AS DOUBLE)) END""",
+]
+
+# Tables of 05_Trend_Rollups.sql and 06_Batch_Recommendations.sql, created
+# empty after every load
+EMBEDDED_TABLES = [
+    """CREATE OR REPLACE TABLE maintenance_watermarks (
+        name VARCHAR PRIMARY KEY,
+        last_watch_id BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CAST(now() AS TIMESTAMP))""",
+    """CREATE OR REPLACE TABLE watch_rollups (
+        grain VARCHAR NOT NULL,
+        dimension VARCHAR NOT NULL,
+        member VARCHAR NOT NULL,
+        bucket_start TIMESTAMP NOT NULL,
+        watches BIGINT NOT NULL,
+        completed_watches BIGINT NOT NULL,
+        watch_percentage_sum DECIMAL(18, 2) NOT NULL,
+        watch_percentage_count BIGINT NOT NULL,
+        PRIMARY KEY (grain, dimension, member, bucket_start))""",
+    """CREATE OR REPLACE TABLE user_recommendations (
+        user_id VARCHAR NOT NULL,
+        rank SMALLINT NOT NULL,
+        title_id VARCHAR NOT NULL,
+        avg_rating DOUBLE,
+        generated_at TIMESTAMP DEFAULT CAST(now() AS TIMESTAMP),
+        PRIMARY KEY (user_id, rank))""",
+    """CREATE OR REPLACE TABLE user_recommendations_staging (
+        user_id VARCHAR NOT NULL,
+        rank SMALLINT NOT NULL,
+        title_id VARCHAR NOT NULL,
+        avg_rating DOUBLE)""",
+]
+
+# Set-based equivalents of the two watch_history AFTER INSERT triggers,
+# applied to the rows above the pre-insert max watch_id
+EMULATED_TRIGGERS = [
+    """UPDATE watch_history
+       SET completed = CASE WHEN watch_percentage >= 0.9 THEN 1 ELSE 0 END
+       WHERE watch_id > ?""",
+    """UPDATE users
+       SET watch_time_hours = users.watch_time_hours + d.hours, updated_at = CAST(now() AS TIMESTAMP)
+       FROM (
+           SELECT wh.user_id, SUM((t.runtime * wh.watch_percentage) / 60) AS hours
+           FROM watch_history wh
+           JOIN titles t ON wh.title_id = t.title_id
+           WHERE wh.watch_id > ? AND t.runtime IS NOT NULL
+           GROUP BY wh.user_id
+       ) d
+       WHERE users.user_id = d.user_id""",
+]
+
+
+# INSERT INTO t (a, b) VALUES (?, ?) -- the shape fast_executemany can bind as a whole
+_INSERT_VALUES_RE = re.compile(
+    r"\s*INSERT\s+INTO\s+\[?(\w+)\]?\s*\(([^)]*)\)\s*VALUES\s*\(\s*\?(?:\s*,\s*\?)*\s*\)\s*;?\s*$",
+    re.IGNORECASE)
+
+
+class DuckDBCursor:
+    # Minimal pyodbc-style cursor over a DuckDB connection
+    def __init__(self, owner):
+        self._owner = owner
+        self._result = None
+        self.fast_executemany = False
+        self.description = None
+
+    def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        self._result = self._owner._execute(sql, list(params))
+        self.description = self._result.description if self._result is not None else None
+        return self
+
+    def executemany(self, sql, rows):
+        # Like pyodbc, fast_executemany binds every row in one round trip;
+        # DuckDB's own executemany runs one statement per row
+        if self.fast_executemany and _INSERT_VALUES_RE.match(sql):
+            self._result = self._owner._insert_rows(sql, rows)
+            return
+        for row in rows:
+            self.execute(sql, list(row))
+
+    def fetchone(self):
+        return self._result.fetchone()
+
+    def fetchall(self):
+        return self._result.fetchall()
+
+    def close(self):
+        self._result = None
+
+
+class DuckDBConnection:
+    # One transaction at a time over a DuckDB cursor, started on first use
+    def __init__(self, backend):
+        self._backend = backend
+        self._con = backend._con.cursor()
+        self._in_transaction = False
+        self.autocommit = False
+
+    def cursor(self):
+        return DuckDBCursor(self)
+
+    def _execute(self, sql, params):
+        procedure = parse_exec(sql, params)
+        if procedure is not None:
+            return self._backend._call(self._con, *procedure)
+        sql, params = translate(sql, params)
+        return self._write(sql, lambda: self._con.execute(sql, params))
+
+    def _insert_rows(self, sql, rows):
+        # All rows as one object-typed relation; NaN and None become NULL
+        match = _INSERT_VALUES_RE.match(sql)
+        table, columns = match.group(1), [c.strip().strip('[]') for c in match.group(2).split(',')]
+        frame = pd.DataFrame(list(rows), columns=columns, dtype=object)
+
+        def insert():
+            self._con.register('_rows', frame)
+            try:
+                return self._con.execute(f"INSERT INTO {table} ({', '.join(columns)}) SELECT * FROM _rows")
+            finally:
+                self._con.unregister('_rows')
+        return self._write(sql, insert)
+
+    def _write(self, sql, execute):
+        if not self.autocommit and not self._in_transaction:
+            self._con.execute("BEGIN TRANSACTION")
+            self._in_transaction = True
+        inserts_watch = re.match(r"\s*INSERT\s+INTO\s+\[?watch_history\b", sql, re.IGNORECASE)
+        if inserts_watch:
+            before = self._con.execute("SELECT COALESCE(MAX(watch_id), 0) FROM watch_history").fetchone()[0]
+        result = execute()
+        if inserts_watch and self._backend.emulate_triggers:
+            for statement in EMULATED_TRIGGERS:
+                self._con.execute(statement, [before])
+        return result
+
+    def commit(self):
+        if self._in_transaction:
+            self._con.execute("COMMIT")
+            self._in_transaction = False
+
+    def rollback(self):
+        if self._in_transaction:
+            self._con.execute("ROLLBACK")
+            self._in_transaction = False
+
+    def close(self):
+        self.rollback()
+        self._con.close()
+
+
+class DuckDBBackend:
+    name = 'duckdb'
+
+    def __init__(self, data_dir=None, database=':memory:', threads=None, emulate_triggers=True,
+                 procedures_file=PROCEDURES_FILE, trends_file=TRENDS_FILE, compact=True):
+        import duckdb
+
+        self._con = duckdb.connect(database)
+        if threads:
+            self._con.execute(f"SET threads = {int(threads)}")
+        # SQL Server sorts NULLs first ascending and last descending
+        self._con.execute("SET default_null_order = 'nulls_first_on_asc_last_on_desc'")
+        self.emulate_triggers = emulate_triggers
+        self.compact = compact
+        self.procedures_file = procedures_file
+        self.trends_file = trends_file
+        self.procedures = {}
+        self.queries = 0
+        self._write_lock = threading.Lock()
+        if data_dir is not None:
+            self.load(data_dir)
+
+    # -- loading --------------------------------------------------------
+    def _create_tables(self):
+        for table, columns in TABLE_COLUMNS.items():
+            definition = ', '.join(f'{column} {_TYPE_NAMES[kind]}' for column, kind in columns.items())
+            self._con.execute(f"CREATE OR REPLACE TABLE {table} ({definition})")
+
+    def _finish_load(self):
+        # IDENTITY columns continue after the loaded ids
+        for table, column in IDENTITY_COLUMNS.items():
+            start = self._con.execute(f"SELECT COALESCE(MAX({column}), 0) + 1 FROM {table}").fetchone()[0]
+            self._con.execute(f"CREATE OR REPLACE SEQUENCE seq_{table} START WITH {start}")
+            self._con.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET DEFAULT nextval('seq_{table}')")
+        for column in ('created_at', 'updated_at'):
+            for table, columns in TABLE_COLUMNS.items():
+                if column in columns:
+                    self._con.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET DEFAULT CAST(now() AS TIMESTAMP)")
+        self._con.execute("ALTER TABLE watch_history ALTER COLUMN completed SET DEFAULT 0")
+        self._con.execute("ALTER TABLE users ALTER COLUMN watch_time_hours SET DEFAULT 0.00")
+        self._create_objects()
+
+    def load(self, data_dir):
+        # <table>.parquet is preferred over <table>.csv; missing tables stay empty
+        self._create_tables()
+        for table in TABLE_COLUMNS:
+            parquet = os.path.join(data_dir, f'{table}.parquet')
+            csv = os.path.join(data_dir, f'{table}.csv')
+            if os.path.exists(parquet):
+                source = f"read_parquet('{parquet.replace(chr(39), chr(39) * 2)}')"
+            elif os.path.exists(csv):
+                source = f"read_csv('{csv.replace(chr(39), chr(39) * 2)}', header = true)"
+            else:
+                continue
+            self._con.execute(f"INSERT INTO {table} BY NAME SELECT * FROM {source}")
+        self._finish_load()
+        return self
+
+    def load_frames(self, frames):
+        # Same as load() from in-memory DataFrames, e.g. datagen output
+        self._create_tables()
+        for table, frame in frames.items():
+            self._con.register('_frame', frame)
+            self._con.execute(f"INSERT INTO {table} BY NAME SELECT * FROM _frame")
+            self._con.unregister('_frame')
+        self._finish_load()
+        return self
+
+    def _create_objects(self):
+        text = ''
+        for path in (self.procedures_file, self.trends_file):
+            if path and os.path.exists(path):
+                with open(path, encoding='utf-8') as f:
+                    text += f.read() + '\n'
+        for statement in FUNCTION_MACROS + EMBEDDED_TABLES:
+            self._con.execute(statement)
+        views = extract_views(text)
+        views.update(VIEW_OVERRIDES)
+        for name, body in views.items():
+            self._con.execute(f"CREATE OR REPLACE VIEW {name} AS {translate(body)[0]}")
+        self.procedures = extract_procedures(text, EMBEDDED_PROCEDURES)
+
+    # -- queries --------------------------------------------------------
+    def _call(self, con, name, arguments):
+        if name not in self.procedures:
+            raise NotImplementedError(f"Procedure {name} is not available in the embedded backend")
+        parameters, body = self.procedures[name]
+        positional = [arguments.pop(f'#{i}') for i in range(len(arguments)) if f'#{i}' in arguments]
+        values = dict(zip(parameters, positional))
+        values.update({key.lower(): value for key, value in arguments.items()})
+        used = set(re.findall(r"\$(\w+)", body))
+        return con.execute(body, {key: values.get(key) for key in used})
+
+    def read(self, sql, params=None, timings=None):
+        # With compact=True the result is fetched as Arrow and compacted
+        # like the SQL Server columnar path; otherwise df() converts it in
+        # one step and fetch is 0
+        con = self._con.cursor()
+        try:
+            self.queries += 1
+            started = time.perf_counter()
+            procedure = parse_exec(sql, params)
+            if procedure is not None:
+                result = self._call(con, *procedure)
+            else:
+                sql, params = translate(sql, params)
+                result = con.execute(sql, params)
+            executed = time.perf_counter()
+            if self.compact:
+                # to_arrow_table() replaced fetch_arrow_table() in newer releases
+                fetch = getattr(result, 'to_arrow_table', None) or result.fetch_arrow_table
+                table = fetch()
+                fetched = time.perf_counter()
+                frame = frame_from_arrow(table)
+            else:
+                fetched = executed
+                frame = result.df()
+            if timings is not None:
+                timings.update(execute=executed - started, fetch=fetched - executed,
+                               build=time.perf_counter() - fetched)
+            return frame
+        finally:
+            con.close()
+
+    def run(self, fn, retries=1):
+        # Writers are serialized; DuckDB would abort conflicting updates
+        with self._write_lock:
+            conn = DuckDBConnection(self)
+            try:
+                return fn(conn)
+            finally:
+                conn.close()
+
+    @contextmanager
+    def connection(self):
+        with self._write_lock:
+            conn = DuckDBConnection(self)
+            try:
+                yield conn
+            finally:
+                conn.close()
+
+    def metrics(self):
+        return {'backend': self.name, 'compact': self.compact, 'queries': self.queries}
+
+    def close(self):
+        self._con.close()
+
+
+def create_backend(kind=None, data_dir=None, pool=None):
+    kind = (kind or os.environ.get('NETFLIX_BACKEND', 'sqlserver')).lower()
+    if kind == 'duckdb':
+        return DuckDBBackend(
+            data_dir or os.environ.get('NETFLIX_DATA_DIR'),
+            database=os.environ.get('NETFLIX_DUCKDB_PATH', ':memory:'),
+        )
+    if kind == 'sqlserver':
+        if pool is None:
+            from db_pool import ConnectionPool, resolve_connect
+            pool = ConnectionPool(resolve_connect())
+        return SqlServerBackend(pool)
+    raise ValueError(f"Unknown backend: {kind}")
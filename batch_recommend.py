@@ -0,0 +1,351 @@
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from bulk_load import chunk_rows
+from recommender import GenreRecommender
+from snapshot import Encoder, to_float
+
+# ------------------------------
+# Offline top-N recommendations for every user
+# ------------------------------
+# Scores every user with GenreRecommender's ranking (the order of
+# sp_get_user_recommendations, or affinity x rating with --weighted) and
+# writes the top N per user to user_recommendations (06_Batch_Recommendations.sql).
+# The parent reads titles, genres and watch events once and saves them as
+# .npy files that every worker process memory-maps read-only, so the
+# pages are shared instead of copied. Users are split into partitions by
+# a hash of user_id; each worker scores one partition at a time while the
+# parent bulk-inserts finished partitions into the staging table, and
+# sp_publish_recommendations swaps them in at the end. Later runs only
+# rescore the users with watch events above the 'recommendations'
+# watermark; use --full after the title catalogue changes.
+#
+#   python batch_recommend.py --workers 8 --limit 10
+#   python batch_recommend.py --full --weighted
+
+WATERMARK = 'recommendations'
+
+STAGING_INSERT = """
+    INSERT INTO user_recommendations_staging (user_id, rank, title_id, avg_rating)
+    VALUES (?, ?, ?, ?)"""
+
+PUBLISH_SQL = """
+    SET NOCOUNT ON;
+    DECLARE @rows INT;
+    EXEC sp_publish_recommendations @p_low_watch_id = ?, @p_high_watch_id = ?, @p_rows_published = @rows OUTPUT;
+    SELECT @rows;"""
+
+# sp_publish_recommendations for DuckDB
+DUCKDB_PUBLISH = [
+    "INSERT INTO user_recommendations (user_id, rank, title_id, avg_rating) "
+    "SELECT user_id, rank, title_id, avg_rating FROM user_recommendations_staging",
+    "DELETE FROM user_recommendations_staging",
+]
+
+EVENTS_SQL = """
+    SELECT TOP (?) watch_id, user_id, title_id, watch_percentage
+    FROM watch_history
+    WHERE watch_id > ? AND watch_id <= ?{users}
+    ORDER BY watch_id"""
+
+# Users with events in the incremental range
+CHANGED_USERS = " AND user_id IN (SELECT user_id FROM watch_history WHERE watch_id > ? AND watch_id <= ?)"
+
+
+def read_watermark(backend):
+    frame = backend.read("SELECT MAX(last_watch_id) AS last_watch_id FROM maintenance_watermarks WHERE name = ?",
+                         [WATERMARK])
+    value = frame['last_watch_id'].iloc[0] if len(frame) else None
+    return None if value is None or pd.isna(value) else int(value)
+
+
+def load_inputs(backend, low, high, chunk_size=1_000_000):
+    # Titles and genres as in the snapshot, plus every event up to `high` of
+    # the users to score (all users when low is None)
+    titles = backend.read("SELECT title_id, imdb_score FROM titles")
+    genres = backend.read("SELECT genre_id FROM genres")
+    title_genres = backend.read("SELECT title_id, genre_id FROM title_genres")
+    title_codes, genre_codes, users = Encoder(), Encoder(), Encoder()
+    title_codes.encode(titles['title_id'].to_numpy())
+    genre_codes.encode(genres['genre_id'].to_numpy())
+
+    tg_titles = title_codes.lookup(title_genres['title_id'].to_numpy())
+    tg_genres = genre_codes.lookup(title_genres['genre_id'].to_numpy())
+    keep = (tg_titles >= 0) & (tg_genres >= 0)
+    tg_titles, tg_genres = tg_titles[keep], tg_genres[keep]
+    order = np.lexsort((tg_genres, tg_titles))
+    tg_indptr = np.zeros(len(title_codes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tg_titles, minlength=len(title_codes)), out=tg_indptr[1:])
+
+    sql = EVENTS_SQL.format(users=CHANGED_USERS if low is not None else '')
+    event_users, event_titles, event_pct = [], [], []
+    after = 0
+    while True:
+        params = [chunk_size, after, high] + ([low, high] if low is not None else [])
+        df = backend.read(sql, params)
+        if df.empty:
+            break
+        after = int(df['watch_id'].iloc[-1])
+        codes = title_codes.lookup(df['title_id'].to_numpy())
+        keep = codes >= 0
+        event_users.append(users.encode(df['user_id'].to_numpy()[keep]))
+        event_titles.append(codes[keep])
+        event_pct.append(np.nan_to_num(to_float(df['watch_percentage'])[keep]).astype(np.float32))
+        if len(df) < chunk_size:
+            break
+
+    def joined(parts, dtype):
+        return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+    # Events grouped by user (CSR over user codes)
+    event_users = joined(event_users, np.int32)
+    order_events = np.argsort(event_users, kind='stable')
+    events_indptr = np.zeros(len(users) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(event_users, minlength=len(users)), out=events_indptr[1:])
+    arrays = {
+        'title_score': to_float(titles['imdb_score']),
+        'tg_indptr': tg_indptr,
+        'tg_genres': tg_genres[order].astype(np.int32),
+        'events_indptr': events_indptr,
+        'events_title': joined(event_titles, np.int32)[order_events],
+        'events_pct': joined(event_pct, np.float32)[order_events],
+    }
+    return np.asarray(users.values, dtype=object), np.asarray(title_codes.values, dtype=object), \
+        len(genre_codes), arrays
+
+
+def save_arrays(directory, arrays):
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(array))
+
+
+def open_arrays(directory, names):
+    # Read-only memory maps; every process shares the same page cache
+    return {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in names}
+
+
+def partition_users(user_ids, n_partitions):
+    # Stable hash of user_id, so a user lands in the same partition every run
+    buckets = pd.util.hash_array(user_ids) % np.uint64(n_partitions)
+    order = np.argsort(buckets, kind='stable')
+    bounds = np.searchsorted(buckets[order], np.arange(1, n_partitions, dtype=np.uint64))
+    return [part for part in np.split(order, bounds) if part.size]
+
+
+class PartitionScorer(GenreRecommender):
+    # GenreRecommender over one partition of users at a time. Genre vectors
+    # and watched titles come from the partition's user x title matrix
+    # instead of per-user accumulators, so nothing per user is kept between
+    # partitions.
+    def __init__(self, arrays, n_genres):
+        n_titles = len(arrays['title_score'])
+        super().__init__(np.arange(n_titles), np.empty(n_titles, dtype=object), np.zeros(n_titles),
+                         np.asarray(arrays['title_score']), np.arange(n_genres),
+                         np.asarray(arrays['tg_indptr']), np.asarray(arrays['tg_genres']), n_users=0)
+        self.arrays = arrays
+
+    def load_partition(self, users, weighted):
+        indptr = self.arrays['events_indptr']
+        starts, stops = indptr[users], indptr[users + 1]
+        counts = stops - starts
+        index = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        rows = np.repeat(np.arange(len(users)), counts)
+        cols = self.position[self.arrays['events_title'][index]]
+        shape = (len(users), len(self.title_ids))
+        watched = sparse.csr_matrix((np.ones(len(index), dtype=np.float32), (rows, cols)), shape=shape)
+        watched.sum_duplicates()
+        if weighted:
+            weights = sparse.csr_matrix((self.arrays['events_pct'][index], (rows, cols)), shape=shape)
+        else:
+            weights = watched
+        self._watched = watched
+        self._vectors = np.asarray((weights @ self.title_genres).toarray(), dtype=np.float32)
+
+    def _user_vector(self, user, weighted):
+        return self._vectors[user]
+
+    def _watched_positions(self, user):
+        start, stop = self._watched.indptr[user], self._watched.indptr[user + 1]
+        return self._watched.indices[start:stop].astype(np.int64)
+
+    def score(self, users, limit, weighted, block_users=256):
+        # (top-N title codes per user concatenated, count per user)
+        self.load_partition(users, weighted)
+        positions = []
+        for start in range(0, len(users), block_users):
+            positions.extend(self._scan(range(start, min(start + block_users, len(users))), limit, weighted))
+        counts = np.array([len(p) for p in positions], dtype=np.int64)
+        rows = np.concatenate(positions) if positions else np.empty(0, dtype=np.int64)
+        return self.order[rows], counts
+
+
+# Worker process state, set once by _init_worker
+_SCORER = None
+
+
+def _init_worker(directory, names, n_genres):
+    global _SCORER
+    _SCORER = PartitionScorer(open_arrays(directory, names), n_genres)
+
+
+def _score_partition(task):
+    users, limit, weighted = task
+    titles, counts = _SCORER.score(users, limit, weighted)
+    return users, titles, counts
+
+
+def partition_frame(user_ids, title_ids, title_score, users, titles, counts):
+    # Staging rows for one scored partition; rank 1 is the best title
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    rating = title_score[titles]
+    return pd.DataFrame({
+        'user_id': np.repeat(user_ids[users], counts),
+        'rank': np.arange(len(titles)) - starts + 1,
+        'title_id': title_ids[titles],
+        'avg_rating': np.where(np.isnan(rating), None, rating),
+    })
+
+
+def write_staging(backend, frame, chunk_size=50_000):
+    def work(conn):
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        for start in range(0, len(frame), chunk_size):
+            cursor.executemany(STAGING_INSERT, chunk_rows(frame.iloc[start:start + chunk_size]))
+        conn.commit()
+    if len(frame):
+        backend.run(work)
+
+
+def clear_staging(backend):
+    def work(conn):
+        conn.cursor().execute("DELETE FROM user_recommendations_staging")
+        conn.commit()
+    backend.run(work)
+
+
+def publish(backend, low, high):
+    def work(conn):
+        cursor = conn.cursor()
+        if backend.name != 'duckdb':
+            row = cursor.execute(PUBLISH_SQL, low, high).fetchone()
+            conn.commit()
+            return row[0]
+        if low is None:
+            cursor.execute("DELETE FROM user_recommendations")
+        else:
+            cursor.execute("DELETE FROM user_recommendations WHERE user_id IN "
+                           "(SELECT user_id FROM watch_history WHERE watch_id > ? AND watch_id <= ?)", low, high)
+        rows = cursor.execute("SELECT COUNT(*) FROM user_recommendations_staging").fetchone()[0]
+        for statement in DUCKDB_PUBLISH:
+            cursor.execute(statement)
+        if cursor.execute("SELECT 1 FROM maintenance_watermarks WHERE name = ?", WATERMARK).fetchone():
+            cursor.execute("UPDATE maintenance_watermarks SET last_watch_id = ?, updated_at = CAST(now() AS TIMESTAMP) "
+                           "WHERE name = ?", high, WATERMARK)
+        else:
+            cursor.execute("INSERT INTO maintenance_watermarks (name, last_watch_id) VALUES (?, ?)", WATERMARK, high)
+        conn.commit()
+        return rows
+    return backend.run(work)
+
+
+def run_batch(backend, limit=10, workers=None, full=False, weighted=False, partition_size=20_000,
+              report_every=10.0):
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    high = int(backend.read("SELECT COALESCE(MAX(watch_id), 0) AS high FROM watch_history")['high'].iloc[0])
+    low = None if full else read_watermark(backend)
+    if low is not None and low >= high:
+        return {'mode': 'incremental', 'users': 0, 'rows': 0, 'watermark': high,
+                'seconds': round(time.perf_counter() - started, 3), 'users_per_sec': 0.0}
+
+    user_ids, title_ids, n_genres, arrays = load_inputs(backend, low, high)
+    title_score = arrays['title_score']
+    loaded = time.perf_counter()
+    n_users = len(user_ids)
+    partitions = partition_users(user_ids, max(workers * 4, -(-n_users // partition_size), 1))
+    tasks = [(users, limit, weighted) for users in partitions]
+    workers = min(workers, len(tasks))
+    clear_staging(backend)
+
+    scored = rows = 0
+    write_seconds = 0.0
+    last_report = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix='batch_recommend_') as directory:
+        save_arrays(directory, arrays)
+        del arrays
+        names = ['title_score', 'tg_indptr', 'tg_genres', 'events_indptr', 'events_title', 'events_pct']
+        if workers <= 1:
+            _init_worker(directory, names, n_genres)
+            results = map(_score_partition, tasks)
+            pool = None
+        else:
+            # spawn: workers must not inherit the parent's driver threads and sockets
+            pool = multiprocessing.get_context('spawn').Pool(
+                workers, initializer=_init_worker, initargs=(directory, names, n_genres))
+            results = pool.imap_unordered(_score_partition, tasks)
+        try:
+            for users, titles, counts in results:
+                frame = partition_frame(user_ids, title_ids, title_score, users, titles, counts)
+                write_start = time.perf_counter()
+                write_staging(backend, frame)
+                write_seconds += time.perf_counter() - write_start
+                scored += len(users)
+                rows += len(frame)
+                if time.perf_counter() - last_report >= report_every:
+                    elapsed = time.perf_counter() - loaded
+                    print(json.dumps({'users': scored, 'of': n_users,
+                                      'users_per_sec': round(scored / max(elapsed, 1e-9), 1)}))
+                    last_report = time.perf_counter()
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+    scored_at = time.perf_counter()
+    published = publish(backend, low, high)
+    finished = time.perf_counter()
+    return {
+        'mode': 'full' if low is None else 'incremental',
+        'workers': workers,
+        'partitions': len(tasks),
+        'users': scored,
+        'rows': int(published),
+        'watermark': high,
+        'load_seconds': round(loaded - started, 3),
+        'score_seconds': round(scored_at - loaded, 3),
+        'write_seconds': round(write_seconds, 3),
+        'publish_seconds': round(finished - scored_at, 3),
+        'seconds': round(finished - started, 3),
+        'users_per_sec': round(scored / max(scored_at - loaded, 1e-9), 1),
+    }
+
+
+def main():
+    from backends import create_backend
+
+    parser = argparse.ArgumentParser(description="Precompute top-N recommendations for every user")
+    parser.add_argument('--limit', type=int, default=10, help="Recommendations per user")
+    parser.add_argument('--workers', type=int, default=None, help="Scoring processes (default: CPU count)")
+    parser.add_argument('--full', action='store_true', help="Rescore every user, not just those with new events")
+    parser.add_argument('--weighted', action='store_true', help="Rank by watch-percentage affinity x rating")
+    parser.add_argument('--partition-size', type=int, default=20_000)
+    args = parser.parse_args()
+
+    backend = create_backend()
+    try:
+        print(json.dumps(run_batch(backend, args.limit, args.workers, args.full, args.weighted,
+                                   args.partition_size)))
+    finally:
+        backend.close()
+
+
+if __name__ == '__main__':
+    main()
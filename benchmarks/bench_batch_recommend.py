@@ -0,0 +1,43 @@
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import DuckDBBackend
+from batch_recommend import run_batch
+from datagen import generate
+
+# ------------------------------
+# Batch recommendation throughput vs worker count
+# ------------------------------
+# Runs a full batch_recommend pass over a generated DuckDB dataset once per
+# worker count and reports users/sec and the speedup over one worker.
+# Loading and publishing are reported separately; they do not scale with
+# workers.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batch recommendation scaling")
+    parser.add_argument("--scale", default="1m", help="datagen scale")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--weighted", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    backend = DuckDBBackend().load_frames(generate(args.scale, args.seed))
+    baseline = None
+    try:
+        for workers in args.workers:
+            result = run_batch(backend, args.limit, workers, full=True, weighted=args.weighted)
+            baseline = baseline or result['users_per_sec']
+            result['speedup'] = round(result['users_per_sec'] / baseline, 2) if baseline else None
+            print(json.dumps(dict(result, scale=args.scale)))
+    finally:
+        backend.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_ltv import synthetic_subscriptions
+from cohorts import CohortEngine
+
+# ------------------------------
+# Cohort engine: full build vs monthly extend
+# ------------------------------
+# Times the first refresh (every closed month from one read of all
+# subscriptions) and the refresh after one more month closes (only the
+# subscriptions overlapping it), on synthetic subscriptions, and checks
+# that both paths give the same MRR movements.
+
+TYPES = {8.99: 'Basic', 13.99: 'Standard', 17.99: 'Premium'}
+
+
+def frame_reader(subscriptions):
+    # Stands in for backend.read with SUBSCRIPTIONS_SQL's filter
+    start = pd.to_datetime(subscriptions['subscription_start_date'])
+    end = pd.to_datetime(subscriptions['subscription_end_date'])
+
+    def read(sql, params):
+        before, since = pd.Timestamp(params[0]), pd.Timestamp(params[1])
+        return subscriptions[(start < before) & (end.isna() | (end >= since))]
+    return read
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the churn and cohort engine")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--as-of", default="2025-01-15")
+    args = parser.parse_args()
+
+    subscriptions = synthetic_subscriptions(args.users)
+    subscriptions['subscription_type'] = subscriptions['monthly_fee'].map(TYPES)
+    read = frame_reader(subscriptions)
+    as_of = pd.Timestamp(args.as_of)
+    previous = as_of - pd.DateOffset(months=1)
+
+    full = CohortEngine(read)
+    start = time.perf_counter()
+    full.refresh(as_of)
+    full_s = time.perf_counter() - start
+
+    engine = CohortEngine(read)
+    engine.refresh(previous)
+    rows_before = engine.rows_read
+    start = time.perf_counter()
+    engine.refresh(as_of)
+    extend_s = time.perf_counter() - start
+
+    same = np.allclose(full.mrr_movements().drop(columns='month').to_numpy(dtype=float),
+                       engine.mrr_movements().drop(columns='month').to_numpy(dtype=float))
+    print(json.dumps({'users': args.users, 'subscriptions': len(subscriptions), 'months': full.stats()['months'],
+                      'full_s': round(full_s, 3), 'extend_s': round(extend_s, 3),
+                      'full_rows': full.rows_read, 'extend_rows': engine.rows_read - rows_before,
+                      'same': bool(same)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import DuckDBBackend
+from content_recommender import TITLE_FEATURES_SQL, ContentIndex
+from datagen import generate_titles
+
+# ------------------------------
+# Content index build, load and query cost
+# ------------------------------
+# Builds the index over a generated catalogue of each requested size,
+# loaded into the embedded DuckDB backend and read through
+# ContentIndex.from_backend as the dashboard does, saves it, then times a
+# cold memory-mapped load and "more like what this user watched" queries
+# through the exact scan and the inverted-file lists. Recall is the share
+# of the exact top-k the approximate answer also returns.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the content-based title index")
+    parser.add_argument("--titles", type=float, nargs="+", default=[1e4, 1e5, 5e5])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--history", type=int, default=20, help="Watched titles per query")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--probe", type=int, default=None, help="Lists scanned per approximate query")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    for n_titles in map(int, args.titles):
+        titles, genres, title_genres, _, _ = generate_titles(n_titles, args.seed)
+        backend = DuckDBBackend().load_frames({'titles': titles, 'genres': genres, 'title_genres': title_genres})
+
+        start = time.perf_counter()
+        index = ContentIndex.from_backend(backend.read, n_lists=args.lists, seed=args.seed)
+        build = time.perf_counter() - start
+        titles = backend.read(TITLE_FEATURES_SQL)
+        backend.close()
+        directory = tempfile.mkdtemp(prefix='content_index_')
+        try:
+            index.save(directory)
+            start = time.perf_counter()
+            index = ContentIndex.load(directory, n_probe=args.probe)
+            load = time.perf_counter() - start
+
+            timings = {True: [], False: []}
+            recall = []
+            for _ in range(args.queries):
+                history = pd.DataFrame({
+                    'title_id': titles['title_id'].to_numpy()[rng.integers(0, n_titles, args.history)],
+                    'watch_percentage': rng.random(args.history),
+                })
+                answers = {}
+                for exact in (True, False):
+                    start = time.perf_counter()
+                    answers[exact] = index.recommend_history(history, args.limit, exact=exact)
+                    timings[exact].append(time.perf_counter() - start)
+                recall.append(len(set(answers[True]['title_id']) & set(answers[False]['title_id'])) / args.limit)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        print(json.dumps({
+            'titles': n_titles,
+            'dims': int(index.vectors.shape[1]),
+            'mb': round(index.nbytes() / 2 ** 20, 1),
+            'build_s': round(build, 2),
+            'load_ms': round(load * 1000, 2),
+            'exact_p50_ms': round(float(np.median(timings[True])) * 1000, 2),
+            'ivf_p50_ms': round(float(np.median(timings[False])) * 1000, 2),
+            'ivf_recall': round(float(np.mean(recall)), 3),
+            'lists': len(index.centroids),
+            'probe': index.n_probe,
+            'default_mode': index.stats()['mode'],
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import DuckDBBackend, SqlServerBackend
+from columnar import arrow_odbc_available
+from page_queries import AVG_WATCH_PER_USER, COUNTRY_GENRE
+from query_cache import frame_nbytes
+
+# ------------------------------
+# Row-wise vs columnar result fetching
+# ------------------------------
+# Fetches the unbounded dashboard queries with each fetch path and prints
+# rows/sec, peak Python memory while fetching, and the resident size of
+# the resulting DataFrame (what the query cache holds):
+#   read_sql  pd.read_sql on a pooled connection (the original path)
+#   rows      the same, phase-timed (NETFLIX_FETCH=rows)
+#   columnar  typed NumPy columns from fetchmany batches (default)
+#   arrow     arrow-odbc, when installed
+# With --backend duckdb, df() is compared with the compacted Arrow path.
+
+QUERIES = {
+    'avg_watch_per_user': AVG_WATCH_PER_USER,
+    'user_ltv_all': "SELECT * FROM vw_user_ltv",
+    'country_genre': COUNTRY_GENRE,
+    'users': "SELECT * FROM users",
+    'watch_history': "SELECT TOP {rows} * FROM watch_history ORDER BY watch_id",
+}
+
+
+def measure(read, sql, repeat):
+    best = None
+    for _ in range(repeat):
+        tracemalloc.start()
+        started = time.perf_counter()
+        frame = read(sql)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if best is None or elapsed < best[0]:
+            best = (elapsed, peak, frame)
+    elapsed, peak, frame = best
+    return {
+        'rows': len(frame),
+        'seconds': round(elapsed, 4),
+        'rows_per_sec': round(len(frame) / elapsed) if elapsed else None,
+        'peak_mb': round(peak / 2 ** 20, 2),
+        'frame_mb': round(frame_nbytes(frame) / 2 ** 20, 2),
+        'categorical_columns': sum(isinstance(dtype, pd.CategoricalDtype) for dtype in frame.dtypes),
+        'object_columns': sum(dtype == object for dtype in frame.dtypes),
+    }
+
+
+def readers(args):
+    if args.backend == 'duckdb':
+        return {
+            'df': DuckDBBackend(args.data_dir, compact=False).read,
+            'arrow': DuckDBBackend(args.data_dir).read,
+        }
+    from db_pool import ConnectionPool, resolve_connect
+
+    pool = ConnectionPool(resolve_connect(), max_size=2)
+    modes = {
+        'read_sql': lambda sql: pool.run(lambda conn: pd.read_sql(sql, conn)),
+        'rows': SqlServerBackend(pool, fetch='rows').read,
+        'columnar': SqlServerBackend(pool, fetch='columnar').read,
+    }
+    if arrow_odbc_available():
+        modes['arrow'] = SqlServerBackend(pool, fetch='arrow').read
+    return modes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare row-wise and columnar result fetching")
+    parser.add_argument("--backend", choices=["sqlserver", "duckdb"], default="sqlserver")
+    parser.add_argument("--data-dir", help="CSV/Parquet directory for --backend duckdb")
+    parser.add_argument("--query", action="append", choices=list(QUERIES),
+                        help="Query to fetch (repeatable, default: all)")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Rows for the watch_history query")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    modes = readers(args)
+    for name in args.query or list(QUERIES):
+        sql = QUERIES[name].replace('{rows}', str(int(args.rows)))
+        for mode, read in modes.items():
+            print(json.dumps(dict(query=name, mode=mode, backend=args.backend, **measure(read, sql, args.repeat))))
+
+
+if __name__ == "__main__":
+    main()
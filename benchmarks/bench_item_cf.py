@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from item_cf import ItemItemIndex
+
+# ------------------------------
+# Item-item index rebuild cost
+# ------------------------------
+# Generates synthetic watch events (Zipf-distributed title popularity) and
+# reports full build time and memory at each requested scale.
+
+
+def synthetic_events(n_events, n_users, n_titles, seed=0, zipf=1.1):
+    rng = np.random.default_rng(seed)
+    ranks = np.arange(1, n_titles + 1, dtype=np.float64)
+    popularity = ranks ** -zipf
+    popularity /= popularity.sum()
+    users = rng.integers(0, n_users, n_events, dtype=np.int32)
+    titles = rng.choice(n_titles, size=n_events, p=popularity).astype(np.int32)
+    weights = rng.random(n_events, dtype=np.float32)
+    return users, titles, weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark item-item CF index builds")
+    parser.add_argument("--events", type=float, nargs="+", default=[1e6, 1e7, 1e8])
+    parser.add_argument("--users-per-event", type=float, default=0.02,
+                        help="Distinct users as a fraction of events")
+    parser.add_argument("--titles", type=int, default=20_000)
+    parser.add_argument("--neighbours", type=int, default=50)
+    parser.add_argument("--updates", type=int, default=1000,
+                        help="Incremental single-event updates to time after each build")
+    args = parser.parse_args()
+
+    for n_events in map(int, args.events):
+        n_users = max(int(n_events * args.users_per_event), 1)
+        users, titles, weights = synthetic_events(n_events, n_users, args.titles)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        index = ItemItemIndex(args.titles, n_neighbours=args.neighbours).build(users, titles, weights, n_users=n_users)
+        build_s = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        new_users, new_titles, new_weights = synthetic_events(args.updates, n_users, args.titles, seed=1)
+        start = time.perf_counter()
+        index.update(new_users, new_titles, new_weights)
+        update_s = time.perf_counter() - start
+
+        print(json.dumps({
+            'events': n_events,
+            'users': n_users,
+            'titles': args.titles,
+            'build_s': round(build_s, 3),
+            'events_per_s': round(n_events / build_s),
+            'build_peak_mb': round(peak / 2**20, 1),
+            'index_mb': round(index.nbytes() / 2**20, 1),
+            'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            'update_us_per_event': round(update_s / max(args.updates, 1) * 1e6, 1),
+        }))
+        del users, titles, weights, index
+
+
+if __name__ == "__main__":
+    main()
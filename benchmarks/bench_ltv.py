@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ltv import compute_user_ltv
+
+# ------------------------------
+# Scalar UDF vs set-based LTV
+# ------------------------------
+# With --db, times the dashboard's LTV queries against the live database
+# using dbo.fn_calculate_user_ltv (before) and vw_user_ltv (after). Without
+# it, times the vectorized Python calculator on synthetic subscriptions.
+
+DB_QUERIES = {
+    'top_ltv': {
+        'before': """
+            SELECT u.user_id, u.name, dbo.fn_calculate_user_ltv(u.user_id) AS lifetime_value
+            FROM users u
+            ORDER BY lifetime_value DESC""",
+        'after': """
+            SELECT user_id, name, lifetime_value
+            FROM vw_user_ltv
+            ORDER BY lifetime_value DESC""",
+    },
+    'high_watch_low_ltv': {
+        'before': """
+            SELECT u.user_id, u.name,
+                   ROUND(AVG(wh.watch_percentage * 100), 2) AS avg_watch_percentage,
+                   dbo.fn_calculate_user_ltv(u.user_id) AS lifetime_value
+            FROM users u
+            JOIN watch_history wh ON u.user_id = wh.user_id
+            GROUP BY u.user_id, u.name
+            HAVING AVG(wh.watch_percentage) > 0.8 AND dbo.fn_calculate_user_ltv(u.user_id) < 50
+            ORDER BY avg_watch_percentage DESC""",
+        'after': """
+            SELECT u.user_id, u.name,
+                   ROUND(AVG(wh.watch_percentage * 100), 2) AS avg_watch_percentage,
+                   l.lifetime_value
+            FROM users u
+            JOIN watch_history wh ON u.user_id = wh.user_id
+            JOIN vw_user_ltv l ON u.user_id = l.user_id
+            GROUP BY u.user_id, u.name, l.lifetime_value
+            HAVING AVG(wh.watch_percentage) > 0.8 AND l.lifetime_value < 50
+            ORDER BY avg_watch_percentage DESC""",
+    },
+}
+
+
+def synthetic_subscriptions(n_users, seed=0):
+    rng = np.random.default_rng(seed)
+    per_user = rng.integers(1, 4, n_users)
+    user_ids = np.repeat(np.arange(n_users), per_user)
+    n = user_ids.size
+    start = np.datetime64('2020-01-01') + rng.integers(0, 1800, n).astype('timedelta64[D]')
+    end = start + rng.integers(30, 900, n).astype('timedelta64[D]')
+    end = np.where(rng.random(n) < 0.4, np.datetime64('NaT'), end)
+    return pd.DataFrame({
+        'user_id': pd.Series(user_ids).map('u{}'.format),
+        'monthly_fee': rng.choice([8.99, 13.99, 17.99], n),
+        'subscription_start_date': start,
+        'subscription_end_date': end,
+    })
+
+
+def time_db(repeat):
+    from db_pool import ConnectionPool, resolve_connect
+
+    pool = ConnectionPool(resolve_connect(), max_size=1)
+    for name, variants in DB_QUERIES.items():
+        for variant, sql in variants.items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                rows = len(pool.run(lambda conn: pd.read_sql(sql, conn)))
+                timings.append(time.perf_counter() - start)
+            print(json.dumps({'query': name, 'variant': variant, 'rows': rows,
+                              'best_s': round(min(timings), 3), 'median_s': round(float(np.median(timings)), 3)}))
+    pool.close()
+
+
+def time_python(n_users, repeat):
+    subscriptions = synthetic_subscriptions(n_users)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = compute_user_ltv(subscriptions)
+        timings.append(time.perf_counter() - start)
+    print(json.dumps({'query': 'compute_user_ltv', 'users': n_users, 'subscriptions': len(subscriptions),
+                      'rows': len(result), 'best_s': round(min(timings), 3)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scalar-UDF vs set-based LTV")
+    parser.add_argument("--db", action="store_true", help="Time the SQL variants against the live database")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    if args.db:
+        time_db(args.repeat)
+    time_python(args.users, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_watch_writer import sample_events
+from db_pool import ConnectionPool, resolve_connect
+from maintenance import apply_watch_time, get_mode, set_mode
+from watch_writer import WatchWriter
+
+# ------------------------------
+# Trigger vs deferred maintenance
+# ------------------------------
+# Inserts --events watch events through WatchWriter in each maintenance
+# mode. In deferred mode the catch-up pass is timed as well, so the total
+# is comparable with trigger mode. Rows are real inserts; --cleanup
+# deletes them and subtracts their watch time again. The original mode is
+# restored at the end.
+
+CLEANUP_SQL = """
+    UPDATE u
+    SET u.watch_time_hours = u.watch_time_hours - d.hours
+    FROM users u
+    INNER JOIN (
+        SELECT wh.user_id, SUM((t.runtime * wh.watch_percentage) / 60) AS hours
+        FROM watch_history wh
+        INNER JOIN titles t ON wh.title_id = t.title_id
+        WHERE wh.watch_id > ? AND t.runtime IS NOT NULL
+        GROUP BY wh.user_id
+    ) d ON u.user_id = d.user_id;
+    DELETE FROM watch_history WHERE watch_id > ?;"""
+
+
+def max_watch_id(conn):
+    return conn.cursor().execute("SELECT ISNULL(MAX(watch_id), 0) FROM watch_history").fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare trigger and deferred watch_history maintenance")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--mode", action="append", choices=["trigger", "deferred"],
+                        help="Mode to benchmark (repeatable, default: both)")
+    parser.add_argument("--max-batch", type=int, default=2000)
+    parser.add_argument("--cleanup", action="store_true", help="Remove the inserted rows afterwards")
+    args = parser.parse_args()
+
+    pool = ConnectionPool(resolve_connect(), max_size=4)
+    original = pool.run(get_mode)
+    events = sample_events(pool, args.events)
+    start_id = pool.run(max_watch_id)
+
+    try:
+        for mode in args.mode or ["trigger", "deferred"]:
+            pool.run(lambda conn: set_mode(conn, mode))
+            writer = WatchWriter(pool, max_batch=args.max_batch)
+            started = time.perf_counter()
+            writer.submit_many(events)
+            writer.flush()
+            ingest = time.perf_counter() - started
+            writer.close()
+
+            catch_up = {'seconds': 0.0}
+            if mode == "deferred":
+                catch_up = pool.run(apply_watch_time)
+            total = ingest + catch_up['seconds']
+            print(json.dumps({
+                'mode': mode,
+                'events': len(events),
+                'ingest_seconds': round(ingest, 3),
+                'ingest_events_per_sec': round(len(events) / ingest, 1),
+                'catch_up_seconds': catch_up['seconds'],
+                'total_seconds': round(total, 3),
+                'events_per_sec': round(len(events) / total, 1),
+                'writer': writer.metrics(),
+            }))
+    finally:
+        if original in ("trigger", "deferred"):
+            pool.run(lambda conn: set_mode(conn, original))
+        if args.cleanup:
+            def cleanup(conn):
+                conn.cursor().execute(CLEANUP_SQL, start_id, start_id)
+                conn.commit()
+            pool.run(cleanup)
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import create_backend
+from db_pool import ConnectionPool, resolve_connect
+from page_queries import PAGE_QUERIES
+from query_plan import compare_plan
+
+# ------------------------------
+# Sequential vs parallel page latency
+# ------------------------------
+# Runs each page's query plan against the live database (or the embedded
+# DuckDB replica with --backend duckdb), first one query after another and
+# then concurrently, and prints both wall-clock times.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sequential and parallel page query latency")
+    parser.add_argument("--page", action="append", choices=list(PAGE_QUERIES),
+                        help="Page to benchmark (repeatable, default: all)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--backend", choices=["sqlserver", "duckdb"], default="sqlserver")
+    parser.add_argument("--data-dir", help="CSV/Parquet directory for --backend duckdb")
+    args = parser.parse_args()
+
+    pool = ConnectionPool(resolve_connect(), max_size=args.pool_size) if args.backend == "sqlserver" else None
+    backend = create_backend(args.backend, data_dir=args.data_dir, pool=pool)
+    run = backend.read
+
+    for page in args.page or list(PAGE_QUERIES):
+        for attempt in range(args.repeat):
+            report = compare_plan(PAGE_QUERIES[page], run, max_workers=args.pool_size)
+            report.update(page=page, attempt=attempt, backend=backend.name)
+            print(json.dumps(report))
+    backend.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_pool import ConnectionPool, resolve_connect
+from watch_writer import WatchWriter
+
+# ------------------------------
+# Single-row inserts vs buffered group commit
+# ------------------------------
+# Writes --events watch events from --producers threads, first with the
+# dashboard's old path (one INSERT + commit per event) and then through
+# WatchWriter, and prints events/sec for each. Rows are real inserts: they
+# fire the watch_history triggers and add to users.watch_time_hours. With
+# --cleanup the inserted watch_history rows are deleted afterwards.
+
+SINGLE_INSERT = """
+    INSERT INTO watch_history
+    (user_id, title_id, watch_percentage, completed, created_at, updated_at)
+    VALUES (?, ?, ?, 0, SYSDATETIME(), SYSDATETIME())"""
+
+
+def sample_events(pool, n, seed=0):
+    users = pool.run(lambda conn: [r[0] for r in conn.cursor().execute("SELECT TOP 1000 user_id FROM users").fetchall()])
+    titles = pool.run(lambda conn: [r[0] for r in conn.cursor().execute("SELECT TOP 1000 title_id FROM titles").fetchall()])
+    rng = np.random.default_rng(seed)
+    return list(zip(
+        rng.choice(users, n).tolist(),
+        rng.choice(titles, n).tolist(),
+        np.round(rng.random(n), 2).tolist(),
+    ))
+
+
+def run_producers(events, producers, produce):
+    parts = [events[i::producers] for i in range(producers)]
+    threads = [threading.Thread(target=produce, args=(part,)) for part in parts]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return start
+
+
+def bench_single(pool, events, producers):
+    def produce(part):
+        for event in part:
+            def write(conn):
+                conn.cursor().execute(SINGLE_INSERT, *event)
+                conn.commit()
+            pool.run(write)
+    start = run_producers(events, producers, produce)
+    return time.perf_counter() - start, {}
+
+
+def bench_buffered(pool, events, producers, max_batch, max_latency):
+    writer = WatchWriter(pool, max_batch=max_batch, max_latency=max_latency)
+    futures = []
+
+    def produce(part):
+        futures.extend(writer.submit_many(part))
+    start = run_producers(events, producers, produce)
+    writer.flush()
+    elapsed = time.perf_counter() - start
+    writer.close()
+    return elapsed, writer.metrics()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare single-row and buffered watch_history writes")
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--producers", type=int, default=8)
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--max-batch", type=int, default=2000)
+    parser.add_argument("--max-latency", type=float, default=0.05)
+    parser.add_argument("--cleanup", action="store_true", help="Delete the inserted rows afterwards")
+    args = parser.parse_args()
+
+    pool = ConnectionPool(resolve_connect(), max_size=args.pool_size)
+    events = sample_events(pool, args.events)
+    watermark = pool.run(lambda conn: conn.cursor().execute("SELECT ISNULL(MAX(watch_id), 0) FROM watch_history").fetchone()[0])
+
+    for mode in ("single", "buffered"):
+        if mode == "single":
+            elapsed, extra = bench_single(pool, events, args.producers)
+        else:
+            elapsed, extra = bench_buffered(pool, events, args.producers, args.max_batch, args.max_latency)
+        report = {
+            'mode': mode,
+            'events': len(events),
+            'producers': args.producers,
+            'seconds': round(elapsed, 3),
+            'events_per_sec': round(len(events) / elapsed, 1),
+        }
+        report.update(extra)
+        print(json.dumps(report))
+
+    if args.cleanup:
+        def cleanup(conn):
+            conn.cursor().execute("DELETE FROM watch_history WHERE watch_id > ?", watermark)
+            conn.commit()
+        pool.run(cleanup)
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
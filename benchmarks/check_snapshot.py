@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import DuckDBBackend
+from datagen import generate
+from snapshot import ColumnarSnapshot
+
+# ------------------------------
+# Snapshot watch-time consistency check
+# ------------------------------
+# Loads a generated dataset into the embedded DuckDB backend (which
+# emulates the watch_history triggers), builds the snapshot, then writes a
+# new user with a subscription and one batch of events for the new user
+# and for existing users. After refresh() every user's snapshot
+# watch_time_hours must match users.watch_time_hours; exits 1 otherwise.
+#
+#   python benchmarks/check_snapshot.py --scale 10k
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check snapshot watch_time_hours against the users table")
+    parser.add_argument("--scale", default="10k")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--existing", type=int, default=5, help="Existing users given an event in the batch")
+    args = parser.parse_args()
+
+    backend = DuckDBBackend().load_frames(generate(args.scale, args.seed))
+    snapshot = ColumnarSnapshot(backend.read)
+    snapshot.load()
+
+    users = backend.read("SELECT user_id FROM users ORDER BY user_id")['user_id'].tolist()[:args.existing]
+    title = backend.read("SELECT MIN(title_id) AS title_id FROM titles WHERE runtime IS NOT NULL")['title_id'][0]
+
+    def write(conn):
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO users (user_id, name, age, country, watch_time_hours) "
+                       "VALUES ('check_user', 'Check User', 30, 'US', 0)")
+        cursor.execute("INSERT INTO subscriptions (user_id, subscription_type, monthly_fee, subscription_status, "
+                       "subscription_start_date) VALUES ('check_user', 'Basic', 8.99, 'active', CURRENT_DATE)")
+        cursor.executemany(
+            "INSERT INTO watch_history (user_id, title_id, watch_percentage, completed) VALUES (?, ?, ?, 0)",
+            [('check_user', title, 0.5)] + [(user, title, 0.75) for user in users])
+        conn.commit()
+    backend.run(write)
+    applied = snapshot.refresh()
+
+    expected = backend.read("SELECT user_id, watch_time_hours FROM users")
+    codes = snapshot.users.lookup(expected['user_id'].to_numpy())
+    truth = expected['watch_time_hours'].to_numpy(dtype=np.float64)
+    diff = np.abs(snapshot.user_watch_hours[codes] - truth)
+    worst = int(np.argmax(diff))
+    result = {
+        'events_applied': applied,
+        'users': len(expected),
+        'mismatched': int((diff > 0.005).sum()),
+        'max_diff_hours': round(float(diff[worst]), 4),
+        'worst_user': expected['user_id'][worst],
+    }
+    print(json.dumps(result))
+    backend.close()
+    sys.exit(1 if result['mismatched'] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import DuckDBBackend, create_backend
+from cube import CUBE_QUERIES, WatchCube
+from db_pool import ConnectionPool, resolve_connect
+from page_queries import PAGE_QUERIES, PAGED_QUERIES, SEARCH_INDEXES
+from pagination import read_page
+from recommender import GenreRecommender
+from rollups import apply_rollups
+from search_index import SearchIndex
+from sketches import APPROX_QUERIES, ApproximateAggregates
+from snapshot import SNAPSHOT_QUERIES, ColumnarSnapshot
+
+# ------------------------------
+# End-to-end dashboard benchmark
+# ------------------------------
+# Times every query of every page in PAGE_QUERIES plus the recommender
+# (the stored procedure and the in-memory GenreRecommender) and records
+# latency percentiles, row counts and the peak Python memory while
+# building each result. Paged tables are also timed by their first page,
+# and the typeahead indexes by their build and per-keystroke searches. With --snapshot the queries the columnar
+# snapshot can answer are timed from it as well, the segment breakdowns
+# from the watch cube, and the approximate answers from sketches.py with
+# their largest relative error against the exact ones. The Trends page
+# reads watch_rollups, so the rollups are caught up first (build_ms) and
+# the refresh the page runs is timed once they are current. Results go to stdout as
+# JSON lines and, with --output, to one JSON file that --compare can diff
+# against later.
+#
+#   python benchmarks/run_benchmarks.py --backend duckdb --scale 1m --output results/1m.json
+#   python benchmarks/run_benchmarks.py --backend duckdb --data-dir data/100m --repeat 3
+#   python benchmarks/run_benchmarks.py --backend sqlserver --compare results/baseline.json
+
+RECOMMEND_SQL = "EXEC sp_get_user_recommendations @p_user_id = ?, @p_limit = ?"
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 2)
+
+
+def measure(fn, repeat, warmup):
+    for _ in range(warmup):
+        fn()
+    latencies, peaks, rows = [], [], 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        started = time.perf_counter()
+        result = fn()
+        latencies.append(time.perf_counter() - started)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        rows = len(result)
+    return {
+        'runs': repeat,
+        'rows': rows,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': round(max(latencies) * 1000, 2),
+        'peak_mb': round(max(peaks) / 2 ** 20, 2),
+    }
+
+
+def sample_users(read, n, seed):
+    users = read("SELECT user_id FROM users")['user_id'].tolist()
+    rng = np.random.default_rng(seed)
+    return [users[i] for i in rng.choice(len(users), min(n, len(users)), replace=False)]
+
+
+def benchmark(read, pages, repeat, warmup, users, limit, use_snapshot=False):
+    for page in pages:
+        for name, sql in PAGE_QUERIES[page].items():
+            yield dict(page=page, query=name, source='database', **measure(lambda: read(sql), repeat, warmup))
+
+    # First keyset page of each paged table, which is what the pages load
+    for page in pages:
+        for name in PAGE_QUERIES[page]:
+            if name in PAGED_QUERIES:
+                query = PAGED_QUERIES[name]
+                yield dict(page=page, query=f'{name}[page]', source='database',
+                           **measure(lambda: read_page(read, query, 50)[0], repeat, warmup))
+
+    # One recommendation call per sampled user and run
+    calls = iter(users * (repeat + warmup))
+    yield dict(page='Recommender Demo', query='sp_get_user_recommendations', source='database',
+               **measure(lambda: read(RECOMMEND_SQL, [next(calls), limit]), repeat, warmup))
+
+    started = time.perf_counter()
+    snapshot = ColumnarSnapshot(read)
+    snapshot.load()
+    recommender = GenreRecommender.from_snapshot(snapshot)
+    build = round((time.perf_counter() - started) * 1000, 2)
+    calls = iter(users * (repeat + warmup))
+    yield dict(page='Recommender Demo', query='genre_recommender', source='snapshot', build_ms=build,
+               **measure(lambda: recommender.recommend(next(calls), limit), repeat, warmup))
+
+    # Typeahead search: every prefix of the sampled users' names, as typed
+    started = time.perf_counter()
+    indexes = {name: SearchIndex(read, **config) for name, config in SEARCH_INDEXES.items()}
+    for index in indexes.values():
+        index.load()
+    build = round((time.perf_counter() - started) * 1000, 2)
+    names = [str(indexes['users'].get(user)['name']) for user in users]
+    typed = iter([name[:i] for name in names for i in range(1, len(name) + 1)] * (repeat + warmup))
+    yield dict(page='Recommender Demo', query='user_search', source='index', build_ms=build,
+               **measure(lambda: indexes['users'].search(next(typed), 100), repeat, warmup))
+
+    if use_snapshot:
+        for page in pages:
+            for name in PAGE_QUERIES[page]:
+                if name in SNAPSHOT_QUERIES:
+                    answer = SNAPSHOT_QUERIES[name]
+                    yield dict(page=page, query=name, source='snapshot',
+                               **measure(lambda: answer(snapshot), repeat, warmup))
+
+        started = time.perf_counter()
+        cube = WatchCube.from_snapshot(snapshot)
+        build = round((time.perf_counter() - started) * 1000, 2)
+        for page in pages:
+            for name in PAGE_QUERIES[page]:
+                if name in CUBE_QUERIES:
+                    answer = CUBE_QUERIES[name]
+                    yield dict(page=page, query=name, source='cube', build_ms=build, cells=len(cube),
+                               **measure(lambda: answer(cube), repeat, warmup))
+
+        started = time.perf_counter()
+        sketches = ApproximateAggregates.from_snapshot(snapshot)
+        build = round((time.perf_counter() - started) * 1000, 2)
+        for page in pages:
+            for name in PAGE_QUERIES[page]:
+                if name in APPROX_QUERIES:
+                    answer = APPROX_QUERIES[name]
+                    error = max_error_pct(answer(sketches), SNAPSHOT_QUERIES[name](snapshot))
+                    yield dict(page=page, query=name, source='sketch', build_ms=build, max_error_pct=error,
+                               **measure(lambda: answer(sketches), repeat, warmup))
+
+
+def max_error_pct(estimate, exact):
+    # Largest relative error of any estimated column, in percent
+    errors = [0.0]
+    for column in estimate.columns:
+        if column.endswith('_error'):
+            column = column[:-len('_error')]
+            truth = exact[column].to_numpy(dtype=np.float64)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                relative = np.abs(estimate[column].to_numpy(dtype=np.float64) - truth) / np.abs(truth)
+            errors.append(float(np.nanmax(relative, initial=0.0)))
+    return round(max(errors) * 100, 2)
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['page'], r['query'], r['source']): r for r in json.load(f)['results']}
+    regressions = []
+    for result in results:
+        before = baseline.get((result['page'], result['query'], result['source']))
+        if before and result['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+            regressions.append({'page': result['page'], 'query': result['query'], 'source': result['source'],
+                                'baseline_p50_ms': before['p50_ms'], 'p50_ms': result['p50_ms']})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every dashboard query and the recommender")
+    parser.add_argument("--backend", choices=["sqlserver", "duckdb"], default="sqlserver")
+    parser.add_argument("--data-dir", help="CSV/Parquet directory for --backend duckdb")
+    parser.add_argument("--scale", help="Generate a datagen scale in memory for --backend duckdb")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--page", action="append", choices=list(PAGE_QUERIES),
+                        help="Page to benchmark (repeatable, default: all)")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--snapshot", action="store_true", help="Also time the in-memory snapshot answers")
+    parser.add_argument("--users", type=int, default=20, help="Users sampled for recommender calls")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--output", help="Write all results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file; exit 1 if p50 regresses")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.backend == "duckdb" and args.scale:
+        from datagen import generate
+        backend = DuckDBBackend().load_frames(generate(args.scale, args.seed))
+    else:
+        pool = ConnectionPool(resolve_connect(), max_size=2) if args.backend == "sqlserver" else None
+        backend = create_backend(args.backend, data_dir=args.data_dir, pool=pool)
+
+    pages = args.page or list(PAGE_QUERIES)
+    results = []
+    try:
+        if "Trends" in pages:
+            run = apply_rollups(backend)
+            result = dict(page='Trends', query='apply_rollups', source='rollup',
+                          build_ms=round(run['seconds'] * 1000, 2), buckets=run['buckets_updated'],
+                          **measure(lambda: apply_rollups(backend), args.repeat, args.warmup))
+            results.append(result)
+            print(json.dumps(result))
+        users = sample_users(backend.read, args.users, args.seed)
+        for result in benchmark(backend.read, pages, args.repeat, args.warmup, users, args.limit, args.snapshot):
+            results.append(result)
+            print(json.dumps(result))
+    finally:
+        backend.close()
+
+    report = {
+        'meta': {
+            'backend': backend.name,
+            'scale': args.scale,
+            'data_dir': args.data_dir,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'snapshot': args.snapshot,
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for regression in regressions:
+            print(json.dumps(dict(regression, regression=True)))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
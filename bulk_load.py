@@ -0,0 +1,335 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from maintenance import advance_watermark, get_mode
+from schema import IDENTITY_COLUMNS, LOAD_LEVELS, TABLE_COLUMNS
+
+# ------------------------------
+# Streaming CSV bulk loader
+# ------------------------------
+# Python replacement for 02_Insert_Data.sql. Each CSV is read in fixed-size
+# chunks, converted column by column with pandas, and written with pyodbc's
+# fast_executemany (array-bound parameters) by several connections per
+# table. Tables in the same FK level load concurrently. Every committed
+# chunk is recorded in a checkpoint file so an interrupted load resumes
+# where it stopped. Memory stays bounded by chunk_size x queue depth.
+#
+#   python bulk_load.py --data-dir /data/combined_dataset
+#   python bulk_load.py --data-dir /data/combined_dataset --tables watch_history --workers 4
+
+
+def convert_chunk(frame, types):
+    # Vectorized string -> typed column conversion; unparseable values become NULL
+    out = {}
+    for column in frame.columns:
+        values = frame[column]
+        kind = types[column]
+        if kind == 'int':
+            values = pd.to_numeric(values, errors='coerce').astype('Int64')
+        elif kind == 'float':
+            values = pd.to_numeric(values, errors='coerce')
+        elif kind == 'decimal':
+            values = pd.to_numeric(values, errors='coerce').round(2)
+        elif kind == 'date':
+            values = pd.to_datetime(values, errors='coerce').dt.date
+        elif kind == 'datetime':
+            values = pd.to_datetime(values, errors='coerce')
+        out[column] = values
+    return pd.DataFrame(out)
+
+
+def chunk_rows(frame):
+    # Parameter rows for executemany: Python scalars with None for NULL
+    columns = []
+    for column in frame.columns:
+        values = frame[column]
+        if isinstance(values.dtype, pd.DatetimeTZDtype) or values.dtype.kind == 'M':
+            array = np.array(values.dt.to_pydatetime(), dtype=object)
+        else:
+            array = values.astype(object).to_numpy(copy=True)
+        array[pd.isna(values).to_numpy()] = None
+        columns.append(array.tolist())
+    return list(zip(*columns))
+
+
+class Checkpoint:
+    def __init__(self, path, restart=False):
+        self.path = path
+        self._lock = threading.Lock()
+        self.state = {'tables': {}}
+        if not restart and os.path.exists(path):
+            with open(path) as f:
+                self.state = json.load(f)
+
+    def table(self, name, chunk_size):
+        with self._lock:
+            entry = self.state['tables'].setdefault(
+                name, {'chunk_size': chunk_size, 'done': [], 'rows': 0, 'complete': False})
+        if entry['chunk_size'] != chunk_size:
+            raise ValueError(
+                f"{name}: checkpoint was written with chunk_size={entry['chunk_size']}; "
+                f"rerun with that size or --restart")
+        return entry
+
+    def mark(self, name, chunk, rows=0, complete=False):
+        with self._lock:
+            entry = self.state['tables'][name]
+            if chunk is not None:
+                entry['done'].append(chunk)
+                entry['rows'] += rows
+            entry['complete'] = entry['complete'] or complete
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.state, f)
+            os.replace(tmp, self.path)
+
+
+def enabled_triggers(cursor, table):
+    cursor.execute(
+        "SELECT name FROM sys.triggers WHERE parent_id = OBJECT_ID(?) AND is_disabled = 0", table)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def set_triggers(connect, table, names, enabled):
+    if not names:
+        return
+    conn = connect()
+    try:
+        cursor = conn.cursor()
+        action = 'ENABLE' if enabled else 'DISABLE'
+        for name in names:
+            cursor.execute(f"{action} TRIGGER [{name}] ON [{table}]")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class TableLoader:
+    def __init__(self, connect, table, path, checkpoint, chunk_size=50_000, workers=2,
+                 keep_identity=True, encoding='utf-8'):
+        self.connect = connect
+        self.table = table
+        self.path = path
+        self.checkpoint = checkpoint
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.keep_identity = keep_identity
+        self.encoding = encoding
+        self.rows = 0
+        self.skipped = 0
+        self.error = None
+        self._lock = threading.Lock()
+
+    def _columns(self):
+        header = pd.read_csv(self.path, nrows=0, encoding=self.encoding).columns
+        types = TABLE_COLUMNS[self.table]
+        unknown = [c for c in header if c not in types]
+        if unknown:
+            raise ValueError(f"{self.path}: columns not in {self.table}: {unknown}")
+        columns = list(header)
+        identity = IDENTITY_COLUMNS.get(self.table)
+        if identity in columns and not self.keep_identity:
+            columns.remove(identity)
+        return list(header), columns, types
+
+    def _insert(self, conn, sql, frame):
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        cursor.executemany(sql, chunk_rows(frame))
+        conn.commit()
+
+    def _worker(self, work, sql, identity_insert):
+        # A failed chunk is rolled back and left out of the checkpoint, so a
+        # rerun loads it again
+        try:
+            conn = self.connect()
+        except Exception as e:
+            self.error = self.error or e
+            return
+        try:
+            conn.autocommit = False
+            if identity_insert:
+                conn.cursor().execute(f"SET IDENTITY_INSERT [{self.table}] ON")
+            while True:
+                item = work.get()
+                if item is None:
+                    return
+                number, frame = item
+                self._insert(conn, sql, frame)
+                self.checkpoint.mark(self.table, number, len(frame))
+                with self._lock:
+                    self.rows += len(frame)
+        except Exception as e:
+            self.error = self.error or e
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _put(work, item, threads):
+        # Blocks until `item` is queued; False once every writer has exited
+        while any(t.is_alive() for t in threads):
+            try:
+                work.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(self, report_every=10.0):
+        entry = self.checkpoint.table(self.table, self.chunk_size)
+        if entry['complete']:
+            print(f"{self.table}: already loaded ({entry['rows']:,} rows), skipping")
+            return 0, 0.0
+        done = set(entry['done'])
+        header, columns, types = self._columns()
+        identity_insert = self.keep_identity and IDENTITY_COLUMNS.get(self.table) in columns
+        placeholders = ', '.join('?' * len(columns))
+        sql = f"INSERT INTO [{self.table}] ({', '.join(columns)}) VALUES ({placeholders})"
+
+        # Chunks 0..k-1 all done: let the CSV parser skip those rows outright
+        prefix = 0
+        while prefix in done:
+            prefix += 1
+        reader = pd.read_csv(
+            self.path, dtype=str, keep_default_na=False, na_values=[''],
+            header=None, names=header, usecols=columns,
+            skiprows=1 + prefix * self.chunk_size,
+            chunksize=self.chunk_size, encoding=self.encoding,
+        )
+
+        # Bounded queue: the reader blocks once the writers fall behind
+        work = queue.Queue(maxsize=self.workers * 2)
+        threads = [threading.Thread(target=self._worker, args=(work, sql, identity_insert), daemon=True)
+                   for _ in range(self.workers)]
+        for t in threads:
+            t.start()
+
+        start = last_report = time.perf_counter()
+        try:
+            for number, chunk in enumerate(reader, start=prefix):
+                if number in done:
+                    self.skipped += len(chunk)
+                    continue
+                frame = convert_chunk(chunk[columns], types)
+                if not self._put(work, (number, frame), threads):
+                    raise RuntimeError(f"{self.table}: all writer threads stopped") from self.error
+                now = time.perf_counter()
+                if now - last_report >= report_every:
+                    last_report = now
+                    print(f"{self.table}: {self.rows:,} rows ({self.rows / (now - start):,.0f} rows/s)")
+        finally:
+            # One stop sentinel per writer; waits for queue space as long
+            # as a writer is left to take it
+            for _ in threads:
+                if not self._put(work, None, threads):
+                    break
+            for t in threads:
+                t.join()
+
+        elapsed = time.perf_counter() - start
+        if self.error is not None:
+            raise RuntimeError(f"{self.table}: load failed after {self.rows:,} rows") from self.error
+        self.checkpoint.mark(self.table, None, complete=True)
+        print(f"{self.table}: {self.rows:,} rows in {elapsed:.1f}s "
+              f"({self.rows / max(elapsed, 1e-9):,.0f} rows/s)")
+        return self.rows, elapsed
+
+
+def load(data_dir, tables=None, chunk_size=50_000, workers=2, parallel_tables=4,
+         checkpoint_path=None, restart=False, keep_identity=True, fire_triggers=False,
+         encoding='utf-8', connect=None):
+    if connect is None:
+        from db_pool import resolve_connect
+        connect = resolve_connect()
+    checkpoint = Checkpoint(checkpoint_path or os.path.join(data_dir, '.bulk_load_checkpoint.json'), restart)
+    wanted = set(tables or TABLE_COLUMNS)
+    summary = {}
+
+    # BULK INSERT does not fire triggers by default; match that unless asked.
+    # Only triggers enabled now are disabled, and exactly those re-enabled.
+    disabled = {}
+    if not fire_triggers and 'watch_history' in wanted:
+        conn = connect()
+        try:
+            disabled['watch_history'] = enabled_triggers(conn.cursor(), 'watch_history')
+        finally:
+            conn.close()
+        set_triggers(connect, 'watch_history', disabled['watch_history'], enabled=False)
+
+    start = time.perf_counter()
+    try:
+        for level in LOAD_LEVELS:
+            loaders = []
+            for table in level:
+                path = os.path.join(data_dir, f'{table}.csv')
+                if table not in wanted:
+                    continue
+                if not os.path.exists(path):
+                    print(f"{table}: {path} not found, skipping")
+                    continue
+                loaders.append(TableLoader(connect, table, path, checkpoint, chunk_size, workers,
+                                           keep_identity, encoding))
+            with ThreadPoolExecutor(max_workers=max(1, min(parallel_tables, len(loaders) or 1))) as executor:
+                futures = {loader.table: executor.submit(loader.run) for loader in loaders}
+                for table, future in futures.items():
+                    rows, elapsed = future.result()
+                    summary[table] = {
+                        'rows': rows,
+                        'seconds': round(elapsed, 2),
+                        'rows_per_sec': round(rows / elapsed) if elapsed else 0,
+                    }
+    finally:
+        for table, names in disabled.items():
+            set_triggers(connect, table, names, enabled=True)
+
+    # In deferred maintenance mode the loaded events must not be applied
+    # again: users.csv already carries their watch_time_hours
+    if 'watch_history' in disabled:
+        conn = connect()
+        try:
+            if get_mode(conn) == 'deferred':
+                advance_watermark(conn)
+        finally:
+            conn.close()
+
+    elapsed = time.perf_counter() - start
+    total = sum(s['rows'] for s in summary.values())
+    print(f"Loaded {total:,} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream the combined_dataset CSVs into SQL Server")
+    parser.add_argument('--data-dir', required=True, help="Directory with users.csv, titles.csv, ...")
+    parser.add_argument('--tables', nargs='+', choices=sorted(TABLE_COLUMNS))
+    parser.add_argument('--chunk-size', type=int, default=50_000)
+    parser.add_argument('--workers', type=int, default=2, help="Writer connections per table")
+    parser.add_argument('--parallel-tables', type=int, default=4)
+    parser.add_argument('--checkpoint', help="Defaults to <data-dir>/.bulk_load_checkpoint.json")
+    parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint")
+    parser.add_argument('--no-keep-identity', action='store_true',
+                        help="Let SQL Server assign IDENTITY values instead of using the CSV's")
+    parser.add_argument('--fire-triggers', action='store_true',
+                        help="Keep watch_history triggers enabled during the load")
+    parser.add_argument('--encoding', default='utf-8')
+    args = parser.parse_args()
+
+    summary = load(
+        args.data_dir, tables=args.tables, chunk_size=args.chunk_size, workers=args.workers,
+        parallel_tables=args.parallel_tables, checkpoint_path=args.checkpoint, restart=args.restart,
+        keep_identity=not args.no_keep_identity, fire_triggers=args.fire_triggers,
+        encoding=args.encoding,
+    )
+    print(json.dumps(summary))
+
+
+if __name__ == '__main__':
+    main()
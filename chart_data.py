@@ -0,0 +1,225 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# ------------------------------
+# Chart data budgets and spec cache
+# ------------------------------
+# Every chart ships its source rows to the browser, so chart data is
+# reduced on the server before the chart is built:
+#   top_k      - the k largest categories plus one "Other" row
+#   bin_scatter - points folded into a grid of bins, one mark per bin
+#   decimate   - per-series min/max per bucket of a long x axis
+# Reduced frames keep the original columns, so the same encoding draws
+# both. Anything still over the row budget is cut to the budget.
+#
+# ChartCache keeps the Vega-Lite spec (without data) per chart and data
+# fingerprint, so Altair's to_dict() and schema validation run once per
+# distinct result instead of on every rerun, and it records the rows and
+# bytes each chart sends.
+
+DEFAULT_BUDGET = 1000
+OTHER = 'Other'
+
+
+def _fold(frame, keys, sums=(), means=None):
+    # One row per `keys` group: `sums` added up, `means` ({column: weight
+    # column or None}) averaged, weighted where a weight is given
+    means = means or {}
+    work = frame.assign(_all=0) if not keys else frame
+    keys = list(keys) or ['_all']
+    spec = {column: (column, 'sum') for column in sums}
+    for column, weight in means.items():
+        if weight is None:
+            spec[column] = (column, 'mean')
+            continue
+        valid = work[column].notna()
+        work = work.assign(**{f'_{column}_sum': (work[column] * work[weight]).where(valid),
+                              f'_{column}_weight': work[weight].where(valid)})
+        spec[f'_{column}_sum'] = (f'_{column}_sum', 'sum')
+        spec[f'_{column}_weight'] = (f'_{column}_weight', 'sum')
+    out = work.groupby(keys, sort=False, dropna=False).agg(**spec).reset_index()
+    for column, weight in means.items():
+        if weight is not None:
+            out[column] = out.pop(f'_{column}_sum') / out.pop(f'_{column}_weight').replace(0, np.nan)
+    return out.drop(columns=['_all'], errors='ignore')
+
+
+def top_k(frame, key, by, k=20, group=(), sums=(), means=None, other=OTHER):
+    # Keeps the k values of `key` with the largest total `by` and folds
+    # the rest into one `other` row per `group`. Columns not in sums or
+    # means are left empty on the folded rows; other=None drops the rest.
+    means = means or {}
+    if frame.empty or frame[key].nunique() <= k:
+        return frame
+    keep = frame.groupby(key, sort=False)[by].sum().nlargest(k).index
+    inside = frame[key].isin(keep)
+    if other is None:
+        return frame[inside]
+    rest = frame[~inside]
+    sums = [column for column in dict.fromkeys([*sums, by]) if column not in means]
+    folded = _fold(rest, list(group), sums, means)
+    folded[key] = f"{other} ({rest[key].nunique():,})"
+    return pd.concat([frame[inside], folded.reindex(columns=frame.columns)], ignore_index=True)
+
+
+def bin_scatter(frame, x, y, bins=30, label=None, noun='points', sums=(), means=None, budget=DEFAULT_BUDGET):
+    # Frames over `budget` rows become one row per occupied (x, y) bin at
+    # the mean position of its points, with a `points` count. `label` is
+    # kept for single-point bins and reads "<n> <noun>" otherwise.
+    if len(frame) <= budget:
+        return frame
+    data = frame.dropna(subset=[x, y])
+    cells = pd.DataFrame({
+        '_bx': pd.cut(data[x], bins, labels=False, include_lowest=True),
+        '_by': pd.cut(data[y], bins, labels=False, include_lowest=True),
+    }, index=data.index)
+    work = pd.concat([data, cells], axis=1).assign(points=1)
+    out = _fold(work, ['_bx', '_by'], ['points', *sums], dict({x: None, y: None}, **(means or {})))
+    if label is not None:
+        first = work.groupby(['_bx', '_by'], sort=False, dropna=False)[label].first().reset_index(drop=True)
+        out[label] = np.where(out['points'] == 1, first.astype(str), out['points'].map(lambda n: f"{n:,} {noun}"))
+    columns = [*frame.columns, *(['points'] if 'points' not in frame.columns else [])]
+    return out.drop(columns=['_bx', '_by']).reindex(columns=columns)
+
+
+def decimate(frame, x, y, max_points=DEFAULT_BUDGET, series=None):
+    # Keeps the first, last, min and max point of every bucket of each
+    # series (ordered by x), at most about `max_points` rows per series,
+    # so peaks survive and the line keeps its shape.
+    ys = [y] if isinstance(y, str) else list(y)
+    groups = frame.groupby(series, sort=False) if series else [(None, frame)]
+    parts = []
+    for _, part in groups:
+        if len(part) <= max_points:
+            parts.append(part)
+            continue
+        part = part.sort_values(x, kind='stable')
+        per_bucket = 2 + 2 * len(ys)
+        bucket = np.arange(len(part)) * max(max_points // per_bucket, 1) // len(part)
+        keep = {0, len(part) - 1}
+        positions = pd.Series(np.arange(len(part)))
+        grouped = positions.groupby(bucket)
+        keep.update(grouped.first().tolist())
+        keep.update(grouped.last().tolist())
+        for column in ys:
+            values = pd.Series(part[column].to_numpy(), dtype='float64')
+            by_bucket = values.groupby(bucket)
+            keep.update(by_bucket.idxmin().dropna().astype(int).tolist())
+            keep.update(by_bucket.idxmax().dropna().astype(int).tolist())
+        parts.append(part.iloc[sorted(keep)])
+    return pd.concat(parts) if parts else frame
+
+
+def _fingerprint(frame):
+    hashed = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+    return hashlib.sha1(hashed.tobytes() + '\x1f'.join(map(str, frame.columns)).encode('utf-8')).hexdigest()
+
+
+def arrow_nbytes(frame):
+    # Size of the Arrow stream the frontend receives for `frame`
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return int(frame.memory_usage(index=False, deep=True).sum())
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().size
+
+
+def chart_spec(chart):
+    # Altair chart -> Vega-Lite dict without its inline data or the
+    # default theme's fixed view size
+    spec = chart.to_dict()
+    spec.pop('datasets', None)
+    spec.pop('data', None)
+    view = spec.get('config', {}).get('view', {})
+    if view.get('continuousWidth') == 300 and view.get('continuousHeight') == 300:
+        view.pop('continuousWidth')
+        view.pop('continuousHeight')
+        if not view:
+            spec['config'].pop('view')
+        if not spec['config']:
+            spec.pop('config')
+    return spec
+
+
+class ChartCache:
+    def __init__(self, max_entries=512, budget=DEFAULT_BUDGET):
+        self.max_entries = max_entries
+        self.budget = budget
+        self._specs = OrderedDict()
+        self._charts = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def prepare(self, name, data, build, reduce=None, budget=None, variant=None):
+        # Returns (reduced data, Vega-Lite spec, report). `build` maps the
+        # reduced frame to an Altair chart; `variant` keys charts whose
+        # encoding depends on more than the data.
+        start = time.perf_counter()
+        budget = budget or self.budget
+        rows_in = len(data)
+        if reduce is not None and rows_in:
+            data = reduce(data)
+        truncated = len(data) > budget
+        if truncated:
+            data = data.head(budget)
+        key = (name, variant, _fingerprint(data))
+        with self._lock:
+            cached = self._specs.get(key)
+            if cached is not None:
+                self._specs.move_to_end(key)
+        hit = cached is not None
+        if not hit:
+            spec = chart_spec(build(data))
+            cached = (spec, len(json.dumps(spec, default=str)), arrow_nbytes(data))
+        spec, spec_bytes, data_bytes = cached
+        report = {
+            'chart': name,
+            'rows_in': rows_in,
+            'rows_out': len(data),
+            'truncated': truncated,
+            'spec_bytes': spec_bytes,
+            'data_bytes': data_bytes,
+            'cache': 'hit' if hit else 'miss',
+            'seconds': time.perf_counter() - start,
+        }
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self._specs[key] = cached
+                while len(self._specs) > self.max_entries:
+                    self._specs.popitem(last=False)
+            self._charts[name] = report
+        return data, spec, report
+
+    def charts(self):
+        # Latest report per chart, largest payload first
+        with self._lock:
+            reports = list(self._charts.values())
+        return sorted(reports, key=lambda r: -(r['spec_bytes'] + r['data_bytes']))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'specs': len(self._specs),
+                'charts': len(self._charts),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'rows_sent': sum(r['rows_out'] for r in self._charts.values()),
+                'rows_reduced': sum(r['rows_in'] - r['rows_out'] for r in self._charts.values()),
+                'payload_bytes': sum(r['spec_bytes'] + r['data_bytes'] for r in self._charts.values()),
+            }
@@ -0,0 +1,288 @@
+import argparse
+import json
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from snapshot import Encoder, to_float
+
+# ------------------------------
+# Churn, cohorts and MRR movements
+# ------------------------------
+# One read of the subscriptions columns feeds every subscription metric
+# of the Subscription & Revenue page, per closed calendar month:
+#   mrr_movements  - MRR and active customers at each month end, and the
+#                    new / reactivated / upgraded / downgraded / churned
+#                    MRR that moved it
+#   churn_by_type  - subscriptions active at the start of the month that
+#                    ended in it without the user moving to another plan
+#   cohorts        - users by the month of their first subscription and
+#                    the share still paying N months later
+#
+# A subscription counts for a month if it is still running at the month
+# end: it started in or before the month and ends (by date, whatever its
+# status) in a later one. Each subscription becomes a +fee event in its
+# start month and a -fee event in its end month; summing the events per
+# (user, month) and running them per user gives every user's MRR before
+# and after each change, and the movements are read off those pairs.
+# Fees are summed in cents so a plan switch nets to exactly zero.
+#
+# Only closed months are computed. refresh() reads the subscriptions that
+# overlap the months closed since the last call and appends those months,
+# so the full history is read once per process.
+#
+#   engine = CohortEngine(backend.read)
+#   engine.refresh()
+#   engine.mrr_movements()
+#
+#   python cohorts.py --backend duckdb --data-dir data --report mrr
+
+SUBSCRIPTIONS_SQL = """
+    SELECT user_id, subscription_type, monthly_fee, subscription_start_date, subscription_end_date
+    FROM subscriptions
+    WHERE subscription_start_date < ?
+      AND (subscription_end_date IS NULL OR subscription_end_date >= ?)"""
+
+# End month of subscriptions without an end date
+OPEN = np.int64(np.iinfo(np.int32).max)
+MOVEMENTS = ['new', 'reactivated', 'upgraded', 'downgraded', 'churned']
+
+
+def month_index(dates):
+    # Dates -> months since 1970-01; NULL -> OPEN
+    months = pd.to_datetime(pd.Series(dates)).to_numpy().astype('datetime64[M]')
+    return np.where(np.isnat(months), OPEN, months.astype(np.int64))
+
+
+def month_start(month):
+    return pd.Timestamp(np.datetime64(int(month), 'M')).date()
+
+
+def closed_month(as_of=None):
+    # Last calendar month that has fully ended by `as_of`
+    as_of = pd.Timestamp(as_of or pd.Timestamp.today())
+    return int(np.datetime64(as_of.date(), 'M').astype(np.int64)) - 1
+
+
+def _by(index, n, weights=None):
+    return np.bincount(index, weights=weights, minlength=n)
+
+
+class CohortEngine:
+    def __init__(self, read):
+        # read(sql, params) -> DataFrame
+        self.read = read
+        self.users = Encoder()
+        self.types = Encoder()
+        self.cohort = np.empty(0, dtype=np.int64)       # first start month per user
+        self.first_active = np.empty(0, dtype=np.int64)  # first paying month end per user
+        self.last_month = None
+        self._months = []
+        self._types = []
+        self._cohorts = []
+        self._lock = threading.Lock()
+        self.rows_read = 0
+        self.refreshes = 0
+        self.last_seconds = 0.0
+
+    def refresh(self, as_of=None):
+        # Appends the months closed since the last call; returns how many
+        target = closed_month(as_of)
+        with self._lock:
+            if self.last_month is not None and target <= self.last_month:
+                return 0
+            start = time.perf_counter()
+            first = self.last_month + 1 if self.last_month is not None else None
+            frame = self.read(SUBSCRIPTIONS_SQL, [month_start(target + 1),
+                                                  month_start(first) if first is not None else '1900-01-01'])
+            if first is None:
+                starts = month_index(frame['subscription_start_date'])
+                first = int(starts.min()) if len(starts) else target
+            added = target - first + 1
+            if added > 0:
+                self._advance(frame, first, target)
+            self.last_month = target
+            self.rows_read += len(frame)
+            self.refreshes += 1
+            self.last_seconds = time.perf_counter() - start
+            return max(added, 0)
+
+    def _advance(self, frame, m0, m1):
+        # Months m0..m1 from the subscriptions overlapping them; users'
+        # cohort and first paying month carry over from earlier months
+        n = m1 - m0 + 1
+        users = self.users.encode(frame['user_id'].to_numpy()).astype(np.int64)
+        types = self.types.encode(frame['subscription_type'].to_numpy()).astype(np.int64)
+        fee = np.rint(to_float(frame['monthly_fee']) * 100).astype(np.int64)
+        start = month_index(frame['subscription_start_date'])
+        end = month_index(frame['subscription_end_date'])
+        n_users, n_types = len(self.users), len(self.types)
+        self.cohort = np.concatenate([self.cohort, np.full(n_users - self.cohort.size, OPEN)])
+        self.first_active = np.concatenate([self.first_active, np.full(n_users - self.first_active.size, OPEN)])
+        np.minimum.at(self.cohort, users, start)
+
+        # Running before m0, starting in the range, ending in the range
+        pre = (start < m0) & (end >= m0)
+        plus = (start >= m0) & (start <= m1)
+        minus = (end >= m0) & (end <= m1)
+        prev0 = _by(users[pre], n_users, fee[pre]).astype(np.int64)
+
+        # Net MRR change per (user, month), sorted by user then month
+        ev_keys = np.concatenate([users[plus] * n + (start[plus] - m0), users[minus] * n + (end[minus] - m0)])
+        keys, inverse = np.unique(ev_keys, return_inverse=True)
+        delta = np.rint(_by(inverse, keys.size, np.concatenate([fee[plus], -fee[minus]]))).astype(np.int64)
+        key_user = keys // n
+        key_month = keys % n
+        run = np.cumsum(delta)
+        firsts = np.flatnonzero(np.r_[True, key_user[1:] != key_user[:-1]]) if keys.size else np.empty(0, np.int64)
+        offset = np.repeat(run[firsts] - delta[firsts], np.diff(np.r_[firsts, keys.size]))
+        curr = prev0[key_user] + run - offset
+        prev = curr - delta
+
+        up = (prev == 0) & (curr > 0)
+        down = (prev > 0) & (curr == 0)
+        up_rows = np.flatnonzero(up)
+        _, first_up = np.unique(key_user[up_rows], return_index=True)
+        first_up = up_rows[first_up]
+        new = np.zeros(keys.size, dtype=bool)
+        new[first_up[self.first_active[key_user[first_up]] == OPEN]] = True
+        self.first_active[key_user[new]] = key_month[new] + m0
+        masks = {
+            'new': new,
+            'reactivated': up & ~new,
+            'upgraded': (prev > 0) & (curr > prev),
+            'downgraded': (curr > 0) & (curr < prev),
+            'churned': down,
+        }
+
+        months = pd.DataFrame({'month': pd.to_datetime(np.arange(m0, m1 + 1).astype('datetime64[M]'))})
+        months['mrr'] = (prev0.sum() + np.cumsum(_by(key_month, n, delta))) / 100.0
+        months['active_customers'] = (prev0 > 0).sum() + np.cumsum(_by(key_month[up], n) - _by(key_month[down], n))
+        for name, mask in masks.items():
+            months[f'{name}_customers'] = _by(key_month[mask], n)
+            months[f'{name}_mrr'] = _by(key_month[mask], n, delta[mask]) / 100.0
+        months['net_new_mrr'] = months[[f'{name}_mrr' for name in MOVEMENTS]].sum(axis=1).round(2)
+        self._months.append(months)
+
+        # Subscription churn by type. A subscription ending in a month that
+        # was running at its start churned unless the user still pays.
+        ended = minus & (start < end)
+        still_paying = curr[np.searchsorted(keys, users[ended] * n + (end[ended] - m0))] > 0
+        cell = types * n
+        starts_cell = cell[plus] + start[plus] - m0
+        ends_cell = cell[minus] + end[minus] - m0
+
+        def running(weights_pre, weights_plus, weights_minus):
+            # Per type at each month end: running before m0 + started - ended
+            change = _by(starts_cell, n_types * n, weights_plus) - _by(ends_cell, n_types * n, weights_minus)
+            return _by(types[pre], n_types, weights_pre)[:, None] + np.cumsum(change.reshape(n_types, n), axis=1)
+
+        active_end = np.rint(running(None, None, None)).astype(np.int64)
+        fee_end = running(fee[pre], fee[plus], fee[minus])
+        active_start = np.concatenate([_by(types[pre], n_types)[:, None], active_end[:, :-1]], axis=1)
+        ended_cell = cell[ended] + end[ended] - m0
+        churned = _by(ended_cell[~still_paying], n_types * n).reshape(n_types, n)
+        switched = _by(ended_cell[still_paying], n_types * n).reshape(n_types, n)
+        by_type = pd.DataFrame({
+            'month': np.tile(months['month'].to_numpy(), n_types),
+            'subscription_type': np.repeat(np.array(self.types.values, dtype=object), n),
+            'active_start': active_start.ravel(),
+            'churned': churned.ravel(),
+            'switched': switched.ravel(),
+            'active_end': active_end.ravel(),
+            'mrr': fee_end.ravel() / 100.0,
+        })
+        by_type['churn_rate'] = (100.0 * by_type['churned'] / by_type['active_start'].replace(0, np.nan)).round(2)
+        self._types.append(by_type[(by_type['active_start'] > 0) | (by_type['active_end'] > 0)])
+
+        # Paying users per (cohort, month): +1 when a user starts paying,
+        # -1 when they stop, run along the months
+        members = self.cohort[self.cohort <= m1]
+        cohort_months, sizes = np.unique(members, return_counts=True)
+        payers = np.flatnonzero(prev0 > 0)
+        c_users = np.concatenate([payers, key_user[up], key_user[down]])
+        c_month = np.concatenate([np.zeros(payers.size, np.int64), key_month[up], key_month[down]])
+        c_sign = np.concatenate([np.ones(payers.size + up.sum()), -np.ones(down.sum())])
+        row = np.searchsorted(cohort_months, self.cohort[c_users])
+        paying = np.cumsum(_by(row * n + c_month, cohort_months.size * n, c_sign).reshape(-1, n), axis=1)
+        c_idx, m_idx = np.nonzero(cohort_months[:, None] <= np.arange(m0, m1 + 1)[None, :])
+        cohorts = pd.DataFrame({
+            'cohort': pd.to_datetime(cohort_months[c_idx].astype('datetime64[M]')),
+            'month': pd.to_datetime((m_idx + m0).astype('datetime64[M]')),
+            'age': m_idx + m0 - cohort_months[c_idx],
+            'size': sizes[c_idx],
+            'active': np.rint(paying[c_idx, m_idx]).astype(np.int64),
+        })
+        cohorts['retention'] = (100.0 * cohorts['active'] / cohorts['size']).round(2)
+        self._cohorts.append(cohorts)
+
+    @staticmethod
+    def _concat(parts, sort):
+        if not parts:
+            return pd.DataFrame()
+        return pd.concat(parts, ignore_index=True).sort_values(sort, kind='stable', ignore_index=True)
+
+    def mrr_movements(self):
+        with self._lock:
+            return self._concat(self._months, ['month'])
+
+    def churn_by_type(self):
+        with self._lock:
+            return self._concat(self._types, ['month', 'subscription_type'])
+
+    def cohorts(self):
+        with self._lock:
+            return self._concat(self._cohorts, ['cohort', 'age'])
+
+    def survival_curve(self):
+        # Share of all cohorts still paying N months after their start
+        # month, over the cohorts old enough to have reached N
+        cohorts = self.cohorts()
+        if cohorts.empty:
+            return pd.DataFrame(columns=['age', 'cohorts', 'size', 'active', 'retention'])
+        curve = cohorts.groupby('age').agg(cohorts=('cohort', 'size'), size=('size', 'sum'),
+                                           active=('active', 'sum')).reset_index()
+        curve['retention'] = (100.0 * curve['active'] / curve['size']).round(2)
+        return curve
+
+    def stats(self):
+        with self._lock:
+            return {
+                'last_month': str(month_start(self.last_month)) if self.last_month is not None else None,
+                'months': sum(len(part) for part in self._months),
+                'users': len(self.users),
+                'types': len(self.types),
+                'rows_read': self.rows_read,
+                'refreshes': self.refreshes,
+                'last_seconds': round(self.last_seconds, 3),
+            }
+
+
+def main():
+    from backends import create_backend
+
+    parser = argparse.ArgumentParser(description="Churn, cohort and MRR movement report")
+    parser.add_argument("--backend", choices=["sqlserver", "duckdb"], default="sqlserver")
+    parser.add_argument("--data-dir", default=None)
+    parser.add_argument("--as-of", default=None, help="Report the months closed by this date (default today)")
+    parser.add_argument("--report", choices=["mrr", "churn", "cohorts", "survival"], default="mrr")
+    args = parser.parse_args()
+
+    backend = create_backend(args.backend, args.data_dir)
+    engine = CohortEngine(backend.read)
+    engine.refresh(args.as_of)
+    frame = {
+        'mrr': engine.mrr_movements,
+        'churn': engine.churn_by_type,
+        'cohorts': engine.cohorts,
+        'survival': engine.survival_curve,
+    }[args.report]()
+    for record in frame.to_dict('records'):
+        print(json.dumps(record, default=str))
+    print(json.dumps(engine.stats()))
+
+
+if __name__ == "__main__":
+    main()
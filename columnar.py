@@ -0,0 +1,198 @@
+import datetime
+import decimal
+import time
+
+import numpy as np
+import pandas as pd
+
+# ------------------------------
+# Columnar result fetching
+# ------------------------------
+# pd.read_sql over pyodbc builds a list of Row objects for the whole
+# result and then lets pandas infer every column from Python objects, so
+# strings stay `object` and DECIMAL values stay `Decimal`. The paths here
+# build typed columns instead:
+#   frame_from_rows    what pd.read_sql does, with the phases timed
+#   frame_from_cursor  pyodbc, fetchmany batches turned into NumPy arrays
+#                      using the cursor's type codes
+#   frame_from_arrow   any pyarrow Table (DuckDB, arrow-odbc)
+#   read_arrow_odbc    SQL Server straight into Arrow buffers, when the
+#                      optional arrow-odbc package is installed
+# All but frame_from_rows compact the result: DECIMAL becomes float64 and
+# low-cardinality strings become categoricals.
+
+FETCH_BATCH_ROWS = 20_000
+
+# A string column becomes categorical when it has at least this many rows
+# and at most this share of distinct values
+CATEGORY_MIN_ROWS = 256
+CATEGORY_MAX_RATIO = 0.5
+
+_FLOAT_TYPES = (float, decimal.Decimal)
+_DATETIME_TYPES = (datetime.datetime, datetime.date)
+
+
+def _is_low_cardinality(n_rows, n_distinct):
+    return n_rows >= CATEGORY_MIN_ROWS and n_distinct <= n_rows * CATEGORY_MAX_RATIO
+
+
+def compact_frame(frame):
+    # Decimal -> float64, low-cardinality strings -> category (in place)
+    for column in range(frame.shape[1]):
+        values = frame.iloc[:, column]
+        # object, or pandas' string dtype
+        if isinstance(values.dtype, pd.CategoricalDtype) or not pd.api.types.is_string_dtype(values.dtype):
+            continue
+        sample = values.dropna()
+        if sample.empty:
+            continue
+        first = sample.iloc[0]
+        if isinstance(first, decimal.Decimal):
+            frame.isetitem(column, values.astype(np.float64))
+        elif isinstance(first, str) and _is_low_cardinality(len(values), values.nunique()):
+            frame.isetitem(column, values.astype('category'))
+    return frame
+
+
+def _to_array(values, type_code):
+    if isinstance(type_code, type) and issubclass(type_code, _FLOAT_TYPES):
+        return np.array(values, dtype=np.float64)
+    if type_code is bool:
+        return np.array(values, dtype=object if None in values else np.bool_)
+    if type_code is int:
+        return np.array(values, dtype=np.float64 if None in values else np.int64)
+    if isinstance(type_code, type) and issubclass(type_code, _DATETIME_TYPES):
+        return np.array(values, dtype='datetime64[ns]')
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _categorical(values):
+    # Encode straight from the object array, so a low-cardinality column
+    # never exists as a full string column
+    codes, uniques = pd.factorize(values, sort=True)
+    if len(uniques) and isinstance(uniques[0], str) and _is_low_cardinality(len(values), len(uniques)):
+        return pd.Categorical.from_codes(codes, uniques)
+    return values
+
+
+def _execute(cursor, sql, params):
+    if params:
+        cursor.execute(sql, params)
+    else:
+        cursor.execute(sql)
+    # Skip row-count-only results, e.g. from a procedure without NOCOUNT
+    while cursor.description is None and cursor.nextset():
+        pass
+
+
+def frame_from_rows(cursor, sql, params=None, timings=None):
+    started = time.perf_counter()
+    _execute(cursor, sql, params)
+    executed = time.perf_counter()
+    if cursor.description is None:
+        rows, columns = [], []
+    else:
+        columns = [column[0] for column in cursor.description]
+        rows = [tuple(row) for row in cursor.fetchall()]
+    fetched = time.perf_counter()
+    frame = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    if timings is not None:
+        timings.update(execute=executed - started, fetch=fetched - executed,
+                       build=time.perf_counter() - fetched)
+    return frame
+
+
+def frame_from_cursor(cursor, sql, params=None, timings=None, batch_size=FETCH_BATCH_ROWS, compact=True):
+    # Only one batch of Row objects is alive at a time; each batch is
+    # converted column by column and the arrays are concatenated at the end
+    started = time.perf_counter()
+    _execute(cursor, sql, params)
+    executed = time.perf_counter()
+    fetch = build = 0.0
+    if cursor.description is None:
+        frame = pd.DataFrame()
+    else:
+        names = [column[0] for column in cursor.description]
+        types = [column[1] for column in cursor.description]
+        parts = [[] for _ in names]
+        while True:
+            batch_start = time.perf_counter()
+            rows = cursor.fetchmany(batch_size)
+            fetched = time.perf_counter()
+            fetch += fetched - batch_start
+            if not rows:
+                break
+            for i, values in enumerate(zip(*rows)):
+                parts[i].append(_to_array(values, types[i]))
+            build += time.perf_counter() - fetched
+        build_start = time.perf_counter()
+        columns = {}
+        for i, arrays in enumerate(parts):
+            values = np.concatenate(arrays) if arrays else _to_array((), types[i])
+            columns[i] = _categorical(values) if compact and values.dtype == object else values
+        frame = pd.DataFrame(columns)
+        frame.columns = names
+        build += time.perf_counter() - build_start
+    if timings is not None:
+        timings.update(execute=executed - started, fetch=fetch, build=build)
+    return frame
+
+
+def frame_from_arrow(table, compact=True):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if compact:
+        columns = []
+        for column in table.columns:
+            if pa.types.is_decimal(column.type):
+                # Arrow's cast is not correctly rounded (415.34 -> 415.34000000000003);
+                # snap to the nearest float of the decimal's scale, as float(Decimal) does
+                scale = 10.0 ** column.type.scale
+                column = pc.divide(pc.round(pc.multiply(pc.cast(column, pa.float64()), scale)), scale)
+            elif ((pa.types.is_string(column.type) or pa.types.is_large_string(column.type))
+                  and _is_low_cardinality(len(column), pc.count_distinct(column).as_py())):
+                column = pc.dictionary_encode(column)
+            columns.append(column)
+        table = pa.Table.from_arrays(columns, names=table.column_names)
+    # DATE columns as datetime64, like pd.read_sql and DuckDB's df()
+    frame = table.to_pandas(date_as_object=False)
+    for column in range(frame.shape[1]):
+        values = frame.iloc[:, column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Dictionaries are in first-seen order; sort so sort_values is alphabetical
+            frame.isetitem(column, values.cat.reorder_categories(sorted(values.cat.categories)))
+    return frame
+
+
+def arrow_odbc_available():
+    try:
+        import arrow_odbc  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def read_arrow_odbc(connection_string, sql, params=None, timings=None, batch_size=FETCH_BATCH_ROWS,
+                    compact=True):
+    # Parameters are bound as text; SQL Server converts them to the column type
+    import pyarrow as pa
+    from arrow_odbc import read_arrow_batches_from_odbc
+
+    started = time.perf_counter()
+    reader = read_arrow_batches_from_odbc(
+        query=sql,
+        connection_string=connection_string,
+        batch_size=batch_size,
+        parameters=None if not params else [None if p is None else str(p) for p in params],
+    )
+    executed = time.perf_counter()
+    table = pa.Table.from_batches(list(reader), schema=reader.schema)
+    fetched = time.perf_counter()
+    frame = frame_from_arrow(table, compact)
+    if timings is not None:
+        timings.update(execute=executed - started, fetch=fetched - executed,
+                       build=time.perf_counter() - fetched)
+    return frame
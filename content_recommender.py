@@ -0,0 +1,402 @@
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import svds
+
+# ------------------------------
+# Content-based recommender over title metadata
+# ------------------------------
+# Each title becomes one L2-normalised vector built from four blocks:
+#   text     - hashed TF-IDF of the description, reduced to `text_dims`
+#              dimensions with a truncated SVD (LSA)
+#   genres   - multi-hot title_genres
+#   category - one-hot type and age_certification, multi-hot
+#              production_countries
+#   numeric  - z-scored runtime, release_year, imdb_score, tmdb_score and
+#              log imdb_votes / tmdb_popularity
+# Blocks are normalised and weighted separately so a long description
+# cannot drown out the rest, then the whole vector is normalised, making
+# cosine similarity a dot product.
+#
+# build() writes the float32 matrix and the title metadata as .npy
+# files; load() memory-maps them, so a process starts in milliseconds and
+# answers queries without touching the database. A query is the user's
+# watched titles weighted by watch_percentage. Catalogues up to
+# `exact_limit` titles are scanned exactly in blocks. Larger ones use an
+# inverted-file index: titles are clustered with spherical k-means and
+# stored list by list, and a query scores only the `n_probe` lists with
+# the closest centroids.
+#
+#   python content_recommender.py build --out content_index
+#   python content_recommender.py similar tm0000042 --index content_index
+#   python content_recommender.py user U0000001 --index content_index
+
+TITLE_FEATURES_SQL = """
+    SELECT title_id, title, type, description, release_year, age_certification, runtime,
+           production_countries, imdb_score, imdb_votes, tmdb_popularity, tmdb_score
+    FROM titles"""
+
+TITLE_GENRES_SQL = """
+    SELECT tg.title_id, g.name AS genre
+    FROM title_genres tg
+    JOIN genres g ON g.genre_id = tg.genre_id"""
+
+# Best watch_percentage per title for one user; repeat watches count once
+USER_HISTORY_SQL = """
+    SELECT title_id, MAX(watch_percentage) AS watch_percentage
+    FROM watch_history
+    WHERE user_id = ?
+    GROUP BY title_id"""
+
+BLOCK_WEIGHTS = {'text': 1.0, 'genres': 1.0, 'category': 0.5, 'numeric': 0.5}
+
+NUMERIC_COLUMNS = ['runtime', 'release_year', 'imdb_score', 'tmdb_score', 'imdb_votes', 'tmdb_popularity']
+LOG_COLUMNS = {'imdb_votes', 'tmdb_popularity'}
+
+STOP_WORDS = frozenset("""
+    a an and are as at be by for from has he her his in is it its of on or she that the their
+    they this to was were when where which who will with after into while""".split())
+
+ARRAYS = ['vectors', 'title_ids', 'titles', 'release_years', 'scores', 'centroids', 'offsets']
+
+
+# -- features -------------------------------------------------------------
+def _hashed_tfidf(descriptions, n_features):
+    # Sublinear-tf, smoothed-idf TF-IDF over hashed description tokens
+    tokens = descriptions.astype(object).fillna('').str.lower().str.findall(r"[a-z0-9]+(?:'[a-z]+)?").explode().dropna()
+    tokens = tokens[~tokens.isin(STOP_WORDS) & (tokens.str.len() > 1)]
+    rows = tokens.index.to_numpy(dtype=np.int64)
+    cols = (pd.util.hash_array(tokens.to_numpy(dtype=object)) % np.uint64(n_features)).astype(np.int64)
+    n = len(descriptions)
+    counts = sparse.csr_matrix((np.ones(rows.size, dtype=np.float32), (rows, cols)), shape=(n, n_features))
+    counts.sum_duplicates()
+    df = np.bincount(counts.indices, minlength=n_features)
+    idf = np.log((1.0 + n) / (1.0 + df)) + 1.0
+    counts.data = (1.0 + np.log(counts.data)) * idf[counts.indices].astype(np.float32)
+    return counts
+
+
+def _lsa(tfidf, dims, seed):
+    # Rows of U * S from a truncated SVD; empty when there is too little text
+    k = min(dims, min(tfidf.shape) - 1)
+    if k < 1 or tfidf.nnz == 0:
+        return np.zeros((tfidf.shape[0], 0), dtype=np.float32)
+    u, s, _ = svds(tfidf.astype(np.float64), k=k, random_state=seed)
+    return (u * s).astype(np.float32)
+
+
+def _one_hot(values):
+    # Text columns can arrive as categoricals (DuckDB, the columnar fetch),
+    # which do not accept a new fill value, hence the object casts here
+    codes, uniques = pd.factorize(values.astype(object).fillna('Unknown'), sort=True)
+    return np.eye(len(uniques), dtype=np.float32)[codes], [str(u) for u in uniques]
+
+
+def _multi_hot(title_codes, labels, n_titles, min_titles=1):
+    # Labels used by fewer than `min_titles` titles are dropped
+    counts = labels.value_counts()
+    keep = counts.index[counts >= min_titles].sort_values()
+    columns = pd.Index(keep)
+    mask = labels.isin(columns).to_numpy()
+    matrix = np.zeros((n_titles, len(columns)), dtype=np.float32)
+    matrix[title_codes[mask], columns.get_indexer(labels[mask])] = 1.0
+    return matrix, [str(c) for c in columns]
+
+
+def _normalise(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def title_features(titles, title_genres, text_dims=64, n_features=2 ** 18, weights=None, seed=0):
+    # (n_titles x dims float32 matrix, feature description) in `titles` order
+    weights = dict(BLOCK_WEIGHTS, **(weights or {}))
+    titles = titles.reset_index(drop=True)
+    n = len(titles)
+    position = pd.Index(titles['title_id'])
+
+    text = _lsa(_hashed_tfidf(titles['description'], n_features), text_dims, seed)
+
+    codes = position.get_indexer(title_genres['title_id'])
+    known = codes >= 0
+    genres, genre_names = _multi_hot(codes[known], title_genres['genre'][known].reset_index(drop=True), n)
+
+    kind, kinds = _one_hot(titles['type'])
+    rating, ratings = _one_hot(titles['age_certification'])
+    countries = titles['production_countries'].astype(object).fillna('').str.findall(r"[A-Z]{2}").explode().dropna()
+    country, country_names = _multi_hot(countries.index.to_numpy(), countries.reset_index(drop=True), n,
+                                        min_titles=max(2, n // 10_000))
+    category = np.hstack([kind, rating, country])
+
+    numeric = np.column_stack([
+        np.log1p(np.clip(pd.to_numeric(titles[c], errors='coerce').to_numpy(dtype=np.float64), 0, None))
+        if c in LOG_COLUMNS else pd.to_numeric(titles[c], errors='coerce').to_numpy(dtype=np.float64)
+        for c in NUMERIC_COLUMNS])
+    mean, std = np.nanmean(numeric, axis=0), np.nanstd(numeric, axis=0)
+    numeric = np.nan_to_num((numeric - np.nan_to_num(mean)) / np.where(std > 0, std, 1.0)).astype(np.float32)
+
+    blocks = {'text': text, 'genres': genres, 'category': category, 'numeric': numeric}
+    vectors = _normalise(np.hstack([_normalise(block) * weights[name] for name, block in blocks.items()]))
+    info = {
+        'dims': {name: int(block.shape[1]) for name, block in blocks.items()},
+        'weights': weights,
+        'genres': genre_names,
+        'categories': kinds + ratings + country_names,
+        'numeric': NUMERIC_COLUMNS,
+    }
+    return vectors.astype(np.float32), info
+
+
+# -- index ----------------------------------------------------------------
+def _kmeans(vectors, n_lists, seed, iterations=10, sample=100_000, block_size=65536):
+    # Spherical k-means on a sample; returns unit-length centroids
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(vectors), min(sample, len(vectors)), replace=False))
+    data = np.asarray(vectors[rows], dtype=np.float32)
+    centroids = data[rng.choice(len(data), n_lists, replace=False)]
+    for _ in range(iterations):
+        labels = _assign(data, centroids, block_size)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        empty = ~sums.any(axis=1)
+        # Empty lists restart from random sample points
+        sums[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+        centroids = _normalise(sums)
+    return centroids
+
+
+def _assign(vectors, centroids, block_size=65536):
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_size):
+        block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+class ContentIndex:
+    def __init__(self, vectors, title_ids, titles=None, release_years=None, scores=None,
+                 centroids=None, offsets=None, meta=None, exact_limit=100_000, n_probe=None, block_size=32768):
+        self.vectors = vectors
+        self.title_ids = title_ids
+        self.titles = titles
+        self.release_years = release_years
+        self.scores = scores
+        self.centroids = centroids
+        self.offsets = offsets
+        self.meta = meta or {}
+        self.exact_limit = exact_limit
+        # Lists scanned per approximate query
+        self.n_probe = n_probe or (max(1, len(centroids) // 8) if centroids is not None else 0)
+        self.block_size = block_size
+        self.n_titles = len(title_ids)
+        self._title_index = None
+        self._lock = threading.Lock()
+        self.queries = {'exact': 0, 'ivf': 0, 'fallback': 0}
+
+    # -- build / persist --------------------------------------------------
+    @classmethod
+    def build(cls, titles, title_genres, text_dims=64, n_lists=None, weights=None, seed=0, **kwargs):
+        start = time.perf_counter()
+        titles = titles.reset_index(drop=True)
+        vectors, info = title_features(titles, title_genres, text_dims=text_dims, weights=weights, seed=seed)
+        # About 4 * sqrt(n) titles per list. Titles are stored list by list, so
+        # every list is one contiguous slice of the matrix.
+        n_lists = n_lists or int(np.clip(np.sqrt(len(titles)) / 4, 1, 4096))
+        centroids = _kmeans(vectors, min(n_lists, max(len(titles), 1)), seed) if len(titles) else \
+            np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        labels = _assign(vectors, centroids) if len(titles) else np.empty(0, dtype=np.int32)
+        order = np.argsort(labels, kind='stable')
+        offsets = np.r_[0, np.cumsum(np.bincount(labels, minlength=len(centroids)))].astype(np.int64)
+        vectors, titles = vectors[order], titles.iloc[order].reset_index(drop=True)
+        meta = dict(info, n_titles=len(titles), n_lists=len(centroids), seed=seed,
+                    built_at=time.strftime('%Y-%m-%dT%H:%M:%S'), build_seconds=round(time.perf_counter() - start, 3))
+        return cls(
+            vectors,
+            titles['title_id'].astype(str).to_numpy(dtype=str),
+            titles['title'].fillna('').astype(str).to_numpy(dtype=str),
+            pd.to_numeric(titles['release_year'], errors='coerce').to_numpy(dtype=np.float64),
+            pd.to_numeric(titles['imdb_score'], errors='coerce').to_numpy(dtype=np.float64),
+            centroids, offsets, meta, **kwargs)
+
+    @classmethod
+    def from_backend(cls, read, **kwargs):
+        return cls.build(read(TITLE_FEATURES_SQL), read(TITLE_GENRES_SQL), **kwargs)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        return directory
+
+    @classmethod
+    def load(cls, directory, **kwargs):
+        # Every array is memory-mapped; nothing is read until it is queried
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in ARRAYS}
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        return cls(meta=meta, **arrays, **kwargs)
+
+    @property
+    def title_index(self):
+        if self._title_index is None:
+            self._title_index = pd.Index(np.asarray(self.title_ids))
+        return self._title_index
+
+    # -- queries ----------------------------------------------------------
+    def profile(self, positions, weights=None):
+        # watch_percentage-weighted mean of the watched titles' vectors
+        positions = np.asarray(positions, dtype=np.int64)
+        if positions.size == 0:
+            return None
+        weights = np.ones(positions.size) if weights is None else \
+            np.nan_to_num(np.asarray(weights, dtype=np.float64))
+        if weights.sum() <= 0:
+            weights = np.ones(positions.size)
+        order = np.argsort(positions)
+        query = weights[order] @ np.asarray(self.vectors[positions[order]], dtype=np.float32)
+        norm = np.linalg.norm(query)
+        return (query / norm).astype(np.float32) if norm > 0 else None
+
+    def _top(self, candidates, scores, k):
+        if candidates.size > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            candidates, scores = candidates[top], scores[top]
+        order = np.lexsort((candidates, -scores))
+        return candidates[order], scores[order]
+
+    def _exact(self, query, k, exclude):
+        best, best_scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        for start in range(0, self.n_titles, self.block_size):
+            scores = np.asarray(self.vectors[start:start + self.block_size], dtype=np.float32) @ query
+            positions = np.arange(start, start + scores.size)
+            if exclude.size:
+                keep = ~np.isin(positions, exclude)
+                positions, scores = positions[keep], scores[keep]
+            best, best_scores = self._top(np.r_[best, positions], np.r_[best_scores, scores], k)
+        return best, best_scores
+
+    def _lists(self, query):
+        # Positions in the `n_probe` lists whose centroids are closest to the query
+        probe = np.argsort(-(self.centroids @ query), kind='stable')[:self.n_probe]
+        return np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in np.sort(probe)])
+
+    def search(self, query, k=10, exclude=None, exact=None):
+        # (title positions, cosine similarities), best first
+        exclude = np.unique(np.asarray(exclude if exclude is not None else [], dtype=np.int64))
+        if exact is None:
+            exact = self.n_titles <= self.exact_limit or self.centroids is None
+        if not exact:
+            candidates = self._lists(query)
+            candidates = candidates[~np.isin(candidates, exclude)]
+            if candidates.size >= k:
+                self._count('ivf')
+                scores = np.asarray(self.vectors[candidates], dtype=np.float32) @ query
+                return self._top(candidates, scores, k)
+            self._count('fallback')
+        self._count('exact')
+        return self._exact(query, k, exclude)
+
+    def _count(self, key):
+        with self._lock:
+            self.queries[key] += 1
+
+    def _frame(self, positions, scores):
+        return pd.DataFrame({
+            'title_id': np.asarray(self.title_ids)[positions].astype(object),
+            'title': np.asarray(self.titles)[positions].astype(object) if self.titles is not None else None,
+            'release_year': np.asarray(self.release_years)[positions] if self.release_years is not None else None,
+            'avg_rating': np.asarray(self.scores)[positions] if self.scores is not None else None,
+            'similarity': np.round(scores.astype(np.float64), 4),
+        })
+
+    def similar(self, title_id, k=10, exact=None):
+        position = self.title_index.get_indexer([title_id])
+        query = self.profile(position[position >= 0])
+        if query is None:
+            return self._frame(np.empty(0, dtype=np.int64), np.empty(0))
+        return self._frame(*self.search(query, k, exclude=position, exact=exact))
+
+    def recommend_history(self, history, limit=5, exact=None):
+        # `history` has title_id and watch_percentage columns (repeats allowed);
+        # watched titles are never recommended
+        if history is None or history.empty:
+            return self._frame(np.empty(0, dtype=np.int64), np.empty(0))
+        positions = self.title_index.get_indexer(history['title_id'])
+        known = positions >= 0
+        weights = pd.Series(pd.to_numeric(history['watch_percentage'], errors='coerce').to_numpy()[known])
+        best = weights.groupby(positions[known]).max()
+        query = self.profile(best.index.to_numpy(), best.to_numpy())
+        if query is None:
+            return self._frame(np.empty(0, dtype=np.int64), np.empty(0))
+        return self._frame(*self.search(query, limit, exclude=best.index.to_numpy(), exact=exact))
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ARRAYS if getattr(self, name) is not None)
+
+    def stats(self):
+        with self._lock:
+            queries = dict(self.queries)
+        return {
+            'titles': self.n_titles,
+            'dims': int(self.vectors.shape[1]),
+            'mb': round(self.nbytes() / 2 ** 20, 1),
+            'mode': 'exact' if self.n_titles <= self.exact_limit else 'ivf',
+            'queries': queries,
+            'built_at': self.meta.get('built_at'),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query the content-based title index")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help="Build the index from the titles table")
+    build.add_argument('--out', default='content_index')
+    build.add_argument('--text-dims', type=int, default=64)
+    build.add_argument('--lists', type=int, default=None)
+    similar = sub.add_parser('similar', help="Titles most like one title")
+    similar.add_argument('title_id')
+    user = sub.add_parser('user', help="Recommendations from a user's watch history")
+    user.add_argument('user_id')
+    for query in (similar, user):
+        query.add_argument('--index', default='content_index')
+        query.add_argument('--limit', type=int, default=10)
+        query.add_argument('--exact', action='store_true', default=None)
+    args = parser.parse_args()
+
+    from backends import create_backend
+
+    if args.command == 'build':
+        backend = create_backend()
+        index = ContentIndex.from_backend(backend.read, text_dims=args.text_dims, n_lists=args.lists)
+        backend.close()
+        index.save(args.out)
+        print(json.dumps(dict(index.stats(), out=args.out, build_seconds=index.meta['build_seconds'])))
+        return
+
+    history = None
+    if args.command == 'user':
+        # Only the user's history comes from the database
+        backend = create_backend()
+        history = backend.read(USER_HISTORY_SQL, [args.user_id])
+        backend.close()
+    start = time.perf_counter()
+    index = ContentIndex.load(args.index)
+    loaded = time.perf_counter()
+    if args.command == 'similar':
+        result = index.similar(args.title_id, args.limit, exact=args.exact)
+    else:
+        result = index.recommend_history(history, args.limit, exact=args.exact)
+    done = time.perf_counter()
+    print(result.to_string(index=False))
+    print(json.dumps({'load_ms': round((loaded - start) * 1000, 2), 'query_ms': round((done - loaded) * 1000, 2)}))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from snapshot import AGE_GROUPS, _expand_ranges, _grow, sql_round
+
+# ------------------------------
+# Pre-aggregated watch cube
+# ------------------------------
+# Additive measures over watch_history, keyed by the watching user's
+# country, age group and subscription type, the title's genre and the
+# day of the event:
+#   watches      COUNT(watch_id)
+#   pct_sum      SUM(watch_percentage) in hundredths, so sums are exact
+#   pct_count    COUNT(watch_percentage), for AVG over non-NULL values
+#   completed    SUM(completed)
+# Averages are always derived as pct_sum / pct_count after rolling up.
+#
+# Genre and subscription type are many-to-many: an event counts once per
+# genre of its title and once per subscription row of its user, as the
+# page queries' joins do. Each of these two axes has an extra ALL slot
+# holding every event once, which is what a roll-up over that axis reads
+# instead of a sum over its slots.
+#
+# Only non-empty cells are stored, as sorted int64 keys packed from the
+# slot of every dimension plus narrow measure columns. The cube follows
+# a ColumnarSnapshot: new events are added as they are applied, and a
+# user's new subscriptions restate the user's earlier events.
+
+DIMENSIONS = ('country', 'genre', 'age_group', 'subscription_type', 'day')
+
+# (bits, shift) per dimension, lowest bits first
+_LAYOUT = {'day': (20, 0), 'subscription_type': (8, 20), 'age_group': (4, 28), 'genre': (12, 32), 'country': (14, 44)}
+ALL_GENRES = (1 << _LAYOUT['genre'][0]) - 1
+ALL_TYPES = (1 << _LAYOUT['subscription_type'][0]) - 1
+NULL_DAY = (1 << _LAYOUT['day'][0]) - 1
+
+MEASURES = {'watches': np.int32, 'pct_sum': np.int64, 'pct_count': np.int32, 'completed': np.int32}
+
+# Events fanned out per step while building
+_BUILD_EVENTS = 500_000
+
+
+def _pack(slots):
+    key = np.zeros(len(next(iter(slots.values()))), dtype=np.int64)
+    for name, values in slots.items():
+        key |= np.asarray(values, dtype=np.int64) << _LAYOUT[name][1]
+    return key
+
+
+def _slot(keys, name):
+    bits, shift = _LAYOUT[name]
+    return (keys >> shift) & ((1 << bits) - 1)
+
+
+class WatchCube:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.keys = np.empty(0, dtype=np.int64)
+        self.measures = {name: np.empty(0, dtype=dtype) for name, dtype in MEASURES.items()}
+        self.snapshot = None
+        self.watermark = 0
+        # (user, subscription type) row counts the cells currently reflect
+        self._sub_counts = np.zeros((0, 0), dtype=np.int32)
+
+    def __len__(self):
+        return self.keys.size
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        if not snapshot.keep_events:
+            raise ValueError("WatchCube needs a snapshot that keeps its events")
+        with snapshot._lock:
+            cube = cls()
+            cube.snapshot = snapshot
+            cube._sub_counts = snapshot.user_sub_counts.copy()
+            events = snapshot.events
+            for start in range(0, events.size, _BUILD_EVENTS):
+                cube._add(*(events[column][start:start + _BUILD_EVENTS] for column in
+                            ('user', 'title', 'watch_percentage', 'completed', 'created_at')), cube._sub_counts)
+            if events.size:
+                cube.watermark = int(events['watch_id'].max())
+            snapshot.subscribe(cube._on_events)
+        return cube
+
+    # -- maintenance ------------------------------------------------------
+    def _on_events(self, snapshot, batch):
+        with self._lock:
+            self._sync_subscriptions()
+            # Events are only ever added once, e.g. if the snapshot reloads
+            new = batch['watch_id'] > self.watermark
+            if not new.any():
+                return
+            self._add(batch['user'][new], batch['title'][new], batch['watch_percentage'][new],
+                      batch['completed'][new], batch['created_at'][new], self._sub_counts)
+            self.watermark = int(batch['watch_id'][new].max())
+
+    def _sync_subscriptions(self):
+        # Subscriptions loaded since the cells were built join every earlier
+        # event of their user, so those events are added again under the
+        # new subscription type (the ALL slot does not change)
+        current = self.snapshot.user_sub_counts
+        shape = current.shape
+        if self._sub_counts.shape == shape and np.array_equal(self._sub_counts, current):
+            return
+        previous = np.zeros(shape, dtype=np.int32)
+        old = self._sub_counts[:shape[0], :shape[1]]
+        previous[:old.shape[0], :old.shape[1]] = old
+        delta = current - previous
+        self._sub_counts = current.copy()
+        changed = np.flatnonzero(delta.any(axis=1))
+        events = self.snapshot.events
+        if not changed.size or not events.size:
+            return
+        rows = np.flatnonzero(np.isin(events['user'], changed) & (events['watch_id'] <= self.watermark))
+        if rows.size:
+            self._add(*(events[column][rows] for column in
+                        ('user', 'title', 'watch_percentage', 'completed', 'created_at')), delta, new=False)
+
+    def _add(self, users, titles, pct, completed, created_at, sub_counts, new=True):
+        snapshot = self.snapshot
+        n = users.size
+        if not n:
+            return
+        users = users.astype(np.int64)
+        has_pct = ~np.isnan(pct)
+        hundredths = np.where(has_pct, np.rint(np.nan_to_num(pct) * 100), 0).astype(np.int64)
+        days = created_at.astype('datetime64[D]')
+        days = np.where(np.isnat(days), NULL_DAY, days.astype(np.int64))
+
+        # (event, genre slot): one row per genre of the title, plus ALL
+        genre_event, flat = _expand_ranges(snapshot.tg_indptr, titles)
+        genre_event = np.concatenate([genre_event, np.arange(n)])
+        genre = np.concatenate([snapshot.tg_genres[flat].astype(np.int64), np.full(n, ALL_GENRES)])
+
+        # (event, type slot, weight): one row per subscription row of the
+        # user, plus ALL for events not counted before, grouped by event
+        counts = _grow(sub_counts, snapshot.user_sub_type.shape[0])[users]
+        type_event, sub_type = np.nonzero(counts)
+        weight = counts[type_event, sub_type].astype(np.int64)
+        if new:
+            type_event = np.concatenate([type_event, np.arange(n)])
+            sub_type = np.concatenate([sub_type, np.full(n, ALL_TYPES)])
+            weight = np.concatenate([weight, np.ones(n, dtype=np.int64)])
+        order = np.argsort(type_event, kind='stable')
+        type_event, sub_type, weight = type_event[order], sub_type[order], weight[order]
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(type_event, minlength=n))])
+
+        # Every genre row joins every type row of its event
+        pair, flat = _expand_ranges(indptr, genre_event)
+        event = genre_event[pair]
+        user = users[event]
+        keys = _pack({
+            'country': snapshot.user_country[user].astype(np.int64) + 1,
+            'genre': genre[pair],
+            'age_group': snapshot.user_age_group[user],
+            'subscription_type': sub_type[flat],
+            'day': days[event],
+        })
+        weight = weight[flat]
+        self._merge(keys, {
+            'watches': weight,
+            'pct_sum': hundredths[event] * weight,
+            'pct_count': has_pct[event] * weight,
+            'completed': completed[event].astype(np.int64) * weight,
+        })
+
+    def _merge(self, keys, measures):
+        unique, inverse = np.unique(keys, return_inverse=True)
+        sums = {name: np.bincount(inverse, weights=values, minlength=unique.size).astype(np.int64)
+                for name, values in measures.items()}
+        at = np.searchsorted(self.keys, unique)
+        hit = at < self.keys.size
+        hit[hit] = self.keys[at[hit]] == unique[hit]
+        for name, values in sums.items():
+            np.add.at(self.measures[name], at[hit], values[hit].astype(MEASURES[name]))
+        fresh = ~hit
+        if fresh.any():
+            self.keys = np.insert(self.keys, at[fresh], unique[fresh])
+            for name, values in sums.items():
+                self.measures[name] = np.insert(self.measures[name], at[fresh], values[fresh].astype(MEASURES[name]))
+
+    # -- queries ----------------------------------------------------------
+    def _codes(self, name, values):
+        # Slots for dimension labels
+        snapshot = self.snapshot
+        values = list(values)
+        if name == 'country':
+            return [0 if value is None else snapshot.countries.codes.get(value, -2) + 1 for value in values]
+        if name == 'genre':
+            names = list(snapshot.genre_name)
+            return [names.index(value) if value in names else -1 for value in values]
+        if name == 'age_group':
+            return [AGE_GROUPS.index(value) if value in AGE_GROUPS else -1 for value in values]
+        if name == 'subscription_type':
+            return [snapshot.sub_types.codes.get(value, -1) for value in values]
+        return list(pd.to_datetime(values).values.astype('datetime64[D]').astype(np.int64))
+
+    def _labels(self, name, slots):
+        snapshot = self.snapshot
+        if name == 'country':
+            return np.array([None] + snapshot.countries.values, dtype=object)[slots]
+        if name == 'genre':
+            return np.asarray(snapshot.genre_name, dtype=object)[slots]
+        if name == 'age_group':
+            return np.array(AGE_GROUPS, dtype=object)[slots]
+        if name == 'subscription_type':
+            return np.array(snapshot.sub_types.values, dtype=object)[slots]
+        return np.where(slots == NULL_DAY, np.datetime64('NaT'), slots.astype('datetime64[D]'))
+
+    def query(self, by=(), where=None):
+        # Rolls the cube up to the `by` dimensions over the cells matching
+        # `where`: {dimension: label or list of labels}, or (start, end)
+        # dates for 'day' (inclusive). Filtering genre or subscription_type
+        # to several values counts an event once per matching value.
+        by, where = list(by), dict(where or {})
+        for name in by + list(where):
+            if name not in DIMENSIONS:
+                raise ValueError(f"Unknown dimension {name}")
+        with self._lock, self.snapshot._lock:
+            self._sync_subscriptions()
+            keys = self.keys
+            mask = np.ones(keys.size, dtype=bool)
+            for name, everything in (('genre', ALL_GENRES), ('subscription_type', ALL_TYPES)):
+                slots = _slot(keys, name)
+                mask &= (slots != everything) if name in by or name in where else (slots == everything)
+            for name, value in where.items():
+                slots = _slot(keys, name)
+                if name == 'day' and isinstance(value, tuple):
+                    low, high = self._codes('day', value)
+                    mask &= (slots >= low) & (slots <= high)
+                else:
+                    values = value if isinstance(value, (list, tuple, set)) else [value]
+                    mask &= np.isin(slots, self._codes(name, values))
+            keys = keys[mask]
+            group_mask = _pack({name: [(1 << _LAYOUT[name][0]) - 1] for name in by})[0] if by else 0
+            groups, inverse = np.unique(keys & group_mask, return_inverse=True)
+            sums = {name: np.bincount(inverse, weights=values[mask], minlength=groups.size).astype(np.int64)
+                    for name, values in self.measures.items()}
+            df = pd.DataFrame({name: self._labels(name, _slot(groups, name)) for name in by})
+        for name, values in sums.items():
+            df[name] = values
+        with np.errstate(invalid='ignore', divide='ignore'):
+            df['avg_watch_percentage'] = np.where(df['pct_count'] > 0, sql_round(df['pct_sum'] / df['pct_count']),
+                                                  np.nan)
+        return df
+
+    # -- page answers -----------------------------------------------------
+    def country_genre(self):
+        df = self.query(['country', 'genre'])
+        df = df[df['watches'] > 0].rename(columns={'watches': 'total_watches'})
+        df = df[['country', 'genre', 'avg_watch_percentage', 'total_watches']]
+        return df.sort_values(['country', 'avg_watch_percentage'], ascending=[True, False],
+                              na_position='first', kind='stable').reset_index(drop=True)
+
+    def age_group_subscription(self):
+        # users_in_segment is a distinct count, which no cube cell can add
+        # up to; it comes from the snapshot's user dimension
+        cells = self.query(['age_group', 'subscription_type'])
+        with self.snapshot._lock:
+            segments = self.snapshot.age_group_subscription()[['age_group', 'subscription_type', 'users_in_segment']]
+        df = segments.merge(cells, on=['age_group', 'subscription_type'], how='left')
+        df['total_watch_events'] = df['watches'].fillna(0).astype(np.int64)
+        df['total_watch_percentage'] = np.where(df['pct_count'] > 0, df['pct_sum'], np.nan)
+        return df[['age_group', 'subscription_type', 'users_in_segment', 'total_watch_events',
+                   'avg_watch_percentage', 'total_watch_percentage']]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'cells': len(self),
+                'bytes': self.keys.nbytes + sum(values.nbytes for values in self.measures.values()),
+                'watermark': self.watermark,
+            }
+
+
+# Page plan entries (see page_queries.py) the cube can answer
+CUBE_QUERIES = {
+    "country_genre": WatchCube.country_genre,
+    "age_group_subscription": WatchCube.age_group_subscription,
+}
@@ -1,71 +1,428 @@
 import streamlit as st
 import pandas as pd
-import pyodbc
+import io
 import altair as alt
+import os
+import threading
+import time
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from backends import SqlServerBackend, create_backend
+from chart_data import ChartCache, bin_scatter, decimate, top_k
+from cohorts import MOVEMENTS, CohortEngine
+from content_recommender import USER_HISTORY_SQL, ContentIndex
+from cube import CUBE_QUERIES, DIMENSIONS, WatchCube
+from instrumentation import QueryStats, query_labels
+from item_cf import ItemItemIndex
+from maintenance import DeferredMaintainer
+from page_queries import PAGE_QUERIES, PAGED_QUERIES, SEARCH_INDEXES
+from pagination import count_frame, count_rows, export_csv, read_page, slice_frame
+from query_cache import QueryCache, frame_nbytes
+from query_plan import run_plan
+from recommender import GenreRecommender
+from rollups import TrendRollups
+from search_index import SearchIndex
+from sketches import APPROX_QUERIES, ApproximateAggregates
+from snapshot import SNAPSHOT_QUERIES, ColumnarSnapshot
+from warmup import WarmupScheduler, page_jobs
+from watch_writer import WatchWriter
 
 # ------------------------------
 # Database connection configuration
 # ------------------------------
 @st.cache_resource
-def init_connection():
-    drivers = [x for x in pyodbc.drivers() if 'SQL Server' in x]
+def init_pool():
+    # pyodbc needs libodbc, so only the SQL Server path imports it
+    import pyodbc
+    from db_pool import ConnectionPool, find_sql_server_drivers, resolve_connect
+
+    drivers = find_sql_server_drivers()
     for driver in drivers:
         print(f"Found driver: {driver}")
-    
-    drivers_sorted = sorted(drivers, key=lambda x: '18' in x, reverse=True)
-    
+
     if not drivers:
         st.error("No SQL Server ODBC drivers found. Please install msodbcsql17.")
         st.info(f"Available drivers: {pyodbc.drivers()}")
         return None
-    
-    # st.info("Attempting to connect to SQL Server...")
-    
-    for driver in drivers_sorted:
-        try:
-            conn = pyodbc.connect(
-                f'DRIVER={{{driver}}};'
-                'SERVER=0.0.0.0,1433;'
-                'DATABASE=netflix_analytics;'
-                'UID=sa;'
-                'PWD=p@ssw0rd;'
-                'TrustServerCertificate=yes;'
-                'Encrypt=no;'
 
-            )
-            cursor = conn.cursor()
-            cursor.execute("SELECT @@VERSION")
-            version = cursor.fetchone()[0]
-            cursor.close()
-            # st.success(f"Connected using driver: {driver}")
-            return conn
-        except pyodbc.Error as e:
-            print(f"Failed with {driver}: {str(e)}")
-            continue
-        except Exception as e:
-            print(f"Unexpected error with {driver}: {str(e)}")
-            continue
-    
-    st.error(f"Database connection failed with all available drivers: {drivers}")
-    return None
+    try:
+        connect = resolve_connect(drivers)
+    except pyodbc.Error as e:
+        st.error(str(e))
+        return None
+
+    # One pool shared by every session; each query checks out its own connection
+    return ConnectionPool(connect, max_size=8, timeout=30, max_idle_seconds=300)
+
+@st.cache_resource
+def init_backend():
+    # NETFLIX_BACKEND=duckdb runs everything against an embedded replica
+    # loaded from NETFLIX_DATA_DIR instead of SQL Server
+    if os.environ.get("NETFLIX_BACKEND", "sqlserver").lower() == "duckdb":
+        return create_backend("duckdb")
+    pool = init_pool()
+    if pool is None:
+        return None
+    return SqlServerBackend(pool)
 
 # ------------------------------
 # Query execution function
 # ------------------------------
-@st.cache_data(ttl=600)
-def run_query(query=None):
-    conn = init_connection()
-    if conn is None:
+@st.cache_resource
+def init_query_cache():
+    # Shared by every session; bounded by result size rather than entry count
+    return QueryCache(max_bytes=256 * 2**20, ttl=600)
+
+@st.cache_resource
+def init_query_stats():
+    # Rolling window of query timings shown on the Performance page
+    return QueryStats(max_records=5000, labels=query_labels(PAGE_QUERIES))
+
+def run_query(query=None, params=None, scope=None, label=None):
+    backend = init_backend()
+    if backend is None:
         return pd.DataFrame()
+    stats = init_query_stats()
+    timings = {}
+    start = time.perf_counter()
     try:
         if query is not None:
-            df = pd.read_sql(query, conn)
-            return df
+            data = init_query_cache().get_or_load(
+                query, params,
+                lambda: backend.read(query, params, timings=timings),
+                scope=scope,
+            )
+            # Phases are only filled in when this call ran the loader
+            stats.record(query, time.perf_counter() - start, label=label, rows=len(data),
+                         nbytes=frame_nbytes(data), cache="miss" if timings else "hit", **timings)
+            # Shallow copy so callers can add columns without touching the cache
+            return data.copy(deep=False)
         return "HI"
     except Exception as e:
+        stats.record(query, time.perf_counter() - start, label=label, error=str(e), **timings)
         st.error(f"Query execution failed: {e}")
         return pd.DataFrame()
 
+@st.cache_resource
+def init_warmup():
+    backend = init_backend()
+    if backend is None or os.environ.get("NETFLIX_WARMUP", "1") == "0":
+        return None
+    # Loads every page's queries in the background as soon as the first
+    # session starts, then reloads them before they expire
+    return WarmupScheduler(init_query_cache(), backend.read, page_jobs(PAGE_QUERIES, PAGED_QUERIES),
+                           stats=init_query_stats()).start()
+
+@st.cache_resource
+def init_watch_writer():
+    backend = init_backend()
+    if backend is None:
+        return None
+    # Watch events from every session are batched into group commits
+    return WatchWriter(backend, max_batch=2000, max_latency=0.05)
+
+@st.cache_resource
+def init_maintainer():
+    backend = init_backend()
+    if backend is None or backend.name != "sqlserver":
+        return None
+    # Applies watch_time_hours periodically when deferred maintenance is on
+    return DeferredMaintainer(backend.pool, interval=30).start()
+
+@st.cache_resource
+def init_trend_rollups():
+    backend = init_backend()
+    if backend is None:
+        return None
+    # Brings watch_rollups up to date before the Trends page reads it
+    return TrendRollups(backend)
+
+@st.cache_resource
+def init_cohorts():
+    backend = init_backend()
+    if backend is None:
+        return None
+    # Closed-month churn, cohort and MRR results, extended as months close
+    return CohortEngine(backend.read)
+
+# ------------------------------
+# In-memory snapshot engine (optional)
+# ------------------------------
+@st.cache_resource
+def init_snapshot():
+    backend = init_backend()
+    if backend is None:
+        return None
+    # NETFLIX_APPROXIMATE=1 drops the exact distinct-pair sets for good
+    snapshot = ColumnarSnapshot(backend.read, exact_distinct=os.environ.get("NETFLIX_APPROXIMATE") != "1")
+    snapshot.load()
+    return snapshot
+
+@st.cache_resource
+def init_recommender():
+    snapshot = init_snapshot()
+    if snapshot is None:
+        return None
+    return GenreRecommender.from_snapshot(snapshot)
+
+@st.cache_resource
+def init_item_index():
+    snapshot = init_snapshot()
+    if snapshot is None:
+        return None
+    return ItemItemIndex.from_snapshot(snapshot)
+
+@st.cache_resource
+def init_content_index():
+    # Memory-mapped from NETFLIX_CONTENT_INDEX; built from the titles table
+    # and saved there on first use
+    path = os.environ.get("NETFLIX_CONTENT_INDEX", "content_index")
+    if os.path.exists(os.path.join(path, "meta.json")):
+        return ContentIndex.load(path)
+    backend = init_backend()
+    if backend is None:
+        return None
+    index = ContentIndex.from_backend(backend.read)
+    try:
+        index.save(path)
+    except OSError as e:
+        print(f"Content index not saved to {path}: {e}")
+    return index
+
+@st.cache_resource
+def init_cube():
+    snapshot = init_snapshot()
+    if snapshot is None:
+        return None
+    return WatchCube.from_snapshot(snapshot)
+
+@st.cache_resource
+def init_sketches():
+    snapshot = init_snapshot()
+    if snapshot is None:
+        return None
+    return ApproximateAggregates.from_snapshot(snapshot)
+
+@st.cache_resource
+def init_search_indexes():
+    backend = init_backend()
+    if backend is None:
+        return None
+    # Typeahead indexes for the Recommender Demo, built once per process
+    indexes = {name: SearchIndex(backend.read, **config) for name, config in SEARCH_INDEXES.items()}
+    for index in indexes.values():
+        index.load()
+    return indexes
+
+# ------------------------------
+# Page query plans
+# ------------------------------
+def fetch_page(page_name):
+    plan = dict(PAGE_QUERIES[page_name])
+    results = {}
+    snapshot = init_snapshot() if use_snapshot else None
+    if snapshot is not None:
+        # Only new watch events are pulled; aggregates are answered locally
+        snapshot.refresh(min_interval=30)
+        stats = init_query_stats()
+        cube = init_cube()
+        approximate = use_approximate or not snapshot.exact_distinct
+        sketches = init_sketches() if approximate else None
+        for name in [name for name in plan if name in SNAPSHOT_QUERIES]:
+            # Distinct counts and averages from sketches in approximate mode,
+            # segment breakdowns rolled up from the cube otherwise
+            if approximate and name in APPROX_QUERIES:
+                kind, answer = "approx", lambda: APPROX_QUERIES[name](sketches)
+            elif name in CUBE_QUERIES:
+                kind, answer = "cube", lambda: CUBE_QUERIES[name](cube)
+            else:
+                kind, answer = "snapshot", lambda: SNAPSHOT_QUERIES[name](snapshot)
+            start = time.perf_counter()
+            results[name] = answer()
+            elapsed = time.perf_counter() - start
+            stats.record(plan[name], elapsed, kind=kind, rows=len(results[name]),
+                         nbytes=frame_nbytes(results[name]), build=elapsed)
+            del plan[name]
+
+    # Paged tables the snapshot did not answer fetch one page at a time
+    # (see paged_table) instead of the whole result
+    for name in [name for name in plan if name in PAGED_QUERIES]:
+        del plan[name]
+
+    # Run the remaining queries concurrently; worker threads share this
+    # session's script context so st.cache_resource and st.error work.
+    ctx = get_script_run_ctx()
+    fetched, _, _ = run_plan(
+        plan, run_query,
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx),
+    )
+    results.update(fetched)
+    return results
+
+def refresh_trend_rollups():
+    # Adds events written since the last refresh to their buckets; cached
+    # trend results are only evicted when some bucket changed
+    rollups = init_trend_rollups()
+    if rollups is None:
+        return None
+    start = time.perf_counter()
+    try:
+        run = rollups.refresh(min_interval=60)
+    except Exception as e:
+        init_query_stats().record(None, time.perf_counter() - start, kind="rollup", label="Trends/apply_rollups",
+                                  error=str(e))
+        st.error(f"Trend rollup refresh failed: {e}")
+        return None
+    if run is not None:
+        elapsed = time.perf_counter() - start
+        init_query_stats().record(None, elapsed, kind="rollup", label="Trends/apply_rollups",
+                                  rows=run["buckets_updated"], execute=elapsed)
+        if run["buckets_updated"]:
+            init_query_cache().invalidate({'watch_rollups'})
+    return run
+
+def refresh_cohorts():
+    # Reads the subscriptions of months closed since the last refresh;
+    # a no-op until the next month boundary
+    engine = init_cohorts()
+    if engine is None:
+        return None
+    start = time.perf_counter()
+    try:
+        added = engine.refresh()
+    except Exception as e:
+        init_query_stats().record(None, time.perf_counter() - start, kind="cohort", label=f"{page}/cohorts",
+                                  error=str(e))
+        st.error(f"Cohort refresh failed: {e}")
+        return None
+    elapsed = time.perf_counter() - start
+    init_query_stats().record(None, elapsed, kind="cohort", label=f"{page}/cohorts", rows=added,
+                              cache="miss" if added else "hit", build=elapsed)
+    return engine
+
+def error_bounds_caption(data):
+    # Approximate answers carry a <column>_error column per estimate
+    estimated = [column[:-len("_error")] for column in data.columns if column.endswith("_error")]
+    if estimated:
+        st.caption(f"Approximate: {', '.join(estimated)} are estimates; each *_error column is a 95% error bound.")
+
+# ------------------------------
+# Paged tables
+# ------------------------------
+def _next_page(state, cursor):
+    state["cursors"].append(cursor)
+
+def _previous_page(state):
+    state["cursors"].pop()
+
+def paged_table(name, local=None, page_size=None):
+    # Shows one keyset page of PAGED_QUERIES[name] with search, sort and
+    # Prev/Next controls, and returns it. `local` is the full result when
+    # the snapshot already answered the query; pages are then sliced from
+    # it instead of read from the backend.
+    query = PAGED_QUERIES[name]
+    page_size = page_size or query.page_size
+    col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
+    search = col1.text_input("Search", key=f"{name}_search", placeholder="Starts with...").strip() or None
+    sort = col2.selectbox("Sort by", query.sortable, index=query.sortable.index(query.sort), key=f"{name}_sort")
+    descending = col3.checkbox("Descending", value=query.descending, key=f"{name}_descending")
+    sizes = sorted({page_size, 25, 50, 100, 500})
+    size = col4.selectbox("Rows", sizes, index=sizes.index(page_size), key=f"{name}_size")
+
+    # Cursors of the pages visited so far; any new option starts over
+    state = st.session_state.setdefault(f"{name}_pages", {"options": None, "cursors": [None]})
+    options = (search, sort, descending, size)
+    if state["options"] != options:
+        state.update(options=options, cursors=[None])
+
+    if local is not None:
+        data, next_cursor = slice_frame(local, query, size, state["cursors"][-1], sort, descending,
+                                        search=search)
+        total = count_frame(local, query, search=search)
+    else:
+        label = f"{page}/{name}"
+        data, next_cursor = read_page(lambda sql, params: run_query(sql, params, label=f"{label}[page]"),
+                                      query, size, state["cursors"][-1], sort, descending, search=search)
+        total = count_rows(lambda sql, params: run_query(sql, params, label=f"{label}[count]"),
+                           query, search=search)
+    st.dataframe(data, use_container_width=True)
+
+    first = (len(state["cursors"]) - 1) * size
+    col1, col2, col3, col4 = st.columns([1, 1, 3, 2])
+    col1.button("Previous", key=f"{name}_previous", disabled=len(state["cursors"]) == 1,
+                on_click=_previous_page, args=(state,))
+    col2.button("Next", key=f"{name}_next", disabled=next_cursor is None,
+                on_click=_next_page, args=(state, next_cursor))
+    col3.caption(f"Rows {first + 1 if len(data) else 0:,}-{first + len(data):,} of {total:,}")
+
+    # Streams the whole result in chunks rather than as one frame; only
+    # the CSV text is held for the download
+    if col4.button("Prepare CSV export", key=f"{name}_export"):
+        buffer = io.StringIO()
+        start = time.perf_counter()
+        if local is not None:
+            rows = len(local)
+            slice_frame(local, query, rows, None, sort, descending, search=search)[0].to_csv(buffer, index=False)
+        else:
+            rows = export_csv(init_backend().read, query, buffer, sort=sort, descending=descending, search=search)
+        init_query_stats().record(None, time.perf_counter() - start, kind="export", label=f"{page}/{name}",
+                                  rows=rows, nbytes=buffer.tell())
+        col4.download_button("Download CSV", buffer.getvalue(), file_name=f"{name}.csv", mime="text/csv",
+                             key=f"{name}_download")
+    return data
+
+# ------------------------------
+# Typeahead search
+# ------------------------------
+def search_index(name, text, limit=100):
+    index = init_search_indexes()[name]
+    start = time.perf_counter()
+    matches = index.search(text, limit=limit)
+    elapsed = time.perf_counter() - start
+    init_query_stats().record(None, elapsed, kind="search", label=f"Recommender Demo/{name}_search",
+                              rows=len(matches), build=elapsed)
+    return matches
+
+# Labels resolve through the indexes' id -> row lookup
+def user_label(user_id):
+    return f"{init_search_indexes()['users'].get(user_id)['name']} ({user_id})"
+
+def title_label(title_id):
+    # Titles can repeat, so the year and id tell them apart
+    row = init_search_indexes()["titles"].get(title_id)
+    year = f" ({int(row['release_year'])})" if pd.notna(row['release_year']) else ""
+    return f"{row['title']}{year} [{title_id}]"
+
+# ------------------------------
+# Charts
+# ------------------------------
+@st.cache_resource
+def init_chart_cache():
+    # Vega-Lite specs of the reduced chart data, shared by every session
+    return ChartCache(max_entries=512, budget=1000)
+
+def show_chart(name, data, build, reduce=None, budget=None, variant=None, use_container_width=True):
+    # build(data) -> Altair chart. `reduce` folds the data down to what the
+    # chart can show; whatever is left over the row budget is cut.
+    data, spec, report = init_chart_cache().prepare(f"{page}/{name}", data, build, reduce, budget, variant)
+    st.vega_lite_chart(data, spec, use_container_width=use_container_width)
+    if report['truncated']:
+        st.caption(f"Chart shows the first {report['rows_out']:,} of {report['rows_in']:,} rows.")
+    init_query_stats().record(None, report['seconds'], kind="chart", label=f"{report['chart']}[chart]",
+                              rows=report['rows_out'], nbytes=report['spec_bytes'] + report['data_bytes'], cache=report['cache'],
+                              build=report['seconds'])
+
+def bar_chart(name, data, category, value, k=25, height=None):
+    # Ranked bars for the k largest values, the rest folded into "Other"
+    def build(data):
+        chart = alt.Chart(data).mark_bar().encode(
+            x=alt.X(f'{category}:N', sort='-y', title=category.replace('_', ' ').title()),
+            y=alt.Y(f'{value}:Q', title=value.replace('_', ' ').title()),
+            tooltip=[category, value],
+        )
+        return chart.properties(height=height) if height else chart
+    show_chart(name, data[[category, value]], build, reduce=lambda d: top_k(d, category, value, k))
+
 # ------------------------------
 # Streamlit App Layout
 # ------------------------------
@@ -74,41 +431,67 @@ st.title("Netflix Analytics Dashboard")
 
 page = st.sidebar.selectbox(
     "Select Analysis",
-    ["Overview", "User Activity", "Genre Performance", "Subscription & Revenue", "Cross Analysis", "Recommender Demo"]
+    ["Overview", "User Activity", "Genre Performance", "Subscription & Revenue", "Cross Analysis", "Recommender Demo",
+     "Trends", "Performance"]
 )
 
+use_snapshot = st.sidebar.checkbox(
+    "Use in-memory snapshot",
+    value=os.environ.get("NETFLIX_SNAPSHOT") == "1",
+    help="Answer watch_history aggregates from an incrementally refreshed columnar snapshot",
+)
+use_approximate = st.sidebar.checkbox(
+    "Approximate analytics",
+    value=os.environ.get("NETFLIX_APPROXIMATE") == "1",
+    disabled=not use_snapshot,
+    help="Distinct counts from HyperLogLog sketches and averages from samples, with 95% error bounds",
+)
+
+backend = init_backend()
+if backend is not None:
+    warmup = init_warmup()
+    if warmup is not None:
+        with st.sidebar.expander("Warm-up", expanded=warmup.warmed_at is None):
+            st.progress(warmup.progress())
+            st.json(warmup.stats())
+    with st.sidebar.expander("Backend"):
+        st.json(backend.metrics())
+    with st.sidebar.expander("Query Cache"):
+        st.json(init_query_cache().stats())
+    with st.sidebar.expander("Watch Writer"):
+        st.json(init_watch_writer().metrics())
+
 # ================================
 # Overview Page
 # ================================
 if page == "Overview":
     st.header("Platform Overview")
+    results = fetch_page(page)
     
     col1, col2, col3, col4 = st.columns(4)
     
-    total_users = run_query("SELECT COUNT(*) AS count FROM users")
-    active_subs = run_query("SELECT COUNT(*) AS count FROM vw_active_subscriptions")
-    total_titles = run_query("SELECT COUNT(*) AS count FROM titles")
-    total_watches = run_query("SELECT COUNT(*) AS count FROM watch_history")
+    counts = results["overview_counts"]
     
-    col1.metric("Total Users", f"{total_users['count'][0]:,}")
-    col2.metric("Active Subscriptions", f"{active_subs['count'][0]:,}")
-    col3.metric("Total Titles", f"{total_titles['count'][0]:,}")
-    col4.metric("Total Watches", f"{total_watches['count'][0]:,}")
+    col1.metric("Total Users", f"{counts['total_users'][0]:,}")
+    col2.metric("Active Subscriptions", f"{counts['active_subs'][0]:,}")
+    col3.metric("Total Titles", f"{counts['total_titles'][0]:,}")
+    col4.metric("Total Watches", f"{counts['total_watches'][0]:,}")
 
     st.subheader("Revenue Analysis")
-    revenue_data = run_query("SELECT * FROM vw_revenue_analysis")
+    revenue_data = results["revenue_analysis"]
     if not revenue_data.empty:
         st.dataframe(revenue_data, use_container_width=True)
-        st.bar_chart(revenue_data.set_index('subscription_type')['monthly_revenue'])
+        bar_chart("revenue_analysis", revenue_data, 'subscription_type', 'monthly_revenue')
 
 # ================================
 # User Activity Page
 # ================================
 elif page == "User Activity":
     st.header("User Activity Analysis")
+    results = fetch_page(page)
 
     st.subheader("User Activity Summary")
-    user_activity = run_query("SELECT TOP 50 * FROM vw_user_activity_summary ORDER BY watch_time_hours DESC")
+    user_activity = results["user_activity_summary"]
     st.dataframe(user_activity, use_container_width=True)
 
     st.subheader("SQL Behind the View")
@@ -127,40 +510,50 @@ elif page == "User Activity":
         """, language="sql")
 
     st.subheader("Engagement by Country")
-    country_data = run_query("SELECT * FROM vw_country_engagement ORDER BY user_count DESC")
+    country_data = results["country_engagement"]
     st.dataframe(country_data, use_container_width=True)
+    error_bounds_caption(country_data)
     
     col1, col2 = st.columns(2)
     with col1:
         st.write("**Average Watch Hours by Country**")
-        country_chart = (
-            alt.Chart(country_data.head(10))
-            .mark_bar()
-            .encode(
-                x=alt.X('avg_watch_hours:Q', title='Avg Watch Hours'),
-                y=alt.Y('country:N', sort='-x', title='Country'),
-                color=alt.Color('avg_watch_hours:Q', scale=alt.Scale(scheme='blues'), legend=None),
-                tooltip=['country', 'avg_watch_hours', 'user_count', 'avg_completion_rate']
-            )
-            .properties(height=400)
+        show_chart(
+            "country_watch_hours", country_data,
+            lambda data: (
+                alt.Chart(data)
+                .mark_bar()
+                .encode(
+                    x=alt.X('avg_watch_hours:Q', title='Avg Watch Hours'),
+                    y=alt.Y('country:N', sort='-x', title='Country'),
+                    color=alt.Color('avg_watch_hours:Q', scale=alt.Scale(scheme='blues'), legend=None),
+                    tooltip=['country', 'avg_watch_hours', 'user_count', 'avg_completion_rate']
+                )
+                .properties(height=400)
+            ),
+            reduce=lambda data: top_k(data, 'country', 'avg_watch_hours', k=10, other=None),
         )
-        st.altair_chart(country_chart, use_container_width=True)
     
     with col2:
         st.write("**Completion Rate vs User Count**")
-        scatter_chart = (
-            alt.Chart(country_data)
-            .mark_circle(size=100)
-            .encode(
-                x=alt.X('user_count:Q', title='Number of Users'),
-                y=alt.Y('avg_completion_rate:Q', title='Avg Completion Rate (%)'),
-                size=alt.Size('avg_watch_hours:Q', title='Avg Watch Hours'),
-                color=alt.Color('country:N', legend=None),
-                tooltip=['country', 'user_count', 'avg_completion_rate', 'avg_watch_hours']
-            )
-            .properties(height=400)
+        # Countries sharing a bin become one point weighted by their users
+        show_chart(
+            "country_scatter", country_data,
+            lambda data: (
+                alt.Chart(data)
+                .mark_circle(size=100)
+                .encode(
+                    x=alt.X('user_count:Q', title='Number of Users'),
+                    y=alt.Y('avg_completion_rate:Q', title='Avg Completion Rate (%)'),
+                    size=alt.Size('avg_watch_hours:Q', title='Avg Watch Hours'),
+                    color=alt.Color('country:N', legend=None),
+                    tooltip=['country', 'user_count', 'avg_completion_rate', 'avg_watch_hours']
+                )
+                .properties(height=400)
+            ),
+            reduce=lambda data: bin_scatter(data, 'user_count', 'avg_completion_rate', bins=25, label='country',
+                                            noun='countries', budget=300,
+                                            means={'avg_watch_hours': 'user_count'}),
         )
-        st.altair_chart(scatter_chart, use_container_width=True)
     
     st.code("""
        CREATE OR ALTER VIEW vw_country_engagement AS
@@ -180,134 +573,93 @@ elif page == "User Activity":
         """, language="sql")
     
     st.subheader("Average watch percentage per user")
-    query = """
-    SELECT 
-        u.user_id,
-        u.name,
-        ROUND(AVG(wh.watch_percentage * 100), 2) AS avg_watch_percentage,
-        COUNT(wh.watch_id) AS total_watches,
-        SUM(wh.completed) AS completed_watches
-    FROM users u
-    LEFT JOIN watch_history wh ON u.user_id = wh.user_id
-    GROUP BY u.user_id, u.name
-    ORDER BY avg_watch_percentage DESC;"""
-    data = run_query(query)
-    st.dataframe(data, use_container_width=True)
+    query = PAGE_QUERIES[page]["avg_watch_per_user"]
+    data = paged_table("avg_watch_per_user", results.get("avg_watch_per_user"))
     
-    top_users = data.head(15)
-    user_chart = (
-        alt.Chart(top_users)
-        .mark_bar()
-        .encode(
-            x=alt.X('avg_watch_percentage:Q', title='Avg Watch Percentage (%)', scale=alt.Scale(domain=[0, 100])),
-            y=alt.Y('name:N', sort='-x', title='User'),
-            color=alt.condition(
-                alt.datum.avg_watch_percentage > 80,
-                alt.value('green'),
-                alt.value('steelblue')
-            ),
-            tooltip=['name', 'avg_watch_percentage', 'total_watches', 'completed_watches']
-        )
-        .properties(height=500)
+    show_chart(
+        "avg_watch_per_user", data,
+        lambda data: (
+            alt.Chart(data)
+            .mark_bar()
+            .encode(
+                x=alt.X('avg_watch_percentage:Q', title='Avg Watch Percentage (%)', scale=alt.Scale(domain=[0, 100])),
+                y=alt.Y('name:N', sort='-x', title='User'),
+                color=alt.condition(
+                    alt.datum.avg_watch_percentage > 80,
+                    alt.value('green'),
+                    alt.value('steelblue')
+                ),
+                tooltip=['name', 'avg_watch_percentage', 'total_watches', 'completed_watches']
+            )
+            .properties(height=500)
+        ),
+        reduce=lambda data: data.head(15),
     )
-    st.altair_chart(user_chart, use_container_width=True)
     st.code(query, language="sql")
 
     st.subheader("Top users by completed titles")
-    query = """
-    SELECT TOP 10
-        u.user_id,
-        u.name,
-        SUM(wh.completed) AS completed_watches
-    FROM users u
-    JOIN watch_history wh ON u.user_id = wh.user_id
-    GROUP BY u.user_id, u.name
-    ORDER BY completed_watches DESC;"""
-    data = run_query(query)
+    query = PAGE_QUERIES[page]["top_users_completed"]
+    data = results["top_users_completed"]
     st.dataframe(data, use_container_width=True)
     
-    completion_chart = (
-        alt.Chart(data)
-        .mark_bar()
-        .encode(
-            x=alt.X('completed_watches:Q', title='Completed Watches'),
-            y=alt.Y('name:N', sort='-x', title='User'),
-            color=alt.Color('completed_watches:Q', scale=alt.Scale(scheme='greens'), legend=None),
-            tooltip=['name', 'completed_watches']
-        )
-        .properties(height=400)
+    show_chart(
+        "top_users_completed", data,
+        lambda data: (
+            alt.Chart(data)
+            .mark_bar()
+            .encode(
+                x=alt.X('completed_watches:Q', title='Completed Watches'),
+                y=alt.Y('name:N', sort='-x', title='User'),
+                color=alt.Color('completed_watches:Q', scale=alt.Scale(scheme='greens'), legend=None),
+                tooltip=['name', 'completed_watches']
+            )
+            .properties(height=400)
+        ),
     )
-    st.altair_chart(completion_chart, use_container_width=True)
     st.code(query, language="sql")
 
     st.subheader("Watch Behavior by Subscription Type & Age Group")
-    query = """
-    WITH age_groups AS (
-    SELECT
-        u.user_id,
-        CASE
-            WHEN u.age < 18 THEN 'Under 18'
-            WHEN u.age BETWEEN 18 AND 24 THEN '18-24'
-            WHEN u.age BETWEEN 25 AND 34 THEN '25-34'
-            WHEN u.age BETWEEN 35 AND 44 THEN '35-44'
-            WHEN u.age BETWEEN 45 AND 54 THEN '45-54'
-            WHEN u.age BETWEEN 55 AND 64 THEN '55-64'
-            ELSE '65+'
-        END AS age_group,
-        s.subscription_type
-    FROM users u
-    JOIN subscriptions s ON u.user_id = s.user_id
-    )
-
-    SELECT
-        ag.age_group,
-        ag.subscription_type,
-        
-        COUNT(DISTINCT ag.user_id) AS users_in_segment,
-        COUNT(wh.watch_id) AS total_watch_events,
-
-        ROUND(AVG(CAST(wh.watch_percentage AS FLOAT)) * 100, 2) AS avg_watch_percentage,
-        ROUND(SUM(CAST(wh.watch_percentage AS FLOAT)) * 100, 2) AS total_watch_percentage
-
-    FROM age_groups ag
-    LEFT JOIN watch_history wh ON ag.user_id = wh.user_id
-
-    GROUP BY ag.age_group, ag.subscription_type
-    ORDER BY ag.age_group, ag.subscription_type;"""
-    data = run_query(query)
+    query = PAGE_QUERIES[page]["age_group_subscription"]
+    data = results["age_group_subscription"]
     st.dataframe(data, use_container_width=True)
+    error_bounds_caption(data)
     
     st.subheader("Watch Events by Age Group & Subscription Type")
-    grouped_chart = (
-        alt.Chart(data)
-        .mark_bar()
-        .encode(
-            x=alt.X('age_group:N', title='Age Group', axis=alt.Axis(labelAngle=-45)),
-            y=alt.Y('total_watch_events:Q', title='Total Watch Events'),
-            color=alt.Color('subscription_type:N', title='Subscription Type'),
-            column=alt.Column('subscription_type:N', title='Subscription Type'),
-            tooltip=['age_group', 'subscription_type', 'total_watch_events', 'avg_watch_percentage', 'users_in_segment']
-        )
-        .properties(width=200, height=300)
+    show_chart(
+        "age_group_subscription", data,
+        lambda data: (
+            alt.Chart(data)
+            .mark_bar()
+            .encode(
+                x=alt.X('age_group:N', title='Age Group', axis=alt.Axis(labelAngle=-45)),
+                y=alt.Y('total_watch_events:Q', title='Total Watch Events'),
+                color=alt.Color('subscription_type:N', title='Subscription Type'),
+                column=alt.Column('subscription_type:N', title='Subscription Type'),
+                tooltip=['age_group', 'subscription_type', 'total_watch_events', 'avg_watch_percentage', 'users_in_segment']
+            )
+            .properties(width=200, height=300)
+        ),
+        use_container_width=False,
     )
-    st.altair_chart(grouped_chart)
     
     # Additional heatmap visualization
     st.subheader("Average Watch Percentage Heatmap")
-    heatmap = (
-        alt.Chart(data)
-        .mark_rect()
-        .encode(
-            x=alt.X('subscription_type:N', title='Subscription Type'),
-            y=alt.Y('age_group:N', title='Age Group'),
-            color=alt.Color('avg_watch_percentage:Q', 
-                          scale=alt.Scale(scheme='viridis'),
-                          title='Avg Watch %'),
-            tooltip=['age_group', 'subscription_type', 'avg_watch_percentage', 'total_watch_events']
-        )
-        .properties(width=400, height=400)
+    show_chart(
+        "age_group_heatmap", data,
+        lambda data: (
+            alt.Chart(data)
+            .mark_rect()
+            .encode(
+                x=alt.X('subscription_type:N', title='Subscription Type'),
+                y=alt.Y('age_group:N', title='Age Group'),
+                color=alt.Color('avg_watch_percentage:Q', 
+                              scale=alt.Scale(scheme='viridis'),
+                              title='Avg Watch %'),
+                tooltip=['age_group', 'subscription_type', 'avg_watch_percentage', 'total_watch_events']
+            )
+            .properties(width=400, height=400)
+        ),
     )
-    st.altair_chart(heatmap, use_container_width=True)
     st.code(query, language="sql")
 
 
@@ -316,6 +668,7 @@ elif page == "User Activity":
 # ================================
 elif page == "Genre Performance":
     st.header("Genre & Titles Performance Analysis")
+    results = fetch_page(page)
 
     query = """
     CREATE OR ALTER VIEW vw_genre_performance AS
@@ -331,73 +684,68 @@ elif page == "Genre Performance":
     LEFT JOIN title_genres tg ON g.genre_id = tg.genre_id
     LEFT JOIN watch_history wh ON tg.title_id = wh.title_id
     GROUP BY g.genre_id, g.name;"""
-    genre_data = run_query("SELECT * FROM vw_genre_performance ORDER BY total_watches DESC")
+    genre_data = results["genre_performance"]
+    # Both genre charts keep the 30 most watched genres. Distinct viewers
+    # don't add up across genres, so the "Other" row leaves unique_viewers empty
+    genre_reduce = lambda data: top_k(data, 'genre_name', 'total_watches', k=30,
+                                      means={'avg_watch_percentage': 'total_watches'})
     if not genre_data.empty:
         st.subheader("Genre Metrics")
         st.dataframe(genre_data, use_container_width=True)
+        error_bounds_caption(genre_data)
         
         col1, col2 = st.columns(2)
         with col1:
             st.write("**Total Watches by Genre**")
-            watches_chart = (
-                alt.Chart(genre_data)
-                .mark_bar()
-                .encode(
-                    x=alt.X('total_watches:Q', title='Total Watches'),
-                    y=alt.Y('genre_name:N', sort='-x', title='Genre'),
-                    color=alt.Color('total_watches:Q', scale=alt.Scale(scheme='blues'), legend=None),
-                    tooltip=['genre_name', 'total_watches', 'avg_watch_percentage', 'unique_viewers']
-                )
-                .properties(height=500)
+            show_chart(
+                "genre_watches", genre_data,
+                lambda data: (
+                    alt.Chart(data)
+                    .mark_bar()
+                    .encode(
+                        x=alt.X('total_watches:Q', title='Total Watches'),
+                        y=alt.Y('genre_name:N', sort='-x', title='Genre'),
+                        color=alt.Color('total_watches:Q', scale=alt.Scale(scheme='blues'), legend=None),
+                        tooltip=['genre_name', 'total_watches', 'avg_watch_percentage', 'unique_viewers']
+                    )
+                    .properties(height=500)
+                ),
+                reduce=genre_reduce,
             )
-            st.altair_chart(watches_chart, use_container_width=True)
         
         with col2:
             st.write("**Avg Watch Percentage by Genre**")
-            percentage_chart = (
-                alt.Chart(genre_data)
-                .mark_bar()
-                .encode(
-                    x=alt.X('avg_watch_percentage:Q', title='Avg Watch Percentage (%)', scale=alt.Scale(domain=[0, 100])),
-                    y=alt.Y('genre_name:N', sort='-x', title='Genre'),
-                    color=alt.Color('avg_watch_percentage:Q', scale=alt.Scale(scheme='greens'), legend=None),
-                    tooltip=['genre_name', 'avg_watch_percentage', 'total_watches', 'unique_viewers']
-                )
-                .properties(height=500)
+            # Ranked by watches so the genres match the chart beside it
+            show_chart(
+                "genre_watch_percentage", genre_data,
+                lambda data: (
+                    alt.Chart(data)
+                    .mark_bar()
+                    .encode(
+                        x=alt.X('avg_watch_percentage:Q', title='Avg Watch Percentage (%)', scale=alt.Scale(domain=[0, 100])),
+                        y=alt.Y('genre_name:N', sort='-x', title='Genre'),
+                        color=alt.Color('avg_watch_percentage:Q', scale=alt.Scale(scheme='greens'), legend=None),
+                        tooltip=['genre_name', 'avg_watch_percentage', 'total_watches', 'unique_viewers']
+                    )
+                    .properties(height=500)
+                ),
+                reduce=genre_reduce,
             )
-            st.altair_chart(percentage_chart, use_container_width=True)
         
         st.code(query, language="sql")
 
     st.subheader("Title-Level Analysis")
-    query = """
-        SELECT TOP 50
-            t.title, t.release_year, t.imdb_score,
-            COUNT(wh.watch_id) AS total_watches,
-            ROUND(AVG(wh.watch_percentage), 2) AS avg_watch_percentage
-        FROM titles t
-        LEFT JOIN watch_history wh ON t.title_id = wh.title_id
-        GROUP BY t.title, t.release_year, t.imdb_score
-        ORDER BY total_watches DESC
-    """
-    title_data = run_query(query)
+    query = PAGE_QUERIES[page]["title_level"]
+    title_data = results["title_level"]
     st.dataframe(title_data, use_container_width=True)
-    st.bar_chart(title_data.set_index('title')['total_watches'])
+    bar_chart("title_level", title_data, 'title', 'total_watches')
     st.code(query, language="sql")
 
     st.subheader("Titles with highest completion rates")
-    query = """
-    SELECT TOP 20
-    t.title,
-    ROUND(AVG(wh.watch_percentage * 100), 2) AS avg_watch_percentage,
-    SUM(wh.completed) AS total_completed
-    FROM titles t
-    JOIN watch_history wh ON t.title_id = wh.title_id
-    GROUP BY t.title
-    ORDER BY avg_watch_percentage DESC, total_completed DESC;"""
-    data = run_query(query)
+    query = PAGE_QUERIES[page]["title_completion"]
+    data = results["title_completion"]
     st.dataframe(data, use_container_width=True)
-    st.bar_chart(data.set_index('title')['total_completed'])
+    bar_chart("title_completion", data, 'title', 'total_completed')
     st.code(query, language="sql")
 
     st.subheader("Genre with highest engagement score")
@@ -422,9 +770,10 @@ elif page == "Genre Performance":
         GROUP BY g.genre_id, g.name
         ORDER BY total_watch_events DESC;
     END;"""
-    data = run_query('EXEC sp_get_genre_trends')
+    data = results["genre_trends"]
     st.dataframe(data, use_container_width=True)
-    st.bar_chart(data.set_index('genre_name')['engagement_score'])
+    error_bounds_caption(data)
+    bar_chart("genre_trends", data, 'genre_name', 'engagement_score')
     st.code(query, language="sql")
 
     
@@ -434,43 +783,88 @@ elif page == "Genre Performance":
 # ================================
 elif page == "Subscription & Revenue":
     st.header("Subscription & Revenue Analytics")
+    results = fetch_page(page)
 
-    query="""
-        SELECT subscription_type, COUNT(subscription_id) AS subscriber_count,
-               SUM(monthly_fee) AS total_monthly_revenue,
-               ROUND(AVG(monthly_fee), 2) AS avg_fee
-        FROM subscriptions
-        WHERE subscription_status='active'
-        GROUP BY subscription_type
-    """
-    sub_data = run_query(query)
+    query = PAGE_QUERIES[page]["revenue_by_type"]
+    sub_data = results["revenue_by_type"]
     st.subheader("Revenue by Subscription Type")
     st.dataframe(sub_data, use_container_width=True)
-    st.bar_chart(sub_data.set_index('subscription_type')['total_monthly_revenue'])
+    bar_chart("revenue_by_type", sub_data, 'subscription_type', 'total_monthly_revenue')
     st.code(query, language="sql")
 
-    query="""
-        SELECT u.user_id, u.name, dbo.fn_calculate_user_ltv(u.user_id) AS lifetime_value
-        FROM users u
-        ORDER BY lifetime_value DESC
-    """
-    ltv_data = run_query(query)
+    engine = refresh_cohorts()
+    movements = engine.mrr_movements() if engine is not None else pd.DataFrame()
+    if not movements.empty:
+        st.subheader("MRR Movements")
+        last = movements.iloc[-1]
+        st.caption(f"Closed months through {last['month']:%B %Y}; the current month is added once it ends.")
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("MRR", f"${last['mrr']:,.2f}", f"{last['net_new_mrr']:+,.2f}")
+        col2.metric("Paying customers", f"{last['active_customers']:,}")
+        col3.metric("New customers", f"{last['new_customers']:,}")
+        start_customers = last['active_customers'] - last['new_customers'] - last['reactivated_customers'] + last['churned_customers']
+        col4.metric("Customer churn", f"{100.0 * last['churned_customers'] / start_customers:.2f}%" if start_customers else "-")
+        months = st.slider("Months shown:", 1, len(movements), min(24, len(movements)))
+        shown = movements.tail(months)
+        moves = shown.melt(id_vars='month', value_vars=[f'{name}_mrr' for name in MOVEMENTS],
+                           var_name='movement', value_name='mrr_change')
+        moves['movement'] = moves['movement'].str[:-len('_mrr')]
+        show_chart("mrr_movements", moves, lambda data: alt.Chart(data).mark_bar().encode(
+            x=alt.X('yearmonth(month):O', title='Month'),
+            y=alt.Y('mrr_change:Q', title='MRR change', stack='zero'),
+            color=alt.Color('movement:N', sort=MOVEMENTS, scale=alt.Scale(domain=MOVEMENTS)),
+            tooltip=[alt.Tooltip('yearmonth(month):O', title='month'), 'movement', 'mrr_change'],
+        ))
+        st.dataframe(shown.iloc[::-1], use_container_width=True)
+
+        st.subheader("Churn Rate by Subscription Type")
+        st.caption("Subscriptions running at the start of a month that ended in it; plan switches are counted separately.")
+        churn = engine.churn_by_type()
+        churn = churn[churn['month'] >= shown['month'].iloc[0]]
+        show_chart("churn_by_type", churn, lambda data: alt.Chart(data).mark_line(point=True).encode(
+            x=alt.X('yearmonth(month):O', title='Month'),
+            y=alt.Y('churn_rate:Q', title='Churn rate (%)'),
+            color='subscription_type:N',
+            tooltip=[alt.Tooltip('yearmonth(month):O', title='month'), 'subscription_type',
+                     'active_start', 'churned', 'switched', 'churn_rate'],
+        ))
+
+        st.subheader("Monthly Start Cohorts")
+        cohorts = engine.cohorts()
+        cohorts = cohorts[cohorts['cohort'] >= shown['month'].iloc[0]]
+        show_chart("cohort_retention", cohorts, lambda data: alt.Chart(data).mark_rect().encode(
+            x=alt.X('age:O', title='Months since first subscription'),
+            y=alt.Y('yearmonth(cohort):O', title='Cohort'),
+            color=alt.Color('retention:Q', title='Retention (%)', scale=alt.Scale(scheme='blues')),
+            tooltip=[alt.Tooltip('yearmonth(cohort):O', title='cohort'), 'age', 'size', 'active', 'retention'],
+        ))
+        curve = engine.survival_curve()
+        show_chart("survival_curve", curve, lambda data: alt.Chart(data).mark_line().encode(
+            x=alt.X('age:Q', title='Months since first subscription'),
+            y=alt.Y('retention:Q', title='Still paying (%)', scale=alt.Scale(domain=[0, 100])),
+            tooltip=['age', 'cohorts', 'size', 'active', 'retention'],
+        ))
+
+    query = PAGED_QUERIES["user_ltv"].sql
     st.subheader("Top Users by Lifetime Value")
-    st.dataframe(ltv_data.head(10), use_container_width=True)
+    paged_table("user_ltv")
     st.code(query, language="sql")
     st.code("""
-    CREATE OR ALTER FUNCTION fn_calculate_user_ltv(@p_user_id VARCHAR(50))
-    RETURNS DECIMAL(10, 2)
-    AS
-    BEGIN
-        DECLARE @ltv DECIMAL(10, 2);
-
-        SELECT @ltv = SUM(s.monthly_fee * DATEDIFF(DAY, s.subscription_start_date, ISNULL(s.subscription_end_date, CAST(GETDATE() AS DATE))) / 30.0)
+    CREATE OR ALTER VIEW vw_user_ltv AS
+    SELECT
+        u.user_id,
+        u.name,
+        CAST(ISNULL(l.lifetime_value, 0.00) AS DECIMAL(10, 2)) AS lifetime_value,
+        ISNULL(l.subscription_days, 0) AS subscription_days
+    FROM users u
+    LEFT JOIN (
+        SELECT
+            s.user_id,
+            SUM(s.monthly_fee * DATEDIFF(DAY, s.subscription_start_date, ISNULL(s.subscription_end_date, CAST(GETDATE() AS DATE))) / 30.0) AS lifetime_value,
+            SUM(DATEDIFF(DAY, s.subscription_start_date, ISNULL(s.subscription_end_date, CAST(GETDATE() AS DATE)))) AS subscription_days
         FROM subscriptions s
-        WHERE s.user_id = @p_user_id;
-
-        RETURN ISNULL(@ltv, 0.00);
-    END;
+        GROUP BY s.user_id
+    ) l ON u.user_id = l.user_id;
     """, language="sql")
 
 # ================================
@@ -478,65 +872,116 @@ elif page == "Subscription & Revenue":
 # ================================
 elif page == "Cross Analysis":
     st.header("Cross-Analysis: Content vs User Engagement")
+    results = fetch_page(page)
 
-    query="""SELECT 
-        u.country,
-        g.name AS genre,
-        ROUND(AVG(wh.watch_percentage * 100), 2) AS avg_watch_percentage,
-        COUNT(wh.watch_id) AS total_watches
-    FROM users u
-    JOIN watch_history wh ON u.user_id = wh.user_id
-    JOIN title_genres tg ON wh.title_id = tg.title_id
-    JOIN genres g ON tg.genre_id = g.genre_id
-    GROUP BY u.country, g.name
-    ORDER BY u.country, avg_watch_percentage DESC;"""
-    data = run_query(query)
+    query = PAGE_QUERIES[page]["country_genre"]
     st.subheader("Active vs Inactive subscriptions")
-    st.dataframe(data, use_container_width=True)
+    paged_table("country_genre", results.get("country_genre"))
     st.code(query, language="sql")
 
-    query="""
-    SELECT 
-        u.user_id,
-        u.name,
-        ROUND(AVG(wh.watch_percentage * 100), 2) AS avg_watch_percentage,
-        dbo.fn_calculate_user_ltv(u.user_id) AS lifetime_value
-    FROM users u
-    JOIN watch_history wh ON u.user_id = wh.user_id
-    GROUP BY u.user_id, u.name
-    HAVING AVG(wh.watch_percentage) > 0.8 AND dbo.fn_calculate_user_ltv(u.user_id) < 50
-    ORDER BY avg_watch_percentage DESC;"""
-    data = run_query(query)
+    query = PAGE_QUERIES[page]["high_watch_low_ltv"]
+    data = results["high_watch_low_ltv"]
     st.subheader("Users with high watch percentage but low subscription revenue")
     st.dataframe(data, use_container_width=True)
     st.code(query, language="sql")
 
+    if use_snapshot:
+        st.subheader("Segment Explorer")
+        cube = init_cube()
+        col1, col2 = st.columns(2)
+        group_by = col1.multiselect("Group by:", [d for d in DIMENSIONS if d != "day"], default=["country"])
+        daily = col2.checkbox("Split by day", value=False)
+        col1, col2, col3 = st.columns(3)
+        days = col1.date_input("Watched between:", value=())
+        sub_types = col2.multiselect("Subscription type:", list(init_snapshot().sub_types.values))
+        genres = col3.multiselect("Genre:", sorted(g for g in init_snapshot().genre_name if g is not None))
+
+        where = {}
+        if len(days) == 2:
+            where["day"] = (days[0], days[1])
+        if sub_types:
+            where["subscription_type"] = sub_types
+        if genres:
+            where["genre"] = genres
+        start = time.perf_counter()
+        data = cube.query(group_by + (["day"] if daily else []), where)
+        elapsed = time.perf_counter() - start
+        init_query_stats().record(None, elapsed, kind="cube", label=f"{page}/segment_explorer",
+                                  rows=len(data), nbytes=frame_nbytes(data), build=elapsed)
+        st.caption(f"{len(data):,} rows from {len(cube):,} cube cells in {elapsed * 1000:,.1f} ms")
+        st.dataframe(data, use_container_width=True)
+        # The chart keeps the 10 (bars: 30) largest segments, the rest as
+        # "Other", and at most ~500 days per line
+        if daily:
+            def reduce_daily(data):
+                if group_by:
+                    data = top_k(data, group_by[0], 'watches', k=10, group=['day', *group_by[1:]],
+                                 sums=['completed'], means={'avg_watch_percentage': 'watches'})
+                return decimate(data, 'day', 'watches', max_points=500, series=group_by[0] if group_by else None)
+            show_chart(
+                "segment_explorer_daily", data,
+                lambda data: (
+                    alt.Chart(data)
+                    .mark_line()
+                    .encode(
+                        x=alt.X('day:T', title='Day'),
+                        y=alt.Y('watches:Q', title='Watch Events'),
+                        color=alt.Color(f'{group_by[0]}:N') if group_by else alt.value('steelblue'),
+                        tooltip=['day:T', *group_by, 'watches', 'avg_watch_percentage']
+                    )
+                    .properties(height=400)
+                ),
+                reduce=reduce_daily, budget=5000, variant=tuple(group_by),
+            )
+        elif group_by:
+            show_chart(
+                "segment_explorer", data,
+                lambda data: (
+                    alt.Chart(data)
+                    .mark_bar()
+                    .encode(
+                        x=alt.X(f'{group_by[0]}:N', title=group_by[0].replace('_', ' ').title()),
+                        y=alt.Y('watches:Q', title='Watch Events'),
+                        color=alt.Color(f'{group_by[1]}:N') if len(group_by) > 1 else alt.value('steelblue'),
+                        tooltip=[*group_by, 'watches', 'avg_watch_percentage', 'completed']
+                    )
+                    .properties(height=400)
+                ),
+                reduce=lambda data: top_k(data, group_by[0], 'watches', k=30, group=group_by[1:], sums=['completed'],
+                                          means={'avg_watch_percentage': 'watches'}),
+                variant=tuple(group_by),
+            )
+
 # ------------------------------
 # Recommender Demo Page
 # ------------------------------
 elif page == "Recommender Demo":
     st.header("Recommender System & Trigger Demo")
+    indexes = init_search_indexes()
+    if indexes is not None:
+        # New users and titles are indexed incrementally
+        indexes["users"].refresh(min_interval=60)
+        indexes["titles"].refresh(min_interval=300)
 
-    # Fetch users
-    users_df = run_query("SELECT user_id, name FROM users")
+    # Users matching the search box; the selection is the user_id itself
+    user_search = st.text_input("Find user:", placeholder="Name or user id")
+    users_df = search_index("users", user_search) if indexes is not None else pd.DataFrame()
     if users_df.empty:
-        st.info("No users available.")
+        st.info("No matching users." if user_search else "No users available.")
     else:
-        # Remove duplicate names
-        users_df['display'] = users_df['name'] + " (" + users_df['user_id'] + ")"
-        selected_display = st.selectbox("Select User:", users_df['display'])
-        user_id = users_df.loc[users_df['display'] == selected_display, 'user_id'].values[0]
-
+        user_id = st.selectbox(
+            "Select User:", users_df['user_id'],
+            format_func=user_label,
+        )
 
         # Fetch titles
-        titles_df = run_query("SELECT title_id, title FROM titles ORDER BY title")
+        title_search = st.text_input("Find title:", placeholder="Any part of the title")
+        titles_df = search_index("titles", title_search)
         if titles_df.empty:
-            st.info("No titles available.")
+            st.info("No matching titles." if title_search else "No titles available.")
         else:
-            selected_title = st.selectbox("Select Title to Watch:", titles_df['title'])
-            if selected_title is not None:
-                title_id = titles_df.loc[titles_df['title'] == selected_title, 'title_id'].values[0]
-
+            title_id = st.selectbox("Select Title to Watch:", titles_df['title_id'], format_func=title_label)
+            if title_id is not None:
                 # Watch percentage input
                 watch_percentage = st.slider("Watch Percentage", min_value=0, max_value=100, value=50)
 
@@ -547,49 +992,101 @@ elif page == "Recommender Demo":
                     min_value=1, max_value=50, value=default_recs, step=1
                 )
 
+                recommendation_modes = ["Genre overlap"]
+                if use_snapshot:
+                    recommendation_modes.append("Collaborative filtering (item-item)")
+                recommendation_modes.append("Content-based (title metadata)")
+                recommendation_mode = st.radio("Recommendation mode:", recommendation_modes, horizontal=True)
+
                 if st.button("Simulate Watching"):
-                    conn = init_connection()
-                    if conn:
+                    writer = init_watch_writer()
+                    if writer:
                         try:
-                            cursor = conn.cursor()
+                            stats = init_query_stats()
                             watch_percentage_decimal = watch_percentage / 100
-                            cursor.execute("""
-                                INSERT INTO watch_history 
-                                (user_id, title_id, watch_percentage, completed, created_at, updated_at)
-                                VALUES (?, ?, ?, ?, SYSDATETIME(), SYSDATETIME())
-                            """, user_id, title_id, watch_percentage_decimal, 0)
+                            # Wait for the group commit holding this event so the
+                            # reads below see it
+                            start = time.perf_counter()
+                            try:
+                                writer.submit(user_id, title_id, watch_percentage_decimal, timeout=10).result(timeout=30)
+                            except Exception as e:
+                                stats.record(None, time.perf_counter() - start, kind="write",
+                                             label="Recommender Demo/watch_event", error=str(e))
+                                raise
+                            elapsed = time.perf_counter() - start
+                            stats.record(None, elapsed, kind="write", label="Recommender Demo/watch_event",
+                                         rows=1, execute=elapsed)
+                            # In deferred maintenance mode, bring watch_time_hours up to date now
+                            maintainer = init_maintainer()
+                            if maintainer is not None:
+                                start = time.perf_counter()
+                                maintainer.run_once()
+                                elapsed = time.perf_counter() - start
+                                stats.record(None, elapsed, kind="write", label="Recommender Demo/deferred_maintenance",
+                                             error=maintainer.last_error, execute=elapsed)
 
-                            conn.commit()
+                            # Evicts watch_history readers (incl. watch_time_hours, which the
+                            # trigger maintains); other users' scoped entries are kept
+                            init_query_cache().invalidate({'watch_history'}, scope=user_id)
 
-                            st.success("Watch history recorded! Trigger updated user watch_time_hours and completed flag.")
+                            st.success("Watch history recorded! User watch_time_hours and completed flag updated.")
 
                             # User Metrics
-                            user_metrics = run_query(f"""
+                            user_metrics = run_query("""
                                 SELECT name, watch_time_hours
                                 FROM users
-                                WHERE user_id='{user_id}'
-                            """)
+                                WHERE user_id = ?
+                            """, [user_id], scope=user_id)
                             st.subheader("User Watch Time")
                             st.dataframe(user_metrics, use_container_width=True)
 
                             # Recent Watch History
-                            recent_wh = run_query(f"""
+                            recent_wh = run_query("""
                                 SELECT TOP 5 *
                                 FROM watch_history
-                                WHERE user_id='{user_id}'
+                                WHERE user_id = ?
                                 ORDER BY created_at DESC
-                            """)
+                            """, [user_id], scope=user_id)
                             st.subheader("Recent Watch History")
                             st.dataframe(recent_wh, use_container_width=True)
 
-                            recommendations = run_query(f"""
-                                EXEC sp_get_user_recommendations @p_user_id='{user_id}', @p_limit={number_of_recommendations}
-                            """)
+                            content_index = None
+                            if recommendation_mode == "Content-based (title metadata)":
+                                recommender, content_index = None, init_content_index()
+                            elif recommendation_mode == "Collaborative filtering (item-item)":
+                                recommender = init_item_index()
+                            else:
+                                recommender = init_recommender() if use_snapshot else None
+                            if content_index is not None:
+                                # Only the user's history is read; titles are scored
+                                # from the memory-mapped index
+                                history = run_query(USER_HISTORY_SQL, [user_id], scope=user_id)
+                                start = time.perf_counter()
+                                recommendations = content_index.recommend_history(
+                                    history, int(number_of_recommendations))
+                                elapsed = time.perf_counter() - start
+                                stats.record(None, elapsed, kind="snapshot", label="Recommender Demo/ContentIndex",
+                                             rows=len(recommendations), execute=elapsed)
+                            elif recommender is not None:
+                                # Pick up the event just written before scoring; the
+                                # models update incrementally from the new rows
+                                init_snapshot().refresh()
+                                start = time.perf_counter()
+                                recommendations = recommender.recommend(user_id, int(number_of_recommendations))
+                                elapsed = time.perf_counter() - start
+                                stats.record(None, elapsed, kind="snapshot",
+                                             label=f"Recommender Demo/{type(recommender).__name__}",
+                                             rows=len(recommendations), build=elapsed)
+                            else:
+                                recommendations = run_query(
+                                    "EXEC sp_get_user_recommendations @p_user_id = ?, @p_limit = ?",
+                                    [user_id, int(number_of_recommendations)], scope=user_id,
+                                )
 
                             st.subheader("Recommended Titles")
                             if not recommendations.empty:
                                 st.dataframe(recommendations, use_container_width=True)
-                                st.bar_chart(recommendations.set_index('title')['avg_rating'])
+                                bar_chart("recommendations", recommendations, 'title', 'avg_rating', k=50)
                             else:
                                 st.info("No recommendations available yet.")
                             st.code("""
@@ -628,3 +1125,196 @@ elif page == "Recommender Demo":
                             st.error(f"Error: {e}")
         
 
+
+# ================================
+# Trends Page
+# ================================
+elif page == "Trends":
+    st.header("Viewing Trends")
+    refresh_trend_rollups()
+    results = fetch_page(page)
+
+    daily = results["daily_trends"]
+    if daily.empty:
+        st.info("No rollups yet. Run `python rollups.py apply` or backfill a date range below.")
+    else:
+        latest = daily.iloc[-1]
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Watches (last 7 days)", f"{int(latest['watches_7d']):,}")
+        col2.metric("Watches (last 30 days)", f"{int(latest['watches_30d']):,}")
+        col3.metric("Completion Rate (7 days)", f"{latest['completion_rate_7d']:.2f}%")
+
+        st.subheader("Daily Watches")
+        volume = daily.melt(id_vars='day', value_vars=['watches', 'watches_7d', 'watches_30d'],
+                            var_name='window', value_name='count')
+        show_chart(
+            "daily_watches", volume,
+            lambda data: (
+                alt.Chart(data)
+                .mark_line()
+                .encode(
+                    x=alt.X('day:T', title='Day'),
+                    y=alt.Y('count:Q', title='Watches'),
+                    color=alt.Color('window:N', title='Window'),
+                    tooltip=['day:T', 'window', 'count']
+                )
+                .properties(height=350)
+            ),
+            reduce=lambda data: decimate(data, 'day', 'count', max_points=500, series='window'),
+            budget=1500,
+        )
+
+        st.subheader("Completion Rate")
+        completion = daily.melt(id_vars='day', value_vars=['completion_rate', 'completion_rate_7d', 'completion_rate_30d'],
+                                var_name='window', value_name='rate')
+        show_chart(
+            "daily_completion", completion,
+            lambda data: (
+                alt.Chart(data)
+                .mark_line()
+                .encode(
+                    x=alt.X('day:T', title='Day'),
+                    y=alt.Y('rate:Q', title='Completion Rate (%)'),
+                    color=alt.Color('window:N', title='Window'),
+                    tooltip=['day:T', 'window', 'rate']
+                )
+                .properties(height=350)
+            ),
+            reduce=lambda data: decimate(data, 'day', 'rate', max_points=500, series='window'),
+            budget=1500,
+        )
+
+    st.subheader("Trending Titles (last 7 days vs the 7 before)")
+    trending = results["trending_titles"]
+    if not trending.empty:
+        st.dataframe(trending, use_container_width=True)
+        bar_chart("trending_titles", trending, 'title', 'watch_growth')
+    st.code(PAGE_QUERIES[page]["trending_titles"], language="sql")
+
+    st.subheader("Genre Momentum")
+    momentum = results["genre_momentum"]
+    if not momentum.empty:
+        st.dataframe(momentum, use_container_width=True)
+        show_chart(
+            "genre_momentum", momentum,
+            lambda data: (
+                alt.Chart(data)
+                .mark_bar()
+                .encode(
+                    x=alt.X('momentum_pct:Q', title='Change in Watches (%)'),
+                    y=alt.Y('genre:N', sort='-x', title='Genre'),
+                    color=alt.condition(alt.datum.momentum_pct > 0, alt.value('steelblue'), alt.value('orange')),
+                    tooltip=['genre', 'recent_watches', 'previous_watches', 'momentum_pct', 'share_of_watches']
+                )
+                .properties(height=300)
+            ),
+        )
+    st.code(PAGE_QUERIES[page]["genre_momentum"], language="sql")
+
+    rollups = init_trend_rollups()
+    if rollups is not None:
+        with st.expander("Rollup maintenance"):
+            st.json(rollups.stats())
+            # Rebuilds the buckets of a date range, e.g. after a bulk load or
+            # corrections to existing events
+            backfill_range = st.date_input("Backfill days", value=())
+            if st.button("Backfill", disabled=len(backfill_range) != 2):
+                start = time.perf_counter()
+                try:
+                    result = rollups.backfill(*backfill_range)
+                except Exception as e:
+                    init_query_stats().record(None, time.perf_counter() - start, kind="rollup",
+                                              label="Trends/backfill_rollups", error=str(e))
+                    st.error(f"Backfill failed: {e}")
+                else:
+                    elapsed = time.perf_counter() - start
+                    init_query_stats().record(None, elapsed, kind="rollup", label="Trends/backfill_rollups",
+                                              rows=result["buckets_written"], execute=elapsed)
+                    init_query_cache().invalidate({'watch_rollups'})
+                    st.success(f"Rebuilt {result['buckets_written']:,} buckets from {result['from']} to {result['to']}.")
+
+# ================================
+# Performance Page
+# ================================
+elif page == "Performance":
+    st.header("Query Performance")
+    stats = init_query_stats()
+    records = stats.records()
+
+    if records.empty:
+        st.info("No queries recorded yet. Open another page first.")
+    else:
+        cached = records['cache'].notna()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Queries Recorded", f"{len(records):,}")
+        col2.metric("p95 Latency", f"{records['seconds'].quantile(0.95) * 1000:,.1f} ms")
+        col3.metric("Cache Hit Rate",
+                    f"{(records.loc[cached, 'cache'] == 'hit').mean():.0%}" if cached.any() else "n/a")
+        col4.metric("Errors", f"{records['error'].notna().sum():,}")
+
+        st.subheader("Slowest Queries")
+        summary = stats.summary()
+        st.dataframe(summary, use_container_width=True)
+
+        st.subheader("Where the Time Goes")
+        phases = summary.head(10).melt(
+            id_vars='query', value_vars=['execute_ms', 'fetch_ms', 'build_ms'],
+            var_name='phase', value_name='ms',
+        ).dropna()
+        phase_chart = (
+            alt.Chart(phases)
+            .mark_bar()
+            .encode(
+                x=alt.X('ms:Q', title='Mean Time (ms)'),
+                y=alt.Y('query:N', sort=list(summary.head(10)['query']), title='Query'),
+                color=alt.Color('phase:N', title='Phase'),
+                tooltip=['query', 'phase', alt.Tooltip('ms:Q', format='.2f')]
+            )
+            .properties(height=400)
+        )
+        st.altair_chart(phase_chart, use_container_width=True)
+
+        st.subheader("Latency Histogram")
+        selected_query = st.selectbox("Query:", ["All queries"] + sorted(records['query'].unique()))
+        histogram = stats.histogram(None if selected_query == "All queries" else selected_query)
+        histogram_chart = (
+            alt.Chart(histogram)
+            .mark_bar()
+            .encode(
+                x=alt.X('bucket:N', sort=list(histogram['bucket']), title='Latency'),
+                y=alt.Y('count:Q', title='Queries'),
+                tooltip=['bucket', 'count']
+            )
+            .properties(height=300)
+        )
+        st.altair_chart(histogram_chart, use_container_width=True)
+
+        st.subheader("Chart Payloads")
+        st.caption("Rows and bytes each chart last sent to the browser, after server-side reduction.")
+        st.json(init_chart_cache().stats())
+        st.dataframe(pd.DataFrame(init_chart_cache().charts()), use_container_width=True)
+
+        if use_snapshot and init_snapshot() is not None:
+            st.subheader("Snapshot Models")
+            st.caption("The genre recommender rebuilds from the snapshot whenever new titles appear.")
+            st.json({'snapshot': init_snapshot().stats(), 'genre_recommender': init_recommender().stats()})
+
+        st.subheader("Recent Queries")
+        st.dataframe(records.sort_values('ts', ascending=False).head(100), use_container_width=True)
+
+        with st.expander("SQL by query label"):
+            st.json(stats.statements())
+
+    st.subheader("Export")
+    col1, col2, col3 = st.columns(3)
+    col1.download_button("Prometheus metrics", stats.to_prometheus(), file_name="query_metrics.prom",
+                         mime="text/plain")
+    col2.download_button("Query log (JSONL)", stats.to_jsonl(), file_name="query_metrics.jsonl",
+                         mime="application/jsonl")
+    if col3.button("Reset statistics"):
+        stats.clear()
+        st.rerun()
+
+# Optional file for a Prometheus textfile collector, rewritten after every run
+if os.environ.get("NETFLIX_METRICS_FILE"):
+    init_query_stats().export(os.environ["NETFLIX_METRICS_FILE"])
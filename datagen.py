@@ -0,0 +1,307 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from schema import TABLE_COLUMNS
+
+# ------------------------------
+# Synthetic dataset generator
+# ------------------------------
+# Seeded generator for every table in 01_Create_Tables.sql:
+#   - title popularity is Zipfian and user activity is log-normal, so a few
+#     titles and heavy users dominate watch_history
+#   - titles have 1-4 genres drawn from a skewed genre distribution
+#   - users hold 1-3 consecutive subscriptions; the last one is churned
+#     (cancelled) with probability churn_rate
+#   - users.watch_time_hours equals what the triggers would have summed
+# watch_history is produced in chunks, so 100M events need only a chunk's
+# worth of memory. Output is the same for a given seed and chunk_size.
+#
+#   python datagen.py --scale 1m --out data/1m
+#   python datagen.py --scale 100m --out data/100m --format parquet
+
+SCALES = {
+    '10k': {'users': 1_000, 'titles': 500, 'events': 10_000},
+    '1m': {'users': 50_000, 'titles': 5_000, 'events': 1_000_000},
+    '10m': {'users': 300_000, 'titles': 20_000, 'events': 10_000_000},
+    '100m': {'users': 2_000_000, 'titles': 50_000, 'events': 100_000_000},
+}
+
+GENRES = ['drama', 'comedy', 'thriller', 'action', 'romance', 'documentation', 'crime', 'family',
+          'animation', 'fantasy', 'scifi', 'horror', 'european', 'reality', 'history', 'music',
+          'sport', 'war', 'western']
+
+COUNTRIES = ['US', 'IN', 'GB', 'BR', 'CA', 'DE', 'FR', 'MX', 'ES', 'JP', 'KR', 'AU', 'IT', 'NL', 'TR']
+
+PLANS = {'Basic': 8.99, 'Standard': 13.99, 'Premium': 17.99}
+
+SOURCES = [('Netflix', 'US'), ('Hulu', 'US'), ('Prime Video', 'US'), ('Disney+', 'US'),
+           ('HBO Max', 'US'), ('BBC iPlayer', 'GB'), ('Crunchyroll', 'JP'), ('Globoplay', 'BR')]
+
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn',
+               'Priya', 'Wei', 'Lucas', 'Sofia', 'Mateo', 'Aisha', 'Yuki', 'Omar', 'Elena', 'Noah']
+LAST_NAMES = ['Smith', 'Garcia', 'Chen', 'Patel', 'Kim', 'Silva', 'Muller', 'Rossi', 'Nguyen', 'Khan',
+              'Brown', 'Lopez', 'Sato', 'Novak', 'Okafor', 'Dubois', 'Cohen', 'Larsen', 'Haddad', 'Ivanov']
+
+WORDS = ['love', 'war', 'family', 'secret', 'city', 'detective', 'space', 'dream', 'island', 'revenge',
+         'friendship', 'murder', 'journey', 'kingdom', 'school', 'music', 'heist', 'ghost', 'future',
+         'history', 'comedy', 'romance', 'survival', 'monster', 'power', 'truth', 'escape', 'legacy']
+
+START = np.datetime64('2020-01-01')
+END = np.datetime64('2025-06-30')
+
+
+def _rng(seed, *key):
+    return np.random.default_rng(np.random.SeedSequence([seed, *key]))
+
+
+def zipf_weights(n, a=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** a
+    return weights / weights.sum()
+
+
+def _random_days(rng, low, high, size):
+    span = (high - low).astype(int)
+    return low + rng.integers(0, max(span, 1), size).astype('timedelta64[D]')
+
+
+def generate_titles(n_titles, seed=0):
+    rng = _rng(seed, 1)
+    is_show = rng.random(n_titles) < 0.35
+    runtime = np.where(is_show, rng.integers(20, 65, n_titles), np.clip(rng.normal(102, 22, n_titles), 60, 210))
+    score = np.round(np.clip(rng.normal(6.5, 1.1, n_titles), 1.0, 9.8), 1)
+    score[rng.random(n_titles) < 0.03] = np.nan
+    words = rng.choice(WORDS, size=(n_titles, 8))
+    titles = pd.DataFrame({
+        'title_id': [f'tm{i:07d}' for i in range(n_titles)],
+        'title': [f'{w[0].title()} of the {w[1].title()} {i}' for i, w in enumerate(words)],
+        'type': np.where(is_show, 'SHOW', 'MOVIE'),
+        'description': [' '.join(w) for w in words],
+        'release_year': np.clip(2024 - rng.exponential(9, n_titles).astype(int), 1950, 2024),
+        'age_certification': rng.choice(['G', 'PG', 'PG-13', 'R', 'TV-MA', 'TV-14', None], n_titles),
+        'runtime': runtime.astype(int),
+        'production_countries': [f"['{c}']" for c in rng.choice(COUNTRIES, n_titles)],
+        'seasons': np.where(is_show, rng.integers(1, 9, n_titles), None),
+        'imdb_id': [f'tt{i:08d}' for i in rng.permutation(n_titles)],
+        'imdb_score': score,
+        'imdb_votes': rng.lognormal(8, 1.5, n_titles).astype(int),
+        'tmdb_popularity': np.round(rng.lognormal(2.5, 1.0, n_titles), 3),
+        'tmdb_score': np.round(np.clip(score + rng.normal(0, 0.5, n_titles), 1, 10), 1),
+    })
+
+    # 1-4 genres per title, popular genres first
+    genre_p = zipf_weights(len(GENRES), 0.8)
+    counts = rng.choice([1, 2, 3, 4], n_titles, p=[0.3, 0.4, 0.2, 0.1])
+    pairs = set()
+    for i, k in enumerate(counts):
+        for g in rng.choice(len(GENRES), k, replace=False, p=genre_p):
+            pairs.add((i, int(g) + 1))
+    pairs = np.array(sorted(pairs))
+    title_genres = pd.DataFrame({'title_id': titles['title_id'].to_numpy()[pairs[:, 0]], 'genre_id': pairs[:, 1]})
+    genres = pd.DataFrame({'genre_id': np.arange(1, len(GENRES) + 1), 'name': GENRES})
+
+    sources = pd.DataFrame({'source_id': np.arange(1, len(SOURCES) + 1),
+                            'name': [s[0] for s in SOURCES], 'region': [s[1] for s in SOURCES]})
+    per_title = rng.integers(1, 3, n_titles)
+    rows = np.repeat(np.arange(n_titles), per_title)
+    source_ids = rng.integers(1, len(SOURCES) + 1, len(rows))
+    title_sources = pd.DataFrame({'title_id': titles['title_id'].to_numpy()[rows], 'source_id': source_ids})
+    title_sources = title_sources.drop_duplicates(['title_id', 'source_id'], ignore_index=True)
+    title_sources['link'] = 'https://example.com/' + title_sources['title_id'] + '/' + title_sources['source_id'].astype(str)
+    return titles, genres, title_genres, sources, title_sources
+
+
+def generate_users(n_users, seed=0):
+    rng = _rng(seed, 2)
+    created = _random_days(rng, START, END - np.timedelta64(90, 'D'), n_users)
+    users = pd.DataFrame({
+        'user_id': [f'U{i:07d}' for i in range(n_users)],
+        'name': [f'{a} {b}' for a, b in zip(rng.choice(FIRST_NAMES, n_users), rng.choice(LAST_NAMES, n_users))],
+        'age': np.clip(rng.normal(35, 12, n_users), 13, 90).astype(int),
+        'country': rng.choice(COUNTRIES, n_users, p=zipf_weights(len(COUNTRIES), 0.9)),
+        'watch_time_hours': 0.0,
+        'favorite_genre': rng.choice(GENRES, n_users, p=zipf_weights(len(GENRES), 0.8)),
+        'last_login': created + (rng.random(n_users) * (END - created).astype(int)).astype('timedelta64[D]'),
+        'created_at': pd.to_datetime(created),
+        'updated_at': pd.to_datetime(created),
+    })
+    return users
+
+
+def generate_subscriptions(users, seed=0, churn_rate=0.25):
+    rng = _rng(seed, 3)
+    n = len(users)
+    per_user = rng.choice([1, 2, 3], n, p=[0.6, 0.3, 0.1])
+    owner = np.repeat(np.arange(n), per_user)
+    position = np.arange(len(owner)) - np.repeat(np.cumsum(per_user) - per_user, per_user)
+    is_last = position == per_user[owner] - 1
+
+    # Consecutive periods starting at the user's sign-up date
+    lengths = rng.integers(30, 420, len(owner)).astype('timedelta64[D]')
+    offsets = np.zeros(len(owner), dtype='timedelta64[D]')
+    for p in range(1, 3):
+        mask = position == p
+        offsets[mask] = offsets[np.flatnonzero(mask) - 1] + lengths[np.flatnonzero(mask) - 1]
+    starts = users['created_at'].to_numpy().astype('datetime64[D]')[owner] + offsets
+    starts = np.minimum(starts, END - np.timedelta64(1, 'D'))
+    ends = np.minimum(starts + lengths, END)
+
+    churned = is_last & (rng.random(len(owner)) < churn_rate)
+    plan = rng.choice(list(PLANS), len(owner), p=[0.4, 0.35, 0.25])
+    status = np.where(~is_last, 'inactive', np.where(churned, 'cancelled', 'active'))
+    return pd.DataFrame({
+        'subscription_id': np.arange(1, len(owner) + 1),
+        'user_id': users['user_id'].to_numpy()[owner],
+        'subscription_type': plan,
+        'monthly_fee': np.array([PLANS[p] for p in plan]),
+        'subscription_status': status,
+        'subscription_start_date': pd.to_datetime(starts),
+        'subscription_end_date': pd.to_datetime(np.where(is_last & ~churned, np.datetime64('NaT'), ends)),
+    })
+
+
+def iter_watch_history(n_events, users, titles, seed=0, chunk_size=1_000_000, zipf_a=1.1):
+    # Yields (chunk DataFrame, per-user watch hours added by the chunk).
+    # Chunk i covers the i-th slice of the time range, so watch_id grows
+    # with created_at, and only users who signed up by then can watch.
+    rng = _rng(seed, 4)
+    n_users, n_titles = len(users), len(titles)
+    title_p = zipf_weights(n_titles, zipf_a)[rng.permutation(n_titles)]
+    signup = users['created_at'].to_numpy().astype('datetime64[s]').astype(np.int64)
+    by_signup = np.argsort(signup, kind='stable')
+    signup_sorted = signup[by_signup]
+    activity = np.cumsum(rng.lognormal(0, 1.0, n_users)[by_signup])
+    runtime = titles['runtime'].to_numpy(dtype=np.float64)
+    user_ids, title_ids = users['user_id'].to_numpy(), titles['title_id'].to_numpy()
+    start_s = START.astype('datetime64[s]').astype(np.int64)
+    span_s = int((END - START).astype('timedelta64[s]').astype(np.int64))
+
+    for chunk, offset in enumerate(range(0, n_events, chunk_size)):
+        size = min(chunk_size, n_events - offset)
+        crng = _rng(seed, 5, chunk)
+        slice_start = start_s + span_s * offset // n_events
+        slice_end = start_s + span_s * (offset + size) // n_events
+        eligible = max(int(np.searchsorted(signup_sorted, slice_end, side='right')), 1)
+        picks = np.searchsorted(activity[:eligible], crng.random(size) * activity[eligible - 1])
+        u = by_signup[np.minimum(picks, eligible - 1)]
+        t = crng.choice(n_titles, size, p=title_p)
+        low = np.maximum(signup[u], slice_start)
+        created = low + (crng.random(size) * np.maximum(slice_end - low, 0)).astype(np.int64)
+        order = np.argsort(created, kind='stable')
+        u, t, created = u[order], t[order], created[order]
+        # A third of views finish; the rest stop somewhere along the way
+        finished = crng.random(size) < 0.35
+        pct = np.round(np.where(finished, crng.uniform(0.9, 1.0, size), crng.beta(2, 3, size) * 0.9), 2)
+        created = created.astype('datetime64[s]')
+        frame = pd.DataFrame({
+            'watch_id': np.arange(offset + 1, offset + size + 1),
+            'user_id': user_ids[u],
+            'title_id': title_ids[t],
+            'watch_percentage': pct,
+            'completed': (pct >= 0.9).astype(np.int8),
+            'created_at': created,
+            'updated_at': created,
+        })
+        hours = np.bincount(u, weights=runtime[t] * pct / 60, minlength=n_users)
+        yield frame, hours
+
+
+def generate(scale='10k', seed=0, chunk_size=1_000_000, **overrides):
+    # All tables as DataFrames; for scales that fit in memory
+    sizes = dict(SCALES[scale], **overrides)
+    titles, genres, title_genres, sources, title_sources = generate_titles(sizes['titles'], seed)
+    users = generate_users(sizes['users'], seed)
+    hours = np.zeros(len(users))
+    chunks = []
+    for frame, added in iter_watch_history(sizes['events'], users, titles, seed, chunk_size):
+        chunks.append(frame)
+        hours += added
+    users['watch_time_hours'] = np.round(hours, 2)
+    return {
+        'users': users, 'titles': titles, 'genres': genres, 'title_genres': title_genres,
+        'sources': sources, 'title_sources': title_sources,
+        'subscriptions': generate_subscriptions(users, seed),
+        'watch_history': pd.concat(chunks, ignore_index=True) if chunks else None,
+    }
+
+
+class _TableWriter:
+    # Appends chunks to <out>/<table>.csv or .parquet
+    def __init__(self, out_dir, table, fmt):
+        self.path = os.path.join(out_dir, f'{table}.{fmt}')
+        self.columns = list(TABLE_COLUMNS[table])
+        self.fmt = fmt
+        self._writer = None
+        self._header = True
+
+    def write(self, frame):
+        frame = frame[self.columns]
+        if self.fmt == 'csv':
+            frame.to_csv(self.path, mode='w' if self._header else 'a', header=self._header, index=False)
+            self._header = False
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table.cast(self._writer.schema))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def write_dataset(out_dir, scale='10k', seed=0, fmt='csv', chunk_size=1_000_000, **overrides):
+    # Streams watch_history to disk chunk by chunk, then writes users with
+    # the accumulated watch_time_hours
+    sizes = dict(SCALES[scale], **overrides)
+    os.makedirs(out_dir, exist_ok=True)
+    started = time.perf_counter()
+    titles, genres, title_genres, sources, title_sources = generate_titles(sizes['titles'], seed)
+    users = generate_users(sizes['users'], seed)
+
+    writer = _TableWriter(out_dir, 'watch_history', fmt)
+    hours = np.zeros(len(users))
+    written = 0
+    for frame, added in iter_watch_history(sizes['events'], users, titles, seed, chunk_size):
+        writer.write(frame)
+        hours += added
+        written += len(frame)
+        print(f"watch_history: {written:,}/{sizes['events']:,} rows")
+    writer.close()
+    users['watch_time_hours'] = np.round(hours, 2)
+
+    tables = {'users': users, 'titles': titles, 'genres': genres, 'title_genres': title_genres,
+              'sources': sources, 'title_sources': title_sources,
+              'subscriptions': generate_subscriptions(users, seed)}
+    for table, frame in tables.items():
+        table_writer = _TableWriter(out_dir, table, fmt)
+        table_writer.write(frame)
+        table_writer.close()
+    counts = {table: len(frame) for table, frame in tables.items()}
+    counts['watch_history'] = written
+    print(f"Wrote {sum(counts.values()):,} rows to {out_dir} in {time.perf_counter() - started:.1f}s")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Netflix analytics dataset")
+    parser.add_argument('--scale', choices=list(SCALES), default='10k')
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--titles', type=int)
+    parser.add_argument('--events', type=int)
+    args = parser.parse_args()
+    overrides = {k: getattr(args, k) for k in ('users', 'titles', 'events') if getattr(args, k)}
+    write_dataset(args.out, args.scale, args.seed, args.format, args.chunk_size, **overrides)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pyodbc
+
+# ------------------------------
+# Connection settings
+# ------------------------------
+DB_SERVER = os.environ.get("NETFLIX_DB_SERVER", "0.0.0.0,1433")
+DB_NAME = os.environ.get("NETFLIX_DB_NAME", "netflix_analytics")
+DB_USER = os.environ.get("NETFLIX_DB_USER", "sa")
+DB_PASSWORD = os.environ.get("NETFLIX_DB_PASSWORD", "p@ssw0rd")
+
+
+def find_sql_server_drivers():
+    drivers = [x for x in pyodbc.drivers() if 'SQL Server' in x]
+    # Prefer ODBC Driver 18 when it is installed
+    return sorted(drivers, key=lambda x: '18' in x, reverse=True)
+
+
+def build_connection_string(driver):
+    return (
+        f'DRIVER={{{driver}}};'
+        f'SERVER={DB_SERVER};'
+        f'DATABASE={DB_NAME};'
+        f'UID={DB_USER};'
+        f'PWD={DB_PASSWORD};'
+        'TrustServerCertificate=yes;'
+        'Encrypt=no;'
+    )
+
+
+def resolve_connect(drivers=None, timeout=5):
+    # Probe the installed drivers once and return a factory bound to the
+    # first one that connects, so pooled reconnects skip the probing.
+    drivers = find_sql_server_drivers() if drivers is None else drivers
+    errors = []
+    for driver in drivers:
+        conn_str = build_connection_string(driver)
+        try:
+            pyodbc.connect(conn_str, timeout=timeout).close()
+        except pyodbc.Error as e:
+            print(f"Failed with {driver}: {str(e)}")
+            errors.append(e)
+            continue
+        print(f"Using driver: {driver}")
+
+        def connect(conn_str=conn_str):
+            return pyodbc.connect(conn_str, timeout=timeout)
+        # Kept for clients that open their own connections (arrow-odbc)
+        connect.connection_string = conn_str
+        return connect
+    raise pyodbc.InterfaceError(f"Database connection failed with all available drivers: {drivers} ({errors})")
+
+
+def is_disconnect(exc):
+    # SQLSTATE class 08 is "connection exception"
+    if isinstance(exc, (pyodbc.OperationalError, pyodbc.InterfaceError)):
+        return True
+    state = exc.args[0] if getattr(exc, 'args', None) else ''
+    return isinstance(state, str) and state.startswith('08')
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# ------------------------------
+# Bounded connection pool
+# ------------------------------
+class ConnectionPool:
+    def __init__(self, connect, max_size=8, timeout=30, max_idle_seconds=300,
+                 health_check_interval=30):
+        self._connect = connect
+        self.connection_string = getattr(connect, 'connection_string', None)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle_seconds = max_idle_seconds
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        self._idle = []  # (conn, last_used) pairs, most recently used last
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+
+        self._created = 0
+        self._failed = 0
+        self._evicted = 0
+        self._discarded = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    # -- checkout / checkin ---------------------------------------------
+    def acquire(self):
+        start = time.perf_counter()
+        deadline = start + self.timeout
+        waited = False
+        while True:
+            conn, last_used, create = None, None, False
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Connection pool is closed")
+                    self._evict_idle_locked()
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        raise PoolTimeout(f"No connection available within {self.timeout}s "
+                                          f"({self._in_use}/{self.max_size} in use)")
+                    waited = True
+                    self._cond.wait(remaining)
+                self._in_use += 1
+
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._in_use -= 1
+                        self._failed += 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created += 1
+            elif time.monotonic() - last_used > self.health_check_interval and not self._is_healthy(conn):
+                self._discard(conn)
+                continue
+
+            self._record_wait(time.perf_counter() - start, waited)
+            return conn
+
+    def release(self, conn, broken=False):
+        if not broken:
+            try:
+                # Leave no open transaction behind for the next borrower
+                conn.rollback()
+            except Exception:
+                broken = True
+        if broken:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._in_use -= 1
+            if self._closed:
+                self._size -= 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except Exception as e:
+            self.release(conn, broken=is_disconnect(e))
+            raise
+        else:
+            self.release(conn)
+
+    def run(self, fn, retries=1):
+        # Call fn(conn) on a pooled connection, reconnecting and retrying
+        # when the connection turned out to be dead.
+        for attempt in range(retries + 1):
+            try:
+                with self.connection() as conn:
+                    return fn(conn)
+            except Exception as e:
+                if attempt < retries and is_disconnect(e):
+                    continue
+                raise
+
+    # -- maintenance ----------------------------------------------------
+    def _is_healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _evict_idle_locked(self):
+        now = time.monotonic()
+        keep = []
+        for conn, last_used in self._idle:
+            if now - last_used > self.max_idle_seconds:
+                self._size -= 1
+                self._evicted += 1
+                self._close_quietly(conn)
+            else:
+                keep.append((conn, last_used))
+        self._idle = keep
+
+    def _discard(self, conn):
+        self._close_quietly(conn)
+        with self._cond:
+            self._size -= 1
+            self._in_use -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+    def _record_wait(self, elapsed, waited):
+        with self._cond:
+            self._checkouts += 1
+            self._wait_total += elapsed
+            self._wait_max = max(self._wait_max, elapsed)
+            if waited:
+                self._waits += 1
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._size -= 1
+                self._close_quietly(conn)
+            self._idle = []
+            self._cond.notify_all()
+
+    def metrics(self):
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'created': self._created,
+                'failed': self._failed,
+                'evicted': self._evicted,
+                'discarded': self._discarded,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'avg_wait_ms': round(self._wait_total / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                'max_wait_ms': round(self._wait_max * 1000, 3),
+            }
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from query_cache import normalize_sql
+
+# ------------------------------
+# Query instrumentation
+# ------------------------------
+# QueryStats keeps the last `max_records` query executions in memory:
+# execute / fetch / build phases, total latency, rows, result bytes and
+# whether the query cache answered it. Per-query cumulative histograms
+# are kept alongside so the Prometheus export stays monotonic when old
+# records roll out of the window.
+#
+# Queries are labelled "<page>/<name>" when they come from PAGE_QUERIES
+# and "sql:<hash>" otherwise, so bound parameters never add labels.
+
+PHASES = ('execute', 'fetch', 'build')
+
+# Upper bounds in seconds, as in a Prometheus histogram
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def query_labels(page_queries):
+    # {normalized sql: "<page>/<name>"} for every declared page query
+    labels = {}
+    for page, plan in page_queries.items():
+        for name, sql in plan.items():
+            labels.setdefault(normalize_sql(sql), f'{page}/{name}')
+    return labels
+
+
+def sql_label(sql):
+    return 'sql:' + hashlib.sha1(normalize_sql(sql).encode('utf-8')).hexdigest()[:10]
+
+
+class _Totals:
+    __slots__ = ('sql', 'buckets', 'count', 'seconds', 'rows', 'bytes', 'hits', 'misses', 'errors')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.buckets = np.zeros(len(LATENCY_BUCKETS) + 1, dtype=np.int64)
+        self.count = self.rows = self.bytes = self.hits = self.misses = self.errors = 0
+        self.seconds = 0.0
+
+
+class QueryStats:
+    def __init__(self, max_records=5000, labels=None):
+        self.max_records = max_records
+        self.labels = dict(labels or {})
+        self.started = time.time()
+        self._records = deque(maxlen=max_records)
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def label(self, sql):
+        return self.labels.get(normalize_sql(sql)) or sql_label(sql)
+
+    def record(self, sql, seconds, kind='read', label=None, rows=None, nbytes=None, cache=None,
+               error=None, **phases):
+        # cache is 'hit', 'miss' or None when the query bypassed the cache;
+        # sql may be None for non-SQL operations given an explicit label
+        label = label or self.label(sql)
+        record = {
+            'ts': time.time(),
+            'query': label,
+            'kind': kind,
+            'seconds': seconds,
+            **{phase: phases.get(phase) for phase in PHASES},
+            'rows': rows,
+            'bytes': nbytes,
+            'cache': cache,
+            'error': error,
+        }
+        with self._lock:
+            self._records.append(record)
+            totals = self._totals.get((label, kind))
+            if totals is None:
+                totals = self._totals[label, kind] = _Totals(normalize_sql(sql)[:200] if sql else label)
+            totals.buckets[np.searchsorted(LATENCY_BUCKETS, seconds)] += 1
+            totals.count += 1
+            totals.seconds += seconds
+            totals.rows += rows or 0
+            totals.bytes += nbytes or 0
+            totals.hits += cache == 'hit'
+            totals.misses += cache == 'miss'
+            totals.errors += error is not None
+        return record
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._totals.clear()
+
+    # -- views over the rolling window --------------------------------
+    def records(self):
+        with self._lock:
+            records = list(self._records)
+        frame = pd.DataFrame(records, columns=['ts', 'query', 'kind', 'seconds', *PHASES,
+                                               'rows', 'bytes', 'cache', 'error'])
+        frame['ts'] = pd.to_datetime(frame['ts'], unit='s')
+        return frame
+
+    def summary(self):
+        # One row per query, slowest p95 first
+        frame = self.records()
+        if frame.empty:
+            return pd.DataFrame(columns=['query', 'kind', 'calls', 'p50_ms', 'p95_ms', 'max_ms',
+                                         *[f'{phase}_ms' for phase in PHASES], 'avg_rows',
+                                         'avg_kb', 'hit_rate', 'errors'])
+        grouped = frame.groupby(['query', 'kind'])
+        keys = [frame['query'], frame['kind']]
+        hits = (frame['cache'] == 'hit').groupby(keys).sum()
+        cached = frame['cache'].notna().groupby(keys).sum()
+        summary = pd.DataFrame({
+            'calls': grouped.size(),
+            'p50_ms': grouped['seconds'].quantile(0.5) * 1000,
+            'p95_ms': grouped['seconds'].quantile(0.95) * 1000,
+            'max_ms': grouped['seconds'].max() * 1000,
+            **{f'{phase}_ms': grouped[phase].mean() * 1000 for phase in PHASES},
+            'avg_rows': grouped['rows'].mean(),
+            'avg_kb': grouped['bytes'].mean() / 1024,
+            'hit_rate': hits / cached.where(cached > 0),
+            'errors': grouped['error'].count(),
+        }).reset_index()
+        return summary.sort_values('p95_ms', ascending=False, ignore_index=True).round(2)
+
+    def statements(self):
+        # {label: normalized SQL}, to show what a "sql:<hash>" label ran
+        with self._lock:
+            return {label: totals.sql for (label, _), totals in self._totals.items()}
+
+    def slowest(self, n=10):
+        return self.summary().head(n)
+
+    def histogram(self, query=None):
+        # Counts per latency bucket over the rolling window
+        frame = self.records()
+        if query is not None:
+            frame = frame[frame['query'] == query]
+        counts = np.bincount(np.searchsorted(LATENCY_BUCKETS, frame['seconds'].to_numpy(dtype=np.float64)),
+                             minlength=len(LATENCY_BUCKETS) + 1)
+        bounds = [f'<= {b * 1000:g} ms' for b in LATENCY_BUCKETS] + [f'> {LATENCY_BUCKETS[-1] * 1000:g} ms']
+        return pd.DataFrame({'bucket': bounds, 'le': [*LATENCY_BUCKETS, float('inf')], 'count': counts})
+
+    # -- exports --------------------------------------------------------
+    def to_prometheus(self, prefix='netflix_query'):
+        with self._lock:
+            totals = {key: (t.buckets.copy(), t.count, t.seconds, t.rows, t.bytes, t.hits, t.misses, t.errors)
+                      for key, t in self._totals.items()}
+        lines = [
+            f'# HELP {prefix}_duration_seconds Query latency including cache lookups.',
+            f'# TYPE {prefix}_duration_seconds histogram',
+        ]
+        for (label, kind), (buckets, count, seconds, *_) in sorted(totals.items()):
+            tags = f'query="{_escape(label)}",kind="{kind}"'
+            for bound, cumulative in zip(LATENCY_BUCKETS, np.cumsum(buckets)):
+                lines.append(f'{prefix}_duration_seconds_bucket{{{tags},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{prefix}_duration_seconds_bucket{{{tags},le="+Inf"}} {count}')
+            lines.append(f'{prefix}_duration_seconds_sum{{{tags}}} {seconds:.6f}')
+            lines.append(f'{prefix}_duration_seconds_count{{{tags}}} {count}')
+        counters = [
+            ('rows_total', 'Rows returned.', 3),
+            ('result_bytes_total', 'Approximate result size in bytes.', 4),
+            ('cache_hits_total', 'Results served from the query cache.', 5),
+            ('cache_misses_total', 'Results loaded from the backend.', 6),
+            ('errors_total', 'Failed executions.', 7),
+        ]
+        for name, help_text, position in counters:
+            lines.append(f'# HELP {prefix}_{name} {help_text}')
+            lines.append(f'# TYPE {prefix}_{name} counter')
+            for (label, kind), values in sorted(totals.items()):
+                lines.append(f'{prefix}_{name}{{query="{_escape(label)}",kind="{kind}"}} {values[position]}')
+        return '\n'.join(lines) + '\n'
+
+    def to_jsonl(self):
+        with self._lock:
+            records = list(self._records)
+        return ''.join(json.dumps(record, default=str) + '\n' for record in records)
+
+    def export(self, path, fmt=None):
+        # Atomic write, so a Prometheus textfile collector never reads half a file
+        fmt = fmt or ('jsonl' if path.endswith('.jsonl') else 'prometheus')
+        text = self.to_jsonl() if fmt == 'jsonl' else self.to_prometheus()
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, path)
+        return path
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
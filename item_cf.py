@@ -0,0 +1,265 @@
+import threading
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from snapshot import PAIR_SHIFT
+
+# ------------------------------
+# Item-item collaborative filtering index
+# ------------------------------
+# Built from watch_history (user_id, title_id, watch_percentage). Each
+# (user, title) pair is weighted by the user's best watch_percentage for
+# the title, item-item similarity is the cosine of the title columns, and
+# only the top-N neighbours per title are kept.
+#
+# New events update the raw co-occurrence dot products in place, one
+# batch of (title, other) deltas at a time. A pair that was not already
+# among a title's neighbours enters with only the new co-occurrence, so
+# the incremental index can under-rank such pairs until the next full
+# build.
+
+
+def dedupe_max(users, titles, weights):
+    # Collapse repeated (user, title) events to their max weight
+    keys = users.astype(np.int64) * PAIR_SHIFT + titles
+    if keys.size == 0:
+        return users.astype(np.int32), titles.astype(np.int32), weights
+    order = np.argsort(keys, kind='stable')
+    keys, weights = keys[order], weights[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    unique = keys[starts]
+    return (unique // PAIR_SHIFT).astype(np.int32), (unique % PAIR_SHIFT).astype(np.int32), \
+        np.maximum.reduceat(weights, starts)
+
+
+class ItemItemIndex:
+    def __init__(self, n_titles, n_neighbours=50, block_size=2048):
+        self.n_titles = n_titles
+        self.n_neighbours = n_neighbours
+        self.block_size = block_size
+        self.neighbours = np.full((n_titles, n_neighbours), -1, dtype=np.int32)
+        self.dots = np.zeros((n_titles, n_neighbours), dtype=np.float32)
+        self.norms2 = np.zeros(n_titles, dtype=np.float64)
+        self.ratings = sparse.csr_matrix((0, n_titles), dtype=np.float32)
+        self._overlay = {}  # user -> {title: weight} written since the last build
+        self._lock = threading.RLock()
+        self.title_ids = None
+        self.title_index = {}
+        self.user_index = {}
+        self.titles = self.release_years = self.scores = None
+
+    # -- full build -----------------------------------------------------
+    def build(self, users, titles, weights, n_users=None):
+        users, titles, weights = dedupe_max(
+            np.asarray(users), np.asarray(titles), np.nan_to_num(np.asarray(weights, dtype=np.float32)))
+        n_users = int(users.max()) + 1 if n_users is None and users.size else (n_users or 0)
+        ratings = sparse.csr_matrix((weights, (users, titles)), shape=(n_users, self.n_titles), dtype=np.float32)
+        by_title = ratings.T.tocsr()
+        norms2 = np.asarray(ratings.multiply(ratings).sum(axis=0), dtype=np.float64).ravel()
+
+        neighbours = np.full((self.n_titles, self.n_neighbours), -1, dtype=np.int32)
+        dots = np.zeros((self.n_titles, self.n_neighbours), dtype=np.float32)
+        norms = np.sqrt(norms2)
+        for start in range(0, self.n_titles, self.block_size):
+            stop = min(start + self.block_size, self.n_titles)
+            # Co-occurrence dot products for a block of titles against all titles
+            block = (by_title[start:stop] @ ratings).tocsr()
+            for i in range(stop - start):
+                lo, hi = block.indptr[i], block.indptr[i + 1]
+                cols, values = block.indices[lo:hi], block.data[lo:hi]
+                keep = cols != start + i
+                cols, values = cols[keep], values[keep]
+                if cols.size == 0:
+                    continue
+                sims = values / np.maximum(norms[start + i] * norms[cols], 1e-12)
+                if cols.size > self.n_neighbours:
+                    top = np.argpartition(-sims, self.n_neighbours - 1)[:self.n_neighbours]
+                    cols, values, sims = cols[top], values[top], sims[top]
+                order = np.argsort(-sims, kind='stable')
+                neighbours[start + i, :cols.size] = cols[order]
+                dots[start + i, :cols.size] = values[order]
+
+        with self._lock:
+            self.ratings = ratings
+            self.norms2 = norms2
+            self.neighbours, self.dots = neighbours, dots
+            self._overlay = {}
+        return self
+
+    @classmethod
+    def from_snapshot(cls, snapshot, n_neighbours=50):
+        with snapshot._lock:
+            index = cls(len(snapshot.titles), n_neighbours=n_neighbours)
+            events = snapshot.events
+            index.build(events['user'], events['title'], events['watch_percentage'], n_users=len(snapshot.users))
+            index._title_metadata(snapshot)
+            index.title_index = snapshot.titles.codes
+            index.user_index = snapshot.users.codes
+            snapshot.subscribe(index._on_events)
+        return index
+
+    def _title_metadata(self, snapshot):
+        with self._lock:
+            self.title_ids = np.array(snapshot.titles.values, dtype=object)
+            self.titles = snapshot.title_name[:self.n_titles].copy()
+            self.release_years = snapshot.title_year[:self.n_titles].copy()
+            self.scores = snapshot.title_score[:self.n_titles].copy()
+
+    def _on_events(self, snapshot, batch):
+        # The snapshot reloads titles when an event names a new one; title
+        # codes only ever grow, so the index grows with them
+        with self._lock:
+            if len(snapshot.titles) > self.n_titles:
+                self.add_titles(len(snapshot.titles))
+                self._title_metadata(snapshot)
+        self.update(batch['user'], batch['title'], batch['watch_percentage'])
+
+    def add_titles(self, n_titles):
+        # New titles start with no neighbours and no ratings
+        with self._lock:
+            extra = n_titles - self.n_titles
+            if extra <= 0:
+                return
+            self.neighbours = np.vstack([self.neighbours, np.full((extra, self.n_neighbours), -1, dtype=np.int32)])
+            self.dots = np.vstack([self.dots, np.zeros((extra, self.n_neighbours), dtype=np.float32)])
+            self.norms2 = np.concatenate([self.norms2, np.zeros(extra)])
+            self.ratings = sparse.csr_matrix(
+                (self.ratings.data, self.ratings.indices, self.ratings.indptr),
+                shape=(self.ratings.shape[0], n_titles))
+            self.n_titles = n_titles
+
+    # -- incremental updates --------------------------------------------
+    def _history(self, user):
+        # The user's current (title -> weight) map: built rows plus overlay
+        history = {}
+        if user < self.ratings.shape[0]:
+            lo, hi = self.ratings.indptr[user], self.ratings.indptr[user + 1]
+            history = dict(zip(self.ratings.indices[lo:hi].tolist(), self.ratings.data[lo:hi].tolist()))
+        history.update(self._overlay.get(user, {}))
+        return history
+
+    def update(self, users, titles, weights):
+        users, titles, weights = dedupe_max(
+            np.asarray(users), np.asarray(titles), np.nan_to_num(np.asarray(weights, dtype=np.float32)))
+        if users.size == 0:
+            return
+        starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+        stops = np.r_[starts[1:], users.size]
+        with self._lock:
+            rows, cols, deltas, bumped, grown = [], [], [], [], []
+            for lo, hi in zip(starts.tolist(), stops.tolist()):
+                # One history per user: old and new weights over every title
+                # the user has watched, including the ones in this batch
+                user = int(users[lo])
+                history = self._history(user)
+                seen = np.fromiter(history.keys(), dtype=np.int64, count=len(history))
+                known = np.union1d(seen, titles[lo:hi])
+                before = np.zeros(known.size)
+                before[np.searchsorted(known, seen)] = np.fromiter(history.values(), dtype=np.float64,
+                                                                   count=len(history))
+                after = before.copy()
+                at = np.searchsorted(known, titles[lo:hi])
+                after[at] = np.maximum(after[at], weights[lo:hi])
+                changed = np.flatnonzero(after > before)
+                if changed.size == 0:
+                    continue
+                self._overlay.setdefault(user, {}).update(
+                    zip(known[changed].tolist(), after[changed].astype(np.float32).tolist()))
+                bumped.append(known[changed])
+                grown.append(after[changed] ** 2 - before[changed] ** 2)
+
+                # Dot product change for (changed title, any title) pairs;
+                # both directions, counting pairs of two changed titles once
+                delta = np.outer(after[changed], after) - np.outer(before[changed], before)
+                delta[np.arange(changed.size), changed] = 0
+                a, b = np.nonzero(delta > 0)
+                back = after[b] <= before[b]
+                rows += [known[changed[a]], known[b[back]]]
+                cols += [known[b], known[changed[a[back]]]]
+                deltas += [delta[a, b], delta[a[back], b[back]]]
+            if not bumped:
+                return
+            np.add.at(self.norms2, np.concatenate(bumped), np.concatenate(grown))
+            self._apply_pairs(np.concatenate(rows), np.concatenate(cols), np.concatenate(deltas))
+
+    def _apply_pairs(self, rows, cols, deltas):
+        keys, inverse = np.unique(rows * PAIR_SHIFT + cols, return_inverse=True)
+        deltas = np.bincount(inverse.ravel(), weights=deltas, minlength=keys.size).astype(np.float32)
+        rows, cols = keys // PAIR_SHIFT, keys % PAIR_SHIFT
+
+        # Pairs already among the neighbours just add to their dot product
+        hit = self.neighbours[rows] == cols[:, None]
+        found = hit.any(axis=1)
+        self.dots[rows[found], hit[found].argmax(axis=1)] += deltas[found]
+
+        # The rest compete with the current neighbours for the top-N slots
+        rows, cols, deltas = rows[~found], cols[~found], deltas[~found]
+        if rows.size == 0:
+            return
+        norms = np.sqrt(self.norms2)
+        starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        for lo, hi in zip(starts.tolist(), np.r_[starts[1:], rows.size].tolist()):
+            title = int(rows[lo])
+            row = self.neighbours[title]
+            valid = row >= 0
+            merged = np.concatenate([row[valid], cols[lo:hi]])
+            values = np.concatenate([self.dots[title, valid], deltas[lo:hi]])
+            sims = values / np.maximum(norms[title] * norms[merged], 1e-12)
+            order = np.argsort(-sims, kind='stable')[:self.n_neighbours]
+            self.neighbours[title] = -1
+            self.dots[title] = 0
+            self.neighbours[title, :order.size] = merged[order]
+            self.dots[title, :order.size] = values[order]
+
+    # -- queries --------------------------------------------------------
+    def similar(self, title, k=10):
+        # (neighbour codes, cosine similarities) for a title code
+        with self._lock:
+            row = self.neighbours[title]
+            valid = row >= 0
+            cols = row[valid]
+            sims = self.dots[title, valid] / np.sqrt(np.maximum(self.norms2[title] * self.norms2[cols], 1e-24))
+            order = np.argsort(-sims, kind='stable')[:k]
+            return cols[order], sims[order]
+
+    def score_user(self, user, k=10):
+        # Sum of neighbour similarities weighted by the user's watch_percentage
+        with self._lock:
+            history = self._history(user)
+            if not history:
+                return np.empty(0, dtype=np.int64), np.empty(0)
+            watched = np.fromiter(history.keys(), dtype=np.int64)
+            weight = np.fromiter(history.values(), dtype=np.float64)
+            rows = self.neighbours[watched]
+            valid = rows >= 0
+            cols = rows[valid]
+            owners = np.repeat(watched, valid.sum(axis=1))
+            sims = self.dots[watched][valid] / np.sqrt(np.maximum(self.norms2[owners] * self.norms2[cols], 1e-24))
+            contrib = sims * np.repeat(weight, valid.sum(axis=1))
+            scores = np.bincount(cols, weights=contrib, minlength=self.n_titles)
+            scores[watched] = 0
+            candidates = np.flatnonzero(scores > 0)
+            if candidates.size > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+            return candidates, scores[candidates]
+
+    def recommend(self, user_id, limit=5):
+        user = self.user_index.get(user_id)
+        with self._lock:
+            codes, scores = self.score_user(user, limit) if user is not None else \
+                (np.empty(0, dtype=np.int64), np.empty(0))
+            return pd.DataFrame({
+                'title_id': self.title_ids[codes] if self.title_ids is not None else codes,
+                'title': self.titles[codes] if self.titles is not None else None,
+                'release_year': self.release_years[codes] if self.release_years is not None else None,
+                'avg_rating': self.scores[codes] if self.scores is not None else None,
+                'similarity': np.round(scores, 4),
+            })
+
+    def nbytes(self):
+        r = self.ratings
+        return self.neighbours.nbytes + self.dots.nbytes + self.norms2.nbytes + \
+            r.data.nbytes + r.indices.nbytes + r.indptr.nbytes
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from snapshot import sql_round
+
+# ------------------------------
+# Vectorized lifetime value
+# ------------------------------
+# Python equivalent of vw_user_ltv / fn_calculate_user_ltv and
+# fn_subscription_duration: one pass over the subscriptions columns
+# instead of one function call per user.
+
+
+def subscription_days(start, end, as_of=None):
+    # DATEDIFF(DAY, start, ISNULL(end, as_of)) on datetime64[D] arrays
+    as_of = np.datetime64(as_of or pd.Timestamp.today().date(), 'D')
+    start = np.asarray(start, dtype='datetime64[D]')
+    end = np.asarray(end, dtype='datetime64[D]')
+    end = np.where(np.isnat(end), as_of, end)
+    return (end - start).astype(np.int64)
+
+
+def compute_user_ltv(subscriptions, users=None, as_of=None):
+    # subscriptions: user_id, monthly_fee, subscription_start_date, subscription_end_date
+    # users (optional): user_id, name -- users without subscriptions get 0.00
+    days = subscription_days(
+        pd.to_datetime(subscriptions['subscription_start_date']).to_numpy(),
+        pd.to_datetime(subscriptions['subscription_end_date']).to_numpy(),
+        as_of,
+    )
+    fee = pd.to_numeric(subscriptions['monthly_fee']).to_numpy(dtype=np.float64)
+    codes, user_ids = pd.factorize(subscriptions['user_id'])
+    n = len(user_ids)
+    result = pd.DataFrame({
+        'user_id': user_ids,
+        'lifetime_value': sql_round(np.bincount(codes, weights=fee * days / 30.0, minlength=n)),
+        'subscription_days': np.bincount(codes, weights=days, minlength=n).astype(np.int64),
+    })
+    if users is not None:
+        result = users[['user_id', 'name']].merge(result, on='user_id', how='left')
+        result['lifetime_value'] = result['lifetime_value'].fillna(0.0)
+        result['subscription_days'] = result['subscription_days'].fillna(0).astype(np.int64)
+    return result
@@ -0,0 +1,175 @@
+import argparse
+import json
+import threading
+import time
+
+# ------------------------------
+# Trigger vs deferred watch_history maintenance
+# ------------------------------
+# Python side of 04_Deferred_Maintenance.sql. In "trigger" mode the two
+# AFTER INSERT triggers keep completed and users.watch_time_hours current
+# on every insert. In "deferred" mode they are disabled, writers set
+# completed themselves, and apply_watch_time() adds the watch time of all
+# events above the watermark in one set-based pass.
+#
+#   python maintenance.py mode deferred
+#   python maintenance.py run --interval 30
+#   python maintenance.py mode trigger
+
+COMPLETED_THRESHOLD = 0.9
+
+MAINTENANCE_TRIGGERS = ['trg_watch_history_completed', 'trg_watch_history_update_user_time']
+
+APPLY_SQL = """
+    SET NOCOUNT ON;
+    DECLARE @to INT, @users INT, @remaining INT;
+    EXEC sp_apply_watch_time @p_batch_size = ?, @p_to_watch_id = @to OUTPUT,
+        @p_users_updated = @users OUTPUT, @p_remaining = @remaining OUTPUT;
+    SELECT @to, @users, @remaining;"""
+
+
+def is_completed(watch_percentage):
+    return 1 if watch_percentage is not None and watch_percentage >= COMPLETED_THRESHOLD else 0
+
+
+def get_mode(conn):
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT name, is_disabled FROM sys.triggers
+        WHERE parent_id = OBJECT_ID('watch_history')
+          AND name IN ({', '.join('?' * len(MAINTENANCE_TRIGGERS))})""", *MAINTENANCE_TRIGGERS)
+    disabled = {name: bool(flag) for name, flag in cursor.fetchall()}
+    if disabled and all(disabled.values()):
+        return 'deferred'
+    if disabled and not any(disabled.values()):
+        return 'trigger'
+    return 'mixed'
+
+
+def set_mode(conn, mode):
+    if mode not in ('trigger', 'deferred'):
+        raise ValueError(f"Unknown maintenance mode: {mode}")
+    conn.cursor().execute("EXEC sp_set_watch_maintenance_mode @p_mode = ?", mode)
+    conn.commit()
+
+
+def get_watermark(conn):
+    row = conn.cursor().execute(
+        "SELECT last_watch_id FROM maintenance_watermarks WHERE name = 'watch_time'").fetchone()
+    return row[0] if row else None
+
+
+def advance_watermark(conn):
+    # Mark every current event as applied, e.g. after a bulk load whose
+    # users.watch_time_hours already include it
+    conn.cursor().execute("""
+        IF OBJECT_ID('maintenance_watermarks', 'U') IS NOT NULL
+            UPDATE maintenance_watermarks
+            SET last_watch_id = (SELECT ISNULL(MAX(watch_id), 0) FROM watch_history),
+                updated_at = SYSDATETIME()
+            WHERE name = 'watch_time'""")
+    conn.commit()
+
+
+def apply_watch_time(conn, batch_size=500_000):
+    # Run passes until the watermark reaches the newest event
+    events = users = passes = 0
+    start = time.perf_counter()
+    while True:
+        before = get_watermark(conn) or 0
+        cursor = conn.cursor()
+        to_watch_id, updated, remaining = cursor.execute(APPLY_SQL, batch_size).fetchone()
+        conn.commit()
+        passes += 1
+        events += max((to_watch_id or 0) - before, 0)
+        users += updated or 0
+        if not remaining:
+            break
+    return {
+        'passes': passes,
+        'watch_ids_applied': events,
+        'users_updated': users,
+        'watermark': to_watch_id,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+class DeferredMaintainer:
+    # Background thread running apply_watch_time every `interval` seconds
+    # while deferred mode is active; it does nothing in trigger mode.
+    def __init__(self, pool, interval=30, batch_size=500_000):
+        self.pool = pool
+        self.interval = interval
+        self.batch_size = batch_size
+        self.last_run = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        with self._lock:
+            def work(conn):
+                if get_mode(conn) != 'deferred':
+                    return None
+                return apply_watch_time(conn, self.batch_size)
+            try:
+                self.last_run = self.pool.run(work)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Deferred maintenance pass failed: {e}")
+            return self.last_run
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='deferred-maintenance', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Switch and run watch_history maintenance")
+    sub = parser.add_subparsers(dest='command', required=True)
+    mode = sub.add_parser('mode', help="Show or set the maintenance mode")
+    mode.add_argument('mode', nargs='?', choices=['trigger', 'deferred'])
+    apply = sub.add_parser('apply', help="Run deferred passes until caught up")
+    apply.add_argument('--batch-size', type=int, default=500_000)
+    run = sub.add_parser('run', help="Run deferred passes periodically")
+    run.add_argument('--interval', type=float, default=30)
+    run.add_argument('--batch-size', type=int, default=500_000)
+    args = parser.parse_args()
+
+    from db_pool import ConnectionPool, resolve_connect
+    pool = ConnectionPool(resolve_connect(), max_size=2)
+    if args.command == 'mode':
+        if args.mode:
+            pool.run(lambda conn: set_mode(conn, args.mode))
+        print(json.dumps({'mode': pool.run(get_mode), 'watermark': pool.run(get_watermark)}))
+    elif args.command == 'apply':
+        print(json.dumps(pool.run(lambda conn: apply_watch_time(conn, args.batch_size))))
+    else:
+        maintainer = DeferredMaintainer(pool, args.interval, args.batch_size)
+        try:
+            while True:
+                report = maintainer.run_once()
+                if report:
+                    print(json.dumps(report))
+                time.sleep(args.interval)
+        except KeyboardInterrupt:
+            pass
+    pool.close()
+
+
+if __name__ == '__main__':
+    main()
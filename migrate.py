@@ -0,0 +1,415 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import xml.etree.ElementTree as ET
+from collections import Counter
+
+# ------------------------------
+# Schema migrations and plan-regression checks
+# ------------------------------
+# migrations/NNNN_name.sql are versioned schema changes, split into
+# batches on GO like sqlcmd does. Each runs in one transaction and is
+# recorded in schema_migrations with a checksum, so `apply` only runs the
+# pending ones and refuses to go on if an applied file was edited since.
+# An application lock keeps two runners from migrating at once.
+#
+# `apply` captures every dashboard query before and after migrating: the
+# median time of a few runs, then one run with SET STATISTICS XML ON for
+# the actual plan (CPU and elapsed time, logical reads, operators, indexes
+# used, missing-index hints). A query regresses when it got slower or
+# read more pages by more than the tolerance, or gained key lookups or
+# table scans. Snapshots go to plans/<name>.json with the .sqlplan files
+# beside them, so they open in SSMS.
+#
+# Migrations target SQL Server; the embedded DuckDB backend has no
+# physical design to migrate.
+#
+#   python migrate.py status
+#   python migrate.py apply                        # capture, migrate, capture, compare
+#   python migrate.py apply --to 0002 --no-capture
+#   python migrate.py capture --name baseline
+#   python migrate.py compare plans/baseline.json plans/after-0003.json
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+PLANS_DIR = 'plans'
+
+SCHEMA_MIGRATIONS_SQL = """
+    IF OBJECT_ID('schema_migrations', 'U') IS NULL
+    CREATE TABLE schema_migrations (
+        version VARCHAR(20) PRIMARY KEY,
+        name NVARCHAR(200) NOT NULL,
+        checksum CHAR(64) NOT NULL,
+        duration_ms INT NOT NULL,
+        applied_at DATETIME2 DEFAULT SYSDATETIME() NOT NULL
+    );"""
+
+LOCK_SQL = """
+    SET NOCOUNT ON;
+    DECLARE @result INT;
+    EXEC @result = sp_getapplock @Resource = 'schema_migrations', @LockMode = 'Exclusive',
+        @LockOwner = 'Session', @LockTimeout = ?;
+    SELECT @result;"""
+
+UNLOCK_SQL = "EXEC sp_releaseapplock @Resource = 'schema_migrations', @LockOwner = 'Session'"
+
+RECOMMEND_SQL = "EXEC sp_get_user_recommendations @p_user_id = ?, @p_limit = ?"
+
+SHOWPLAN_COLUMN = 'Microsoft SQL Server 2005 XML Showplan'
+_NS = '{http://schemas.microsoft.com/sqlserver/2004/07/showplan}'
+
+# Operators whose appearance in a plan counts as a regression
+LOOKUP_OPERATORS = ('Key Lookup', 'RID Lookup', 'Table Scan')
+
+_GO_RE = re.compile(r"^\s*GO\s*$", re.IGNORECASE | re.MULTILINE)
+_COMMENT_RE = re.compile(r"--[^\n]*")
+_FILE_RE = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+
+class Migration:
+    __slots__ = ('version', 'name', 'path', 'sql', 'checksum')
+
+    def __init__(self, version, name, path, sql):
+        self.version = version
+        self.name = name
+        self.path = path
+        self.sql = sql
+        self.checksum = hashlib.sha256(sql.replace('\r\n', '\n').encode('utf-8')).hexdigest()
+
+    @property
+    def batches(self):
+        return [batch for batch in _GO_RE.split(self.sql) if _COMMENT_RE.sub('', batch).strip()]
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = _FILE_RE.match(filename)
+        if match:
+            path = os.path.join(directory, filename)
+            with open(path, encoding='utf-8') as f:
+                migrations.append(Migration(match.group(1), match.group(2), path, f.read()))
+    versions = [m.version for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+def _drain(cursor):
+    # Later statements of a batch only raise their errors once reached
+    rows = 0
+    while True:
+        if cursor.description:
+            rows += len(cursor.fetchall())
+        if not cursor.nextset():
+            return rows
+
+
+def _applied(cursor):
+    cursor.execute("SELECT version, checksum, applied_at FROM schema_migrations")
+    return {version: (checksum.strip(), applied_at) for version, checksum, applied_at in cursor.fetchall()}
+
+
+def migration_status(backend, migrations):
+    def work(conn):
+        cursor = conn.cursor()
+        cursor.execute(SCHEMA_MIGRATIONS_SQL)
+        conn.commit()
+        return _applied(cursor)
+    applied = backend.run(work)
+    status = []
+    for migration in migrations:
+        checksum, applied_at = applied.get(migration.version, (None, None))
+        state = 'pending' if checksum is None else 'applied' if checksum == migration.checksum else 'changed'
+        status.append({'version': migration.version, 'name': migration.name, 'state': state,
+                       'applied_at': str(applied_at) if applied_at else None})
+    return status
+
+
+def pending_migrations(backend, migrations, target=None):
+    status = migration_status(backend, migrations)
+    changed = [s['version'] for s in status if s['state'] == 'changed']
+    if changed:
+        raise RuntimeError(f"Applied migrations were edited since: {', '.join(changed)}. "
+                           "Add a new migration instead.")
+    pending = {s['version'] for s in status if s['state'] == 'pending'}
+    return [m for m in migrations if m.version in pending and (target is None or m.version <= target)]
+
+
+def apply_migrations(backend, migrations, lock_timeout=0):
+    # Applies `migrations` in order, each in its own transaction
+    results = []
+
+    def work(conn):
+        cursor = conn.cursor()
+        cursor.execute(SCHEMA_MIGRATIONS_SQL)
+        conn.commit()
+        if cursor.execute(LOCK_SQL, lock_timeout * 1000).fetchone()[0] < 0:
+            raise RuntimeError("Another migration run holds the schema_migrations lock")
+        try:
+            applied = _applied(cursor)
+            for migration in migrations:
+                if migration.version in applied:
+                    continue
+                start = time.perf_counter()
+                try:
+                    for batch in migration.batches:
+                        cursor.execute(batch)
+                        _drain(cursor)
+                    elapsed = time.perf_counter() - start
+                    cursor.execute("INSERT INTO schema_migrations (version, name, checksum, duration_ms) "
+                                   "VALUES (?, ?, ?, ?)", migration.version, migration.name, migration.checksum,
+                                   int(elapsed * 1000))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                result = {'version': migration.version, 'name': migration.name, 'seconds': round(elapsed, 3)}
+                results.append(result)
+                print(json.dumps(result))
+        finally:
+            cursor.execute(UNLOCK_SQL)
+            conn.commit()
+        return results
+    # No reconnect-and-retry: a dropped connection mid-migration rolls back
+    # and is reported, not silently run again
+    return backend.run(work, retries=0)
+
+
+# ------------------------------
+# Plan capture
+# ------------------------------
+def dashboard_queries(backend):
+    # [(label, sql, params)]: every page query as the pages run it, plus
+    # the per-user reads of the Recommender Demo for the latest viewer
+    from content_recommender import USER_HISTORY_SQL
+    from page_queries import PAGE_QUERIES, PAGED_QUERIES
+    from warmup import page_jobs
+
+    jobs = page_jobs(PAGE_QUERIES, PAGED_QUERIES, list(PAGE_QUERIES))
+    users = backend.read("SELECT TOP 1 user_id FROM watch_history ORDER BY watch_id DESC")
+    if not users.empty:
+        user_id = str(users.iloc[0, 0])
+        jobs.append(("Recommender Demo/sp_get_user_recommendations", RECOMMEND_SQL, [user_id, 10]))
+        jobs.append(("Recommender Demo/user_history", USER_HISTORY_SQL, [user_id]))
+    return jobs
+
+
+def _execute(cursor, sql, params):
+    if params:
+        cursor.execute(sql, *params)
+    else:
+        cursor.execute(sql)
+
+
+def _run_with_plan(cursor, sql, params):
+    # Rows of the query's own result sets, and one showplan per statement
+    cursor.execute("SET STATISTICS XML ON")
+    rows, plans = 0, []
+    try:
+        _execute(cursor, sql, params)
+        while True:
+            if cursor.description:
+                fetched = cursor.fetchall()
+                if cursor.description[0][0] == SHOWPLAN_COLUMN:
+                    plans.extend(row[0] for row in fetched)
+                else:
+                    rows += len(fetched)
+            if not cursor.nextset():
+                break
+    finally:
+        cursor.execute("SET STATISTICS XML OFF")
+    return rows, plans
+
+
+def summarize_plans(plans):
+    summary = {'cost': 0.0, 'cpu_ms': 0, 'elapsed_ms': 0, 'logical_reads': 0, 'batch_mode_operators': 0,
+               'missing_indexes': 0}
+    operators, indexes, warnings = Counter(), set(), set()
+    for plan in plans:
+        root = ET.fromstring(plan)
+        for statement in root.iter(f'{_NS}StmtSimple'):
+            summary['cost'] += float(statement.get('StatementSubTreeCost', 0))
+        for times in root.iter(f'{_NS}QueryTimeStats'):
+            summary['cpu_ms'] += int(times.get('CpuTime', 0))
+            summary['elapsed_ms'] += int(times.get('ElapsedTime', 0))
+        for counters in root.iter(f'{_NS}RunTimeCountersPerThread'):
+            summary['logical_reads'] += int(counters.get('ActualLogicalReads', 0))
+        for op in root.iter(f'{_NS}RelOp'):
+            name = op.get('PhysicalOp')
+            scan = op.find(f'{_NS}IndexScan')
+            if scan is not None and scan.get('Lookup') in ('1', 'true'):
+                name = 'Key Lookup'
+            operators[name] += 1
+            if op.get('EstimatedExecutionMode') == 'Batch':
+                summary['batch_mode_operators'] += 1
+            target = op.find(f'./*/{_NS}Object')
+            if target is not None and target.get('Index'):
+                indexes.add(f"{target.get('Table', '').strip('[]')}.{target.get('Index').strip('[]')}")
+        summary['missing_indexes'] += sum(1 for _ in root.iter(f'{_NS}MissingIndexGroup'))
+        for group in root.iter(f'{_NS}Warnings'):
+            warnings.update(child.tag.replace(_NS, '') for child in group)
+    summary['cost'] = round(summary['cost'], 4)
+    return dict(summary, operators=dict(operators), indexes=sorted(indexes), warnings=sorted(warnings))
+
+
+def _safe_name(label):
+    return re.sub(r"[^\w.-]+", "_", label).strip('_')
+
+
+def capture_plans(backend, name, repeat=3, plans_dir=PLANS_DIR):
+    # Times and actual plans of every dashboard query -> plans/<name>.json
+    plan_dir = os.path.join(plans_dir, name)
+    os.makedirs(plan_dir, exist_ok=True)
+    queries = []
+    for label, sql, params in dashboard_queries(backend):
+        def work(conn):
+            cursor = conn.cursor()
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                _execute(cursor, sql, params)
+                rows = _drain(cursor)
+                timings.append(time.perf_counter() - start)
+            _, plans = _run_with_plan(cursor, sql, params)
+            return rows, timings, plans
+        record = {'query': label}
+        try:
+            rows, timings, plans = backend.run(work)
+        except Exception as e:
+            record['error'] = str(e)
+        else:
+            files = []
+            for i, plan in enumerate(plans):
+                path = os.path.join(plan_dir, f"{_safe_name(label)}{f'.{i + 1}' if len(plans) > 1 else ''}.sqlplan")
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(plan)
+                files.append(path)
+            record.update(rows=rows, runs=len(timings), p50_ms=round(statistics.median(timings) * 1000, 2),
+                          min_ms=round(min(timings) * 1000, 2), plan_files=files, **summarize_plans(plans))
+        queries.append(record)
+        print(json.dumps({k: v for k, v in record.items() if k not in ('operators', 'plan_files')}))
+
+    applied = [s['version'] for s in migration_status(backend, load_migrations()) if s['state'] == 'applied']
+    snapshot = {
+        'meta': {'name': name, 'captured_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'repeat': repeat,
+                 'migrations': applied},
+        'queries': queries,
+    }
+    path = os.path.join(plans_dir, f"{name}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, indent=2)
+    return snapshot
+
+
+def compare_plans(before, after, tolerance=0.2, min_ms=5.0, min_reads=100):
+    # One row per query in both snapshots; `regression` lists why
+    baseline = {q['query']: q for q in before['queries']}
+    rows = []
+    for query in after['queries']:
+        old = baseline.get(query['query'])
+        if old is None:
+            continue
+        if 'error' in query or 'error' in old:
+            if 'error' not in old:
+                rows.append({'query': query['query'], 'regression': [f"error: {query['error']}"]})
+            continue
+        reasons = []
+        if query['p50_ms'] > old['p50_ms'] * (1 + tolerance) and query['p50_ms'] - old['p50_ms'] >= min_ms:
+            reasons.append('slower')
+        if query['logical_reads'] > old['logical_reads'] * (1 + tolerance) and \
+                query['logical_reads'] - old['logical_reads'] >= min_reads:
+            reasons.append('more logical reads')
+        for op in LOOKUP_OPERATORS:
+            if query['operators'].get(op, 0) > old['operators'].get(op, 0):
+                reasons.append(f"new {op}")
+        rows.append({
+            'query': query['query'],
+            'before_p50_ms': old['p50_ms'],
+            'p50_ms': query['p50_ms'],
+            'change_pct': round((query['p50_ms'] / old['p50_ms'] - 1) * 100, 1) if old['p50_ms'] else None,
+            'before_reads': old['logical_reads'],
+            'logical_reads': query['logical_reads'],
+            'plan_changed': set(old['operators']) != set(query['operators']) or old['indexes'] != query['indexes'],
+            'indexes': query['indexes'],
+            'regression': reasons,
+        })
+    return rows
+
+
+def _report(rows):
+    regressions = [row for row in rows if row['regression']]
+    for row in rows:
+        print(json.dumps(row))
+    print(json.dumps({'queries': len(rows), 'regressions': len(regressions),
+                      'faster': sum(1 for row in rows if (row.get('change_pct') or 0) < 0)}))
+    return regressions
+
+
+def main():
+    from backends import create_backend
+    from db_pool import ConnectionPool, resolve_connect
+
+    parser = argparse.ArgumentParser(description="Apply schema migrations and check query plans for regressions")
+    parser.add_argument('--migrations-dir', default=MIGRATIONS_DIR)
+    parser.add_argument('--plans-dir', default=PLANS_DIR)
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status', help="List applied, pending and edited migrations")
+    apply = sub.add_parser('apply', help="Apply pending migrations")
+    apply.add_argument('--to', dest='target', help="Last version to apply")
+    apply.add_argument('--no-capture', action='store_true', help="Skip the before/after plan capture")
+    apply.add_argument('--lock-timeout', type=float, default=0, help="Seconds to wait for another runner")
+    capture = sub.add_parser('capture', help="Capture timings and plans of every dashboard query")
+    capture.add_argument('--name', default=None)
+    for command in (apply, capture):
+        command.add_argument('--repeat', type=int, default=3)
+    compare = sub.add_parser('compare', help="Compare two plan snapshots")
+    compare.add_argument('before')
+    compare.add_argument('after')
+    for command in (apply, compare):
+        command.add_argument('--tolerance', type=float, default=0.2)
+        command.add_argument('--min-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        with open(args.before, encoding='utf-8') as f:
+            before = json.load(f)
+        with open(args.after, encoding='utf-8') as f:
+            after = json.load(f)
+        if _report(compare_plans(before, after, args.tolerance, args.min_ms)):
+            sys.exit(1)
+        return
+
+    migrations = load_migrations(args.migrations_dir)
+    backend = create_backend('sqlserver', pool=ConnectionPool(resolve_connect(), max_size=2))
+    regressions = []
+    try:
+        if args.command == 'status':
+            for row in migration_status(backend, migrations):
+                print(json.dumps(row))
+        elif args.command == 'capture':
+            capture_plans(backend, args.name or time.strftime('%Y%m%d-%H%M%S'), args.repeat, args.plans_dir)
+        else:
+            pending = pending_migrations(backend, migrations, args.target)
+            if not pending:
+                print(json.dumps({'pending': 0}))
+                return
+            last = pending[-1].version
+            before = None if args.no_capture else capture_plans(backend, f"before-{last}", args.repeat,
+                                                                args.plans_dir)
+            apply_migrations(backend, pending, args.lock_timeout)
+            if before is not None:
+                after = capture_plans(backend, f"after-{last}", args.repeat, args.plans_dir)
+                regressions = _report(compare_plans(before, after, args.tolerance, args.min_ms))
+    finally:
+        backend.close()
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+-- ============================================================================
+-- 0001: MONTHLY PARTITIONS FOR watch_history
+-- ============================================================================
+-- watch_history is partitioned on created_at by calendar month, so reads
+-- bounded by date (trend backfills, the last-N-days windows) only touch
+-- their months, and a month can be rebuilt on its own.
+--
+-- The clustered primary key becomes (watch_id, created_at). watch_id stays
+-- the leading key for the watermark range scans of 04-06, and a unique
+-- index on a partitioned table must contain the partitioning column, which
+-- is why created_at also becomes NOT NULL.
+--
+-- The function starts with 12 empty months ahead of today; run
+-- sp_extend_watch_history_partitions monthly to keep that headroom.
+
+-- ============================================================================
+-- PARTITION FUNCTION AND SCHEME
+-- ============================================================================
+IF NOT EXISTS (SELECT 1 FROM sys.partition_functions WHERE name = 'pf_watch_history_month')
+BEGIN
+    DECLARE @this_month DATE = DATEFROMPARTS(YEAR(SYSDATETIME()), MONTH(SYSDATETIME()), 1);
+    DECLARE @month DATE = ISNULL(
+        (SELECT DATEFROMPARTS(YEAR(MIN(created_at)), MONTH(MIN(created_at)), 1) FROM watch_history),
+        @this_month);
+    DECLARE @last DATE = DATEADD(MONTH, 12, @this_month);
+    DECLARE @values NVARCHAR(MAX) = N'';
+
+    WHILE @month <= @last
+    BEGIN
+        SET @values += CASE WHEN @values = N'' THEN N'' ELSE N', ' END
+                     + N'''' + CONVERT(NCHAR(10), @month, 23) + N'''';
+        SET @month = DATEADD(MONTH, 1, @month);
+    END;
+
+    EXEC (N'CREATE PARTITION FUNCTION pf_watch_history_month (DATETIME2) AS RANGE RIGHT FOR VALUES ('
+          + @values + N')');
+END;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.partition_schemes WHERE name = 'ps_watch_history_month')
+    CREATE PARTITION SCHEME ps_watch_history_month AS PARTITION pf_watch_history_month ALL TO ([PRIMARY]);
+GO
+
+
+-- ============================================================================
+-- TABLE
+-- ============================================================================
+-- created_at has a default, but rows inserted with an explicit NULL have none
+IF COLUMNPROPERTY(OBJECT_ID('watch_history'), 'created_at', 'AllowsNull') = 1
+BEGIN
+    UPDATE watch_history SET created_at = ISNULL(updated_at, SYSDATETIME()) WHERE created_at IS NULL;
+    ALTER TABLE watch_history ALTER COLUMN created_at DATETIME2 NOT NULL;
+END;
+GO
+
+-- Rebuilds the table on the partition scheme. The original primary key has
+-- a generated name, so it is looked up.
+IF NOT EXISTS (
+    SELECT 1
+    FROM sys.indexes i
+    JOIN sys.partition_schemes ps ON ps.data_space_id = i.data_space_id
+    WHERE i.object_id = OBJECT_ID('watch_history') AND i.index_id = 1
+)
+BEGIN
+    DECLARE @pk SYSNAME = (
+        SELECT name FROM sys.key_constraints
+        WHERE parent_object_id = OBJECT_ID('watch_history') AND type = 'PK'
+    );
+    IF @pk IS NOT NULL
+        EXEC (N'ALTER TABLE watch_history DROP CONSTRAINT ' + QUOTENAME(@pk));
+
+    ALTER TABLE watch_history ADD CONSTRAINT pk_watch_history
+        PRIMARY KEY CLUSTERED (watch_id, created_at) ON ps_watch_history_month (created_at);
+END;
+GO
+
+
+-- ============================================================================
+-- PROCEDURES
+-- ============================================================================
+
+-- Procedure 1: Add monthly boundaries up to @p_months_ahead months after the
+-- current month. The months split off are empty, so no rows move.
+CREATE OR ALTER PROCEDURE sp_extend_watch_history_partitions
+    @p_months_ahead INT = 12
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @last DATETIME2 = DATEADD(MONTH, @p_months_ahead,
+        CAST(DATEFROMPARTS(YEAR(SYSDATETIME()), MONTH(SYSDATETIME()), 1) AS DATETIME2));
+    DECLARE @next DATETIME2 = (
+        SELECT DATEADD(MONTH, 1, MAX(CAST(rv.value AS DATETIME2)))
+        FROM sys.partition_range_values rv
+        JOIN sys.partition_functions pf ON pf.function_id = rv.function_id
+        WHERE pf.name = 'pf_watch_history_month'
+    );
+
+    WHILE @next <= @last
+    BEGIN
+        ALTER PARTITION SCHEME ps_watch_history_month NEXT USED [PRIMARY];
+        ALTER PARTITION FUNCTION pf_watch_history_month() SPLIT RANGE (@next);
+        SET @next = DATEADD(MONTH, 1, @next);
+    END;
+END;
+GO
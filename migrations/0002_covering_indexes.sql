@@ -0,0 +1,64 @@
+-- ============================================================================
+-- 0002: COVERING INDEXES
+-- ============================================================================
+-- The narrow indexes of 01 and 03 only hold their key columns, so every
+-- per-user or per-title read went back to the clustered index for
+-- watch_percentage, completed or created_at. These indexes replace them
+-- and include those columns.
+--
+-- The watch_history indexes stay on [PRIMARY] instead of the monthly
+-- partition scheme: their reads seek one user or title across all dates,
+-- and an aligned index would have to probe every month. Switching
+-- partitions in or out therefore means disabling them first.
+
+-- ============================================================================
+-- watch_history
+-- ============================================================================
+-- Per-user reads: the recommender's watched-title exclusions, user history,
+-- the users FK cascade. Replaces idx_wh_user and idx_watch_user_date_title.
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE object_id = OBJECT_ID('watch_history') AND name = 'idx_wh_user_covering')
+    CREATE INDEX idx_wh_user_covering ON watch_history (user_id, title_id)
+        INCLUDE (watch_percentage, completed, created_at) ON [PRIMARY];
+GO
+
+-- Per-title reads and the titles FK cascade. Replaces idx_wh_title.
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE object_id = OBJECT_ID('watch_history') AND name = 'idx_wh_title_covering')
+    CREATE INDEX idx_wh_title_covering ON watch_history (title_id)
+        INCLUDE (user_id, watch_percentage, completed, created_at) ON [PRIMARY];
+GO
+
+DROP INDEX IF EXISTS idx_wh_user ON watch_history;
+DROP INDEX IF EXISTS idx_wh_title ON watch_history;
+DROP INDEX IF EXISTS idx_watch_user_date_title ON watch_history;
+-- completed has two values, so a seek on it never beats a scan
+DROP INDEX IF EXISTS idx_wh_completed ON watch_history;
+GO
+
+
+-- ============================================================================
+-- subscriptions
+-- ============================================================================
+-- Per-user LTV and active-subscription lookups. Replaces
+-- idx_subscriptions_user_id, a prefix of its key.
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE object_id = OBJECT_ID('subscriptions') AND name = 'idx_subscription_user_status')
+    CREATE INDEX idx_subscription_user_status ON subscriptions (user_id, subscription_status)
+        INCLUDE (subscription_type, monthly_fee, subscription_start_date, subscription_end_date);
+GO
+
+DROP INDEX IF EXISTS idx_subscriptions_user_id ON subscriptions;
+GO
+
+
+-- ============================================================================
+-- users
+-- ============================================================================
+-- vw_country_engagement groups users by country and averages watch hours.
+-- Replaces idx_country. 03's idx_user_country_subscription named a
+-- subscription_type column users does not have; subscription types are
+-- read from subscriptions.
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE object_id = OBJECT_ID('users') AND name = 'idx_users_country_covering')
+    CREATE INDEX idx_users_country_covering ON users (country) INCLUDE (watch_time_hours, name);
+GO
+
+DROP INDEX IF EXISTS idx_country ON users;
+GO
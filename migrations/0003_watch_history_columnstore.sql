@@ -0,0 +1,19 @@
+-- ============================================================================
+-- 0003: NONCLUSTERED COLUMNSTORE INDEX ON watch_history
+-- ============================================================================
+-- The page aggregates (the views, sp_get_genre_trends, the country x genre
+-- and title breakdowns) read most of watch_history but only these columns.
+-- From a columnstore they run in batch mode over compressed segments
+-- instead of scanning the rowstore, and segments of other months are
+-- skipped by partition. Needs SQL Server 2016 or later.
+--
+-- The index is aligned with the monthly partitions. COMPRESSION_DELAY keeps
+-- new rows in the delta store for 10 minutes, so the completed-flag
+-- trigger updates them there instead of marking compressed rows deleted.
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE object_id = OBJECT_ID('watch_history') AND name = 'ncci_watch_history')
+    CREATE NONCLUSTERED COLUMNSTORE INDEX ncci_watch_history
+        ON watch_history (watch_id, user_id, title_id, watch_percentage, completed, created_at)
+        WITH (COMPRESSION_DELAY = 10)
+        ON ps_watch_history_month (created_at);
+GO
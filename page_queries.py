@@ -0,0 +1,219 @@
+from pagination import PagedQuery
+
+# ------------------------------
+# Query plans for each dashboard page
+# ------------------------------
+# Every page declares the queries it needs up front so they can be
+# fetched together (see query_plan.py) before the page renders.
+
+OVERVIEW_COUNTS = """
+    SELECT
+        (SELECT COUNT(*) FROM users) AS total_users,
+        (SELECT COUNT(*) FROM vw_active_subscriptions) AS active_subs,
+        (SELECT COUNT(*) FROM titles) AS total_titles,
+        (SELECT COUNT(*) FROM watch_history) AS total_watches"""
+
+REVENUE_ANALYSIS = "SELECT * FROM vw_revenue_analysis"
+
+USER_ACTIVITY_SUMMARY = "SELECT TOP 50 * FROM vw_user_activity_summary ORDER BY watch_time_hours DESC"
+
+COUNTRY_ENGAGEMENT = "SELECT * FROM vw_country_engagement ORDER BY user_count DESC"
+
+AVG_WATCH_PER_USER = """
+    SELECT
+        u.user_id,
+        u.name,
+        ROUND(AVG(wh.watch_percentage * 100), 2) AS avg_watch_percentage,
+        COUNT(wh.watch_id) AS total_watches,
+        SUM(wh.completed) AS completed_watches
+    FROM users u
+    LEFT JOIN watch_history wh ON u.user_id = wh.user_id
+    GROUP BY u.user_id, u.name
+    ORDER BY avg_watch_percentage DESC;"""
+
+TOP_USERS_COMPLETED = """
+    SELECT TOP 10
+        u.user_id,
+        u.name,
+        SUM(wh.completed) AS completed_watches
+    FROM users u
+    JOIN watch_history wh ON u.user_id = wh.user_id
+    GROUP BY u.user_id, u.name
+    ORDER BY completed_watches DESC;"""
+
+AGE_GROUP_SUBSCRIPTION = """
+    WITH age_groups AS (
+    SELECT
+        u.user_id,
+        CASE
+            WHEN u.age < 18 THEN 'Under 18'
+            WHEN u.age BETWEEN 18 AND 24 THEN '18-24'
+            WHEN u.age BETWEEN 25 AND 34 THEN '25-34'
+            WHEN u.age BETWEEN 35 AND 44 THEN '35-44'
+            WHEN u.age BETWEEN 45 AND 54 THEN '45-54'
+            WHEN u.age BETWEEN 55 AND 64 THEN '55-64'
+            ELSE '65+'
+        END AS age_group,
+        s.subscription_type
+    FROM users u
+    JOIN subscriptions s ON u.user_id = s.user_id
+    )
+
+    SELECT
+        ag.age_group,
+        ag.subscription_type,
+
+        COUNT(DISTINCT ag.user_id) AS users_in_segment,
+        COUNT(wh.watch_id) AS total_watch_events,
+
+        ROUND(AVG(CAST(wh.watch_percentage AS FLOAT)) * 100, 2) AS avg_watch_percentage,
+        ROUND(SUM(CAST(wh.watch_percentage AS FLOAT)) * 100, 2) AS total_watch_percentage
+
+    FROM age_groups ag
+    LEFT JOIN watch_history wh ON ag.user_id = wh.user_id
+
+    GROUP BY ag.age_group, ag.subscription_type
+    ORDER BY ag.age_group, ag.subscription_type;"""
+
+GENRE_PERFORMANCE = "SELECT * FROM vw_genre_performance ORDER BY total_watches DESC"
+
+TITLE_LEVEL = """
+        SELECT TOP 50
+            t.title, t.release_year, t.imdb_score,
+            COUNT(wh.watch_id) AS total_watches,
+            ROUND(AVG(wh.watch_percentage), 2) AS avg_watch_percentage
+        FROM titles t
+        LEFT JOIN watch_history wh ON t.title_id = wh.title_id
+        GROUP BY t.title, t.release_year, t.imdb_score
+        ORDER BY total_watches DESC
+    """
+
+TITLE_COMPLETION = """
+    SELECT TOP 20
+    t.title,
+    ROUND(AVG(wh.watch_percentage * 100), 2) AS avg_watch_percentage,
+    SUM(wh.completed) AS total_completed
+    FROM titles t
+    JOIN watch_history wh ON t.title_id = wh.title_id
+    GROUP BY t.title
+    ORDER BY avg_watch_percentage DESC, total_completed DESC;"""
+
+GENRE_TRENDS = "EXEC sp_get_genre_trends"
+
+REVENUE_BY_TYPE = """
+        SELECT subscription_type, COUNT(subscription_id) AS subscriber_count,
+               SUM(monthly_fee) AS total_monthly_revenue,
+               ROUND(AVG(monthly_fee), 2) AS avg_fee
+        FROM subscriptions
+        WHERE subscription_status='active'
+        GROUP BY subscription_type
+    """
+
+USER_LTV = """
+        SELECT TOP 10 user_id, name, lifetime_value
+        FROM vw_user_ltv
+        ORDER BY lifetime_value DESC
+    """
+
+COUNTRY_GENRE = """SELECT
+        u.country,
+        g.name AS genre,
+        ROUND(AVG(wh.watch_percentage * 100), 2) AS avg_watch_percentage,
+        COUNT(wh.watch_id) AS total_watches
+    FROM users u
+    JOIN watch_history wh ON u.user_id = wh.user_id
+    JOIN title_genres tg ON wh.title_id = tg.title_id
+    JOIN genres g ON tg.genre_id = g.genre_id
+    GROUP BY u.country, g.name
+    ORDER BY u.country, avg_watch_percentage DESC;"""
+
+HIGH_WATCH_LOW_LTV = """
+    SELECT
+        u.user_id,
+        u.name,
+        ROUND(AVG(wh.watch_percentage * 100), 2) AS avg_watch_percentage,
+        l.lifetime_value
+    FROM users u
+    JOIN watch_history wh ON u.user_id = wh.user_id
+    JOIN vw_user_ltv l ON u.user_id = l.user_id
+    GROUP BY u.user_id, u.name, l.lifetime_value
+    HAVING AVG(wh.watch_percentage) > 0.8 AND l.lifetime_value < 50
+    ORDER BY avg_watch_percentage DESC;"""
+
+USER_LIST = "SELECT user_id, name, created_at FROM users"
+
+TITLE_LIST = "SELECT title_id, title, release_year FROM titles ORDER BY title"
+
+# Read from the watch_rollups buckets (see rollups.py)
+DAILY_TRENDS = "SELECT * FROM vw_daily_trends ORDER BY day"
+
+TRENDING_TITLES = "EXEC sp_get_trending_titles @p_days = 7, @p_limit = 20"
+
+GENRE_MOMENTUM = "EXEC sp_get_genre_momentum @p_days = 7"
+
+
+PAGE_QUERIES = {
+    "Overview": {
+        "overview_counts": OVERVIEW_COUNTS,
+        "revenue_analysis": REVENUE_ANALYSIS,
+    },
+    "User Activity": {
+        "user_activity_summary": USER_ACTIVITY_SUMMARY,
+        "country_engagement": COUNTRY_ENGAGEMENT,
+        "avg_watch_per_user": AVG_WATCH_PER_USER,
+        "top_users_completed": TOP_USERS_COMPLETED,
+        "age_group_subscription": AGE_GROUP_SUBSCRIPTION,
+    },
+    "Genre Performance": {
+        "genre_performance": GENRE_PERFORMANCE,
+        "title_level": TITLE_LEVEL,
+        "title_completion": TITLE_COMPLETION,
+        "genre_trends": GENRE_TRENDS,
+    },
+    "Subscription & Revenue": {
+        "revenue_by_type": REVENUE_BY_TYPE,
+        "user_ltv": USER_LTV,
+    },
+    "Cross Analysis": {
+        "country_genre": COUNTRY_GENRE,
+        "high_watch_low_ltv": HIGH_WATCH_LOW_LTV,
+    },
+    "Recommender Demo": {
+        "user_list": USER_LIST,
+        "title_list": TITLE_LIST,
+    },
+    "Trends": {
+        "daily_trends": DAILY_TRENDS,
+        "trending_titles": TRENDING_TITLES,
+        "genre_momentum": GENRE_MOMENTUM,
+    },
+}
+
+
+# Unbounded results the pages show one keyset page at a time instead of
+# fetching whole (see pagination.py)
+PAGED_QUERIES = {
+    "avg_watch_per_user": PagedQuery(
+        AVG_WATCH_PER_USER, key="user_id",
+        columns={"avg_watch_percentage": -1, "total_watches": None, "completed_watches": 0, "name": None},
+        sort="avg_watch_percentage", search=["name", "user_id"],
+    ),
+    "user_ltv": PagedQuery(
+        "SELECT user_id, name, lifetime_value, subscription_days FROM vw_user_ltv", key="user_id",
+        columns={"lifetime_value": None, "subscription_days": None, "name": None},
+        sort="lifetime_value", search=["name", "user_id"], page_size=10,
+    ),
+    "country_genre": PagedQuery(
+        COUNTRY_GENRE, key=["country", "genre"],
+        columns={"country": "", "genre": None, "avg_watch_percentage": -1, "total_watches": None},
+        sort="total_watches", search=["country", "genre"],
+    ),
+}
+
+
+# Typeahead indexes over the Recommender Demo lists (see search_index.py)
+SEARCH_INDEXES = {
+    "users": dict(sql=USER_LIST, key="user_id", fields=["name", "user_id"], ngram_fields=["name"],
+                  watermark="created_at"),
+    "titles": dict(sql=TITLE_LIST, key="title_id", fields=["title"], ngram_fields=["title"]),
+}
@@ -0,0 +1,210 @@
+import csv
+import re
+
+import numpy as np
+import pandas as pd
+
+# ------------------------------
+# Keyset pagination
+# ------------------------------
+# A PagedQuery wraps an unbounded SELECT (its trailing ORDER BY is
+# dropped) as a derived table. Sorting, filtering and the page boundary
+# are pushed into the outer query:
+#
+#   SELECT TOP (?) * FROM (<sql>) AS q
+#   WHERE <filters> AND (<sort> < ? OR (<sort> = ? AND <key> > ?))
+#   ORDER BY <sort> DESC, <key>
+#
+# so every page costs one bounded round trip, however deep it is: the
+# cursor is the last row's sort and key values, not an OFFSET. NULLs in
+# sort or key columns are compared through ISNULL(col, fill) so they
+# still have a place in the order.
+
+_ORDER_BY_RE = re.compile(r"\bORDER\s+BY\b", re.IGNORECASE)
+
+
+def strip_order_by(sql):
+    # Drop the trailing ';' and outermost ORDER BY, which a derived table
+    # may not have
+    sql = sql.strip().rstrip(';').rstrip()
+    outer = [m for m in _ORDER_BY_RE.finditer(sql)
+             if sql[:m.start()].count('(') == sql[:m.start()].count(')')]
+    return sql[:outer[-1].start()].rstrip() if outer else sql
+
+
+def _like_prefix(text):
+    # User text as a LIKE prefix, with wildcards escaped
+    return re.sub(r"([\\%_\[])", r"\\\1", text) + '%'
+
+
+class PagedQuery:
+    def __init__(self, sql, key, columns, sort, descending=True, search=(), page_size=50):
+        # key: column(s) that are unique per row; they break sort ties.
+        # columns: {column: value used for NULL, or None if never NULL}
+        # for every column that can be sorted or filtered on.
+        # search: columns matched by prefix against free text.
+        # page_size: rows per page shown by default.
+        self.sql = strip_order_by(sql)
+        self.key = [key] if isinstance(key, str) else list(key)
+        self.columns = dict(columns)
+        for column in self.key:
+            self.columns.setdefault(column, None)
+        self.sort = sort
+        self.descending = descending
+        self.search = list(search)
+        self.page_size = page_size
+
+    @property
+    def sortable(self):
+        return list(self.columns)
+
+    def _expr(self, column):
+        fill = self.columns[column]
+        if fill is None:
+            return f"q.{column}"
+        return f"ISNULL(q.{column}, {fill!r})"
+
+    def order(self, sort=None, descending=None):
+        # [(column, descending)]: the sort column, then the key ascending
+        sort = sort or self.sort
+        if sort not in self.columns:
+            raise ValueError(f"Cannot sort on {sort}")
+        descending = self.descending if descending is None else descending
+        return [(sort, descending)] + [(column, False) for column in self.key if column != sort]
+
+    def where(self, filters=None, search=None):
+        clauses, params = [], []
+        for column, value in (filters or {}).items():
+            if column not in self.columns:
+                raise ValueError(f"Cannot filter on {column}")
+            clauses.append(f"{self._expr(column)} = ?")
+            params.append(value)
+        if search and self.search:
+            clauses.append('(' + ' OR '.join(f"q.{column} LIKE ? ESCAPE '\\'" for column in self.search) + ')')
+            params.extend([_like_prefix(search)] * len(self.search))
+        return clauses, params
+
+    def page_sql(self, page_size, after=None, sort=None, descending=None, filters=None, search=None):
+        order = self.order(sort, descending)
+        clauses, params = self.where(filters, search)
+        if after is not None:
+            # (a, b, c) after (x, y, z) in lexicographic order
+            alternatives = []
+            for i, (column, desc) in enumerate(order):
+                terms = [f"{self._expr(c)} = ?" for c, _ in order[:i]]
+                terms.append(f"{self._expr(column)} {'<' if desc else '>'} ?")
+                alternatives.append('(' + ' AND '.join(terms) + ')')
+                params.extend(after[:i + 1])
+            clauses.append('(' + ' OR '.join(alternatives) + ')')
+        sql = f"SELECT TOP (?) * FROM ({self.sql}) AS q"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY " + ", ".join(f"{self._expr(c)}{' DESC' if d else ''}" for c, d in order)
+        return sql, [page_size] + params
+
+    def count_sql(self, filters=None, search=None):
+        clauses, params = self.where(filters, search)
+        sql = f"SELECT COUNT(*) AS total_rows FROM ({self.sql}) AS q"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        return sql, params
+
+    def cursor_of(self, row, sort=None, descending=None):
+        # Cursor after `row`: its order values with NULLs filled, as Python scalars
+        values = []
+        for column, _ in self.order(sort, descending):
+            value = row[column]
+            if pd.isna(value):
+                value = self.columns[column]
+            values.append(value.item() if isinstance(value, np.generic) else value)
+        return tuple(values)
+
+
+def read_page(read, query, page_size=50, after=None, sort=None, descending=None, filters=None, search=None):
+    # Returns (frame, cursor for the next page or None on the last page).
+    # One extra row is fetched to know whether another page exists.
+    sql, params = query.page_sql(page_size + 1, after, sort, descending, filters, search)
+    frame = read(sql, params)
+    if len(frame) <= page_size:
+        return frame, None
+    frame = frame.iloc[:page_size]
+    return frame, query.cursor_of(frame.iloc[-1], sort, descending)
+
+
+def count_rows(read, query, filters=None, search=None):
+    sql, params = query.count_sql(filters, search)
+    frame = read(sql, params)
+    return int(frame.iloc[0, 0]) if len(frame) else 0
+
+
+def iter_chunks(read, query, chunk_size=50_000, sort=None, descending=None, filters=None, search=None):
+    # Every row in `chunk_size` frames; only one chunk is in memory at a time
+    after = None
+    while True:
+        frame, after = read_page(read, query, chunk_size, after, sort, descending, filters, search)
+        if len(frame):
+            yield frame
+        if after is None:
+            return
+
+
+def export_csv(read, query, out, chunk_size=50_000, **options):
+    # Streams the query to a path or text buffer; returns the rows written
+    rows = 0
+    handle = open(out, 'w', newline='', encoding='utf-8') if isinstance(out, str) else out
+    try:
+        for chunk in iter_chunks(read, query, chunk_size, **options):
+            chunk.to_csv(handle, header=rows == 0, index=False, quoting=csv.QUOTE_MINIMAL)
+            rows += len(chunk)
+    finally:
+        if isinstance(out, str):
+            handle.close()
+    return rows
+
+
+def _frame_keys(frame, query, columns):
+    # Order columns as objects with NULLs filled, as ISNULL(col, fill) does
+    return pd.DataFrame({column: frame[column].astype(object) if query.columns[column] is None
+                         else frame[column].astype(object).where(frame[column].notna(), query.columns[column])
+                         for column in columns})
+
+
+def _frame_mask(frame, query, keys, filters=None, search=None):
+    mask = np.ones(len(frame), dtype=bool)
+    for column, value in (filters or {}).items():
+        mask &= (keys[column] if column in keys else frame[column]).to_numpy() == value
+    if search and query.search:
+        prefix = search.lower()
+        matches = np.zeros(len(frame), dtype=bool)
+        for column in query.search:
+            matches |= frame[column].astype(str).str.lower().str.startswith(prefix).to_numpy()
+        mask &= matches
+    return mask
+
+
+def slice_frame(frame, query, page_size=50, after=None, sort=None, descending=None, filters=None, search=None):
+    # read_page over a DataFrame already in memory (e.g. a snapshot
+    # answer), with the same order, filters and cursors
+    order = query.order(sort, descending)
+    frame = frame.reset_index(drop=True)
+    keys = _frame_keys(frame, query, [column for column, _ in order])
+    mask = _frame_mask(frame, query, keys, filters, search)
+    if after is not None:
+        later = np.zeros(len(frame), dtype=bool)
+        equal = np.ones(len(frame), dtype=bool)
+        for (column, desc), value in zip(order, after):
+            values = keys[column].to_numpy()
+            later |= equal & ((values < value) if desc else (values > value))
+            equal &= values == value
+        mask &= later
+    ordered = keys[mask].sort_values([c for c, _ in order], ascending=[not d for _, d in order], kind='stable')
+    page = frame.loc[ordered.index[:page_size + 1]]
+    if len(page) <= page_size:
+        return page.reset_index(drop=True), None
+    page = page.iloc[:page_size]
+    return page.reset_index(drop=True), query.cursor_of(page.iloc[-1], sort, descending)
+
+
+def count_frame(frame, query, filters=None, search=None):
+    keys = _frame_keys(frame, query, list(filters or ()))
+    return int(_frame_mask(frame, query, keys, filters, search).sum())
@@ -0,0 +1,290 @@
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+# ------------------------------
+# Parameterized, dependency-aware query cache
+# ------------------------------
+# Entries are keyed on normalized SQL plus bound parameters, bounded by
+# total result size (LRU), and tagged with the base tables they read so a
+# write can evict only the entries it affects.
+#
+# Lifetimes are jittered so entries cached together do not all expire
+# together. With a `revalidate` hook (see warmup.py), an expired or
+# invalidated entry the hook agrees to reload keeps being served, for up
+# to `stale_ttl` seconds, while it is refreshed in the background
+# (stale-while-revalidate).
+
+# Objects that read today's date (GETDATE): no write invalidates them, so
+# their entries expire at the next local midnight at the latest
+CLOCK = 'getdate()'
+_CLOCK_RE = re.compile(r"\b(?:GETDATE|SYSDATETIME|CURRENT_TIMESTAMP|CURRENT_DATE)\b", re.IGNORECASE)
+
+# Views, procedures and functions -> the tables they read
+OBJECT_DEPENDENCIES = {
+    'vw_user_activity_summary': {'users', 'watch_history', 'subscriptions'},
+    'vw_genre_performance': {'genres', 'title_genres', 'watch_history'},
+    'vw_active_subscriptions': {'subscriptions', 'users', CLOCK},
+    'vw_revenue_analysis': {'subscriptions', CLOCK},
+    'vw_country_engagement': {'users', 'watch_history'},
+    'vw_user_ltv': {'users', 'subscriptions', CLOCK},
+    'sp_get_user_recommendations': {'titles', 'title_genres', 'genres', 'watch_history'},
+    'sp_get_genre_trends': {'genres', 'title_genres', 'watch_history'},
+    'fn_calculate_user_ltv': {'subscriptions', CLOCK},
+    'fn_subscription_duration': {'subscriptions', CLOCK},
+    'fn_user_ltv': {'subscriptions', CLOCK},
+    'vw_daily_trends': {'watch_rollups'},
+    'sp_get_trending_titles': {'watch_rollups', 'titles'},
+    'sp_get_genre_momentum': {'watch_rollups'},
+}
+
+# Columns kept up to date by triggers on another table
+DERIVED_COLUMNS = {
+    'watch_time_hours': 'watch_history',
+}
+
+_OBJECT_RE = re.compile(r"\b(?:FROM|JOIN|EXEC(?:UTE)?|INTO|UPDATE)\s+(?:\[?dbo\]?\.)?\[?(\w+)", re.IGNORECASE)
+_FUNCTION_RE = re.compile(r"\b(?:dbo\.)?(fn_\w+)\s*\(", re.IGNORECASE)
+_TOKEN_RE = re.compile(r"('(?:[^']|'')*')|\s+")
+
+
+def normalize_sql(sql):
+    # Collapse whitespace outside string literals and drop a trailing ';'
+    normalized = _TOKEN_RE.sub(lambda m: m.group(1) or ' ', sql).strip()
+    return normalized.rstrip(';').rstrip()
+
+
+def sql_dependencies(sql):
+    names = {name.lower() for name in _OBJECT_RE.findall(sql)}
+    names |= {name.lower() for name in _FUNCTION_RE.findall(sql)}
+    tables = set()
+    for name in names:
+        tables |= OBJECT_DEPENDENCIES.get(name, {name})
+    lowered = sql.lower()
+    for column, table in DERIVED_COLUMNS.items():
+        if column in lowered:
+            tables.add(table)
+    if _CLOCK_RE.search(sql):
+        tables.add(CLOCK)
+    return frozenset(tables)
+
+
+def _until_midnight():
+    now = datetime.now()
+    return (datetime.combine(now.date() + timedelta(days=1), datetime.min.time()) - now).total_seconds()
+
+
+def frame_nbytes(value):
+    try:
+        return int(value.memory_usage(index=True, deep=True).sum())
+    except AttributeError:
+        return 0
+
+
+class _Entry:
+    __slots__ = ('value', 'nbytes', 'tables', 'scope', 'created', 'expires')
+
+    def __init__(self, value, nbytes, tables, scope, created, expires):
+        self.value = value
+        self.nbytes = nbytes
+        self.tables = tables
+        self.scope = scope
+        self.created = created
+        self.expires = expires
+
+
+class QueryCache:
+    def __init__(self, max_bytes=256 * 2**20, max_entries=2048, ttl=600, jitter=0.1, stale_ttl=None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.jitter = jitter
+        self.stale_ttl = ttl if stale_ttl is None else stale_ttl
+        # revalidate(key) -> True if the key will be reloaded in the background
+        self.revalidate = None
+        self._entries = OrderedDict()
+        self._inflight = {}
+        # table -> count of invalidations; a load whose tables were
+        # invalidated while it ran is not stored
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.discarded = 0
+
+    @staticmethod
+    def make_key(sql, params=None):
+        return normalize_sql(sql), tuple(params or ())
+
+    def get(self, sql, params=None):
+        key = self.make_key(sql, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires <= time.monotonic():
+                return None
+            self._entries.move_to_end(key)
+            return entry.value
+
+    def _revalidating(self, key, entry, now):
+        # Caller holds the lock
+        return self.revalidate is not None and entry.scope is None and \
+            now < entry.expires + self.stale_ttl and self.revalidate(key)
+
+    def expires_in(self, sql, params=None):
+        # Seconds until the entry expires (negative once stale), None if absent
+        key = self.make_key(sql, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry.expires - time.monotonic()
+
+    def get_or_load(self, sql, params, loader, scope=None, tables=None):
+        # loader() runs at most once per key at a time; concurrent callers
+        # for the same key wait on the first one's result.
+        key = self.make_key(sql, params)
+        tables = self._tables(sql, tables)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.value
+            if entry is not None and self._revalidating(key, entry, now):
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+                return entry.value
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = self._inflight[key] = Future()
+                generation = self._generation(tables)
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+        return self._load(key, future, loader, tables, scope, generation)
+
+    def refresh(self, sql, params, loader, scope=None, tables=None):
+        # Reloads the entry even if it is still fresh. Readers keep getting
+        # the old value meanwhile; a reader with nothing cached waits on
+        # this load instead of starting its own.
+        key = self.make_key(sql, params)
+        tables = self._tables(sql, tables)
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                self.refreshes += 1
+                future = self._inflight[key] = Future()
+                generation = self._generation(tables)
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+        return self._load(key, future, loader, tables, scope, generation)
+
+    @staticmethod
+    def _tables(sql, tables):
+        return frozenset(t.lower() for t in (tables if tables is not None else sql_dependencies(sql)))
+
+    def _generation(self, tables):
+        # Caller holds the lock
+        return tuple(self._generations.get(t, 0) for t in sorted(tables))
+
+    def _load(self, key, future, loader, tables, scope, generation):
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        self.put(key, value, tables, scope, generation)
+        with self._lock:
+            self._inflight.pop(key, None)
+        future.set_result(value)
+        return value
+
+    def put(self, key, value, tables, scope=None, generation=None):
+        # `generation` is _generation(tables) from before the value was
+        # read; if a table was invalidated since, the value may predate the
+        # write and is dropped
+        nbytes = frame_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        now = time.monotonic()
+        expires = now + self.ttl * (1 - self.jitter * random.random())
+        if CLOCK in tables:
+            expires = min(expires, now + _until_midnight())
+        with self._lock:
+            if generation is not None and generation != self._generation(tables):
+                self.discarded += 1
+                return
+            self._remove(key)
+            self._entries[key] = _Entry(value, nbytes, tables, scope, now, expires)
+            self._bytes += nbytes
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+        return entry
+
+    def invalidate(self, tables, scope=None):
+        # Evict entries reading any of `tables`. With a scope (e.g. a user_id),
+        # entries scoped to a different user are kept. Entries the
+        # revalidate hook takes are marked expired instead, so they are
+        # served stale until the reload lands. Loads of `tables` already
+        # running (for any scope) are not stored when they finish.
+        tables = {t.lower() for t in tables}
+        now = time.monotonic()
+        with self._lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+            doomed = [key for key, entry in self._entries.items()
+                      if entry.tables & tables
+                      and (scope is None or entry.scope is None or entry.scope == scope)]
+            for key in doomed:
+                entry = self._entries[key]
+                entry.expires = min(entry.expires, now)
+                if not self._revalidating(key, entry, now):
+                    self._remove(key)
+            self.invalidations += len(doomed)
+        return len(doomed)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'stale_hits': self.stale_hits,
+                'refreshes': self.refreshes,
+                'discarded': self.discarded,
+            }
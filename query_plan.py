@@ -0,0 +1,49 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# ------------------------------
+# Concurrent execution of a page's query plan
+# ------------------------------
+# A plan is a dict of {name: sql}. run_plan fans the queries out on a
+# thread pool so a page waits for its slowest query instead of the sum
+# of all of them.
+
+
+def _timed(run, sql):
+    start = time.perf_counter()
+    result = run(sql)
+    return result, time.perf_counter() - start
+
+
+def run_plan(plan, run, max_workers=None, initializer=None):
+    # Returns ({name: result}, {name: seconds}, wall_clock_seconds)
+    start = time.perf_counter()
+    workers = max_workers or max(len(plan), 1)
+    with ThreadPoolExecutor(max_workers=workers, initializer=initializer) as executor:
+        futures = {name: executor.submit(_timed, run, sql) for name, sql in plan.items()}
+        results, timings = {}, {}
+        for name, future in futures.items():
+            results[name], timings[name] = future.result()
+    return results, timings, time.perf_counter() - start
+
+
+def run_plan_sequential(plan, run):
+    start = time.perf_counter()
+    results, timings = {}, {}
+    for name, sql in plan.items():
+        results[name], timings[name] = _timed(run, sql)
+    return results, timings, time.perf_counter() - start
+
+
+def compare_plan(plan, run, max_workers=None):
+    # Sequential and parallel wall-clock times for the same plan, side by side
+    _, seq_timings, seq_wall = run_plan_sequential(plan, run)
+    _, par_timings, par_wall = run_plan(plan, run, max_workers=max_workers)
+    return {
+        'queries': len(plan),
+        'sequential_s': round(seq_wall, 4),
+        'parallel_s': round(par_wall, 4),
+        'slowest_query_s': round(max(par_timings.values(), default=0.0), 4),
+        'speedup': round(seq_wall / par_wall, 2) if par_wall else None,
+        'per_query_s': {name: round(seq_timings[name], 4) for name in plan},
+    }
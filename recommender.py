@@ -0,0 +1,212 @@
+import threading
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from snapshot import PAIR_SHIFT, KeySet
+
+# ------------------------------
+# Vectorized genre-overlap recommender
+# ------------------------------
+# In-memory equivalent of sp_get_user_recommendations. Titles are kept in
+# imdb_score order in a sparse title x genre matrix; a user's candidates
+# are the rows with a non-zero product against their genre vector, minus
+# the titles they already watched.
+
+RESULT_COLUMNS = ['title_id', 'title', 'release_year', 'avg_rating', 'genres']
+
+
+class GenreRecommender:
+    def __init__(self, title_ids, titles, release_years, scores, genre_names,
+                 tg_indptr, tg_genres, n_users, block_size=4096):
+        # Title rows are stored by descending imdb_score, NULL scores last,
+        # so "best rated candidates" are simply the first candidate rows.
+        n_titles = len(title_ids)
+        ranking = np.where(np.isnan(scores), -np.inf, scores)
+        self.order = np.argsort(-ranking, kind='stable')
+        self.position = np.empty(n_titles, dtype=np.int64)
+        self.position[self.order] = np.arange(n_titles)
+
+        self.title_ids = np.asarray(title_ids, dtype=object)[self.order]
+        self.titles = np.asarray(titles, dtype=object)[self.order]
+        self.release_years = np.asarray(release_years)[self.order]
+        self.scores = np.asarray(scores, dtype=np.float64)[self.order]
+        self.genre_names = np.asarray(genre_names, dtype=object)
+
+        rows = np.repeat(np.arange(n_titles), np.diff(tg_indptr))
+        self.title_genres = sparse.csr_matrix(
+            (np.ones(len(tg_genres), dtype=np.float32), (self.position[rows], tg_genres)),
+            shape=(n_titles, len(genre_names)))
+        self.title_genres.sum_duplicates()
+        self.title_genres.data[:] = 1.0
+        self.block_size = block_size
+        self._blocks = [self.title_genres[i:i + block_size] for i in range(0, n_titles, block_size)]
+        self._rating = np.maximum(np.nan_to_num(self.scores, nan=0.0), 0.0)
+        self.max_genres_per_title = max(int(np.diff(self.title_genres.indptr).max(initial=0)), 1)
+
+        n_genres = len(genre_names)
+        self.genre_counts = np.zeros((n_users, n_genres), dtype=np.float32)
+        self.genre_affinity = np.zeros((n_users, n_genres), dtype=np.float32)
+        self.watched = KeySet()
+        self.user_index = {}
+        self.rebuilds = 0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def _build(cls, snapshot, block_size=4096):
+        with snapshot._lock:
+            model = cls(
+                snapshot.titles.values, snapshot.title_name, snapshot.title_year,
+                snapshot.title_score, snapshot.genre_name,
+                snapshot.tg_indptr, snapshot.tg_genres, len(snapshot.users), block_size=block_size)
+            model.user_index = snapshot.users.codes
+            events = snapshot.events
+            for start in range(0, events.size, 1_000_000):
+                stop = start + 1_000_000
+                model.add_events(events['user'][start:stop], events['title'][start:stop],
+                                 events['watch_percentage'][start:stop])
+        return model
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        model = cls._build(snapshot)
+        snapshot.subscribe(model._on_events)
+        return model
+
+    def rebuild(self, snapshot):
+        # Replays every snapshot event against its current titles and genres
+        fresh = self._build(snapshot, self.block_size)
+        with self._lock:
+            self.__dict__.update({name: value for name, value in fresh.__dict__.items()
+                                  if name not in ('_lock', 'rebuilds')})
+            self.rebuilds += 1
+
+    def _on_events(self, snapshot, batch):
+        # Keep affinities and watched sets current as the snapshot refreshes.
+        # The snapshot reloads titles when an event names a new one; a new
+        # title shifts the imdb-ordered rows, so the model is rebuilt (the
+        # snapshot's events already include this batch).
+        if len(snapshot.titles) != len(self.title_ids):
+            self.rebuild(snapshot)
+            return
+        self.add_events(batch['user'], batch['title'], batch['watch_percentage'])
+
+    def add_events(self, users, titles, watch_percentage):
+        users = np.asarray(users, dtype=np.int64)
+        positions = self.position[np.asarray(titles, dtype=np.int64)]
+        pct = np.nan_to_num(np.asarray(watch_percentage, dtype=np.float32))
+        with self._lock:
+            if users.size and users.max() >= self.genre_counts.shape[0]:
+                extra = int(users.max()) + 1 - self.genre_counts.shape[0]
+                pad = np.zeros((extra, self.genre_counts.shape[1]), dtype=np.float32)
+                self.genre_counts = np.vstack([self.genre_counts, pad])
+                self.genre_affinity = np.vstack([self.genre_affinity, pad])
+            # Event x genre incidence, then scatter into the user vectors
+            rows = self.title_genres[positions].tocoo()
+            np.add.at(self.genre_counts, (users[rows.row], rows.col), 1.0)
+            np.add.at(self.genre_affinity, (users[rows.row], rows.col), pct[rows.row])
+            self.watched.add(users * PAIR_SHIFT + positions)
+
+    def _watched_positions(self, user):
+        keys = self.watched.between(user * PAIR_SHIFT, (user + 1) * PAIR_SHIFT)
+        return keys - user * PAIR_SHIFT
+
+    def _user_vector(self, user, weighted):
+        source = self.genre_affinity if weighted else self.genre_counts
+        if user < 0 or user >= source.shape[0]:
+            return np.zeros(source.shape[1], dtype=np.float32)
+        return source[user]
+
+    def _scan(self, users, k, weighted):
+        # Walk the imdb-ordered row blocks and stop as soon as every user's
+        # top k can no longer change, so typical calls touch one block.
+        n_titles = len(self.title_ids)
+        vectors = np.stack([self._user_vector(u, weighted) for u in users]) if len(users) else \
+            np.zeros((0, len(self.genre_names)), dtype=np.float32)
+        watched = [self._watched_positions(u) if u >= 0 else np.empty(0, dtype=np.int64) for u in users]
+        # Best possible overlap of any single title with each user's vector
+        bounds = np.sort(vectors, axis=1)[:, -self.max_genres_per_title:].sum(axis=1)
+        positions = [np.empty(0, dtype=np.int64) for _ in users]
+        scores = [np.empty(0, dtype=np.float64) for _ in users]
+
+        active = np.flatnonzero(vectors.any(axis=1)) if k > 0 else np.empty(0, dtype=np.int64)
+        for offset, block in zip(range(0, n_titles, self.block_size), self._blocks):
+            if active.size == 0:
+                break
+            end = offset + block.shape[0]
+            next_rating = self._rating[end] if end < n_titles else 0.0
+            overlap = np.ascontiguousarray(np.asarray(block @ vectors[active].T).T)
+            still = []
+            for row, j in zip(overlap, active):
+                lo, hi = np.searchsorted(watched[j], [offset, end])
+                row[watched[j][lo:hi] - offset] = 0
+                found = np.flatnonzero(row > 0)
+                if not weighted:
+                    # Rows are already in imdb_score order
+                    positions[j] = np.concatenate([positions[j], found + offset])[:k]
+                    if positions[j].size < k:
+                        still.append(j)
+                    continue
+                cand = np.concatenate([positions[j], found + offset])
+                cand_scores = np.concatenate([scores[j], row[found] * self._rating[found + offset]])
+                if cand.size > k:
+                    keep = np.argpartition(-cand_scores, k - 1)[:k]
+                    cand, cand_scores = cand[keep], cand_scores[keep]
+                positions[j], scores[j] = cand, cand_scores
+                if cand.size < k or cand_scores.min() < bounds[j] * next_rating:
+                    still.append(j)
+            active = np.array(still, dtype=np.int64)
+
+        if weighted:
+            # Affinity x rating, ties by rating order
+            positions = [p[np.lexsort((p, -s))] for p, s in zip(positions, scores)]
+        return positions
+
+    def _frame(self, users, positions):
+        # STRING_AGG in the procedure only sees the genres the user watched
+        indptr, indices = self.title_genres.indptr, self.title_genres.indices
+        genres = []
+        for user, rows in zip(users, positions):
+            vector = self._user_vector(user, False)
+            for row in rows:
+                cols = indices[indptr[row]:indptr[row + 1]]
+                genres.append(', '.join(self.genre_names[cols[vector[cols] > 0]]))
+        rows = np.concatenate(positions) if positions else np.empty(0, dtype=np.int64)
+        return pd.DataFrame({
+            'title_id': self.title_ids[rows],
+            'title': self.titles[rows],
+            'release_year': self.release_years[rows],
+            'avg_rating': self.scores[rows],
+            'genres': genres,
+        }, columns=RESULT_COLUMNS)
+
+    def top_titles(self, user_id, limit=5, weighted=False):
+        # title_ids only, for callers that don't need a DataFrame
+        with self._lock:
+            return self.title_ids[self._scan([self.user_index.get(user_id, -1)], limit, weighted)[0]]
+
+    def recommend(self, user_id, limit=5, weighted=False):
+        with self._lock:
+            user = self.user_index.get(user_id, -1)
+            return self._frame([user], self._scan([user], limit, weighted))
+
+    def recommend_many(self, user_ids, limit=5, weighted=False, block_users=256):
+        # Users are scored in groups with one sparse mat-mat product per block
+        with self._lock:
+            users = [self.user_index.get(u, -1) for u in user_ids]
+            positions = []
+            for start in range(0, len(users), block_users):
+                positions.extend(self._scan(users[start:start + block_users], limit, weighted))
+            frame = self._frame(users, positions)
+        frame.insert(0, 'user_id', np.repeat(np.asarray(user_ids, dtype=object), [len(p) for p in positions]))
+        return frame
+
+    def stats(self):
+        with self._lock:
+            return {
+                'titles': len(self.title_ids),
+                'users': self.genre_counts.shape[0],
+                'watched_pairs': len(self.watched),
+                'rebuilds': self.rebuilds,
+            }
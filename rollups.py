@@ -0,0 +1,252 @@
+import argparse
+import datetime
+import json
+import threading
+import time
+
+# ------------------------------
+# Trend rollups
+# ------------------------------
+# Python side of 05_Trend_Rollups.sql. apply_rollups() adds every event
+# above the 'trend_rollups' watermark to its hourly and daily buckets in
+# watch_rollups; late events have new watch_ids, so they are added to
+# their old buckets. backfill_rollups() rebuilds the buckets of a date
+# range from watch_history, for rows below the watermark that were
+# loaded, corrected or deleted. On SQL Server both call the procedures;
+# the embedded DuckDB backend runs the same statements natively.
+#
+#   python rollups.py apply
+#   python rollups.py backfill --from 2024-01-01 --to 2024-03-31
+#   python rollups.py run --interval 60
+
+WATERMARK = 'trend_rollups'
+
+APPLY_SQL = """
+    SET NOCOUNT ON;
+    DECLARE @to INT, @buckets INT, @remaining INT;
+    EXEC sp_apply_trend_rollups @p_batch_size = ?, @p_to_watch_id = @to OUTPUT,
+        @p_buckets_updated = @buckets OUTPUT, @p_remaining = @remaining OUTPUT;
+    SELECT @to, @buckets, @remaining;"""
+
+BACKFILL_SQL = """
+    SET NOCOUNT ON;
+    DECLARE @written INT;
+    EXEC sp_backfill_trend_rollups @p_from = ?, @p_to = ?, @p_buckets_written = @written OUTPUT;
+    SELECT @written;"""
+
+# fn_watch_rollup_rows for DuckDB; {where} filters watch_history wh, whose
+# event time is event_at (created_at, else updated_at; rows with neither
+# are skipped)
+DUCKDB_ROLLUP_ROWS = """
+    WITH source AS (
+        SELECT wh.*, COALESCE(wh.created_at, wh.updated_at) AS event_at
+        FROM watch_history wh
+    ),
+    events AS (
+        SELECT
+            wh.title_id,
+            wh.watch_percentage,
+            COALESCE(wh.completed, 0) AS completed,
+            COALESCE(u.country, 'Unknown') AS country,
+            COALESCE(s.subscription_type, 'None') AS subscription_type,
+            date_trunc('hour', wh.event_at) AS hour_start,
+            date_trunc('day', wh.event_at) AS day_start
+        FROM source wh
+        LEFT JOIN users u ON u.user_id = wh.user_id
+        LEFT JOIN subscriptions s
+          ON s.user_id = wh.user_id
+         AND s.subscription_start_date <= wh.event_at
+         AND (s.subscription_end_date IS NULL OR s.subscription_end_date >= CAST(wh.event_at AS DATE))
+        WHERE wh.event_at IS NOT NULL AND {where}
+        QUALIFY row_number() OVER (PARTITION BY wh.watch_id
+                                   ORDER BY s.subscription_start_date DESC, s.subscription_id DESC) = 1
+    ),
+    members AS (
+        SELECT *, 'all' AS dimension, 'all' AS member FROM events
+        UNION ALL SELECT *, 'title', title_id FROM events
+        UNION ALL SELECT *, 'country', country FROM events
+        UNION ALL SELECT *, 'subscription_type', subscription_type FROM events
+        UNION ALL
+        SELECT e.*, 'genre', g.name
+        FROM events e
+        JOIN title_genres tg ON tg.title_id = e.title_id
+        JOIN genres g ON g.genre_id = tg.genre_id
+    )
+    SELECT
+        b.grain,
+        m.dimension,
+        m.member,
+        CASE b.grain WHEN 'hour' THEN m.hour_start ELSE m.day_start END AS bucket_start,
+        COUNT(*) AS watches,
+        SUM(CAST(m.completed AS INTEGER)) AS completed_watches,
+        COALESCE(SUM(m.watch_percentage), 0) AS watch_percentage_sum,
+        COUNT(m.watch_percentage) AS watch_percentage_count
+    FROM members m
+    CROSS JOIN (VALUES ('hour'), ('day')) b (grain)
+    GROUP BY ALL"""
+
+_DUCKDB_MERGE = """
+    INSERT INTO watch_rollups
+    {rows}
+    ON CONFLICT (grain, dimension, member, bucket_start) DO UPDATE SET
+        watches = watch_rollups.watches + excluded.watches,
+        completed_watches = watch_rollups.completed_watches + excluded.completed_watches,
+        watch_percentage_sum = watch_rollups.watch_percentage_sum + excluded.watch_percentage_sum,
+        watch_percentage_count = watch_rollups.watch_percentage_count + excluded.watch_percentage_count"""
+
+
+def _watermark(cursor):
+    row = cursor.execute("SELECT last_watch_id FROM maintenance_watermarks WHERE name = ?", WATERMARK).fetchone()
+    if row is None:
+        cursor.execute("INSERT INTO maintenance_watermarks (name, last_watch_id) VALUES (?, 0)", WATERMARK)
+        return 0
+    return row[0]
+
+
+def _apply_duckdb(conn, batch_size):
+    cursor = conn.cursor()
+    top = cursor.execute("SELECT COALESCE(MAX(watch_id), 0) FROM watch_history").fetchone()[0]
+    low = _watermark(cursor)
+    high = min(top, low + batch_size)
+    buckets = 0
+    if high > low:
+        rows = DUCKDB_ROLLUP_ROWS.format(where="wh.watch_id > ? AND wh.watch_id <= ?")
+        buckets = cursor.execute(f"SELECT COUNT(*) FROM ({rows}) d", low, high).fetchone()[0]
+        cursor.execute(_DUCKDB_MERGE.format(rows=rows), low, high)
+        cursor.execute("UPDATE maintenance_watermarks SET last_watch_id = ?, updated_at = CAST(now() AS TIMESTAMP) "
+                       "WHERE name = ?", high, WATERMARK)
+    conn.commit()
+    return high, buckets, top - high
+
+
+def _backfill_duckdb(conn, start, end):
+    cursor = conn.cursor()
+    watermark = _watermark(cursor)
+    low, high = datetime.datetime.combine(start, datetime.time()), \
+        datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time())
+    cursor.execute("DELETE FROM watch_rollups WHERE bucket_start >= ? AND bucket_start < ?", low, high)
+    rows = DUCKDB_ROLLUP_ROWS.format(
+        where="wh.watch_id <= ? AND wh.event_at >= ? AND wh.event_at < ?")
+    written = cursor.execute(f"SELECT COUNT(*) FROM ({rows}) d", watermark, low, high).fetchone()[0]
+    cursor.execute(f"INSERT INTO watch_rollups {rows}", watermark, low, high)
+    conn.commit()
+    return written
+
+
+def apply_rollups(backend, batch_size=500_000):
+    # Run passes until the watermark reaches the newest event
+    passes = buckets = 0
+    start = time.perf_counter()
+
+    def work(conn):
+        if backend.name == 'duckdb':
+            return _apply_duckdb(conn, batch_size)
+        row = conn.cursor().execute(APPLY_SQL, batch_size).fetchone()
+        conn.commit()
+        return tuple(row)
+
+    while True:
+        to_watch_id, updated, remaining = backend.run(work)
+        passes += 1
+        buckets += updated or 0
+        if not remaining:
+            break
+    return {
+        'passes': passes,
+        'buckets_updated': buckets,
+        'watermark': to_watch_id,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def backfill_rollups(backend, start, end):
+    # Rebuild the buckets of the days start..end (inclusive)
+    started = time.perf_counter()
+
+    def work(conn):
+        if backend.name == 'duckdb':
+            return _backfill_duckdb(conn, start, end)
+        row = conn.cursor().execute(BACKFILL_SQL, start, end).fetchone()
+        conn.commit()
+        return row[0]
+    written = backend.run(work)
+    return {
+        'from': str(start),
+        'to': str(end),
+        'buckets_written': written,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def rollup_status(backend):
+    frame = backend.read(
+        "SELECT (SELECT MAX(last_watch_id) FROM maintenance_watermarks WHERE name = ?) AS watermark, "
+        "(SELECT COUNT(*) FROM watch_rollups) AS buckets, "
+        "(SELECT MIN(bucket_start) FROM watch_rollups WHERE grain = 'day') AS first_day, "
+        "(SELECT MAX(bucket_start) FROM watch_rollups WHERE grain = 'day') AS last_day", [WATERMARK])
+    return {key: (None if value is None or value != value else str(value) if key.endswith('_day') else int(value))
+            for key, value in frame.iloc[0].items()}
+
+
+class TrendRollups:
+    # Keeps watch_rollups current for the Trends page; refresh() runs at
+    # most one catch-up per `min_interval` seconds
+    def __init__(self, backend, batch_size=500_000):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.last_refresh = None
+        self.last_run = None
+        self._lock = threading.Lock()
+
+    def refresh(self, min_interval=0):
+        with self._lock:
+            if self.last_refresh and time.time() - self.last_refresh < min_interval:
+                return None
+            self.last_run = apply_rollups(self.backend, self.batch_size)
+            self.last_refresh = time.time()
+            return self.last_run
+
+    def backfill(self, start, end):
+        with self._lock:
+            return backfill_rollups(self.backend, start, end)
+
+    def stats(self):
+        return dict(rollup_status(self.backend), last_run=self.last_run)
+
+
+def main():
+    from backends import create_backend
+
+    parser = argparse.ArgumentParser(description="Maintain the watch_history trend rollups")
+    sub = parser.add_subparsers(dest='command', required=True)
+    apply = sub.add_parser('apply', help="Add new events to their buckets until caught up")
+    apply.add_argument('--batch-size', type=int, default=500_000)
+    backfill = sub.add_parser('backfill', help="Rebuild the buckets of a date range")
+    backfill.add_argument('--from', dest='start', type=datetime.date.fromisoformat, required=True)
+    backfill.add_argument('--to', dest='end', type=datetime.date.fromisoformat, required=True)
+    run = sub.add_parser('run', help="Apply new events periodically")
+    run.add_argument('--interval', type=float, default=60)
+    run.add_argument('--batch-size', type=int, default=500_000)
+    sub.add_parser('status', help="Show the watermark and bucket range")
+    args = parser.parse_args()
+
+    backend = create_backend()
+    if args.command == 'apply':
+        print(json.dumps(apply_rollups(backend, args.batch_size)))
+    elif args.command == 'backfill':
+        print(json.dumps(backfill_rollups(backend, args.start, args.end)))
+    elif args.command == 'status':
+        print(json.dumps(rollup_status(backend)))
+    else:
+        rollups = TrendRollups(backend, args.batch_size)
+        try:
+            while True:
+                print(json.dumps(rollups.refresh()))
+                time.sleep(args.interval)
+        except KeyboardInterrupt:
+            pass
+    backend.close()
+
+
+if __name__ == '__main__':
+    main()
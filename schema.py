@@ -0,0 +1,44 @@
+# ------------------------------
+# Table definitions shared by the loaders and backends
+# ------------------------------
+
+# Column types as declared in 01_Create_Tables.sql
+TABLE_COLUMNS = {
+    'users': {
+        'user_id': 'str', 'name': 'str', 'age': 'int', 'country': 'str',
+        'watch_time_hours': 'decimal', 'favorite_genre': 'str', 'last_login': 'date',
+        'created_at': 'datetime', 'updated_at': 'datetime',
+    },
+    'titles': {
+        'title_id': 'str', 'title': 'str', 'type': 'str', 'description': 'str',
+        'release_year': 'int', 'age_certification': 'str', 'runtime': 'int',
+        'production_countries': 'str', 'seasons': 'int', 'imdb_id': 'str',
+        'imdb_score': 'float', 'imdb_votes': 'int', 'tmdb_popularity': 'float', 'tmdb_score': 'float',
+    },
+    'genres': {'genre_id': 'int', 'name': 'str'},
+    'sources': {'source_id': 'int', 'name': 'str', 'region': 'str'},
+    'title_genres': {'title_id': 'str', 'genre_id': 'int'},
+    'title_sources': {'title_id': 'str', 'source_id': 'int', 'link': 'str'},
+    'subscriptions': {
+        'subscription_id': 'int', 'user_id': 'str', 'subscription_type': 'str',
+        'monthly_fee': 'decimal', 'subscription_status': 'str',
+        'subscription_start_date': 'date', 'subscription_end_date': 'date',
+    },
+    'watch_history': {
+        'watch_id': 'int', 'user_id': 'str', 'title_id': 'str', 'watch_percentage': 'decimal',
+        'completed': 'int', 'created_at': 'datetime', 'updated_at': 'datetime',
+    },
+}
+
+IDENTITY_COLUMNS = {
+    'genres': 'genre_id',
+    'sources': 'source_id',
+    'subscriptions': 'subscription_id',
+    'watch_history': 'watch_id',
+}
+
+# Tables in a level only reference tables in earlier levels
+LOAD_LEVELS = [
+    ['users', 'titles', 'genres', 'sources'],
+    ['title_genres', 'title_sources', 'subscriptions', 'watch_history'],
+]
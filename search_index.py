@@ -0,0 +1,338 @@
+import re
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from pagination import strip_order_by
+from snapshot import ColumnBuffer
+
+# ------------------------------
+# Typeahead search indexes
+# ------------------------------
+# A SearchIndex holds one row per key (e.g. user_id) and two inverted
+# indexes over the case-folded, accent-stripped text of its fields:
+#   tokens    sorted (word, row) pairs; a query word matches every word it
+#             is a prefix of, and rows come out already ordered by that word
+#   trigrams  sorted (3-gram code, row) pairs over `ngram_fields`, used for
+#             substring matches when prefixes find too few rows
+# Both are a large sorted run plus a small sorted delta, so refresh()
+# costs the new rows rather than a rebuild. Selections resolve through a
+# key -> row dict, never a column scan.
+
+MAX_CODEPOINT = '\U0010ffff'
+
+# Characters per value that get trigrams; longer values still match by prefix
+NGRAM_WIDTH = 64
+
+_BUILD_ROWS = 100_000
+
+
+def normalize(values):
+    # Case-folded, accents stripped, whitespace collapsed
+    text = pd.Series(values, dtype=object).fillna('').astype(str)
+    text = text.str.normalize('NFKD').str.replace('[\u0300-\u036f]', '', regex=True)
+    return text.str.casefold().str.replace(r'\s+', ' ', regex=True).str.strip()
+
+
+def trigram_codes(texts):
+    # (codes, rows): every 3-character window of each text packed into an
+    # int64 (21 bits per code point), with the index of the text it came from
+    codes, rows = [], []
+    for start in range(0, len(texts), _BUILD_ROWS):
+        batch = np.asarray(texts[start:start + _BUILD_ROWS], dtype=object)
+        width = min(NGRAM_WIDTH, max((len(text) for text in batch), default=0))
+        if width < 3:
+            continue
+        points = np.asarray(batch, dtype=f'U{width}').view(np.uint32).reshape(len(batch), width).astype(np.int64)
+        grams = (points[:, :-2] << 42) | (points[:, 1:-1] << 21) | points[:, 2:]
+        # Strings are NUL-padded at the end, so a window is whole when its last character is
+        valid = points[:, 2:] != 0
+        codes.append(grams[valid])
+        rows.append(np.nonzero(valid)[0].astype(np.int32) + start)
+    if not codes:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+    return np.concatenate(codes), np.concatenate(rows)
+
+
+def _distinct(values):
+    # (codes, normalized text of each distinct value); NULL is the last, ''
+    codes, uniques = pd.factorize(pd.Series(values))
+    text = np.append(normalize(np.asarray(uniques, dtype=object)).to_numpy(dtype=object), '')
+    return np.where(codes < 0, len(text) - 1, codes), text
+
+
+def _per_row(codes, values, keys):
+    # (keys, rows): for every row in order, the keys of its distinct value,
+    # so text is split once per distinct value. (values, keys) pairs come
+    # grouped by value, as explode() and trigram_codes() produce them.
+    counts = np.bincount(values, minlength=int(codes.max(initial=-1)) + 1)
+    indptr = np.concatenate([[0], np.cumsum(counts)])
+    lengths = indptr[codes + 1] - indptr[codes]
+    starts = np.repeat(indptr[codes], lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return keys[starts + offsets], np.repeat(np.arange(len(codes), dtype=np.int32), lengths)
+
+
+def _argsort(keys):
+    if keys.dtype == object:
+        return pd.Series(keys, dtype=object).argsort(kind='stable').to_numpy()
+    return np.argsort(keys, kind='stable')
+
+
+def _unique_in_order(rows):
+    _, first = np.unique(rows, return_index=True)
+    return rows[np.sort(first)]
+
+
+class Postings:
+    # Sorted (key, row) pairs: a main run plus a small sorted delta that is
+    # merged in once it outgrows 1/16 of the main run, like snapshot.KeySet
+    def __init__(self, dtype):
+        self.dtype = dtype
+        self._runs = [self._empty(), self._empty()]
+
+    def _empty(self):
+        return np.empty(0, dtype=self.dtype), np.empty(0, dtype=np.int32)
+
+    def __len__(self):
+        return sum(keys.size for keys, _ in self._runs)
+
+    @staticmethod
+    def _merge(run, keys, rows):
+        # Both sorted; equal keys keep older rows first
+        if not run[0].size:
+            return keys, rows
+        at = np.searchsorted(run[0], keys, side='right')
+        return np.insert(run[0], at, keys), np.insert(run[1], at, rows)
+
+    def add(self, keys, rows):
+        keys = np.asarray(keys, dtype=self.dtype)
+        order = _argsort(keys)
+        main, delta = self._runs
+        delta = self._merge(delta, keys[order], np.asarray(rows, dtype=np.int32)[order])
+        if delta[0].size > max(1 << 16, main[0].size >> 4):
+            self._runs = [self._merge(main, *delta), self._empty()]
+        else:
+            self._runs = [main, delta]
+
+    def count(self, low, high):
+        # Pairs with low <= key < high
+        return sum(int(np.searchsorted(keys, high) - np.searchsorted(keys, low)) for keys, _ in self._runs)
+
+    def rows(self, low, high, limit=None):
+        # Rows of the first `limit` pairs with low <= key < high, in key
+        # order; rows only grow, so rows sharing a key are ascending
+        parts = []
+        for keys, rows in self._runs:
+            start, stop = np.searchsorted(keys, low), np.searchsorted(keys, high)
+            if limit is not None:
+                stop = min(stop, start + limit)
+            parts.append((keys[start:stop], rows[start:stop]))
+        (main_keys, main_rows), (delta_keys, delta_rows) = parts
+        if not delta_keys.size:
+            return main_rows
+        order = _argsort(np.concatenate([main_keys, delta_keys]))[:limit]
+        return np.concatenate([main_rows, delta_rows])[order]
+
+    def nbytes(self):
+        return sum(keys.nbytes + rows.nbytes for keys, rows in self._runs)
+
+
+class SearchIndex:
+    def __init__(self, fetch, sql, key, fields, ngram_fields=(), watermark=None):
+        # fetch(sql, params) -> DataFrame. Every column of `sql` is kept for
+        # display; `fields` are searched by word prefix and `ngram_fields`
+        # also by substring. With a `watermark` column (e.g. created_at),
+        # refresh() only fetches rows at or above the highest value seen.
+        self._fetch = fetch
+        self.sql = strip_order_by(sql)
+        self.key = key
+        self.fields = list(fields)
+        self.ngram_fields = list(ngram_fields)
+        self.watermark_column = watermark
+        self._lock = threading.RLock()
+        self.columns = None
+        self.loaded = False
+        self.last_refresh = None
+        self._reset()
+
+    def _reset(self):
+        self._positions = {}
+        self._rows = None
+        self._tokens = Postings(object)
+        self._trigrams = Postings(np.int64)
+        self.watermark = None
+
+    def __len__(self):
+        return len(self._positions)
+
+    # -- building ---------------------------------------------------------
+    def load(self):
+        with self._lock:
+            self._reset()
+            self._upsert(self._fetch(self.sql, None))
+            self.loaded = True
+            self.last_refresh = time.time()
+
+    def refresh(self, min_interval=0):
+        # Adds new rows and re-indexes changed ones; returns how many
+        with self._lock:
+            if not self.loaded:
+                self.load()
+                return len(self)
+            if self.last_refresh and time.time() - self.last_refresh < min_interval:
+                return 0
+            if self.watermark_column and self.watermark is not None:
+                # >= so rows sharing the last watermark value are not missed;
+                # rows already indexed unchanged are skipped
+                frame = self._fetch(f"SELECT * FROM ({self.sql}) AS q WHERE q.{self.watermark_column} >= ?",
+                                    [self.watermark])
+            else:
+                frame = self._fetch(self.sql, None)
+            changed = self._upsert(frame)
+            self.last_refresh = time.time()
+            return changed
+
+    def _upsert(self, frame):
+        if self._rows is None:
+            self.columns = list(frame.columns)
+            # Datetimes stay native; building Timestamp objects is slow
+            dtypes = {column: dtype if isinstance(dtype, np.dtype) and dtype.kind == 'M' else object
+                      for column, dtype in frame.dtypes.items()}
+            self._rows = ColumnBuffer({**dtypes, '_text': object, '_alive': np.bool_})
+        if frame.empty:
+            return 0
+        if self.watermark_column:
+            latest = frame[self.watermark_column].max()
+            if pd.notna(latest):
+                latest = latest.to_pydatetime() if isinstance(latest, pd.Timestamp) else latest
+                self.watermark = latest if self.watermark is None else max(self.watermark, latest)
+
+        frame = frame.drop_duplicates(self.key, keep='last')
+        distinct = {field: _distinct(frame[field]) for field in dict.fromkeys(self.fields + self.ngram_fields)}
+        # Searchable text of each row: its normalized fields, space-separated
+        text = [pd.Series(values[codes], dtype=object) for codes, values in map(distinct.get, self.fields)]
+        if len(text) > 1:
+            text[0] = text[0].str.cat(text[1:], sep=' ').str.strip()
+        text = text[0].to_numpy(dtype=object)
+
+        # Skip rows indexed before with the same text; re-index changed ones
+        alive = self._rows['_alive']
+        keys = frame[self.key].tolist()
+        previous = np.array([self._positions.get(key, -1) for key in keys], dtype=np.int64)
+        known = previous >= 0
+        old_text = np.full(len(frame), None, dtype=object)
+        old_text[known] = self._rows['_text'][previous[known]]
+        fresh = ~known | (old_text != text)
+        if not fresh.any():
+            return 0
+        alive[previous[fresh & known]] = False
+        frame, text = frame[fresh], text[fresh]
+
+        start = self._rows.size
+        positions = np.arange(start, start + len(frame), dtype=np.int32)
+        self._rows.append(**{column: frame[column].to_numpy() for column in self.columns},
+                          _text=text, _alive=np.ones(len(frame), dtype=np.bool_))
+        self._positions.update(zip([key for key, new in zip(keys, fresh) if new], positions.tolist()))
+
+        tokens, token_rows, grams, gram_rows = [], [], [], []
+        for field, (codes, values) in distinct.items():
+            codes = codes[fresh]
+            if field in self.fields:
+                words = pd.Series(values, dtype=object).str.split().explode().dropna()
+                field_tokens, rows = _per_row(codes, words.index.to_numpy(), words.to_numpy(dtype=object))
+                tokens.append(field_tokens)
+                token_rows.append(positions[rows])
+            if field in self.ngram_fields:
+                field_grams, rows = _per_row(codes, *trigram_codes(values)[::-1])
+                grams.append(field_grams)
+                gram_rows.append(positions[rows])
+        self._tokens.add(np.concatenate(tokens), np.concatenate(token_rows))
+        if grams:
+            self._trigrams.add(np.concatenate(grams), np.concatenate(gram_rows))
+        return len(frame)
+
+    # -- lookups ----------------------------------------------------------
+    def get(self, key):
+        # Row for a key as a dict, or None
+        with self._lock:
+            position = self._positions.get(key)
+            if position is None:
+                return None
+            return {column: self._rows[column][position] for column in self.columns}
+
+    def _frame(self, positions):
+        return pd.DataFrame({column: self._rows[column][positions] for column in self.columns},
+                            columns=self.columns)
+
+    def search(self, text, limit=20, budget=0.05):
+        # Up to `limit` rows: rows with a word starting with every query
+        # word, ordered by the most selective word's match, then (for 3+
+        # characters) rows containing the query, in load order. Stops
+        # adding matches once `budget` seconds have passed.
+        started = time.perf_counter()
+        query = normalize([text])[0]
+        words = query.split() or ['']
+        with self._lock:
+            if self._rows is None:
+                return pd.DataFrame(columns=self.columns)
+            alive, texts = self._rows['_alive'], self._rows['_text']
+            ranges = sorted(((word, word + MAX_CODEPOINT) for word in words),
+                            key=lambda r: self._tokens.count(*r))
+            # The other words must start a word of the row's text
+            rest = [re.compile(r'(?:^| )' + re.escape(word)) for word in words if word != ranges[0][0]]
+            total = self._tokens.count(*ranges[0])
+
+            # Prefix matches, fetching 4x more postings until enough rows survive
+            found, fetch = np.empty(0, dtype=np.int32), limit * 4
+            while True:
+                rows = _unique_in_order(self._tokens.rows(*ranges[0], limit=fetch))
+                rows = rows[alive[rows]]
+                for pattern in rest:
+                    rows = rows[pd.Series(texts[rows], dtype=object).str.contains(pattern).to_numpy(dtype=bool)]
+                found = rows[:limit]
+                if len(found) >= limit or fetch >= total or time.perf_counter() - started > budget:
+                    break
+                fetch *= 4
+
+            if len(found) < limit and len(query) >= 3 and self.ngram_fields:
+                found = np.concatenate([found, self._substring(query, limit - len(found), found,
+                                                               started, budget)])
+            return self._frame(found)
+
+    def _substring(self, query, limit, exclude, started, budget):
+        codes = np.unique(trigram_codes([query[:NGRAM_WIDTH]])[0])
+        codes = sorted(codes, key=lambda code: self._trigrams.count(code, code + 1))
+        # Rows holding the rarest trigram (ascending, so duplicates are
+        # adjacent), narrowed by the others
+        candidates = self._trigrams.rows(codes[0], codes[0] + 1)
+        candidates = candidates[np.diff(candidates, prepend=-1) != 0]
+        for code in codes[1:]:
+            if len(candidates) <= limit or time.perf_counter() - started > budget:
+                break
+            candidates = candidates[np.isin(candidates, self._trigrams.rows(code, code + 1))]
+        candidates = candidates[self._rows['_alive'][candidates] & ~np.isin(candidates, exclude)]
+
+        # Check growing blocks until `limit` rows contain the query
+        texts, found, start, step = self._rows['_text'], [], 0, limit * 4
+        while start < len(candidates) and sum(map(len, found)) < limit:
+            block = candidates[start:start + step]
+            found.append(block[pd.Series(texts[block], dtype=object).str.contains(query, regex=False)
+                               .to_numpy(dtype=bool)])
+            start, step = start + step, step * 4
+            if time.perf_counter() - started > budget:
+                break
+        return np.concatenate(found)[:limit] if found else np.empty(0, dtype=np.int32)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rows': len(self),
+                'tokens': len(self._tokens),
+                'trigrams': len(self._trigrams),
+                'index_bytes': self._tokens.nbytes() + self._trigrams.nbytes(),
+                'watermark': str(self.watermark) if self.watermark is not None else None,
+                'last_refresh': self.last_refresh,
+            }
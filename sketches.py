@@ -0,0 +1,296 @@
+import threading
+
+import numpy as np
+
+from snapshot import AGE_GROUPS, _expand_ranges, _grow, sql_round
+
+# ------------------------------
+# Approximate aggregates
+# ------------------------------
+# Distinct counts are the most expensive part of the genre, country and
+# segment queries: exact answers need every distinct (genre, user) or
+# (country, title) pair. Here each group keeps a HyperLogLog sketch
+# instead, a fixed 2^precision registers whatever the cardinality, and
+# averages come from a stratified reservoir sample of watch_percentage
+# per group. Both are updated from new events as the snapshot applies
+# them and both are mergeable: HyperLogLog by register-wise max,
+# reservoirs by resampling.
+#
+# Every estimate carries a 95% error bound:
+#   distinct counts  +/- 2 * 1.04 / sqrt(2^precision) relative (3.3% at 12)
+#   averages         +/- 1.96 * s / sqrt(n) * sqrt(1 - n / N) for a sample of
+#                    n of the group's N values, so 0 when n == N
+
+Z_95 = 1.96
+
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def hash64(values, seed=0):
+    # splitmix64 finalizer over integer codes
+    x = np.asarray(values).astype(np.uint64) + _GOLDEN * np.uint64(seed + 1)
+    x = (x ^ (x >> np.uint64(30))) * _MIX1
+    x = (x ^ (x >> np.uint64(27))) * _MIX2
+    return x ^ (x >> np.uint64(31))
+
+
+def _bit_length(x):
+    for shift in (1, 2, 4, 8, 16, 32):
+        x = x | (x >> np.uint64(shift))
+    return np.bitwise_count(x)
+
+
+class HyperLogLog:
+    # One sketch per row of a (rows x 2^precision) uint8 register matrix
+    def __init__(self, n_rows=0, precision=12):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = np.zeros((n_rows, self.m), dtype=np.uint8)
+
+    def __len__(self):
+        return self.registers.shape[0]
+
+    @property
+    def relative_error(self):
+        # Standard error of one estimate
+        return 1.04 / np.sqrt(self.m)
+
+    def grow(self, n_rows):
+        self.registers = _grow(self.registers, n_rows)
+
+    def add(self, rows, hashes):
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.int64)
+        # Leading zeros after the index bits, plus one; the guard bit caps it
+        rest = (hashes << p) | (np.uint64(1) << (p - np.uint64(1)))
+        rank = (65 - _bit_length(rest)).astype(np.uint8)
+        np.maximum.at(self.registers.reshape(-1), np.asarray(rows, dtype=np.int64) * self.m + index, rank)
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches of different precision")
+        self.grow(len(other))
+        np.maximum(self.registers[:len(other)], other.registers, out=self.registers[:len(other)])
+
+    def estimate(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.ldexp(1.0, -self.registers.astype(np.int32)).sum(axis=1)
+        zeros = (self.registers == 0).sum(axis=1)
+        # Linear counting while many registers are still empty
+        with np.errstate(divide='ignore'):
+            small = m * np.log(m / np.maximum(zeros, 1))
+        return np.where((raw <= 2.5 * m) & (zeros > 0), small, raw)
+
+    def nbytes(self):
+        return self.registers.nbytes
+
+
+class Reservoir:
+    # Uniform sample of up to `capacity` values per stratum (Algorithm R)
+    def __init__(self, capacity=1024, seed=0):
+        self.capacity = capacity
+        self.values = np.full((0, capacity), np.nan, dtype=np.float32)
+        self.seen = np.zeros(0, dtype=np.int64)
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return self.seen.size
+
+    def grow(self, n_strata):
+        self.values = _grow(self.values, n_strata, np.nan)
+        self.seen = _grow(self.seen, n_strata)
+
+    def add(self, strata, values):
+        if not strata.size:
+            return
+        order = np.argsort(strata, kind='stable')
+        strata, values = strata[order], values[order]
+        starts = np.flatnonzero(np.r_[True, strata[1:] != strata[:-1]])
+        rank = np.arange(strata.size) - np.repeat(starts, np.diff(np.r_[starts, strata.size]))
+        # 1-based position of every value in its stratum's stream
+        position = self.seen[strata] + rank + 1
+        self.seen += np.bincount(strata, minlength=self.seen.size)
+        slot = np.where(position <= self.capacity, position - 1,
+                        (self._rng.random(strata.size) * position).astype(np.int64))
+        keep = slot < self.capacity
+        # Later values overwrite earlier ones, as a sequential pass would
+        self.values[strata[keep], slot[keep]] = values[keep]
+
+    def mean(self):
+        # (mean, 95% half-width, sample size) per stratum
+        n = np.minimum(self.seen, self.capacity)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.nanmean(np.where(n[:, None] > 0, self.values, 0.0), axis=1) if len(self) else np.zeros(0)
+            sd = np.sqrt(np.nansum((self.values - mean[:, None]) ** 2, axis=1) / np.maximum(n - 1, 1))
+            fpc = np.sqrt(np.clip(1 - n / np.maximum(self.seen, 1), 0, 1))
+            half = Z_95 * sd / np.sqrt(np.maximum(n, 1)) * fpc
+        return np.where(n > 0, mean, np.nan), np.where(n > 0, half, np.nan), n
+
+    def nbytes(self):
+        return self.values.nbytes + self.seen.nbytes
+
+
+class ApproximateAggregates:
+    # Sketches over a ColumnarSnapshot's events:
+    #   genre_users     distinct viewers per genre
+    #   country_titles  distinct titles watched per country
+    #   segment_users   distinct users per (subscription type, age group)
+    # and watch_percentage samples per genre, country and segment.
+    # Answers are the snapshot's page answers with the distinct counts and
+    # averages replaced by estimates, plus a <column>_error bound for each.
+    def __init__(self, precision=12, sample_size=1024, seed=0):
+        self._lock = threading.RLock()
+        self.snapshot = None
+        self.genre_users = HyperLogLog(0, precision)
+        self.country_titles = HyperLogLog(0, precision)
+        self.segment_users = HyperLogLog(0, precision)
+        self.genre_pct = Reservoir(sample_size, seed)
+        self.country_pct = Reservoir(sample_size, seed + 1)
+        self.segment_pct = Reservoir(sample_size, seed + 2)
+        self._sub_counts = np.zeros((0, 0), dtype=np.int32)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, **options):
+        if not snapshot.keep_events:
+            raise ValueError("ApproximateAggregates needs a snapshot that keeps its events")
+        with snapshot._lock:
+            sketches = cls(**options)
+            sketches.snapshot = snapshot
+            sketches._sync_segments()
+            events = snapshot.events
+            for start in range(0, events.size, snapshot.chunk_size):
+                sketches._add(*(events[column][start:start + snapshot.chunk_size]
+                                for column in ('user', 'title', 'watch_percentage')))
+            snapshot.subscribe(sketches._on_events)
+        return sketches
+
+    def _on_events(self, snapshot, batch):
+        with self._lock:
+            self._sync_segments()
+            self._add(batch['user'], batch['title'], batch['watch_percentage'])
+
+    def _grow(self):
+        snapshot = self.snapshot
+        n_segments = len(snapshot.sub_types) * len(AGE_GROUPS)
+        self.genre_users.grow(len(snapshot.genres))
+        self.country_titles.grow(len(snapshot.countries))
+        self.segment_users.grow(n_segments)
+        self.genre_pct.grow(len(snapshot.genres))
+        self.country_pct.grow(len(snapshot.countries))
+        self.segment_pct.grow(n_segments)
+
+    def _sync_segments(self):
+        # Segment membership comes from the user dimension; re-adding a
+        # user to a sketch is a no-op, so changed users are simply added
+        current = self.snapshot.user_sub_counts
+        if self._sub_counts.shape == current.shape and np.array_equal(self._sub_counts, current):
+            return
+        self._grow()
+        previous = np.zeros(current.shape, dtype=np.int32)
+        old = self._sub_counts[:current.shape[0], :current.shape[1]]
+        previous[:old.shape[0], :old.shape[1]] = old
+        users, types = np.nonzero((current > 0) & (previous == 0))
+        self.segment_users.add(types * len(AGE_GROUPS) + self.snapshot.user_age_group[users], hash64(users))
+        self._sub_counts = current.copy()
+
+    def _add(self, users, titles, pct):
+        snapshot = self.snapshot
+        self._grow()
+        users = users.astype(np.int64)
+        has_pct = ~np.isnan(pct)
+
+        event, flat = _expand_ranges(snapshot.tg_indptr, titles)
+        genre = snapshot.tg_genres[flat].astype(np.int64)
+        self.genre_users.add(genre, hash64(users[event]))
+        rated = has_pct[event]
+        self.genre_pct.add(genre[rated], pct[event][rated])
+
+        country = snapshot.user_country[users].astype(np.int64)
+        ok = has_pct & (country >= 0)
+        self.country_titles.add(country[ok], hash64(titles[ok]))
+        self.country_pct.add(country[ok], pct[ok])
+
+        # An event joins every subscription row of its user
+        counts = _grow(self._sub_counts, snapshot.user_sub_type.shape[0])[users[has_pct]]
+        event, sub_type = np.nonzero(counts)
+        weight = counts[event, sub_type]
+        event, sub_type = np.repeat(event, weight), np.repeat(sub_type, weight)
+        rated_users = users[has_pct]
+        self.segment_pct.add(sub_type * len(AGE_GROUPS) + snapshot.user_age_group[rated_users[event]],
+                             pct[has_pct][event])
+
+    @staticmethod
+    def _distinct(sketch):
+        estimate = np.rint(sketch.estimate())
+        return estimate, np.ceil(estimate * 2 * sketch.relative_error)
+
+    # -- page answers -----------------------------------------------------
+    def genre_performance(self):
+        with self._lock, self.snapshot._lock:
+            df = self.snapshot.genre_performance()
+            codes = self.snapshot.genres.lookup(df['genre_id'].to_numpy())
+            viewers, viewers_error = self._distinct(self.genre_users)
+            mean, half, _ = self.genre_pct.mean()
+        df['unique_viewers'] = viewers[codes].astype(np.int64)
+        df['unique_viewers_error'] = viewers_error[codes].astype(np.int64)
+        df['avg_watch_percentage'] = sql_round(mean[codes] * 100)
+        df['avg_watch_percentage_error'] = sql_round(half[codes] * 100)
+        return df
+
+    def genre_trends(self):
+        df = self.genre_performance().rename(columns={
+            'title_count': 'total_titles', 'total_watches': 'total_watch_events'})
+        with np.errstate(invalid='ignore', divide='ignore'):
+            df['engagement_score'] = np.where(df['total_titles'] > 0,
+                                              df['total_watch_events'] / df['total_titles'].clip(lower=1), np.nan)
+        return df
+
+    def country_engagement(self):
+        with self._lock, self.snapshot._lock:
+            df = self.snapshot.country_engagement()
+            codes = self.snapshot.countries.lookup(df['country'].to_numpy())
+            titles, titles_error = self._distinct(self.country_titles)
+            mean, half, _ = self.country_pct.mean()
+        df['unique_titles_watched'] = titles[codes].astype(np.int64)
+        df['unique_titles_watched_error'] = titles_error[codes].astype(np.int64)
+        df['avg_completion_rate'] = sql_round(mean[codes] * 100)
+        df['avg_completion_rate_error'] = sql_round(half[codes] * 100)
+        return df
+
+    def age_group_subscription(self):
+        with self._lock, self.snapshot._lock:
+            self._sync_segments()
+            df = self.snapshot.age_group_subscription()
+            segment = (self.snapshot.sub_types.lookup(df['subscription_type'].to_numpy()) * len(AGE_GROUPS)
+                       + np.array([AGE_GROUPS.index(group) for group in df['age_group']], dtype=np.int64))
+            users, users_error = self._distinct(self.segment_users)
+            mean, half, _ = self.segment_pct.mean()
+        df['users_in_segment'] = users[segment].astype(np.int64)
+        df['users_in_segment_error'] = users_error[segment].astype(np.int64)
+        df['avg_watch_percentage'] = sql_round(mean[segment] * 100)
+        df['avg_watch_percentage_error'] = sql_round(half[segment] * 100)
+        return df
+
+    def stats(self):
+        with self._lock:
+            sketches = (self.genre_users, self.country_titles, self.segment_users)
+            samples = (self.genre_pct, self.country_pct, self.segment_pct)
+            return {
+                'sketches': sum(len(sketch) for sketch in sketches),
+                'precision': self.genre_users.precision,
+                'distinct_error_95': round(float(2 * self.genre_users.relative_error), 4),
+                'sample_size': self.genre_pct.capacity,
+                'bytes': sum(s.nbytes() for s in sketches + samples),
+            }
+
+
+# Page plan entries (see page_queries.py) answered approximately
+APPROX_QUERIES = {
+    "country_engagement": ApproximateAggregates.country_engagement,
+    "age_group_subscription": ApproximateAggregates.age_group_subscription,
+    "genre_performance": ApproximateAggregates.genre_performance,
+    "genre_trends": ApproximateAggregates.genre_trends,
+}
@@ -0,0 +1,609 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# ------------------------------
+# In-process columnar snapshot of the analytics tables
+# ------------------------------
+# Loads users, titles, title_genres, genres, subscriptions and
+# watch_history into NumPy columns with dictionary-encoded keys and keeps
+# running accumulators for the dashboard aggregates. refresh() only pulls
+# watch_history rows above the watch_id high-water mark, so its cost
+# scales with new events instead of total history.
+
+AGE_GROUPS = ['Under 18', '18-24', '25-34', '35-44', '45-54', '55-64', '65+']
+
+PAIR_SHIFT = np.int64(1 << 32)
+
+
+def age_group_codes(age):
+    # Same buckets as the age_groups CTE; NULL ages fall through to ELSE
+    age = np.asarray(age, dtype=float)
+    bounds = [(18, 24), (25, 34), (35, 44), (45, 54), (55, 64)]
+    conditions = [age < 18] + [(age >= low) & (age <= high) for low, high in bounds]
+    return np.select(conditions, np.arange(len(conditions)), len(AGE_GROUPS) - 1).astype(np.int8)
+
+
+def sql_round(values, digits=2):
+    # SQL Server ROUND rounds half away from zero; np.round rounds half to even
+    scale = 10.0 ** digits
+    values = np.asarray(values, dtype=np.float64)
+    return np.sign(values) * np.floor(np.abs(values) * scale + 0.5) / scale
+
+
+def to_float(values):
+    # DECIMAL columns arrive as Decimal objects; NULL becomes NaN
+    return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float64)
+
+
+def _grow(array, size, fill=0):
+    if array.shape[0] >= size:
+        return array
+    extra = np.full((size - array.shape[0],) + array.shape[1:], fill, dtype=array.dtype)
+    return np.concatenate([array, extra])
+
+
+def _expand_ranges(indptr, rows):
+    # For each row r, the flat positions indptr[r]:indptr[r + 1]
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    total = int(counts.sum())
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(np.arange(rows.shape[0]), counts), np.repeat(starts, counts) + offsets
+
+
+class Encoder:
+    # Stable dictionary encoding: value -> int32 code, in first-seen order
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+        self._index = None
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, values):
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+        mapping = np.empty(len(uniques), dtype=np.int32)
+        for i, value in enumerate(uniques):
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.values)
+                self.values.append(value)
+            mapping[i] = code
+        return np.where(codes >= 0, mapping[codes] if len(mapping) else -1, -1).astype(np.int32)
+
+    def lookup(self, values):
+        # -1 for values that have never been encoded
+        if self._index is None or len(self._index) != len(self.values):
+            self._index = pd.Index(self.values, dtype=object)
+        return self._index.get_indexer(pd.Index(values, dtype=object)).astype(np.int32)
+
+
+class KeySet:
+    # Sorted int64 key set with a small sorted delta that is merged lazily,
+    # so adding a batch of keys costs O(batch log n) most of the time.
+    def __init__(self):
+        self._main = np.empty(0, dtype=np.int64)
+        self._delta = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return self._main.size + self._delta.size
+
+    @staticmethod
+    def _contains(sorted_keys, keys):
+        if sorted_keys.size == 0:
+            return np.zeros(keys.shape, dtype=bool)
+        idx = np.minimum(np.searchsorted(sorted_keys, keys), sorted_keys.size - 1)
+        return sorted_keys[idx] == keys
+
+    def add(self, keys):
+        # Returns the keys that were not already present
+        keys = np.unique(np.asarray(keys, dtype=np.int64))
+        fresh = keys[~(self._contains(self._main, keys) | self._contains(self._delta, keys))]
+        if fresh.size:
+            self._delta = np.union1d(self._delta, fresh)
+            if self._delta.size > max(1 << 16, self._main.size >> 4):
+                self._main = np.union1d(self._main, self._delta)
+                self._delta = np.empty(0, dtype=np.int64)
+        return fresh
+
+    def between(self, low, high):
+        # Sorted keys in [low, high)
+        parts = [keys[np.searchsorted(keys, low):np.searchsorted(keys, high)] for keys in (self._main, self._delta)]
+        return np.union1d(*parts) if parts[1].size else parts[0]
+
+
+class ColumnBuffer:
+    # Append-only typed columns with amortized doubling
+    def __init__(self, dtypes):
+        self._dtypes = dtypes
+        self._columns = {name: np.empty(1024, dtype=dtype) for name, dtype in dtypes.items()}
+        self.size = 0
+
+    def append(self, **columns):
+        n = len(next(iter(columns.values())))
+        needed = self.size + n
+        capacity = next(iter(self._columns.values())).shape[0]
+        if needed > capacity:
+            capacity = max(needed, capacity * 2)
+            for name, column in self._columns.items():
+                grown = np.empty(capacity, dtype=self._dtypes[name])
+                grown[:self.size] = column[:self.size]
+                self._columns[name] = grown
+        for name, values in columns.items():
+            self._columns[name][self.size:needed] = values
+        self.size = needed
+
+    def __getitem__(self, name):
+        return self._columns[name][:self.size]
+
+    def nbytes(self):
+        return sum(column[:self.size].nbytes for column in self._columns.values())
+
+
+class ColumnarSnapshot:
+    def __init__(self, fetch, chunk_size=500_000, keep_events=True, exact_distinct=True):
+        # fetch(sql, params) -> DataFrame. exact_distinct=False skips the
+        # (country, title) and (genre, user) pair sets; their distinct
+        # counts are then NaN and come from sketches.py instead.
+        self._fetch = fetch
+        self.chunk_size = chunk_size
+        self.keep_events = keep_events
+        self.exact_distinct = exact_distinct
+        self._lock = threading.RLock()
+        self._listeners = []
+
+        self.users = Encoder()
+        self.titles = Encoder()
+        self.countries = Encoder()
+        self.genres = Encoder()
+        self.sub_types = Encoder()
+
+        self.watermark = 0
+        self.subscription_watermark = 0
+        self.last_refresh = None
+        self.loaded = False
+
+        self.events = ColumnBuffer({
+            'watch_id': np.int64, 'user': np.int32, 'title': np.int32,
+            'watch_percentage': np.float32, 'completed': np.int8,
+            'created_at': 'datetime64[s]',
+        })
+        self._reset_dimensions()
+        self._reset_accumulators()
+
+    def _reset_dimensions(self):
+        self.user_name = np.empty(0, dtype=object)
+        self.user_country = np.empty(0, dtype=np.int32)
+        self.user_age_group = np.empty(0, dtype=np.int8)
+        self.user_watch_hours = np.empty(0, dtype=np.float64)
+        self.user_hours_as_of = np.empty(0, dtype=np.int64)
+        self.user_sub_counts = np.zeros((0, 0), dtype=np.int32)
+        self.user_sub_type = np.empty(0, dtype=np.int32)
+        self.user_sub_start = np.empty(0, dtype='datetime64[D]')
+
+        self.title_name = np.empty(0, dtype=object)
+        self.title_year = np.empty(0, dtype=np.float64)
+        self.title_score = np.empty(0, dtype=np.float64)
+        self.title_runtime = np.empty(0, dtype=np.float64)
+        self.genre_name = np.empty(0, dtype=object)
+        self.tg_indptr = np.zeros(1, dtype=np.int64)
+        self.tg_genres = np.empty(0, dtype=np.int32)
+
+    def _reset_accumulators(self):
+        self.u_count = np.zeros(0, dtype=np.int64)
+        self.u_pct_sum = np.zeros(0, dtype=np.float64)
+        self.u_pct_count = np.zeros(0, dtype=np.int64)
+        self.u_completed = np.zeros(0, dtype=np.int64)
+        self.u_titles = np.zeros(0, dtype=np.int64)
+        self.t_count = np.zeros(0, dtype=np.int64)
+        self.t_pct_sum = np.zeros(0, dtype=np.float64)
+        self.t_pct_count = np.zeros(0, dtype=np.int64)
+        self.t_completed = np.zeros(0, dtype=np.int64)
+        self.c_titles = np.zeros(0, dtype=np.int64)
+        self.g_viewers = np.zeros(0, dtype=np.int64)
+        # country x genre; row 0 holds users with a NULL country
+        self.cg_count = np.zeros((1, 0), dtype=np.int64)
+        self.cg_pct_sum = np.zeros((1, 0), dtype=np.float64)
+        self.cg_pct_count = np.zeros((1, 0), dtype=np.int64)
+
+        self._user_title = KeySet()
+        self._country_title = KeySet()
+        self._genre_user = KeySet()
+
+    def subscribe(self, listener):
+        # listener(snapshot, batch) is called with every newly applied batch
+        # of encoded events (dict of arrays), e.g. to maintain derived indexes.
+        with self._lock:
+            self._listeners.append(listener)
+
+    # -- dimension loading ----------------------------------------------
+    def _load_users(self):
+        # watch_time_hours already holds every event up to hours_as_of (the
+        # trigger ran on insert), so only users new to the snapshot take it;
+        # known users keep their hours, which _apply_events maintains
+        df = self._fetch(
+            "SELECT user_id, name, age, country, watch_time_hours, "
+            "(SELECT MAX(watch_id) FROM watch_history) AS hours_as_of FROM users", None)
+        known = len(self.users)
+        codes = self.users.encode(df['user_id'].to_numpy())
+        n = len(self.users)
+        self.user_name = _grow(self.user_name, n, None)
+        self.user_country = _grow(self.user_country, n, -1)
+        self.user_age_group = _grow(self.user_age_group, n, len(AGE_GROUPS) - 1)
+        self.user_watch_hours = _grow(self.user_watch_hours, n, 0.0)
+        self.user_hours_as_of = _grow(self.user_hours_as_of, n, 0)
+        self.user_sub_type = _grow(self.user_sub_type, n, -1)
+        self.user_sub_start = _grow(self.user_sub_start, n, np.datetime64('NaT'))
+        self.user_name[codes] = df['name'].to_numpy()
+        self.user_country[codes] = self.countries.encode(df['country'].to_numpy())
+        self.user_age_group[codes] = age_group_codes(to_float(df['age']))
+        new = codes >= known
+        self.user_watch_hours[codes[new]] = np.nan_to_num(to_float(df['watch_time_hours']))[new]
+        self.user_hours_as_of[codes[new]] = np.nan_to_num(to_float(df['hours_as_of'])).astype(np.int64)[new]
+        self._grow_accumulators()
+
+    def _load_subscriptions(self):
+        df = self._fetch(
+            "SELECT subscription_id, user_id, subscription_type, subscription_start_date "
+            "FROM subscriptions WHERE subscription_id > ? ORDER BY subscription_id",
+            [self.subscription_watermark])
+        if df.empty:
+            return
+        users = self.users.lookup(df['user_id'].to_numpy())
+        if (users < 0).any():
+            self._load_users()
+            users = self.users.lookup(df['user_id'].to_numpy())
+        types = self.sub_types.encode(df['subscription_type'].to_numpy())
+        starts = pd.to_datetime(df['subscription_start_date']).to_numpy().astype('datetime64[D]')
+        n = len(self.users)
+        counts = np.zeros((n, len(self.sub_types)), dtype=np.int32)
+        counts[:self.user_sub_counts.shape[0], :self.user_sub_counts.shape[1]] = self.user_sub_counts
+        known = users >= 0
+        np.add.at(counts, (users[known], types[known]), 1)
+        self.user_sub_counts = counts
+
+        # Current plan per user = most recently started subscription
+        order = np.argsort(starts[known], kind='stable')
+        u, t, s = users[known][order], types[known][order], starts[known][order]
+        current = self.user_sub_start[u]
+        newer = np.isnat(current) | (s >= current)
+        self.user_sub_type[u[newer]] = t[newer]
+        self.user_sub_start[u[newer]] = s[newer]
+        self.subscription_watermark = int(df['subscription_id'].max())
+
+    def _load_titles(self):
+        titles = self._fetch("SELECT title_id, title, release_year, imdb_score, runtime FROM titles", None)
+        genres = self._fetch("SELECT genre_id, name FROM genres", None)
+        title_genres = self._fetch("SELECT title_id, genre_id FROM title_genres", None)
+
+        codes = self.titles.encode(titles['title_id'].to_numpy())
+        n = len(self.titles)
+        self.title_name = _grow(self.title_name, n, None)
+        self.title_year = _grow(self.title_year, n, np.nan)
+        self.title_score = _grow(self.title_score, n, np.nan)
+        self.title_runtime = _grow(self.title_runtime, n, np.nan)
+        self.title_name[codes] = titles['title'].to_numpy()
+        self.title_year[codes] = to_float(titles['release_year'])
+        self.title_score[codes] = to_float(titles['imdb_score'])
+        self.title_runtime[codes] = to_float(titles['runtime'])
+
+        genre_codes = self.genres.encode(genres['genre_id'].to_numpy())
+        self.genre_name = _grow(self.genre_name, len(self.genres), None)
+        self.genre_name[genre_codes] = genres['name'].to_numpy()
+
+        tg_titles = self.titles.lookup(title_genres['title_id'].to_numpy())
+        tg_genres = self.genres.lookup(title_genres['genre_id'].to_numpy())
+        keep = (tg_titles >= 0) & (tg_genres >= 0)
+        tg_titles, tg_genres = tg_titles[keep], tg_genres[keep]
+        order = np.lexsort((tg_genres, tg_titles))
+        self.tg_genres = tg_genres[order]
+        self.tg_indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tg_titles, minlength=n), out=self.tg_indptr[1:])
+        self._grow_accumulators()
+
+    def _grow_accumulators(self):
+        n_users, n_titles = len(self.users), len(self.titles)
+        n_countries, n_genres = len(self.countries), len(self.genres)
+        for name in ('u_count', 'u_pct_sum', 'u_pct_count', 'u_completed', 'u_titles'):
+            setattr(self, name, _grow(getattr(self, name), n_users))
+        for name in ('t_count', 't_pct_sum', 't_pct_count', 't_completed'):
+            setattr(self, name, _grow(getattr(self, name), n_titles))
+        self.c_titles = _grow(self.c_titles, n_countries)
+        self.g_viewers = _grow(self.g_viewers, n_genres)
+        for name in ('cg_count', 'cg_pct_sum', 'cg_pct_count'):
+            old = getattr(self, name)
+            grown = np.zeros((n_countries + 1, n_genres), dtype=old.dtype)
+            grown[:old.shape[0], :old.shape[1]] = old
+            setattr(self, name, grown)
+
+    # -- event ingestion ------------------------------------------------
+    def _fetch_events(self):
+        return self._fetch(
+            "SELECT TOP (?) watch_id, user_id, title_id, watch_percentage, completed, created_at "
+            "FROM watch_history WHERE watch_id > ? ORDER BY watch_id",
+            [self.chunk_size, self.watermark])
+
+    def _apply_events(self, df, add_watch_time):
+        users = self.users.lookup(df['user_id'].to_numpy())
+        titles = self.titles.lookup(df['title_id'].to_numpy())
+        if (users < 0).any():
+            self._load_users()
+            users = self.users.lookup(df['user_id'].to_numpy())
+        if (titles < 0).any():
+            self._load_titles()
+            titles = self.titles.lookup(df['title_id'].to_numpy())
+        keep = (users >= 0) & (titles >= 0)
+        pct = to_float(df['watch_percentage'])[keep]
+
+        batch = {
+            'watch_id': df['watch_id'].to_numpy(dtype=np.int64)[keep],
+            'user': users[keep],
+            'title': titles[keep],
+            'watch_percentage': pct.astype(np.float32),
+            'completed': np.nan_to_num(to_float(df['completed']))[keep].astype(np.int8),
+            'created_at': pd.to_datetime(df['created_at']).to_numpy().astype('datetime64[s]')[keep],
+        }
+        if self.keep_events:
+            self.events.append(**batch)
+
+        u, t = batch['user'], batch['title']
+        has_pct = ~np.isnan(pct)
+        has_pct_f = has_pct.astype(np.float64)
+        pct0 = np.where(has_pct, pct, 0.0)
+        completed = batch['completed'].astype(np.int64)
+        n_users, n_titles = len(self.users), len(self.titles)
+
+        self.u_count += np.bincount(u, minlength=n_users)
+        self.u_pct_sum += np.bincount(u, weights=pct0, minlength=n_users)
+        self.u_pct_count += np.bincount(u, weights=has_pct_f, minlength=n_users).astype(np.int64)
+        self.u_completed += np.bincount(u, weights=completed, minlength=n_users).astype(np.int64)
+        fresh = self._user_title.add(u.astype(np.int64) * PAIR_SHIFT + t)
+        self.u_titles += np.bincount((fresh // PAIR_SHIFT).astype(np.int64), minlength=n_users)
+
+        self.t_count += np.bincount(t, minlength=n_titles)
+        self.t_pct_sum += np.bincount(t, weights=pct0, minlength=n_titles)
+        self.t_pct_count += np.bincount(t, weights=has_pct_f, minlength=n_titles).astype(np.int64)
+        self.t_completed += np.bincount(t, weights=completed, minlength=n_titles).astype(np.int64)
+
+        country = self.user_country[u]
+        if self.exact_distinct:
+            with_country = has_pct & (country >= 0)
+            fresh = self._country_title.add(country[with_country].astype(np.int64) * PAIR_SHIFT + t[with_country])
+            self.c_titles += np.bincount((fresh // PAIR_SHIFT).astype(np.int64), minlength=len(self.countries))
+
+        # Fan events out to the genres of their title
+        event_idx, flat = _expand_ranges(self.tg_indptr, t)
+        genre = self.tg_genres[flat]
+        if self.exact_distinct:
+            fresh = self._genre_user.add(genre.astype(np.int64) * PAIR_SHIFT + u[event_idx])
+            self.g_viewers += np.bincount((fresh // PAIR_SHIFT).astype(np.int64), minlength=len(self.genres))
+        cell = (country[event_idx] + 1, genre)
+        np.add.at(self.cg_count, cell, 1)
+        np.add.at(self.cg_pct_sum, cell, pct0[event_idx])
+        np.add.at(self.cg_pct_count, cell, has_pct[event_idx].astype(np.int64))
+
+        if add_watch_time:
+            # Mirrors trg_watch_history_update_user_time, for events newer
+            # than the hours read from users
+            runtime = self.title_runtime[t]
+            ok = ~np.isnan(runtime) & has_pct & (batch['watch_id'] > self.user_hours_as_of[u])
+            self.user_watch_hours += np.bincount(u[ok], weights=runtime[ok] * pct[ok] / 60, minlength=n_users)
+
+        if batch['watch_id'].size:
+            self.watermark = max(self.watermark, int(batch['watch_id'].max()))
+        self.watermark = max(self.watermark, int(df['watch_id'].max()))
+        for listener in self._listeners:
+            listener(self, batch)
+        return int(keep.sum())
+
+    def load(self):
+        with self._lock:
+            self.users, self.titles = Encoder(), Encoder()
+            self.countries, self.genres, self.sub_types = Encoder(), Encoder(), Encoder()
+            self.watermark = self.subscription_watermark = 0
+            self.events = ColumnBuffer(self.events._dtypes)
+            self._reset_dimensions()
+            self._reset_accumulators()
+            self._load_users()
+            self._load_titles()
+            self._load_subscriptions()
+            self._pull(add_watch_time=False)
+            self.loaded = True
+            self.last_refresh = time.time()
+
+    def refresh(self, min_interval=0):
+        # Pull new watch events above the high-water mark; returns rows applied
+        with self._lock:
+            if not self.loaded:
+                self.load()
+                return self.events.size
+            if self.last_refresh and time.time() - self.last_refresh < min_interval:
+                return 0
+            self._load_subscriptions()
+            applied = self._pull(add_watch_time=True)
+            self.last_refresh = time.time()
+            return applied
+
+    def _pull(self, add_watch_time):
+        applied = 0
+        while True:
+            df = self._fetch_events()
+            if df.empty:
+                return applied
+            applied += self._apply_events(df, add_watch_time)
+            if len(df) < self.chunk_size:
+                return applied
+
+    # -- aggregates -----------------------------------------------------
+    @staticmethod
+    def _avg(total, count, scale=1.0):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return sql_round(np.where(count > 0, total / np.maximum(count, 1) * scale, np.nan))
+
+    def _user_ids(self):
+        return np.array(self.users.values, dtype=object)
+
+    def user_activity_summary(self, top=None):
+        with self._lock:
+            has = self.u_count > 0
+            sub_type = np.array(self.sub_types.values + [None], dtype=object)[self.user_sub_type]
+            df = pd.DataFrame({
+                'user_id': self._user_ids(),
+                'name': self.user_name,
+                'country': np.array(self.countries.values + [None], dtype=object)[self.user_country],
+                'subscription_type': sub_type,
+                'watch_time_hours': sql_round(self.user_watch_hours),
+                'titles_watched': self.u_titles,
+                'total_watches': self.u_count,
+                'completed_watches': np.where(has, self.u_completed, np.nan),
+                'avg_watch_percentage': self._avg(self.u_pct_sum, self.u_pct_count, 100),
+            })
+        df = df.sort_values('watch_time_hours', ascending=False, kind='stable')
+        return (df.head(top) if top else df).reset_index(drop=True)
+
+    def country_engagement(self):
+        with self._lock:
+            n = len(self.countries)
+            country = self.user_country
+            ok = (country >= 0) & (self.u_pct_count > 0)
+            c, w = country[ok], self.u_pct_count[ok]
+            events = np.bincount(c, weights=w, minlength=n)
+            df = pd.DataFrame({
+                'country': np.array(self.countries.values, dtype=object),
+                'user_count': np.bincount(c, minlength=n),
+                'avg_watch_hours': self._avg(np.bincount(c, weights=self.user_watch_hours[ok] * w, minlength=n), events),
+                'unique_titles_watched': self.c_titles if self.exact_distinct else np.nan,
+                'total_watches': events.astype(np.int64),
+                'avg_completion_rate': self._avg(np.bincount(c, weights=self.u_pct_sum[ok], minlength=n), events, 100),
+            })
+        df = df[df['user_count'] > 0]
+        return df.sort_values('user_count', ascending=False, kind='stable').reset_index(drop=True)
+
+    def avg_watch_per_user(self):
+        with self._lock:
+            has = self.u_count > 0
+            df = pd.DataFrame({
+                'user_id': self._user_ids(),
+                'name': self.user_name,
+                'avg_watch_percentage': self._avg(self.u_pct_sum, self.u_pct_count, 100),
+                'total_watches': self.u_count,
+                'completed_watches': np.where(has, self.u_completed, np.nan),
+            })
+        return df.sort_values('avg_watch_percentage', ascending=False, na_position='last',
+                              kind='stable').reset_index(drop=True)
+
+    def top_users_completed(self, top=10):
+        with self._lock:
+            has = self.u_count > 0
+            df = pd.DataFrame({
+                'user_id': self._user_ids()[has],
+                'name': self.user_name[has],
+                'completed_watches': self.u_completed[has],
+            })
+        return df.sort_values('completed_watches', ascending=False, kind='stable').head(top).reset_index(drop=True)
+
+    def age_group_subscription(self):
+        with self._lock:
+            n_types = len(self.sub_types)
+            counts = self.user_sub_counts[:len(self.users), :n_types].astype(np.int64)
+            groups = self.user_age_group[:counts.shape[0]].astype(np.int64)
+            # Each (user, subscription) row joins to all of that user's events
+            cell = groups[:, None] * n_types + np.arange(n_types)[None, :]
+            size = len(AGE_GROUPS) * n_types
+
+            def per_cell(values):
+                return np.bincount(cell.ravel(), weights=(counts * values[:counts.shape[0], None]).ravel(), minlength=size)
+
+            users = np.bincount(cell.ravel(), weights=(counts > 0).ravel(), minlength=size)
+            events = per_cell(self.u_count)
+            pct_sum = per_cell(self.u_pct_sum)
+            pct_count = per_cell(self.u_pct_count)
+            df = pd.DataFrame({
+                'age_group': np.repeat(np.array(AGE_GROUPS, dtype=object), n_types),
+                'subscription_type': np.tile(np.array(self.sub_types.values, dtype=object), len(AGE_GROUPS)),
+                'users_in_segment': users.astype(np.int64),
+                'total_watch_events': events.astype(np.int64),
+                'avg_watch_percentage': self._avg(pct_sum, pct_count, 100),
+                'total_watch_percentage': np.where(pct_count > 0, sql_round(pct_sum * 100), np.nan),
+            })
+        df = df[df['users_in_segment'] > 0]
+        return df.sort_values(['age_group', 'subscription_type'], kind='stable').reset_index(drop=True)
+
+    def _genre_totals(self):
+        n = len(self.genres)
+        title_of = np.repeat(np.arange(len(self.titles)), np.diff(self.tg_indptr))
+        g = self.tg_genres
+
+        def per_genre(values):
+            return np.bincount(g, weights=values[title_of], minlength=n)
+
+        return {
+            'title_count': np.bincount(g, minlength=n),
+            'total_watches': per_genre(self.t_count).astype(np.int64),
+            'pct_sum': per_genre(self.t_pct_sum),
+            'pct_count': per_genre(self.t_pct_count),
+            'completed': per_genre(self.t_completed),
+        }
+
+    def genre_performance(self):
+        with self._lock:
+            totals = self._genre_totals()
+            df = pd.DataFrame({
+                'genre_id': np.array(self.genres.values, dtype=object),
+                'genre_name': self.genre_name,
+                'title_count': totals['title_count'],
+                'unique_viewers': self.g_viewers if self.exact_distinct else np.nan,
+                'total_watches': totals['total_watches'],
+                'avg_watch_percentage': self._avg(totals['pct_sum'], totals['pct_count'], 100),
+                'completed_watches': np.where(totals['total_watches'] > 0, totals['completed'], np.nan),
+            })
+        return df.sort_values('total_watches', ascending=False, kind='stable').reset_index(drop=True)
+
+    def genre_trends(self):
+        df = self.genre_performance().rename(columns={
+            'title_count': 'total_titles', 'total_watches': 'total_watch_events'})
+        with np.errstate(invalid='ignore', divide='ignore'):
+            df['engagement_score'] = np.where(df['total_titles'] > 0,
+                                              df['total_watch_events'] / df['total_titles'].clip(lower=1), np.nan)
+        return df
+
+    def country_genre(self):
+        with self._lock:
+            n_countries, n_genres = self.cg_count.shape
+            df = pd.DataFrame({
+                'country': np.repeat(np.array([None] + self.countries.values, dtype=object), n_genres),
+                'genre': np.tile(self.genre_name, n_countries),
+                'avg_watch_percentage': self._avg(self.cg_pct_sum, self.cg_pct_count, 100).ravel(),
+                'total_watches': self.cg_count.ravel(),
+            })
+        df = df[df['total_watches'] > 0]
+        return df.sort_values(['country', 'avg_watch_percentage'], ascending=[True, False],
+                              na_position='first', kind='stable').reset_index(drop=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self.users),
+                'titles': len(self.titles),
+                'events': int(self.u_count.sum()),
+                'watermark': self.watermark,
+                'event_bytes': self.events.nbytes(),
+                'last_refresh': self.last_refresh,
+            }
+
+
+# Page plan entries (see page_queries.py) the snapshot can answer locally
+SNAPSHOT_QUERIES = {
+    "user_activity_summary": lambda s: s.user_activity_summary(top=50),
+    "country_engagement": ColumnarSnapshot.country_engagement,
+    "avg_watch_per_user": ColumnarSnapshot.avg_watch_per_user,
+    "top_users_completed": ColumnarSnapshot.top_users_completed,
+    "age_group_subscription": ColumnarSnapshot.age_group_subscription,
+    "genre_performance": ColumnarSnapshot.genre_performance,
+    "genre_trends": ColumnarSnapshot.genre_trends,
+    "country_genre": ColumnarSnapshot.country_genre,
+}
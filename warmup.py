@@ -0,0 +1,250 @@
+import argparse
+import heapq
+import json
+import random
+import threading
+import time
+
+from pagination import PagedQuery
+
+# ------------------------------
+# Warm-up and refresh-ahead scheduler
+# ------------------------------
+# Loads the page queries into the QueryCache in priority order as soon as
+# the app starts, so the first visitor to a page finds its full-history
+# aggregates already cached, then keeps them warm: each entry is reloaded
+# a jittered `lead` seconds before it expires, so entries do not all
+# come due at once. The scheduler is the cache's `revalidate` hook: an
+# entry that expired or was invalidated by a write keeps being served
+# while a worker reloads it, and a page only waits on a query nobody has
+# loaded yet (or on the in-flight load of one, never on a second copy).
+#
+# Paged tables are warmed as the page and count queries for their
+# default first page, which is what the pages request.
+#
+#   python warmup.py                                # one timed warm-up pass
+#   python warmup.py --pages Overview Trends --workers 4
+
+# Pages in warm-up order. The Recommender Demo lists are served by the
+# typeahead indexes instead.
+WARMUP_PAGES = ["Overview", "User Activity", "Genre Performance", "Subscription & Revenue", "Cross Analysis",
+                "Trends"]
+
+
+class WarmupJob:
+    __slots__ = ('label', 'sql', 'params', 'priority', 'deadline', 'running', 'forced', 'runs', 'seconds',
+                 'rows', 'last_run', 'error', 'failures')
+
+    def __init__(self, label, sql, params, priority):
+        self.label = label
+        self.sql = sql
+        self.params = params
+        self.priority = priority
+        self.deadline = 0.0
+        self.running = self.forced = False
+        self.runs = self.failures = 0
+        self.seconds = self.rows = self.last_run = self.error = None
+
+
+def page_jobs(page_queries, paged_queries=None, pages=WARMUP_PAGES):
+    # [(label, sql, params)] in priority order
+    jobs = []
+    for page in pages:
+        for name, sql in page_queries.get(page, {}).items():
+            query = (paged_queries or {}).get(name)
+            if isinstance(query, PagedQuery):
+                # read_page fetches one row more than it shows
+                page_sql, params = query.page_sql(query.page_size + 1)
+                jobs.append((f"{page}/{name}[page]", page_sql, params))
+                count_sql, params = query.count_sql()
+                jobs.append((f"{page}/{name}[count]", count_sql, params))
+            else:
+                jobs.append((f"{page}/{name}", sql, []))
+    return jobs
+
+
+class WarmupScheduler:
+    def __init__(self, cache, read, jobs, stats=None, workers=2, lead=None, jitter=0.5, retry=30):
+        # read(sql, params, timings=None) -> DataFrame, e.g. backend.read.
+        # lead: seconds before expiry an entry is reloaded (default 15% of
+        # the cache TTL), stretched by up to `jitter` of itself.
+        self.cache = cache
+        self.read = read
+        self.stats_sink = stats
+        self.workers = workers
+        self.lead = cache.ttl * 0.15 if lead is None else lead
+        self.jitter = jitter
+        self.retry = retry
+        self.jobs = [WarmupJob(label, sql, params, priority) for priority, (label, sql, params) in enumerate(jobs)]
+        self._by_key = {cache.make_key(job.sql, job.params): job for job in self.jobs}
+        self._heap = [(0.0, job.priority) for job in self.jobs]
+        heapq.heapify(self._heap)
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopped = False
+        self.started = None
+        self.warmed_at = None
+
+    # -- lifecycle --------------------------------------------------------
+    def start(self):
+        with self._cond:
+            if self._threads:
+                return self
+            self.started = time.monotonic()
+            self._stopped = False
+            self._threads = [threading.Thread(target=self._work, name=f"warmup-{i}", daemon=True)
+                             for i in range(self.workers)]
+        self.cache.revalidate = self.revalidate
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        if self.cache.revalidate == self.revalidate:
+            self.cache.revalidate = None
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+
+    def wait(self, timeout=None):
+        # Blocks until every job has been loaded once (or failed)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.warmed_at is None:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    # -- scheduling -------------------------------------------------------
+    def _push(self, job, deadline):
+        # Caller holds the condition; superseded heap entries are skipped
+        job.deadline = deadline
+        heapq.heappush(self._heap, (deadline, job.priority))
+        self._cond.notify()
+
+    def revalidate(self, key):
+        # QueryCache hook, called with the cache lock held
+        job = self._by_key.get(key)
+        if job is None or not self._threads:
+            return False
+        with self._cond:
+            # Reload even if the entry looks fresh: a load in progress may
+            # predate the write, and is then run again when it finishes
+            job.forced = True
+            if not job.running and job.deadline > time.monotonic():
+                self._push(job, time.monotonic())
+        return True
+
+    def _next(self):
+        with self._cond:
+            while not self._stopped:
+                now = time.monotonic()
+                while self._heap and (self._heap[0][0] != self.jobs[self._heap[0][1]].deadline
+                                      or self.jobs[self._heap[0][1]].running):
+                    heapq.heappop(self._heap)
+                if self._heap and self._heap[0][0] <= now:
+                    job = self.jobs[heapq.heappop(self._heap)[1]]
+                    forced, job.running, job.forced = job.forced, True, False
+                    return job, forced
+                self._cond.wait(self._heap[0][0] - now if self._heap else None)
+            return None, False
+
+    def _work(self):
+        while True:
+            job, forced = self._next()
+            if job is None:
+                return
+            self._run(job, forced)
+
+    def _run(self, job, forced=False):
+        remaining = self.cache.expires_in(job.sql, job.params)
+        lead = self.lead * (1 + self.jitter * random.random())
+        error = None
+        if forced or remaining is None or remaining <= lead:
+            timings = {}
+            start = time.perf_counter()
+            try:
+                data = self.cache.refresh(job.sql, job.params,
+                                          lambda: self.read(job.sql, job.params, timings=timings))
+            except Exception as e:
+                error = str(e)
+            elapsed = time.perf_counter() - start
+            if self.stats_sink is not None:
+                self.stats_sink.record(job.sql, elapsed, kind="warmup", label=job.label,
+                                       rows=None if error else len(data), cache="miss", error=error, **timings)
+            job.seconds, job.rows = elapsed, None if error else len(data)
+            remaining = self.cache.expires_in(job.sql, job.params)
+        # else: still fresh (a page loaded it first); only schedule its refresh
+
+        with self._cond:
+            job.running = False
+            job.runs += 1
+            job.last_run = time.time()
+            job.error = error
+            job.failures = job.failures + 1 if error else 0
+            if job.forced:
+                self._push(job, time.monotonic())
+            elif error or remaining is None:
+                self._push(job, time.monotonic() + min(self.retry * 2 ** (job.failures - 1), self.cache.ttl))
+            else:
+                self._push(job, time.monotonic() + max(remaining - lead, 1.0))
+            if self.warmed_at is None and all(j.runs for j in self.jobs):
+                self.warmed_at = time.monotonic()
+                self._cond.notify_all()
+
+    # -- reporting --------------------------------------------------------
+    def progress(self):
+        with self._cond:
+            return sum(1 for job in self.jobs if job.runs) / len(self.jobs) if self.jobs else 1.0
+
+    def stats(self):
+        now = time.monotonic()
+        with self._cond:
+            warmed = [job for job in self.jobs if job.runs]
+            timed = sorted((job for job in warmed if job.seconds is not None), key=lambda job: -job.seconds)
+            pending = [job.deadline - now for job in self.jobs if not job.running]
+            return {
+                'jobs': len(self.jobs),
+                'warmed': len(warmed),
+                'warmup_seconds': round((self.warmed_at or now) - self.started, 3) if self.started else None,
+                'complete': self.warmed_at is not None,
+                'running': [job.label for job in self.jobs if job.running],
+                'loads': sum(job.runs for job in self.jobs),
+                'next_refresh_s': round(max(min(pending), 0.0), 1) if pending else None,
+                'slowest': {job.label: round(job.seconds, 3) for job in timed[:5]},
+                'errors': {job.label: job.error for job in self.jobs if job.error},
+            }
+
+
+def main():
+    from backends import create_backend
+    from page_queries import PAGE_QUERIES, PAGED_QUERIES
+    from query_cache import QueryCache
+
+    parser = argparse.ArgumentParser(description="Time one warm-up pass over the page queries")
+    parser.add_argument('--pages', nargs='+', default=WARMUP_PAGES)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    backend = create_backend()
+    scheduler = WarmupScheduler(QueryCache(), backend.read, page_jobs(PAGE_QUERIES, PAGED_QUERIES, args.pages),
+                                workers=args.workers).start()
+    reported = set()
+    while not scheduler.wait(timeout=0.5) or len(reported) < len(scheduler.jobs):
+        for job in scheduler.jobs:
+            if job.runs and job.label not in reported:
+                reported.add(job.label)
+                print(json.dumps({'query': job.label, 'seconds': round(job.seconds or 0, 3), 'rows': job.rows,
+                                  'error': job.error}))
+    print(json.dumps(scheduler.stats()))
+    scheduler.stop()
+    backend.close()
+
+
+if __name__ == '__main__':
+    main()
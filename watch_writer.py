@@ -0,0 +1,177 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from maintenance import is_completed
+
+# ------------------------------
+# Buffered watch-event writer
+# ------------------------------
+# Producers submit watch events and get a Future back; a single flusher
+# thread drains the buffer and writes a batch as soon as it holds
+# max_batch events or the oldest event has waited max_latency seconds.
+# Each batch is one transaction (one log flush) made of multi-row INSERTs,
+# so the watch_history triggers fire once per statement instead of once
+# per event. The buffer is bounded: when it is full, submit() blocks or
+# raises queue.Full, which pushes back on producers. `completed` is set at
+# write time so rows are correct in deferred maintenance mode too.
+
+# Four parameters per row; SQL Server allows at most 2100 per statement
+ROWS_PER_STATEMENT = 500
+
+
+class WriterClosed(Exception):
+    pass
+
+
+def insert_statement(n_rows):
+    values = ', '.join(["(?, ?, ?, ?, SYSDATETIME(), SYSDATETIME())"] * n_rows)
+    return f"""
+        INSERT INTO watch_history
+        (user_id, title_id, watch_percentage, completed, created_at, updated_at)
+        VALUES {values}"""
+
+
+class WatchWriter:
+    def __init__(self, pool, max_batch=2000, max_latency=0.05, max_pending=20_000):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._cond = threading.Condition()
+        self._submitted = 0
+        self._settled = 0
+        self.committed = 0
+        self.failed = 0
+        self.batches = 0
+        self.flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, name='watch-writer', daemon=True)
+        self._thread.start()
+
+    # -- producers --------------------------------------------------------
+    def submit(self, user_id, title_id, watch_percentage, block=True, timeout=None):
+        # watch_percentage is a 0-1 fraction, as stored in watch_history
+        if self._closed:
+            raise WriterClosed("watch writer is closed")
+        future = Future()
+        with self._cond:
+            self._submitted += 1
+        try:
+            row = (user_id, title_id, watch_percentage, is_completed(watch_percentage))
+            self._queue.put((row, future), block, timeout)
+        except queue.Full:
+            with self._cond:
+                self._submitted -= 1
+            raise
+        return future
+
+    def submit_many(self, events, block=True, timeout=None):
+        return [self.submit(*event, block=block, timeout=timeout) for event in events]
+
+    def flush(self, timeout=None):
+        # Wait until every event submitted so far is committed or failed
+        with self._cond:
+            target = self._submitted
+            return self._cond.wait_for(lambda: self._settled >= target, timeout)
+
+    def close(self, timeout=None):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    # -- flusher ----------------------------------------------------------
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None, True
+        batch = [first]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            if batch:
+                self._write(batch)
+        # Drain anything submitted while closing
+        rest = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                rest.append(item)
+        if rest:
+            self._write(rest)
+
+    def _insert(self, rows):
+        def write(conn):
+            cursor = conn.cursor()
+            for start in range(0, len(rows), ROWS_PER_STATEMENT):
+                chunk = rows[start:start + ROWS_PER_STATEMENT]
+                cursor.execute(insert_statement(len(chunk)), [value for row in chunk for value in row])
+            conn.commit()
+        self.pool.run(write)
+
+    def _write(self, batch):
+        rows = [row for row, _ in batch]
+        started = time.perf_counter()
+        try:
+            self._insert(rows)
+            outcomes = [None] * len(batch)
+        except Exception:
+            # One bad row fails the whole transaction; retry row by row so
+            # only the offending events are rejected
+            outcomes = []
+            for row in rows:
+                try:
+                    self._insert([row])
+                    outcomes.append(None)
+                except Exception as e:
+                    outcomes.append(e)
+        elapsed = time.perf_counter() - started
+
+        failed = 0
+        for (_, future), error in zip(batch, outcomes):
+            if error is None:
+                future.set_result(True)
+            else:
+                failed += 1
+                future.set_exception(error)
+        with self._cond:
+            self.batches += 1
+            self.committed += len(batch) - failed
+            self.failed += failed
+            self.flush_seconds += elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            self._settled += len(batch)
+            self._cond.notify_all()
+
+    def metrics(self):
+        with self._cond:
+            return {
+                'submitted': self._submitted,
+                'committed': self.committed,
+                'failed': self.failed,
+                'pending': self._submitted - self._settled,
+                'batches': self.batches,
+                'avg_batch': round((self.committed + self.failed) / self.batches, 1) if self.batches else 0.0,
+                'avg_flush_ms': round(self.flush_seconds / self.batches * 1000, 2) if self.batches else 0.0,
+                'max_flush_ms': round(self.max_flush_seconds * 1000, 2),
+            }